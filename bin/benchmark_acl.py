@@ -0,0 +1,82 @@
+"""
+measure acl checks per second for joining rooms and listing channels, with the per-user decision cache and with
+only the precompiled rules (decision_cache_size=0); roles come from an in-memory fake db, so the numbers exclude the
+round trip of the roles lookup
+
+usage: PYTHONPATH=. python bin/benchmark_acl.py [n_checks] [n_targets]
+"""
+
+import logging
+logging.disable(logging.INFO)  # before importing the environment, it logs while setting up
+
+import sys
+import time
+
+from activitystreams import parse as as_parser
+
+from dino import environ
+from dino.config import ApiActions
+from dino.config import ApiTargets
+from dino.config import ConfigKeys
+from dino.config import SessionKeys
+from dino.validation.acl import AclPatternValidator
+from dino.validation.acl import AclRangeValidator
+from dino.validation.acl import AclStrInCsvValidator
+from dino.validation.acl import AclValidator
+
+n_checks = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+n_targets = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+
+
+class FakeDb(object):
+    def channel_for_room(self, room_id):
+        return 'channel-0'
+
+    def get_user_roles_for_target(self, user_id, channel_id, room_id=None):
+        return {'global': [], 'channel': [], 'room': []}
+
+
+environ.env.db = FakeDb()
+environ.env.session = {
+    SessionKeys.user_id.value: '1234',
+    SessionKeys.gender.value: 'f',
+    SessionKeys.age.value: '30',
+    SessionKeys.membership.value: 'tg_p',
+    SessionKeys.country.value: 'de',
+}
+environ.env.config = {
+    ConfigKeys.ACL: {
+        'room': {'join': {'acls': ['gender', 'age', 'country', 'custom']}},
+        'channel': {'list': {'acls': ['gender', 'age', 'country', 'custom']}},
+        'available': {'acls': ['gender', 'age', 'country', 'membership', 'custom']},
+        'validation': {
+            'gender': {'type': 'str_in_csv', 'value': AclStrInCsvValidator('m,f')},
+            'membership': {'type': 'str_in_csv', 'value': AclStrInCsvValidator()},
+            'country': {'type': 'str_in_csv', 'value': AclStrInCsvValidator()},
+            'age': {'type': 'range', 'value': AclRangeValidator()},
+            'custom': {'type': 'custom', 'value': AclPatternValidator()},
+        }
+    }
+}
+
+target_acls = [
+    {'gender': 'f', 'age': '18:', 'country': 'de,se,cn', 'custom': 'gender=f,(membership=tg_p|membership=tg)'},
+    {'gender': 'm', 'age': ':35'},
+]
+activity = as_parser({
+    'actor': {'id': '1234'},
+    'verb': 'join',
+    'object': {'url': 'channel-0'},
+    'target': {'id': 'room-0', 'objectType': 'room'}
+})
+print('checks: {}, rooms/channels: {}'.format(n_checks, n_targets))
+
+for name, validator in [('rules only', AclValidator(decision_cache_size=0)), ('decision cache', AclValidator())]:
+    for target, action in [(ApiTargets.ROOM, ApiActions.JOIN), (ApiTargets.CHANNEL, ApiActions.LIST)]:
+        before = time.perf_counter()
+        for i in range(n_checks):
+            target_id = '{}-{}'.format(target, i % n_targets)
+            validator.validate_acl_for_action(
+                activity, target, action, target_acls[i % len(target_acls)], target_id=target_id, channel_id='channel-0')
+        elapsed = time.perf_counter() - before
+        print('[{}] {} {}: {:.0f} checks/s'.format(name, target, action, n_checks / elapsed))
@@ -0,0 +1,51 @@
+"""
+reproduce the blacklist numbers from the BlackListChecker docstring, comparing the
+'regular' check (one substring test per blacklisted word) with the Aho-Corasick matcher
+
+usage: python bin/benchmark_blacklist.py [blacklist_size] [n_messages]
+"""
+
+import random
+import string
+import sys
+import time
+
+from dino.utils.blacklist import BlackListMatcher
+
+blacklist_size = int(sys.argv[1]) if len(sys.argv) > 1 else 60000
+n_messages = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+
+
+def random_word(min_length: int = 4, max_length: int = 12) -> str:
+    length = random.randint(min_length, max_length)
+    return ''.join(random.choice(string.ascii_lowercase) for _ in range(length))
+
+
+def random_message() -> str:
+    return ' '.join(random_word(2, 10) for _ in range(random.randint(3, 20)))
+
+
+def regular(blacklist: set, message: str):
+    if not any(word in message for word in blacklist):
+        return None
+    for word in blacklist:
+        if word in message:
+            return word
+    return None
+
+
+blacklist = {random_word() for _ in range(blacklist_size)}
+messages = [random_message() for _ in range(min(n_messages, 10000))]
+print('length of blacklist: {}, messages to check: {}'.format(len(blacklist), n_messages))
+
+before = time.perf_counter()
+matcher = BlackListMatcher(blacklist)
+matcher.find('')
+print('[automaton] built in {:.2f}s'.format(time.perf_counter() - before))
+
+for name, method in [('automaton', lambda m: matcher.find(m)), ('regular', lambda m: regular(blacklist, m))]:
+    before = time.perf_counter()
+    for i in range(n_messages):
+        method(messages[i % len(messages)])
+    elapsed = time.perf_counter() - before
+    print('[{}] done in {:.2f}s, avg time: {:.4f}ms'.format(name, elapsed, elapsed / n_messages * 1000))
@@ -0,0 +1,59 @@
+"""
+compare deleting all messages of a user one request at a time (how Driver.msgs_delete used to
+work) with the concurrent execution in Driver.msgs_delete, against the fake cassandra session
+in test/storage/fake_cassandra.py with a simulated round trip latency
+
+usage: python bin/benchmark_cassandra_delete.py [n_messages] [latency_ms] [concurrency]
+"""
+
+import sys
+import time
+from uuid import uuid4 as uuid
+
+from dino.storage.cassandra_driver import Driver
+from dino.storage.cassandra_driver import StatementKeys
+from test.storage.fake_cassandra import FakeCassandraSession
+
+n_messages = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+latency = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.001
+concurrency = int(sys.argv[3]) if len(sys.argv) > 3 else 50
+
+
+def create_driver() -> (Driver, list):
+    session = FakeCassandraSession(latency=latency, max_workers=concurrency)
+    driver = Driver(session, 'dino', 'SimpleStrategy', 1, concurrency=concurrency)
+    driver.init()
+
+    message_ids = list()
+    for i in range(n_messages):
+        message_id = str(uuid())
+        sent_time = '2017-01-01T%02d:%02d:%02dZ' % (i // 3600 % 24, i // 60 % 60, i % 60)
+        session.add_message(message_id, 'room-%s' % (i % 10), '1234', sent_time, 'spam')
+        message_ids.append(message_id)
+
+    return driver, message_ids
+
+
+def sequential_delete(driver: Driver, message_ids: list) -> None:
+    # the msgs_delete() loop before it executed requests concurrently
+    for message_id in message_ids:
+        keys = driver._execute(StatementKeys.msg_select, message_id)
+        for key in keys.current_rows:
+            rows = driver._execute(StatementKeys.msg_select_one, key.target_id, key.from_user_id, key.sent_time)
+            for _ in rows.current_rows:
+                driver.msg_update(key.from_user_id, key.target_id, '', key.sent_time, deleted=True)
+
+
+print('messages: {}, latency: {:.1f}ms, concurrency: {}'.format(n_messages, latency * 1000, concurrency))
+
+for name, method in [('sequential', sequential_delete), ('concurrent', lambda d, ids: d.msgs_delete(ids))]:
+    _driver, _message_ids = create_driver()
+    n_requests_before = _driver.session.n_requests
+
+    before = time.perf_counter()
+    method(_driver, _message_ids)
+    elapsed = time.perf_counter() - before
+
+    n_deleted = sum(1 for m in _driver.session.messages.values() if m['deleted'])
+    print('[{}] deleted {} in {:.2f}s ({} requests)'.format(
+        name, n_deleted, elapsed, _driver.session.n_requests - n_requests_before))
@@ -0,0 +1,80 @@
+"""
+compare the per-event overhead of config lookups, formatting the values on every
+call (how ConfigDict.get() used to work) vs. using the values resolved at load time
+
+usage: python bin/benchmark_config.py [n_events]
+"""
+
+import sys
+import time
+
+from dino.config import ConfigKeys
+from dino.environ import ConfigDict
+
+n_events = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+config = ConfigDict({
+    ConfigKeys.TESTING: False,
+    ConfigKeys.RESPONSE_FORMAT: 'status_code,data,error',
+    ConfigKeys.ENVIRONMENT: 'default',
+    ConfigKeys.LOG_LEVEL: 'INFO',
+    ConfigKeys.HISTORY: {'type': 'top', 'limit': 50},
+    ConfigKeys.CACHE_SERVICE: {'type': 'redis', 'host': '{redis_host}', 'db': 21},
+    'redis_host': 'localhost',
+})
+
+# roughly the lookups done for one socket event (pre_process, acl validation, respond_with, history)
+lookups = [
+    (ConfigKeys.TESTING, None),
+    (ConfigKeys.ENVIRONMENT, None),
+    (ConfigKeys.RESPONSE_FORMAT, None),
+    (ConfigKeys.LOG_LEVEL, None),
+    (ConfigKeys.TYPE, ConfigKeys.HISTORY),
+    (ConfigKeys.LIMIT, ConfigKeys.HISTORY),
+    (ConfigKeys.HOST, ConfigKeys.CACHE_SERVICE),
+]
+
+
+def legacy_format(s, key, params):
+    # the formatting ConfigDict.get() used to do on every call
+    if s is None:
+        return s
+    if isinstance(s, list):
+        return [legacy_format(r, key, params) for r in s]
+    if isinstance(s, dict):
+        return {k: legacy_format(v, key, params) for k, v in s.items()}
+    if not isinstance(s, str):
+        return s
+    if s.lower() == 'null' or s.lower() == 'none':
+        return ''
+
+    import re
+    keydb = set('{' + key + '}')
+    while True:
+        sres = re.search("{.*?}", s)
+        if sres is None:
+            break
+        keydb.add(sres.group())
+        s = s.format(**params)
+    return s
+
+
+def uncached_get(key, domain):
+    if domain is not None:
+        return legacy_format(config.params[domain][key], key, config.params)
+    return legacy_format(config.params[key], key, config.params)
+
+
+def run(get_method) -> float:
+    before = time.perf_counter()
+    for _ in range(n_events):
+        for key, domain in lookups:
+            get_method(key, domain)
+    return time.perf_counter() - before
+
+
+before_elapsed = run(uncached_get)
+after_elapsed = run(lambda key, domain: config.get(key, domain=domain))
+
+for name, elapsed in [('formatted on every call', before_elapsed), ('resolved at load time', after_elapsed)]:
+    print('{:<25} {:8.3f}s total, {:6.2f}us per event'.format(name, elapsed, elapsed / n_events * 1e6))
@@ -0,0 +1,84 @@
+"""
+measure whisper validation latency against the stub json-rpc server from the test suite, comparing a new http
+client per call (how RemoteHandler used to work) with the shared keep-alive client, serially and fanned out
+
+usage: PYTHONPATH=. python bin/benchmark_remote_whisper.py [n_whispers] [n_receivers] [delay_ms]
+"""
+
+import eventlet
+eventlet.monkey_patch()
+
+import hashlib
+import logging
+import sys
+import time
+
+from jsonrpcclient.clients.http_client import HTTPClient
+from jsonrpcclient.requests import Request
+
+from dino.config import ConfigKeys
+from dino.environ import ConfigDict
+from dino.remote.handler import RemoteHandler
+from test.remote.stub_server import StubWhisperServer
+
+n_whispers = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+n_receivers = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+delay = float(sys.argv[3]) / 1000 if len(sys.argv) > 3 else 0.01
+
+
+class NoCache(object):
+    def get_can_whisper_to_user(self, *args):
+        return None, None
+
+    def set_can_whisper_to_user(self, *args):
+        pass
+
+
+class Env(object):
+    def __init__(self, url: str):
+        self.config = ConfigDict({
+            ConfigKeys.REMOTE: {
+                ConfigKeys.HOST: url,
+                ConfigKeys.PATH_CAN_WHISPER: 'whisper',
+                ConfigKeys.PRIVATE_KEY: 'secret'
+            }
+        })
+        self.cache = NoCache()
+
+    def capture_exception(self, _):
+        pass
+
+
+def new_client_per_call(url: str, sender_id: int, receiver: str):
+    request = str(Request(method="whisper.validate", senderId=sender_id, receiverName=receiver))
+    client = HTTPClient(url + '/whisper')
+    client.session.headers.update({
+        "Content-Type": "application/json-rpc",
+        "X-RPC-SIGN": hashlib.md5(('secret' + request).encode('utf-8')).hexdigest()
+    })
+    return client.send(request).data
+
+
+logging.disable(logging.INFO)
+
+server = StubWhisperServer(delay=delay).start()
+remote = RemoteHandler(Env(server.url))
+receivers = ['user-{}'.format(i) for i in range(n_receivers)]
+print('whispers: {}, receivers per whisper: {}, server delay: {}ms'.format(n_whispers, n_receivers, delay * 1000))
+
+methods = [
+    ('client per call', lambda: [new_client_per_call(server.url, 1234, receiver) for receiver in receivers]),
+    ('pooled, serial', lambda: [remote.can_send_whisper_to('1234', receiver) for receiver in receivers]),
+    ('pooled, fan-out', lambda: remote.can_send_whisper_to_users('1234', set(receivers))),
+]
+
+for name, method in methods:
+    connections_before = server.connections
+    before = time.perf_counter()
+    for _ in range(n_whispers):
+        method()
+    elapsed = time.perf_counter() - before
+    print('[{}] done in {:.2f}s, avg per whisper: {:.2f}ms, connections opened: {}'.format(
+        name, elapsed, elapsed / n_whispers * 1000, server.connections - connections_before))
+
+server.stop()
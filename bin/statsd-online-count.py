@@ -9,6 +9,7 @@ from redis import Redis
 STATSD_HOST = '10.20.2.108'
 PREFIX = '%s.' % socket.gethostname()
 GRANULARITY = 2  # seconds
+NODE_TIMEOUT = 60  # seconds without a heartbeat before a node's session count is ignored
 
 
 hosts = yaml.safe_load(open('statsd-online-count.yaml'))
@@ -25,11 +26,15 @@ def online_count():
             count = r_servers[community].scard('users:multicast')
             c.gauge('%s.count' % community, count)
 
-            sessions = r_servers[community].hgetall('session:count')
+            # one entry per node, only counting nodes that have reported recently
+            live_nodes = r_servers[community].zrangebyscore(
+                'session:count:heartbeat', time.time() - NODE_TIMEOUT, '+inf')
             session_count = 0
 
-            for _, value in sessions.items():
-                session_count += int(float(str(value, 'utf-8')))
+            if len(live_nodes) > 0:
+                for value in r_servers[community].hmget('session:count', live_nodes):
+                    if value is not None:
+                        session_count += int(float(str(value, 'utf-8')))
 
             c.gauge('%s.count' % community, count)
             c.gauge('%s.sessions' % community, session_count)
@@ -3,7 +3,6 @@ from flask import request
 
 from dino.config import ApiTargets
 from dino.config import ErrorCodes as ECodes
-from dino.exceptions import NoSuchRoomException
 from dino.hooks import *
 from dino.config import ApiActions
 from dino.utils.decorators import timeit
@@ -518,37 +517,34 @@ def on_list_rooms(data: dict, activity: Activity) -> (int, Union[dict, str]):
     excluded_users = utils.get_excluded_users(user_id)
     room_roles = roles['room']
 
-    filtered_rooms = dict()
-    for room_id, room_details in rooms.items():
-        exclude_room = False
-
-        # don't show rooms if I ignored the owner, or if the owner ignored me; both cases should be in the
-        # same set of "excluded" users; owner lists are cached per room, so don't query db for all at once
-        for owner_id in environ.env.db.get_room_owners(room_id):
-            if utils.should_exclude_user(owner_id, excluded_users):
-                exclude_room = True
-                break
-
-        if exclude_room:
-            continue
-
-        try:
-            acls = utils.get_acls_in_room_for_action(room_id, ApiActions.LIST)
-            is_valid, err_msg = validation.acl.validate_acl_for_action(
-                activity, ApiTargets.ROOM, ApiActions.LIST,
-                acls, target_id=room_id, object_type='room'
-            )
-        except Exception as e:
-            logger.warning('could not check acls for room %s in on_list_rooms: %s' % (room_id, str(e)))
-
-            # likely the room was deleted, so reset cached user roles so this room is not included anymore
-            environ.env.cache.reset_user_roles(user_id)
-            continue
-
-        # if not allowed to join, don't show in list
-        if not is_valid:
-            continue
+    # don't show rooms if I ignored the owner, or if the owner ignored me; both cases should be in the
+    # same set of "excluded" users; owner lists are cached per room, so don't query db for all at once
+    visible_room_ids = [
+        room_id for room_id in rooms.keys()
+        if not any(
+            utils.should_exclude_user(owner_id, excluded_users)
+            for owner_id in environ.env.db.get_room_owners(room_id)
+        )
+    ]
+
+    # all acls of all rooms in one go, for both checking the 'list' action and returning them
+    all_acls = utils.get_all_acls_for_rooms(visible_room_ids)
+    if len(all_acls) < len(visible_room_ids):
+        # likely a room was deleted, so reset cached user roles so it's not included anymore
+        logger.warning('could not find acls for all rooms in on_list_rooms, some were likely deleted')
+        environ.env.cache.reset_user_roles(user_id)
+
+    # if not allowed to list, don't show in list
+    list_acls = {
+        room_id: all_acls[room_id].get(ApiActions.LIST, dict())
+        for room_id in visible_room_ids if room_id in all_acls
+    }
+    allowed_room_ids = validation.acl.filter_targets_for_action(
+        activity, ApiTargets.ROOM, ApiActions.LIST, list_acls, channel_id=channel_id)
 
+    filtered_rooms = dict()
+    for room_id in allowed_room_ids:
+        room_details = rooms[room_id]
         room_details['roles'] = ''
         if room_id in room_roles.keys():
             room_details['roles'] = ','.join(room_roles[room_id])
@@ -560,13 +556,7 @@ def on_list_rooms(data: dict, activity: Activity) -> (int, Union[dict, str]):
     rooms_with_acls = activity_json['object']['attachments']
 
     for room_info in rooms_with_acls:
-        try:
-            acls = utils.get_acls_for_room(room_info['id'])
-        except NoSuchRoomException:
-            # might have been removed recently and cache hasn't updated yet
-            continue
-
-        acl_activity = utils.activity_for_get_acl(activity, acls)
+        acl_activity = utils.activity_for_get_acl(activity, all_acls[room_info['id']])
         room_info['attachments'] = acl_activity['object']['attachments']
 
     activity_json['object']['attachments'] = rooms_with_acls
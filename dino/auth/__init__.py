@@ -37,3 +37,11 @@ class IAuth(Interface):
         :param user_id: the id of the user
         :return: a dict with user info
         """
+
+    def get_user_infos(self, user_ids: list) -> dict:
+        """
+        same as get_user_info() but for many users at once, using a single round trip for the users not cached
+
+        :param user_ids: a list of user ids
+        :return: a dict of {user_id: <dict with user info>}
+        """
@@ -2,15 +2,16 @@ import logging
 import traceback
 from datetime import datetime
 
-import redis
 from typing import Union
 
 from zope.interface import implementer
 
 from dino.auth import IAuth
+from dino.cache.instrumentation import create_redis_client
 from dino.config import ConfigKeys
 from dino.config import RedisKeys
 from dino.config import SessionKeys
+from dino.utils import split_into_chunks
 
 logger = logging.getLogger(__name__)
 
@@ -24,8 +25,9 @@ class AuthRedis(object):
             self.redis_pool = None
             self.redis_instance = FakeStrictRedis(host=host, port=port, db=db)
         else:
-            self.redis_pool = redis.ConnectionPool(host=host, port=port, db=db)
-            self.redis_instance = None
+            auth_config = env.config.get(ConfigKeys.AUTH_SERVICE, default=dict()) or dict()
+            self.redis_instance = create_redis_client(env, 'auth', host, port=port, db=db, conf=auth_config)
+            self.redis_pool = self.redis_instance.connection_pool
 
         if env is None:
             from dino import environ
@@ -35,9 +37,7 @@ class AuthRedis(object):
 
     @property
     def redis(self):
-        if self.redis_pool is None:
-            return self.redis_instance
-        return redis.Redis(connection_pool=self.redis_pool)
+        return self.redis_instance
 
     def get_user_info(self, user_id: str, skip_cache: bool = False) -> dict:
         key = RedisKeys.auth_key(user_id)
@@ -47,7 +47,37 @@ class AuthRedis(object):
             if session is not None and len(session):
                 return session
 
-        binary_stored_session = self.redis.hgetall(key)
+        stored_session = self._to_user_info(self.redis.hgetall(key))
+        self.env.cache.set_user_info(user_id, stored_session)
+        return stored_session
+
+    def get_user_infos(self, user_ids: list, skip_cache: bool = False) -> dict:
+        user_infos = dict()
+        missing = list()
+
+        for user_id in user_ids:
+            session = None
+            if not skip_cache:
+                session = self.env.cache.get_user_info(user_id)
+
+            if session is not None and len(session):
+                user_infos[user_id] = session
+            else:
+                missing.append(user_id)
+
+        for chunk in split_into_chunks(missing, 500):
+            p = self.redis.pipeline()
+            for user_id in chunk:
+                p.hgetall(RedisKeys.auth_key(user_id))
+
+            for user_id, binary_stored_session in zip(chunk, p.execute()):
+                stored_session = self._to_user_info(binary_stored_session)
+                self.env.cache.set_user_info(user_id, stored_session)
+                user_infos[user_id] = stored_session
+
+        return user_infos
+
+    def _to_user_info(self, binary_stored_session: dict) -> dict:
         stored_session = dict()
 
         for key, val in binary_stored_session.items():
@@ -60,7 +90,6 @@ class AuthRedis(object):
                 continue
             stored_session[key] = val
 
-        self.env.cache.set_user_info(user_id, stored_session)
         return stored_session
 
     def update_session_for_key(self, user_id: str, session_key: str, session_value: Union[str, datetime]) -> None:
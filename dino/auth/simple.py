@@ -29,6 +29,9 @@ class AllowAllAuth(object):
     def get_user_info(self, user_id: str) -> dict:
         return dict()
 
+    def get_user_infos(self, user_ids: list) -> dict:
+        return {user_id: dict() for user_id in user_ids}
+
     def authenticate_and_populate_session(self, user_id: str, token: str) -> (bool, Union[None, str], Union[None, dict]):
         return True, None, {'user_id': user_id, 'token': token, 'user_name': 'user_name'}
     
@@ -43,5 +46,8 @@ class DenyAllAuth(object):
     def get_user_info(self, user_id: str) -> dict:
         return dict()
 
+    def get_user_infos(self, user_ids: list) -> dict:
+        return {user_id: dict() for user_id in user_ids}
+
     def authenticate_and_populate_session(self, user_id: str, token: str) -> (bool, Union[None, str], Union[None, dict]):
         return False, 'not allowed', None
@@ -342,6 +342,28 @@ class ICache(Interface):
         :return: nothing
         """
 
+    def login_session(self, user_id: str, user_name: str, sid: str) -> None:
+        """
+        cache the user name and add the sid for this user on login, using a single pipeline
+
+        :param user_id: the id of the user
+        :param user_name: the name of the user, or None to not update it
+        :param sid: the sid of the new session
+        :return: nothing
+        """
+
+    def disconnect_session(
+            self, user_id: str, sid: str, update_last_online: bool = True, remaining_sids: list = None) -> list:
+        """
+        remove the sid for this user and update the last online time on disconnect, using a single pipeline
+
+        :param user_id: the id of the user
+        :param sid: the sid of the session that disconnected
+        :param update_last_online: false if the user is invisible
+        :param remaining_sids: the sids the user still has, if already known by the caller, e.g. from the db
+        :return: the sids the user still has after removing this one
+        """
+
     def set_sids_for_user(self, user_id: str, all_sids: list) -> None:
         """
         cache a list of sids for this user, will overwrite if any previous sid has been cached
@@ -368,6 +390,14 @@ class ICache(Interface):
         :return: a list of sids or None if not cached
         """
 
+    def get_nodes_for_sids(self, sids: list) -> dict:
+        """
+        get the node each sid is connected to, i.e. the name of that node's internal queue, as registered on login
+
+        :param sids: a list of sids
+        :return: a dict of sid to node; sids without a known node are not included
+        """
+
     def get_rooms_for_channel(self, channel_id: str, with_info: bool = True) -> dict:
         """
         get the rooms for this channel with or without info
@@ -393,7 +423,31 @@ class ICache(Interface):
         :return: the room infos
         """
 
-    def set_rooms_for_channel(self, channel_id: str, rooms_infos: dict, with_info: bool = True) -> None:
+    def add_visible_user_to_rooms(self, user_id: str, room_ids_per_channel: Dict[str, list]) -> None:
+        """
+        count this user as visible in the rooms of the room directories (the rooms for a channel with info), e.g. when
+        a visible user joins or an invisible user becomes visible; the count of a room only changes if the user wasn't
+        already counted in it, and channels without a directory are skipped, it will be built with the current numbers
+        when next needed
+
+        :param user_id: the uuid of the user
+        :param room_ids_per_channel: channel uuid to the room uuids, e.g. {'<channel uuid>': ['<room uuid>']}
+        :return: nothing
+        """
+
+    def remove_visible_user_from_rooms(self, user_id: str, room_ids_per_channel: Dict[str, list]) -> None:
+        """
+        stop counting this user as visible in the rooms of the room directories, e.g. when the user leaves or becomes
+        invisible; the count of a room only changes if the user was counted in it
+
+        :param user_id: the uuid of the user
+        :param room_ids_per_channel: channel uuid to the room uuids, e.g. {'<channel uuid>': ['<room uuid>']}
+        :return: nothing
+        """
+
+    def set_rooms_for_channel(
+            self, channel_id: str, rooms_infos: dict, with_info: bool = True, visible_users: dict = None
+    ) -> None:
         """
         set the room info for this channel
 
@@ -409,6 +463,8 @@ class ICache(Interface):
         :param channel_id: uuid of the channel
         :param rooms_infos: the room infos
         :param with_info: if the rooms_infos includes ephemeral and users tag or not
+        :param visible_users: room uuid to the set of visible user ids counted in 'users', used with info to only
+        count later joins, leaves and status changes of users that weren't already counted
         :return: nothing
         """
 
@@ -1005,6 +1061,23 @@ class ICache(Interface):
         :return:
         """
 
+    def get_user_statuses(self, user_ids: list) -> dict:
+        """
+        get the status of multiple users at once, using a single MGET for the keys
+        not already in the in-memory cache
+
+        :param user_ids: a list of user ids
+        :return: a dict of {user_id: status} for the users that have a status cached
+        """
+
+    def set_user_statuses(self, statuses: dict) -> None:
+        """
+        set the status of multiple users at once using a single pipeline
+
+        :param statuses: a dict of {user_id: status}
+        :return: nothing
+        """
+
     def user_check_status(self, user_id, other_status):
         """
 
@@ -1079,8 +1152,16 @@ class ICache(Interface):
 
     def set_session_count(self, session_count: int) -> None:
         """
-        save the number of active sessions connected to this node
+        save the number of active sessions connected to this node, together with a heartbeat for this node; counts
+        of nodes without a recent heartbeat are removed
 
         :param session_count: number of sessions
         :return: nothing
         """
+
+    def get_session_count(self) -> int:
+        """
+        get the total number of sessions connected to all nodes that have reported their count recently
+
+        :return: number of sessions
+        """
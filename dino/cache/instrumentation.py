@@ -0,0 +1,148 @@
+import logging
+import time
+
+import redis
+from eventlet.queue import LifoQueue
+
+from dino.config import ConfigKeys
+
+__author__ = 'Oscar Eriksson <oscar.eriks@gmail.com>'
+
+logger = logging.getLogger(__name__)
+
+# indices of the per command counters in RedisInstrumentation
+COUNT, LATENCY, POOL_WAIT = 0, 1, 2
+
+
+class RedisInstrumentation(object):
+    """
+    counts redis commands, and sums up their latency and the time spent waiting for a pooled
+    connection, per command name; reported periodically to statsd as e.g.
+
+        redis.cache.hgetall.count
+        redis.cache.hgetall.latency  (avg ms since last report)
+        redis.cache.hgetall.pool_wait  (avg ms since last report)
+
+    counters are reset after each report, so sending one packet per command is avoided
+    """
+
+    def __init__(self, env, name: str, report_interval: int = 60):
+        self.env = env
+        self.name = name
+        self.report_interval = report_interval
+        self.counters = dict()
+        self.last_reported = time.time()
+
+    def _counters_for(self, command: str) -> list:
+        counters = self.counters.get(command)
+        if counters is None:
+            counters = [0, 0.0, 0.0]
+            self.counters[command] = counters
+        return counters
+
+    def record_pool_wait(self, command: str, elapsed: float) -> None:
+        self._counters_for(command)[POOL_WAIT] += elapsed
+
+    def record_command(self, command: str, elapsed: float) -> None:
+        counters = self._counters_for(command)
+        counters[COUNT] += 1
+        counters[LATENCY] += elapsed
+
+        now = time.time()
+        if now - self.last_reported > self.report_interval:
+            self.report(now)
+
+    def report(self, now: float = None) -> None:
+        self.last_reported = now or time.time()
+        counters, self.counters = self.counters, dict()
+
+        stats = getattr(self.env, 'stats', None)
+        if stats is None:
+            return
+
+        try:
+            for command, (count, latency, pool_wait) in counters.items():
+                if count == 0:
+                    continue
+                prefix = 'redis.{}.{}'.format(self.name, command.lower().replace(' ', '_'))
+                stats.gauge(prefix + '.count', count)
+                stats.timing(prefix + '.latency', latency / count * 1000)
+                stats.timing(prefix + '.pool_wait', pool_wait / count * 1000)
+        except Exception as e:
+            logger.warning('could not report redis stats for {}: {}'.format(self.name, str(e)))
+
+
+class InstrumentedConnectionPool(redis.BlockingConnectionPool):
+    """
+    blocking pool backed by an eventlet queue, so a green thread waiting for a connection yields
+    to the hub instead of blocking the process, and the pool never grows beyond max_connections
+    """
+
+    def __init__(self, instrumentation: RedisInstrumentation, **kwargs):
+        super(InstrumentedConnectionPool, self).__init__(queue_class=LifoQueue, **kwargs)
+        self.instrumentation = instrumentation
+
+    def get_connection(self, command_name, *keys, **options):
+        before = time.perf_counter()
+        try:
+            return super(InstrumentedConnectionPool, self).get_connection(command_name, *keys, **options)
+        finally:
+            # pipelines check out their connection as 'MULTI', but are counted as 'PIPELINE'
+            if command_name == 'MULTI':
+                command_name = 'PIPELINE'
+            self.instrumentation.record_pool_wait(command_name, time.perf_counter() - before)
+
+
+class InstrumentedPipeline(redis.client.Pipeline):
+    def execute(self, raise_on_error=True):
+        before = time.perf_counter()
+        try:
+            return super(InstrumentedPipeline, self).execute(raise_on_error=raise_on_error)
+        finally:
+            self.connection_pool.instrumentation.record_command('PIPELINE', time.perf_counter() - before)
+
+
+class InstrumentedRedis(redis.Redis):
+    def execute_command(self, *args, **options):
+        before = time.perf_counter()
+        try:
+            return super(InstrumentedRedis, self).execute_command(*args, **options)
+        finally:
+            self.connection_pool.instrumentation.record_command(args[0], time.perf_counter() - before)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return InstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+def create_redis_client(env, name: str, host: str, port: int = 6379, db: int = 0, conf: dict = None):
+    """
+    create one long-lived client for a service (cache, auth, database), to be reused for all
+    commands instead of constructing a new client on every access; pool options are read from
+    the service's block in the config, e.g.:
+
+        cache:
+            max_connections: 50
+            pool_timeout: 20
+            health_check_interval: 30
+            socket_keepalive: True
+    """
+    if conf is None:
+        conf = dict()
+    if port is None:
+        port = 6379
+
+    instrumentation = RedisInstrumentation(
+        env, name, report_interval=int(conf.get(ConfigKeys.STATS_INTERVAL, 60)))
+
+    pool = InstrumentedConnectionPool(
+        instrumentation,
+        host=host,
+        port=int(port),
+        db=int(db or 0),
+        max_connections=int(conf.get(ConfigKeys.MAX_CONNECTIONS, 50)),
+        timeout=int(conf.get(ConfigKeys.POOL_TIMEOUT, 20)),
+        health_check_interval=int(conf.get(ConfigKeys.HEALTH_CHECK_INTERVAL, 30)),
+        socket_keepalive=str(conf.get(ConfigKeys.SOCKET_KEEPALIVE, True)).strip().lower() in {'true', 'yes', '1'}
+    )
+
+    return InstrumentedRedis(connection_pool=pool)
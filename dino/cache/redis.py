@@ -4,6 +4,10 @@ import traceback
 import random
 import sys
 import socket
+import heapq
+import string
+import time
+from collections import OrderedDict
 from typing import Set
 
 import pytz
@@ -18,9 +22,10 @@ from dino.config import ConfigKeys
 from dino.config import UserKeys
 from dino.config import RoleKeys
 from dino.cache import ICache
+from dino.cache.instrumentation import create_redis_client
+from dino.utils.blacklist import BlackListMatcher
 from datetime import datetime
 from datetime import timedelta
-import redis
 
 __author__ = 'Oscar Eriksson <oscar.eriks@gmail.com>'
 
@@ -36,80 +41,195 @@ ONE_HOUR = 60*60
 TEN_SECONDS = 10
 SEVEN_DAYS = 7 * 24 * ONE_HOUR
 LONG_AGO = 789000000  # january 1995
+SESSION_COUNT_TIMEOUT = 60  # nodes report every 10 seconds, a node not reporting for this long is considered gone
+
+# indices of the per key family counters in MemoryCache
+HITS, MISSES, EVICTIONS = 0, 1, 2
+MAX_KEY_FAMILIES = 200
+
+# fields in the room directory hash (rooms for channel with info)
+DIRECTORY_BUILT = '|built'
+DIRECTORY_USERS = '|users'
+
+
+def _is_hex(s: str) -> bool:
+    return all(c in string.hexdigits for c in s)
+
 
 logger = logging.getLogger(__name__)
 
 
 class MemoryCache(object):
-    def __init__(self):
-        self.vals = dict()
+    """
+    size-bounded in-memory cache with lru eviction; expiry times are kept in a heap, so
+    expired keys can be purged by popping from the heap instead of scanning every key
+
+    per key family (e.g. 'user:status' for 'user:status:1234') hit/miss/eviction counters
+    are kept and periodically reported as gauges to statsd, and the ttl for a family can be
+    overridden in the config, e.g. cache.ttl['user:status'] = 60
+    """
+
+    def __init__(self, max_size: int = 500000, ttls: dict = None, stats_interval: int = 60, env=None):
+        self.vals = OrderedDict()
+        self.expiry = list()
+        self.max_size = max_size
+        self.ttls = ttls or dict()
+        self.stats_interval = stats_interval
+        self.env = env
+        self.counters = dict()
+        self.last_reported = time.time()
+
+    def _family(self, key) -> str:
+        family = MemoryCache.key_family(key)
+        if family not in self.counters and len(self.counters) >= MAX_KEY_FAMILIES:
+            return 'other'
+        return family
+
+    @staticmethod
+    def key_family(key) -> str:
+        """
+        the leading non-id segments of a key, at most two, e.g. 'user:status:1234' -> 'user:status',
+        'users:roles-1234' -> 'users:roles' and 'room:<uuid>' -> 'room'
+        """
+        segments = list()
+        for segment in str(key).split(':', 2)[:2]:
+            name = segment.split('-', 1)[0]
+            if len(name) == 0 or not name.isalpha() or (len(name) == 8 and name != segment and _is_hex(name)):
+                break
+            segments.append(name)
+            if name != segment:
+                break
+
+        if len(segments) == 0:
+            return 'other'
+        return ':'.join(segments)
+
+    def _count(self, family: str, index: int) -> None:
+        counters = self.counters.get(family)
+        if counters is None:
+            counters = [0, 0, 0]
+            self.counters[family] = counters
+        counters[index] += 1
 
     def set(self, key, value, ttl=30):
         try:
-            expires_at = (datetime.utcnow() + timedelta(seconds=ttl)).timestamp()
-            self.vals[key] = (expires_at, value)
-        except:
-            pass
+            now = time.time()
+            family = self._family(key)
+            ttl = self.ttls.get(family, ttl)
+            expires_at = now + ttl
+
+            if key in self.vals:
+                self.vals.move_to_end(key)
+            self.vals[key] = (expires_at, value, family)
+            heapq.heappush(self.expiry, (expires_at, key))
+
+            self._purge_expired(now)
+            while len(self.vals) > self.max_size:
+                _, (_, _, evicted_family) = self.vals.popitem(last=False)
+                self._count(evicted_family, EVICTIONS)
+
+            # overwritten, deleted and evicted keys leave stale entries in the heap
+            if len(self.expiry) > 2 * max(len(self.vals), 1024):
+                self._rebuild_expiry()
+
+            if now - self.last_reported > self.stats_interval:
+                self.report_stats(now)
+        except Exception as e:
+            logger.warning('could not set key {} in memory cache: {}'.format(key, str(e)))
 
     def get(self, key):
         try:
-            if key not in self.vals:
+            item = self.vals.get(key)
+            if item is None:
+                self._count(self._family(key), MISSES)
                 return None
-            expires_at, value = self.vals[key]
-            now = datetime.utcnow().timestamp()
-            if now > expires_at:
+
+            expires_at, value, family = item
+            if time.time() > expires_at:
+                self._count(family, MISSES)
                 del self.vals[key]
                 return None
+
+            self.vals.move_to_end(key)
+            self._count(family, HITS)
             return value
-        except:
+        except Exception:
             return None
 
+    def _purge_expired(self, now: float) -> int:
+        n_purged = 0
+        while len(self.expiry) > 0 and self.expiry[0][0] < now:
+            expires_at, key = heapq.heappop(self.expiry)
+
+            # the key might have been set again with a new expiry time since this entry was pushed
+            item = self.vals.get(key)
+            if item is not None and item[0] == expires_at:
+                del self.vals[key]
+                n_purged += 1
+        return n_purged
+
+    def _rebuild_expiry(self) -> None:
+        self.expiry = [(item[0], key) for key, item in self.vals.items()]
+        heapq.heapify(self.expiry)
+
     def cleanup(self):
         """
-        avoid in-memory cache buildup, since keys are only deleted if
-        the expiry time has passed when accessing them
+        purge expired keys and report the counters; expired keys are also purged when new keys are
+        set, so this is only needed to release memory if no keys has been set for a while; only the
+        expired entries are popped from the heap, the keys that are still valid are not scanned
         """
-        # skip cleaning up keys that expire <30 seconds from now, usually
-        # they will be cleaned up normally through being accessed, or else
-        # they'll be cleaned up next time this method is called
-        now = (datetime.utcnow() + timedelta(seconds=31)).timestamp()
-
-        # in case it gets modified while we iterate
-        values = self.vals.copy()
-        n_keys_before = len(values)
-
-        for key, (expires_at, _) in values.items():
-            if now > expires_at:
-                try:
-                    del self.vals[key]
-                except KeyError:
-                    # already deleted since we copied the dict
-                    pass
-
-        n_keys_after = len(self.vals)
-        logger.info(f"cleaned up {n_keys_before}-{n_keys_after}={n_keys_before-n_keys_after} in-memory keys")
+        now = time.time()
+        n_keys_before = len(self.vals)
+        n_purged = self._purge_expired(now)
+        self.report_stats(now)
+        logger.info(f"cleaned up {n_keys_before}-{n_purged}={len(self.vals)} in-memory keys")
+
+    def report_stats(self, now: float = None) -> None:
+        self.last_reported = now or time.time()
+
+        stats = getattr(self.env, 'stats', None)
+        if stats is None:
+            return
+
+        try:
+            stats.gauge('cache.memory.size', len(self.vals))
+            for family, (hits, misses, evictions) in list(self.counters.items()):
+                family = family.replace(':', '_')
+                stats.gauge('cache.memory.{}.hits'.format(family), hits)
+                stats.gauge('cache.memory.{}.misses'.format(family), misses)
+                stats.gauge('cache.memory.{}.evictions'.format(family), evictions)
+        except Exception as e:
+            logger.warning('could not report memory cache stats: {}'.format(str(e)))
 
     def delete(self, key):
         if key in self.vals:
             del self.vals[key]
 
     def flushall(self):
-        self.vals = dict()
+        self.vals = OrderedDict()
+        self.expiry = list()
 
 
 @implementer(ICache)
 class CacheRedis(object):
     def __init__(self, env, host: str, port: int = 6379, db: int = 0):
+        cache_config = env.config.get(ConfigKeys.CACHE_SERVICE, default=dict()) or dict()
+
         if env.config.get(ConfigKeys.TESTING, False) or host == 'mock':
             from fakeredis import FakeStrictRedis
 
             self.redis_pool = None
             self.redis_instance = FakeStrictRedis(host=host, port=port, db=db)
         else:
-            self.redis_pool = redis.ConnectionPool(host=host, port=port, db=db)
-            self.redis_instance = None
-
-        self.cache = MemoryCache()
+            self.redis_instance = create_redis_client(env, 'cache', host, port=port, db=db, conf=cache_config)
+            self.redis_pool = self.redis_instance.connection_pool
+
+        self.cache = MemoryCache(
+            max_size=int(cache_config.get(ConfigKeys.MAX_SIZE, 500000)),
+            ttls=cache_config.get(ConfigKeys.TTL, None),
+            stats_interval=int(cache_config.get(ConfigKeys.STATS_INTERVAL, 60)),
+            env=env
+        )
         self.env = env
         self.status_topic = None
 
@@ -134,9 +254,7 @@ class CacheRedis(object):
 
     @property
     def redis(self):
-        if self.redis_pool is None:
-            return self.redis_instance
-        return redis.Redis(connection_pool=self.redis_pool)
+        return self.redis_instance
 
     def _flushall(self) -> None:
         self.redis.flushdb()
@@ -339,11 +457,13 @@ class CacheRedis(object):
             return value
 
         values = self.redis.smembers(cache_key)
-        if value is not None:
-            decoded = {str(v, 'utf-8') for v in values}
-            self.cache.set(cache_key, decoded, ttl=TEN_MINUTES)
-            return decoded
-        return None
+        if values is None or len(values) == 0:
+            return None
+
+        # the matcher is only built when the list changes, not for every message that is checked
+        decoded = BlackListMatcher({str(v, 'utf-8') for v in values})
+        self.cache.set(cache_key, decoded, ttl=TEN_MINUTES)
+        return decoded
 
     def reset_black_list(self) -> None:
         cache_key = RedisKeys.black_list()
@@ -352,22 +472,26 @@ class CacheRedis(object):
 
     def set_black_list(self, the_list: set) -> None:
         cache_key = RedisKeys.black_list()
-        self.cache.set(cache_key, the_list, ttl=TEN_MINUTES)
+        self.cache.set(cache_key, BlackListMatcher(the_list), ttl=TEN_MINUTES)
         self.redis.delete(cache_key)
         self.redis.sadd(cache_key, *the_list)
 
     def remove_from_black_list(self, word: str) -> None:
         cache_key = RedisKeys.black_list()
         the_cached_list = self.cache.get(cache_key)
-        the_cached_list.remove(word)
-        self.cache.set(cache_key, the_cached_list, ttl=TEN_MINUTES)
+        if the_cached_list is not None:
+            # the matcher is updated in place, no need to rebuild it
+            the_cached_list.discard(word)
+            self.cache.set(cache_key, the_cached_list, ttl=TEN_MINUTES)
         self.redis.srem(cache_key, word)
 
     def add_to_black_list(self, word: str) -> None:
         cache_key = RedisKeys.black_list()
         the_cached_list = self.cache.get(cache_key)
-        the_cached_list.add(word)
-        self.cache.set(cache_key, the_cached_list, ttl=TEN_MINUTES)
+        if the_cached_list is not None:
+            # the matcher is updated in place, no need to rebuild it
+            the_cached_list.add(word)
+            self.cache.set(cache_key, the_cached_list, ttl=TEN_MINUTES)
         self.redis.sadd(cache_key, word)
 
     def _set_memory_cache_and_hset(self, key: str, user_id: str, timestamp: str) -> None:
@@ -542,22 +666,32 @@ class CacheRedis(object):
             'admin': all_rooms[room_id]['admin'],
             'users': len(visible_users)
         }
+
+        read from the room directory of the channel, one hash with a '<room_id>' field for the room info and a
+        '<room_id>|users' field for the number of visible users, which is kept up to date on joins, leaves and status
+        changes instead of rebuilding the directory (see add_visible_user_to_rooms()); not cached in memory, since
+        the counts change
         """
         key = RedisKeys.rooms_for_channel_with_info(channel_id)
 
-        rooms = self.cache.get(key)
-        if rooms is not None:
-            return rooms
-
         raw_rooms = self.redis.hgetall(key)
-        if raw_rooms is None or len(raw_rooms) == 0:
+        if raw_rooms is None or DIRECTORY_BUILT.encode('utf8') not in raw_rooms:
+            # missing, or only has counts incremented after it expired
             return None
 
+        room_infos, room_users = dict(), dict()
+        for field, value in raw_rooms.items():
+            field, value = str(field, 'utf8'), str(value, 'utf8')
+            if field == DIRECTORY_BUILT:
+                continue
+            if field.endswith(DIRECTORY_USERS):
+                room_users[field[:-len(DIRECTORY_USERS)]] = value
+            else:
+                room_infos[field] = value
+
         clean_rooms = dict()
-        for room_id, room_info in raw_rooms.items():
-            room_id = str(room_id, 'utf8')
-            room_info = str(room_info, 'utf8')
-            room_sort, room_ephemeral, room_admin, room_users, room_name = room_info.split('|', maxsplit=4)
+        for room_id, room_info in room_infos.items():
+            room_sort, room_ephemeral, room_admin, room_name = room_info.split('|', maxsplit=3)
 
             if room_sort == '':
                 room_sort = '999'
@@ -573,27 +707,29 @@ class CacheRedis(object):
             else:
                 room_ephemeral = False
 
-            if room_users == '':
-                room_users = '0'
-            room_users = int(room_users)
+            room_users_value = room_users.get(room_id, '')
+            if room_users_value == '':
+                room_users_value = '0'
 
             clean_rooms[room_id] = {
                 'name': room_name,
                 'sort_order': room_sort,
                 'ephemeral': room_ephemeral,
                 'admin': room_admin,
-                'users': room_users
+                'users': max(0, int(room_users_value))
             }
 
         return clean_rooms
 
-    def set_rooms_for_channel(self, channel_id: str, rooms_infos: dict, with_info: bool = True) -> None:
+    def set_rooms_for_channel(
+            self, channel_id: str, rooms_infos: dict, with_info: bool = True, visible_users: dict = None
+    ) -> None:
         if with_info:
-            self._set_rooms_for_channel_with_info(channel_id, rooms_infos)
+            self._set_rooms_for_channel_with_info(channel_id, rooms_infos, visible_users)
         else:
             self._set_rooms_for_channel_without_info(channel_id, rooms_infos)
 
-    def _set_rooms_for_channel_with_info(self, channel_id: str, rooms_infos: dict) -> None:
+    def _set_rooms_for_channel_with_info(self, channel_id: str, rooms_infos: dict, visible_users: dict = None) -> None:
         """
         rooms_with_n_users[room_id] = {
             'name': all_rooms[room_id]['name'],
@@ -603,25 +739,92 @@ class CacheRedis(object):
             'users': len(visible_users)
         }
 
-        room_sort, room_ephemeral, room_admin, room_users, room_name = room_info.split('|', maxsplit=4)
+        room_sort, room_ephemeral, room_admin, room_name = room_info.split('|', maxsplit=3)
+
+        the visible users counted for each room (visible_users, room uuid to user ids) are written to a set next to
+        the directory, and only users added to or removed from that set change the counts; the directory expires after
+        ten minutes, so counts that drifted (e.g. a join counted while it was being built) are corrected by the next
+        build
         """
         key = RedisKeys.rooms_for_channel_with_info(channel_id)
-        self.cache.set(key, rooms_infos, ttl=TEN_SECONDS)
+        if visible_users is None:
+            visible_users = dict()
 
-        redis_rooms = dict()
+        redis_rooms = {DIRECTORY_BUILT: '1'}
         for room_id, room_info in rooms_infos.items():
-            r_value = '{}|{}|{}|{}|{}'.format(
+            redis_rooms[room_id] = '{}|{}|{}|{}'.format(
                 str(room_info['sort_order']),
                 str(room_info.get('ephemeral', True)).lower(),
                 str(room_info.get('admin', False)).lower(),
-                str(room_info.get('users', 0)),
                 room_info['name']
             )
-            redis_rooms[room_id] = r_value
+            redis_rooms[room_id + DIRECTORY_USERS] = str(room_info.get('users', 0))
+
+        with self.redis.pipeline(transaction=True) as p:
+            p.delete(key)
+            p.hmset(key, redis_rooms)
+            p.expire(key, TEN_MINUTES)
+
+            for room_id in rooms_infos.keys():
+                users_key = RedisKeys.visible_users_in_directory(room_id)
+                p.delete(users_key)
+                if len(visible_users.get(room_id, set())) > 0:
+                    p.sadd(users_key, *visible_users[room_id])
+                    p.expire(users_key, TEN_MINUTES)
+            p.execute()
 
-        if len(redis_rooms) > 0:
-            self.redis.hmset(key, redis_rooms)
-            self.redis.expire(key, ONE_MINUTE)
+    def add_visible_user_to_rooms(self, user_id: str, room_ids_per_channel: Dict[str, list]) -> None:
+        self._change_visible_user_in_rooms(user_id, room_ids_per_channel, is_visible=True)
+
+    def remove_visible_user_from_rooms(self, user_id: str, room_ids_per_channel: Dict[str, list]) -> None:
+        self._change_visible_user_in_rooms(user_id, room_ids_per_channel, is_visible=False)
+
+    def _change_visible_user_in_rooms(self, user_id: str, room_ids_per_channel: Dict[str, list], is_visible: bool):
+        """
+        add or remove the user from the sets of visible users of the rooms, and only change the count of a room if
+        the user was actually added or removed, so joins and leaves from several sessions, or a user already counted
+        when the directory was built, are counted once; channels without a directory are skipped, since the next
+        build counts the visible users in the database
+        """
+        channel_ids = [channel_id for channel_id, room_ids in room_ids_per_channel.items() if len(room_ids) > 0]
+        if len(channel_ids) == 0:
+            return
+
+        with self.redis.pipeline() as p:
+            for channel_id in channel_ids:
+                key = RedisKeys.rooms_for_channel_with_info(channel_id)
+                p.hexists(key, DIRECTORY_BUILT)
+                p.ttl(key)
+            directories = p.execute()
+
+        changed_rooms = list()
+        with self.redis.pipeline() as p:
+            for i, channel_id in enumerate(channel_ids):
+                has_directory, ttl = directories[2*i], directories[2*i+1]
+                if not has_directory or ttl <= 0:
+                    continue
+
+                for room_id in room_ids_per_channel[channel_id]:
+                    users_key = RedisKeys.visible_users_in_directory(room_id)
+                    if is_visible:
+                        p.sadd(users_key, user_id)
+                        p.expire(users_key, ttl)
+                    else:
+                        p.srem(users_key, user_id)
+                    changed_rooms.append((channel_id, room_id))
+
+            changes = p.execute()
+
+        if is_visible:
+            # every sadd is followed by an expire in the pipeline
+            changes = changes[::2]
+
+        delta = 1 if is_visible else -1
+        with self.redis.pipeline() as p:
+            for (channel_id, room_id), changed in zip(changed_rooms, changes):
+                if changed > 0:
+                    p.hincrby(RedisKeys.rooms_for_channel_with_info(channel_id), room_id + DIRECTORY_USERS, delta)
+            p.execute()
 
     def _set_rooms_for_channel_without_info(self, channel_id: str, rooms_infos: dict) -> None:
         """
@@ -693,6 +896,7 @@ class CacheRedis(object):
         def _try_to_remove_sid(sid_to_remove):
             sid_key = RedisKeys.user_id_for_sid()
             self.redis.hdel(sid_key, sid_to_remove)
+            self.redis.hdel(RedisKeys.node_for_sid(), sid_to_remove)
 
             if user_id is None:
                 return
@@ -741,12 +945,63 @@ class CacheRedis(object):
 
         key = RedisKeys.sid_for_user_id()
         sid_key = RedisKeys.user_id_for_sid()
-        for sid in all_sids:
-            self.redis.hset(sid_key, sid, user_id)
+        for user_sid in all_sids:
+            self.redis.hset(sid_key, user_sid, user_id)
 
         all_sids = ','.join(list(set(all_sids)))
         self.redis.hset(key, user_id, all_sids)
 
+        # only the new sid is known to be on this node
+        node_queue = self._node_queue()
+        if node_queue is not None:
+            self.redis.hset(RedisKeys.node_for_sid(), sid, node_queue)
+
+    def login_session(self, user_id: str, user_name: str, sid: str) -> None:
+        all_sids = set(self.get_sids_for_user(user_id) or list())
+        all_sids.add(sid)
+
+        p = self.redis.pipeline()
+        if user_name is not None:
+            key = RedisKeys.user_names()
+            p.hset(key, user_id, user_name)
+            self.cache.set('%s-%s' % (key, user_id), user_name)
+
+        sid_key = RedisKeys.user_id_for_sid()
+        for user_sid in all_sids:
+            p.hset(sid_key, user_sid, user_id)
+        p.hset(RedisKeys.sid_for_user_id(), user_id, ','.join(all_sids))
+
+        node_queue = self._node_queue()
+        if node_queue is not None:
+            p.hset(RedisKeys.node_for_sid(), sid, node_queue)
+        p.execute()
+
+    def disconnect_session(
+            self, user_id: str, sid: str, update_last_online: bool = True, remaining_sids: list = None) -> list:
+        if remaining_sids is None:
+            remaining_sids = self.get_sids_for_user(user_id) or list()
+        remaining_sids = {user_sid for user_sid in remaining_sids if user_sid != sid}
+
+        p = self.redis.pipeline()
+        p.hdel(RedisKeys.user_id_for_sid(), sid)
+        p.hdel(RedisKeys.node_for_sid(), sid)
+
+        key = RedisKeys.sid_for_user_id()
+        if len(remaining_sids) > 0:
+            p.hset(key, user_id, ','.join(remaining_sids))
+        else:
+            p.hdel(key, user_id)
+
+        if update_last_online:
+            self._set_last_online_in_pipeline(p, user_id)
+
+        p.execute()
+
+        if update_last_online:
+            self._publish_last_online(user_id)
+
+        return list(remaining_sids)
+
     def get_user_for_sid(self, sid: str):
         sid_key = RedisKeys.user_id_for_sid()
         user_id = self.redis.hget(sid_key, sid)
@@ -763,6 +1018,21 @@ class CacheRedis(object):
         all_sids = list(set(str(all_sids, 'utf-8').split(',')))
         return all_sids.copy()
 
+    def _node_queue(self):
+        # name of this node's internal queue, set when the queue is set up; None on nodes without one (e.g. testing)
+        return getattr(self.env, 'node_queue', None)
+
+    def get_nodes_for_sids(self, sids: list) -> dict:
+        if len(sids) == 0:
+            return dict()
+
+        nodes = self.redis.hmget(RedisKeys.node_for_sid(), sids)
+        return {
+            sid: str(node, 'utf-8')
+            for sid, node in zip(sids, nodes)
+            if node is not None
+        }
+
     def get_users_in_room_by_name(self, room_name: str, is_super_user: bool) -> dict:
         if is_super_user:
             key = RedisKeys.users_in_room_incl_invisible_by_name(room_name)
@@ -892,37 +1162,46 @@ class CacheRedis(object):
         return self.cache.get(key)
 
     def get_can_whisper_to_user(self, sender_id: str, target_user_name: str):
-        key = RedisKeys.can_whisper_to(sender_id)
-        cache_key = '%s-%s' % (key, target_user_name)
+        key = RedisKeys.can_whisper_to(sender_id, target_user_name)
 
-        can_whisper_and_reason = self.cache.get(cache_key)
+        can_whisper_and_reason = self.cache.get(key)
         if can_whisper_and_reason is not None:
             can_whisper, reason_code = can_whisper_and_reason
             return can_whisper, reason_code
 
-        can_whisper = self.redis.hget(key, target_user_name)
-        if can_whisper is None:
+        with self.redis.pipeline() as p:
+            p.get(key)
+            p.ttl(key)
+            can_whisper, ttl = p.execute()
+
+        if can_whisper is None or ttl is None or ttl <= 0:
             return None, None
 
         can_whisper, reason_code = str(can_whisper, 'utf-8').split('|')
-        return can_whisper == '1', reason_code
+        can_whisper, reason_code = can_whisper == '1', int(reason_code)
+
+        # not for longer than in redis, so it's checked again ten minutes after it was validated
+        self.cache.set(key, (can_whisper, reason_code), ttl=ttl)
+        return can_whisper, reason_code
 
     def set_can_whisper_to_user(self, sender_id: str, target_user_name: str, allowed: bool, reason_code: int) -> None:
-        # if not allowed, we need to check remote system, maybe they will soon be allowed
+        key = RedisKeys.can_whisper_to(sender_id, target_user_name)
+
+        # if not allowed, we need to check remote system again soon, maybe they will be allowed by then, so only
+        # remember it on this node for a short while, to not call the remote system for every whisper meanwhile
         if not allowed:
+            self.cache.set(key, (allowed, reason_code), ttl=THIRTY_SECONDS)
             return
 
-        key = RedisKeys.can_whisper_to(sender_id)
-        cache_key = '%s-%s' % (key, target_user_name)
-
         can_whisper_and_reason = '|'.join([
             '1' if allowed else '0',
             str(reason_code)
         ])
 
-        self.cache.set(cache_key, (allowed, reason_code), ttl=TEN_MINUTES)
-        self.redis.hset(key, target_user_name, can_whisper_and_reason)
-        self.redis.expire(key, EIGHT_HOURS_IN_SECONDS)
+        # one key per sender and receiver, so each result expires ten minutes after it was validated, even if the
+        # sender keeps whispering to others
+        self.cache.set(key, (allowed, reason_code), ttl=TEN_MINUTES)
+        self.redis.setex(key, TEN_MINUTES, can_whisper_and_reason)
 
     def get_channels_with_sort(self):
         key = RedisKeys.channels_with_sort()
@@ -1234,6 +1513,41 @@ class CacheRedis(object):
         self.cache.set(key, status, ttl=TEN_SECONDS)
         return status
 
+    def get_user_statuses(self, user_ids: list) -> dict:
+        statuses = dict()
+        missing = list()
+
+        for user_id in user_ids:
+            status = self.cache.get(RedisKeys.user_status(user_id))
+            if status is not None:
+                statuses[user_id] = status
+            else:
+                missing.append(user_id)
+
+        for chunk in split_into_chunks(missing, 500):
+            values = self.redis.mget([RedisKeys.user_status(user_id) for user_id in chunk])
+
+            for user_id, status in zip(chunk, values):
+                if status is None or status == b'':
+                    continue
+
+                status = str(status, 'utf-8')
+                self.cache.set(RedisKeys.user_status(user_id), status, ttl=TEN_SECONDS)
+                statuses[user_id] = status
+
+        return statuses
+
+    def set_user_statuses(self, statuses: dict) -> None:
+        for chunk in split_into_chunks(list(statuses.items()), 500):
+            p = self.redis.pipeline()
+
+            for user_id, status in chunk:
+                key = RedisKeys.user_status(user_id)
+                self.cache.set(key, status, ttl=THIRTY_SECONDS)
+                p.set(key, status)
+
+            p.execute()
+
     def get_room_owners(self, room_id: str) -> Optional[Set]:
         key = RedisKeys.room_owners(room_id)
 
@@ -1447,6 +1761,12 @@ class CacheRedis(object):
             logger.exception(traceback.format_exc())
 
     def _set_last_online(self, user_id: str):
+        p = self.redis.pipeline()
+        self._set_last_online_in_pipeline(p, user_id)
+        p.execute()
+        self._publish_last_online(user_id)
+
+    def _set_last_online_in_pipeline(self, p, user_id: str) -> None:
         u = datetime.utcnow()
         u = u.replace(tzinfo=pytz.utc)
         unix_time = str(int(u.timestamp()))
@@ -1456,11 +1776,10 @@ class CacheRedis(object):
         last_online_key = RedisKeys.user_last_online(user_id)
         self.cache.set(last_online_key, unix_time, ttl=ONE_HOUR)
 
-        p = self.redis.pipeline()
         p.set(last_online_key, unix_time)
         p.expire(last_online_key, SEVEN_DAYS)
-        p.execute()
 
+    def _publish_last_online(self, user_id: str) -> None:
         if self.status_topic is not None:
             self.env.publish(
                 activity_for_status_change(user_id, "lastonline"),
@@ -1501,7 +1820,29 @@ class CacheRedis(object):
 
     def set_session_count(self, session_count: int) -> None:
         node_key = '{}-{}'.format(self.listen_host, self.listen_port)
-        self.redis.hset(RedisKeys.session_count(), node_key, session_count)
+        now = time.time()
+
+        # the heartbeat lets readers skip nodes that stopped reporting, and lets the count of those nodes be removed
+        p = self.redis.pipeline()
+        p.hset(RedisKeys.session_count(), node_key, session_count)
+        p.zadd(RedisKeys.session_count_heartbeat(), {node_key: now})
+        p.zrangebyscore(RedisKeys.session_count_heartbeat(), '-inf', now - SESSION_COUNT_TIMEOUT)
+        stale_nodes = p.execute()[-1]
+
+        if len(stale_nodes) > 0:
+            p = self.redis.pipeline()
+            p.hdel(RedisKeys.session_count(), *stale_nodes)
+            p.zrem(RedisKeys.session_count_heartbeat(), *stale_nodes)
+            p.execute()
+
+    def get_session_count(self) -> int:
+        live_nodes = self.redis.zrangebyscore(
+            RedisKeys.session_count_heartbeat(), time.time() - SESSION_COUNT_TIMEOUT, '+inf')
+        if len(live_nodes) == 0:
+            return 0
+
+        counts = self.redis.hmget(RedisKeys.session_count(), live_nodes)
+        return sum(int(float(str(count, 'utf-8'))) for count in counts if count is not None)
 
     def trim_user_changed_at(self):
         # just trim sometimes, O(log(n)+m) to remove
@@ -148,6 +148,7 @@ class ErrorCodes(object):
     NOT_ALLOWED_TO_WHISPER_SELF = 723
     NOT_ALLOWED_TO_WHISPER_GENERIC_ERROR = 724
     REMOTE_ERROR = 725
+    TRY_AGAIN_LATER = 726
 
     NO_SUCH_USER = 800
     NO_SUCH_CHANNEL = 801
@@ -270,6 +271,31 @@ class ConfigKeys(object):
     TITLE = 'title'
     VERB = 'verb'
     SPAM_CLASSIFIER = 'spam_classifier'
+    SPAM = 'spam'
+    BATCH_SIZE = 'batch_size'
+    BATCH_BYTES = 'batch_bytes'
+    LINGER_MS = 'linger_ms'
+    COMPRESSION = 'compression'
+    FLUSH_INTERVAL = 'flush_interval'
+    PROCESSES = 'processes'
+    MAX_SIZE = 'max_size'
+    TTL = 'ttl'
+    STATS_INTERVAL = 'stats_interval'
+    MAX_CONNECTIONS = 'max_connections'
+    POOL_TIMEOUT = 'pool_timeout'
+    HEALTH_CHECK_INTERVAL = 'health_check_interval'
+    SOCKET_KEEPALIVE = 'socket_keepalive'
+    ADMISSION = 'admission'
+    RATE = 'rate'
+    BURST = 'burst'
+    MAX_WAIT = 'max_wait'
+    WRITE_BEHIND = 'write_behind'
+    JOURNAL = 'journal'
+    JOURNAL_FLUSH_INTERVAL = 'journal_flush_interval'
+    BAN_INDEX = 'ban_index'
+    DEDUP = 'dedup'
+    BLOOM_CAPACITY = 'bloom_capacity'
+    PURGE_INTERVAL = 'purge_interval'
     HEARTBEAT = 'heartbeat'
     TIMEOUT = 'timeout'
     INTERVAL = 'interval'
@@ -323,8 +349,9 @@ class RedisKeys(object):
     RKEY_ACLS_IN_ROOM = 'room:acls:%s'  # room:acls:room_id
     RKEY_ACLS_IN_ROOM_FOR_ACTION = 'room:acls:%s:%s'  # room:acls:room_id:action_name
     RKEY_ACLS_IN_CHANNEL_FOR_ACTION = 'channel:acls:%s:%s'  # room:acls:channel_id:action_name
-    RKEY_ROOMS_FOR_CHANNEL_WITH_INFO = 'channel:rooms:info:%s'  # channel:rooms:info:channel_id
+    RKEY_ROOMS_FOR_CHANNEL_WITH_INFO = 'channel:rooms:directory:%s'  # channel:rooms:directory:channel_id
     RKEY_ROOMS_FOR_CHANNEL_WITHOUT_INFO = 'channel:rooms:noinfo:%s'  # channel:rooms:noinfo:channel_id
+    RKEY_VISIBLE_USERS_IN_DIRECTORY = 'channel:rooms:visible:%s'  # channel:rooms:visible:room_id
     RKEY_TYPE_OF_ROOMS_IN_CHANNEL = 'channel:roomtype:%s'  # channel:roomtype:channel_id
     RKEY_ROOMS_FOR_USER = 'user:rooms:%s'  # user:rooms:user_id
     RKEY_USERS_IN_ROOM = 'room:%s'  # room:room_id
@@ -368,6 +395,7 @@ class RedisKeys(object):
 
     RKEY_SID_TO_USER_ID = 'user:sid:map'
     RKEY_USER_ID_TO_SID = 'sid:user:map'
+    RKEY_NODE_FOR_SID = 'sid:node:map'
     RKEY_BANNED_USERS_GLOBAL = 'users:banned:global'
     RKEY_BANNED_USERS_ROOM = 'users:banned:room:%s'  # users:banned:room:room_id
     RKEY_MUTED_USERS_ROOM = 'users:muted:room:%s'  # users:muted:room:room_id
@@ -376,9 +404,10 @@ class RedisKeys(object):
     RKEY_HEARTBEAT = 'heartbeat:{}'
     RKEY_AVATARS = 'user:avatars'
     RKEY_SESSION_COUNT = 'session:count'
+    RKEY_SESSION_COUNT_HEARTBEAT = 'session:count:heartbeat'
     RKEY_USER_NAMES_SET = 'user:names:set'
 
-    RKEY_CAN_WHISPER = 'whisper:{}'  # whisper:user_id
+    RKEY_CAN_WHISPER = 'whisper:{}:{}'  # whisper:user_id:target_user_name
     RKEY_ROOMS_WITH_ACL_ACTION = 'rooms:acl:{}'  # rooms:acl:<acl_action> => "room_id_1,room_id_2,..."
     RKEY_ACLS_FOR_ROOMS_HAVING_ACTION = 'rooms:acl:{}:{}'  # rooms:acl:<room_id>:<acl_action> => {acl_type: acl_value}
     RKEY_JOIN_COUNTS = 'rooms:joins:{}'  # rooms:joins:room_id
@@ -415,13 +444,17 @@ class RedisKeys(object):
         return RedisKeys.RKEY_USER_NAMES_SET
 
     @staticmethod
-    def can_whisper_to(user_id: str) -> str:
-        return RedisKeys.RKEY_CAN_WHISPER.format(user_id)
+    def can_whisper_to(user_id: str, target_user_name: str) -> str:
+        return RedisKeys.RKEY_CAN_WHISPER.format(user_id, target_user_name)
 
     @staticmethod
     def session_count() -> str:
         return RedisKeys.RKEY_SESSION_COUNT
 
+    @staticmethod
+    def session_count_heartbeat() -> str:
+        return RedisKeys.RKEY_SESSION_COUNT_HEARTBEAT
+
     @staticmethod
     def avatars() -> str:
         return RedisKeys.RKEY_AVATARS
@@ -502,6 +535,10 @@ class RedisKeys(object):
     def rooms_for_channel_without_info(channel_id: str) -> str:
         return RedisKeys.RKEY_ROOMS_FOR_CHANNEL_WITHOUT_INFO % channel_id
 
+    @staticmethod
+    def visible_users_in_directory(room_id: str) -> str:
+        return RedisKeys.RKEY_VISIBLE_USERS_IN_DIRECTORY % room_id
+
     @staticmethod
     def default_rooms() -> str:
         return RedisKeys.RKEY_DEFAULT_ROOMS
@@ -542,6 +579,10 @@ class RedisKeys(object):
     def user_id_for_sid() -> str:
         return RedisKeys.RKEY_USER_ID_TO_SID
 
+    @staticmethod
+    def node_for_sid() -> str:
+        return RedisKeys.RKEY_NODE_FOR_SID
+
     @staticmethod
     def banned_users(room_id: str=None) -> str:
         if room_id is None:
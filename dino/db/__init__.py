@@ -525,6 +525,53 @@ class IDatabase(Interface):
         :return: a list of strings, roles for that room
         """
 
+    def get_user_roles_for_target(self, user_id: str, channel_id: str, room_id: str = None) -> dict:
+        """
+        the global roles of a user and the roles in one channel and (optionally) one room, in one lookup, e.g.:
+
+            {
+                "global": ["superuser"],
+                "channel": ["admin"],
+                "room": ["owner"]
+            }
+
+        :param user_id: the id of the user
+        :param channel_id: the uuid of the channel
+        :param room_id: the uuid of the room, or None to skip room roles
+        :return: a dict of lists of roles
+        """
+
+    def get_user_roles_for_targets(self, user_id: str, channel_ids: set, room_ids: set) -> dict:
+        """
+        same as get_user_roles_for_target() but for many channels and rooms at once, whether the user has joined them
+        or not, e.g.:
+
+            {
+                "global": ["superuser"],
+                "channel": {"<channel uuid>": ["admin"]},
+                "room": {"<room uuid>": ["owner"]}
+            }
+
+        :param user_id: the id of the user
+        :param channel_ids: the uuids of the channels
+        :param room_ids: the uuids of the rooms
+        :return: a dict with a list of global roles and dicts of lists of roles per channel and room
+        """
+
+    def get_users_roles_in_room(self, user_ids: list, room_id: str) -> dict:
+        """
+        same as get_user_roles_in_room() but for many users at once, e.g.:
+
+            {
+                "1234": ["owner", "admin"],
+                "5678": []
+            }
+
+        :param user_ids: a list of user ids
+        :param room_id: the uuid of the room
+        :return: a dict of {user_id: [roles]}
+        """
+
     def get_reason_for_ban_global(self, user_id: str) -> str:
         """
         get the reason for a global ban, or empty string if no reason found
@@ -767,6 +814,21 @@ class IDatabase(Interface):
         mute a user in a room for a period of time
         """
 
+    def get_ban_and_mute_timestamps(self) -> list:
+        """
+        get all bans and mutes that haven't ended yet
+
+        :return: a list of (scope, target_id, user_id, timestamp) tuples, where scope is one of 'global', 'channel',
+        'room' or 'mute', target_id is the channel or room uuid ('' for global bans) and timestamp is when it ends
+        """
+
+    def remove_expired_bans_and_mutes(self) -> None:
+        """
+        remove all bans and mutes that have ended, in one go
+
+        :return: nothing
+        """
+
     def get_mutes_for_user(self, user_id: str) -> dict:
         """
         get all room mutes for this user, mostly used for the rest api
@@ -1087,6 +1149,30 @@ class IDatabase(Interface):
         :return: nothing
         """
 
+    def login_session(self, user_id: str, user_name: str, sid: str, user_info: dict) -> None:
+        """
+        the session bookkeeping done on login as one unit of work: set the user info, create or
+        update the user name and add the sid for this user
+
+        :param user_id: the id of the user
+        :param user_name: the name of the user, or None to not create or update the user
+        :param sid: a session id from flask
+        :param user_info: the user info from the session, see set_user_info()
+        :return: nothing
+        """
+
+    def disconnect_session(self, user_id: str, sid: str, update_last_online: bool = True) -> list:
+        """
+        the session bookkeeping done on disconnect as one unit of work: remove the sid for this user
+        (including from any rooms), update the last online time, and remove all sids for the user if
+        this was the last one
+
+        :param user_id: the id of the user
+        :param sid: the session id that disconnected
+        :param update_last_online: false if the user is invisible
+        :return: the sids the user still has after removing this one
+        """
+
     def reset_sids_for_user(self, user_id: str) -> None:
         """
         remove all sids (session id) generated by flask for this user
@@ -1381,6 +1467,17 @@ class IDatabase(Interface):
         :return:
         """
 
+    def apply_membership_changes(self, joins: dict, leaves: set, room_sids: set) -> None:
+        """
+        apply a batch of journaled joins and leaves; applying the same batch more than once has no further effect,
+        and joins whose sessions in 'room_sids' have all disconnected since may be skipped
+
+        :param joins: a dict of {(user_id, room_id): user_name} for users that joined
+        :param leaves: a set of (user_id, room_id) tuples for users that left
+        :param room_sids: a set of (user_id, room_id, sid) tuples of sessions used when joining
+        :return: nothing
+        """
+
     def update_last_read_for(self, users: set, room_id: str, time_stamp: int) -> None:
         """
         update the last read timestamp of a room for a set of users
@@ -1438,6 +1535,35 @@ class IDatabase(Interface):
         :return: a dict with acls separated by action
         """
 
+    def get_all_acls_channels(self, channel_ids: list) -> Dict[str, dict]:
+        """
+        get all acls for many channels at once, in one query instead of one per channel
+
+        example response:
+
+        {
+            '<channel uuid>': {
+                'list': {
+                    'gender': 'm,f'
+                }
+            },
+            '<other channel uuid>': {}
+        }
+
+        :param channel_ids: the uuids of the channels
+        :return: a dict of channel uuid to acls separated by action (like get_all_acls_channel()); channels that
+        doesn't exist are not included
+        """
+
+    def get_all_acls_rooms(self, room_ids: list) -> Dict[str, dict]:
+        """
+        get all acls for many rooms at once, in one query instead of one per room
+
+        :param room_ids: the uuids of the rooms
+        :return: a dict of room uuid to acls separated by action (like get_all_acls_room()); rooms that doesn't exist
+        are not included
+        """
+
     def get_acls_in_room_for_action(self, room_id: str, action: str) -> dict:
         """
         get acls in a room with a certain action (join/kick/message etc.)
@@ -1520,6 +1646,16 @@ class IDatabase(Interface):
         :return: the status
         """
 
+    def get_user_statuses(self, user_ids: list, skip_cache: bool = False) -> dict:
+        """
+        get the status of multiple users at once (online/offline/invisible); users without
+        a known status will be reported as unavailable
+
+        :param user_ids: a list of user ids
+        :param skip_cache: bypass the cache or not
+        :return: a dict of {user_id: status}
+        """
+
     def set_user_offline(self, user_id: str) -> None:
         """
         indicate a user is offline
@@ -16,7 +16,9 @@ from dino.environ import GNEnvironment
 from dateutil import parser
 from dateutil.tz import tzutc
 
+import base64
 import datetime
+import json
 import logging
 
 __author__ = 'Oscar Eriksson <oscar.eriks@gmail.com>'
@@ -42,14 +44,83 @@ class StorageManager(BaseManager):
         from_time, to_time = self.format_time_range(from_time, to_time)
 
         if from_time is not None and to_time is not None:
-            from_time_int = int(from_time.strftime('%s'))
-            to_time_int = int(to_time.strftime('%s'))
-            return self.env.storage.get_undeleted_messages_for_user_and_time(
-                user_id, from_time_int, to_time_int)
+            return list(self.iter_messages_from_user(user_id, from_time, to_time))
 
         msg_ids = self.env.storage.get_undeleted_message_ids_for_user(user_id)
         return self.env.storage.get_messages(msg_ids)
 
+    def iter_messages_from_user(self, user_id: str, from_time: datetime.datetime, to_time: datetime.datetime):
+        """
+        stream all non-deleted room messages from a user in a time range
+        """
+        from_time_int = int(from_time.strftime('%s'))
+        to_time_int = int(to_time.strftime('%s'))
+
+        for message in self.env.storage.iter_history_for_user(user_id, from_time_int, to_time_int, include_deleted=False):
+            if message['domain'] != 'room':
+                continue
+            yield message
+
+    def export_messages_from_user(self, user_id: str, from_time: str = None, to_time: str = None, cursor: str = None):
+        """
+        stream all non-deleted room messages from a user in a time range, one storage page at a time, together with
+        a cursor for each message; passing that cursor back in (with the same user and time range) continues right
+        after that message
+
+        :return: a generator of (message, cursor) tuples
+        """
+        # validated before returning the generator, so an invalid request fails before anything is streamed
+        from_time, to_time = self.format_time_range(from_time, to_time)
+        from_time_int = int(from_time.strftime('%s'))
+        to_time_int = int(to_time.strftime('%s'))
+
+        paging_state, last_message_id = None, None
+        if not is_blank(cursor):
+            paging_state, last_message_id = StorageManager.decode_cursor(cursor)
+
+        messages = self.env.storage.iter_history_pages_for_user(
+            user_id, from_time_int, to_time_int, paging_state=paging_state)
+
+        return StorageManager._export_messages(messages, paging_state, last_message_id)
+
+    @staticmethod
+    def _export_messages(messages, paging_state, last_message_id):
+        # the cursor's page is fetched again, so skip up to and including the last message that was already exported
+        skipping = last_message_id is not None
+
+        for message, page_paging_state in messages:
+            if skipping:
+                if page_paging_state == paging_state:
+                    if message['message_id'] == last_message_id:
+                        skipping = False
+                    continue
+                skipping = False
+
+            if message['deleted'] or message['domain'] != 'room':
+                continue
+
+            yield message, StorageManager.encode_cursor(page_paging_state, message)
+
+    @staticmethod
+    def encode_cursor(paging_state, message: dict) -> str:
+        cursor = {
+            'page': None if paging_state is None else base64.b64encode(paging_state).decode('ascii'),
+            'message_id': message['message_id'],
+            'timestamp': message['timestamp']
+        }
+        return base64.urlsafe_b64encode(json.dumps(cursor).encode('utf-8')).decode('ascii')
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> (bytes, str):
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+            paging_state = cursor['page']
+            if paging_state is not None:
+                paging_state = base64.b64decode(paging_state)
+            return paging_state, cursor['message_id']
+        except Exception as e:
+            raise RuntimeError('invalid cursor "{}": {}'.format(cursor, str(e)))
+
     def undelete_message(self, message_id: str) -> None:
         self.env.storage.undelete_message(message_id)
         self.env.db.mark_spam_not_deleted_if_exists(message_id)
@@ -81,6 +152,13 @@ class StorageManager(BaseManager):
         )
 
     def find_history(self, room_id, user_id, from_time, to_time) -> (list, datetime, datetime):
+        history, from_time, to_time = self.iter_history(room_id, user_id, from_time, to_time)
+        return list(history), from_time, to_time
+
+    def iter_history(self, room_id, user_id, from_time, to_time):
+        """
+        same as find_history() but returns an iterable of messages, a generator when only a user id is given
+        """
         if is_blank(user_id) and is_blank(room_id):
             raise RuntimeError('need user ID and/or room ID')
 
@@ -91,8 +169,11 @@ class StorageManager(BaseManager):
         from_time = from_time.strftime(ConfigKeys.DEFAULT_DATE_FORMAT)
         to_time = to_time.strftime(ConfigKeys.DEFAULT_DATE_FORMAT)
 
-        history = self.env.storage.get_history_for_time_slice(
-            room_id, user_id, from_time_int, to_time_int)
+        if is_blank(room_id):
+            # streamed page by page from storage instead of loaded all at once
+            history = self.env.storage.iter_history_for_user(user_id, from_time_int, to_time_int)
+        else:
+            history = self.env.storage.get_history_for_time_slice(room_id, user_id, from_time_int, to_time_int)
 
         return history, from_time, to_time
 
@@ -126,9 +126,20 @@ class UserManager(BaseManager):
             })
         return output
 
+    def _publish_to_user_nodes(self, data: dict, user_id: str) -> None:
+        """
+        only the nodes the user is connected to need to handle the event, so if the presence registry knows which
+        nodes those are, publish to them directly instead of to all nodes
+        """
+        nodes = utils.get_nodes_for_user_id(user_id, self.env)
+        if nodes is None:
+            self.env.publish(data)
+        else:
+            self.env.publish_to_nodes(data, nodes)
+
     def join_room(self, user_id, user_name, room_id, session_ids, namespace) -> None:
         data = join_activity(user_id, user_name, room_id, session_ids, namespace)
-        self.env.publish(data)
+        self._publish_to_user_nodes(data, user_id)
 
     def room_created(self, user_id, user_name, room_id, room_name, session_ids, namespace) -> None:
         data = created_activity(user_id, user_name, room_id, room_name, session_ids, namespace)
@@ -136,7 +147,7 @@ class UserManager(BaseManager):
 
     def leave_room(self, user_id, user_name, room_id, session_ids, namespace) -> None:
         data = leave_activity(user_id, user_name, room_id, session_ids, namespace)
-        self.env.publish(data)
+        self._publish_to_user_nodes(data, user_id)
 
     def kick_user(
             self, room_id: Optional[str], user_id: str, reason: str = None, admin_id: str = None, room_name: str = None
@@ -188,7 +199,7 @@ class UserManager(BaseManager):
             else:
                 logger.warning('reason is not base64, ignoring')
 
-        self.env.publish(kick_activity)
+        self._publish_to_user_nodes(kick_activity, user_id)
 
     def remove_mute(self, user_id: str, room_id: str, room_name: str) -> None:
         mute_activity = {
@@ -217,6 +228,9 @@ class UserManager(BaseManager):
                 broadcast=True, include_self=True, namespace='/ws'
             )
 
+            # lets the ban index on all nodes drop the mute
+            self.env.publish(mute_activity)
+
     def mute_user(
             self, user_id: str, room_id: str, duration: str,
             reason: str = None, muter_id: str = None, room_name: str = None
@@ -264,6 +278,9 @@ class UserManager(BaseManager):
             broadcast=True, include_self=True, namespace='/ws'
         )
 
+        # lets the ban index on all nodes add the mute
+        self.env.publish(mute_activity)
+
     def ban_user(
             self, user_id: str, target_id: str, duration: str, target_type: str,
             reason: str = None, banner_id: str = None, user_name: str = None, target_name: str = None
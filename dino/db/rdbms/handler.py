@@ -25,6 +25,7 @@ from uuid import uuid4 as uuid
 
 import pytz
 from activitystreams import Activity
+from sqlalchemy import bindparam
 from sqlalchemy import func
 from sqlalchemy import or_
 from sqlalchemy.orm import joinedload
@@ -39,6 +40,7 @@ from dino.config import ConfigKeys
 from dino.config import RoleKeys
 from dino.config import UserKeys
 from dino.db import IDatabase
+from dino.db.rdbms import rooms_users_association_table
 from dino.db.rdbms.dbman import Database
 from dino.db.rdbms.mock import MockDatabase
 from dino.db.rdbms.models import AclConfigs, UserInfo, Joins, Mutes
@@ -122,6 +124,9 @@ class DatabaseRdbms(object):
             ConfigKeys.COUNT_CUMULATIVE_JOINS, default=False
         )
 
+        # set by init_write_behind() if joins and leaves should be journaled and written in batches
+        self.journal = None
+
     @with_session
     def _session(self, session):
         return session
@@ -345,6 +350,46 @@ class DatabaseRdbms(object):
 
         return room_roles + global_roles
 
+    def get_users_roles_in_room(self, user_ids: list, room_id: str) -> dict:
+        @with_session
+        def _roles(_user_ids: list, session=None) -> dict:
+            room_roles = dict()
+            global_roles = dict()
+
+            for chunk in split_into_chunks(_user_ids, 500):
+                _room_roles = session.query(RoomRoles.user_id, RoomRoles.roles)\
+                    .join(RoomRoles.room)\
+                    .filter(RoomRoles.user_id.in_(chunk))\
+                    .filter(Rooms.uuid == room_id)\
+                    .all()
+
+                _global_roles = session.query(GlobalRoles.user_id, GlobalRoles.roles)\
+                    .filter(GlobalRoles.user_id.in_(chunk))\
+                    .all()
+
+                for _user_id, _user_roles in _room_roles:
+                    room_roles[_user_id] = _user_roles
+                for _user_id, _user_roles in _global_roles:
+                    global_roles[_user_id] = _user_roles
+
+            return room_roles, global_roles
+
+        def _split(_roles) -> list:
+            if _roles is None:
+                return list()
+            return [a for a in _roles.split(',') if len(a) > 0]
+
+        user_ids = list(user_ids)
+        if len(user_ids) == 0:
+            return dict()
+
+        all_room_roles, all_global_roles = _roles(user_ids)
+
+        return {
+            user_id: _split(all_room_roles.get(user_id)) + _split(all_global_roles.get(user_id))
+            for user_id in user_ids
+        }
+
     def get_admins_in_room(self, room_id: str, this_user_id: str=None) -> set:
         users = self.users_in_room(room_id, this_user_id, skip_cache=True)
         mods_in_room = list()
@@ -434,6 +479,22 @@ class DatabaseRdbms(object):
 
         return owners
 
+    def get_user_roles_for_target(self, user_id: str, channel_id: str, room_id: str = None) -> dict:
+        roles = self.get_user_roles(user_id)
+        return {
+            'global': roles['global'],
+            'channel': roles['channel'].get(channel_id, list()),
+            'room': roles['room'].get(room_id, list()) if room_id is not None else list()
+        }
+
+    def get_user_roles_for_targets(self, user_id: str, channel_ids: set, room_ids: set) -> dict:
+        roles = self.get_user_roles(user_id)
+        return {
+            'global': roles['global'],
+            'channel': {channel_id: roles['channel'].get(channel_id, list()) for channel_id in channel_ids},
+            'room': {room_id: roles['room'].get(room_id, list()) for room_id in room_ids}
+        }
+
     def get_user_roles(self, user_id: str, skip_cache: bool = False) -> dict:
         @with_session
         def _roles(session=None) -> dict:
@@ -501,6 +562,7 @@ class DatabaseRdbms(object):
             room.acls.append(join_acl)
 
         self.env.cache.set_admin_room(room_uuid)
+        self.env.cache.reset_rooms_for_channel(room.channel.uuid)
         session.commit()
 
     @with_session
@@ -511,6 +573,7 @@ class DatabaseRdbms(object):
 
         room.admin = False
         self.env.cache.remove_admin_room()
+        self.env.cache.reset_rooms_for_channel(room.channel.uuid)
         session.commit()
 
     def create_admin_room(self) -> str:
@@ -603,6 +666,43 @@ class DatabaseRdbms(object):
         self.env.cache.set_user_status(user_id, status)
         return status
 
+    def get_user_statuses(self, user_ids: list, skip_cache: bool = False) -> dict:
+        @with_session
+        def _get_user_statuses(_user_ids: list, session=None) -> dict:
+            _statuses = dict()
+            for chunk in split_into_chunks(_user_ids, 500):
+                rows = session.query(UserStatus.uuid, UserStatus.status)\
+                    .filter(UserStatus.uuid.in_(chunk))\
+                    .all()
+
+                for _user_id, _status in rows:
+                    _statuses[_user_id] = _status
+            return _statuses
+
+        user_ids = list(user_ids)
+        statuses = dict()
+
+        if not skip_cache:
+            statuses = self.env.cache.get_user_statuses(user_ids) or dict()
+
+        missing = [user_id for user_id in user_ids if user_id not in statuses]
+        if len(missing) == 0:
+            return statuses
+
+        from_db = _get_user_statuses(missing)
+        not_in_db = len(missing) - len(from_db)
+        if not_in_db > 0:
+            logger.warning("no UserStatus in db for {} of {} users".format(not_in_db, len(missing)))
+
+        missing_statuses = {
+            user_id: from_db.get(user_id, UserKeys.STATUS_UNAVAILABLE)
+            for user_id in missing
+        }
+
+        self.env.cache.set_user_statuses(missing_statuses)
+        statuses.update(missing_statuses)
+        return statuses
+
     @with_session
     def set_user_status_invisible(self, user_id: str, session=None):
         user_status = session.query(UserStatus).filter(UserStatus.uuid == user_id).first()
@@ -616,12 +716,16 @@ class DatabaseRdbms(object):
 
     def set_user_invisible(self, user_id: str, is_offline=False) -> None:
         # TODO: send to "status" topic that the user changed status
+        was_visible = not self._is_invisible(user_id)
 
         if is_offline:
             self.env.cache.set_user_status_invisible(user_id)
         else:
             self.env.cache.set_user_invisible(user_id, update_last_online=True)
 
+        if was_visible:
+            self._count_visible_user_in_joined_rooms(user_id, is_visible=False)
+
         try:
             self.set_user_status_invisible(user_id)
         except (IntegrityError, StaleDataError) as e:
@@ -700,8 +804,12 @@ class DatabaseRdbms(object):
 
         # TODO: send to "status" topic that the user changed status
         logger.debug('setting user %s as offline in cache' % user_id)
+        was_invisible = self._is_invisible(user_id)
         self.env.cache.set_user_offline(user_id)
 
+        if was_invisible:
+            self._count_visible_user_in_joined_rooms(user_id, is_visible=True)
+
         try:
             self._set_last_online(user_id)
         except Exception as e:
@@ -736,8 +844,12 @@ class DatabaseRdbms(object):
             session.commit()
 
         # TODO: send to "status" topic that the user changed status
+        was_invisible = self._is_invisible(user_id)
         self.env.cache.set_user_online(user_id)
 
+        if was_invisible:
+            self._count_visible_user_in_joined_rooms(user_id, is_visible=True)
+
         if update_last_online:
             # in case there's no time in the db from before, or it's very old, and there's issues updating it when
             # disconnecting, we at least have something closer to the true value
@@ -776,8 +888,23 @@ class DatabaseRdbms(object):
                 clean_rooms[row.uuid] = row.name
             return clean_rooms
 
+        def _with_pending(rooms: dict) -> dict:
+            # joins and leaves still in the journal are not yet in the tables
+            if self.journal is None:
+                return rooms
+
+            joined, left = self.journal.pending_rooms_for_user(user_id)
+            for room_id in left:
+                rooms.pop(room_id, None)
+            for room_id in joined - rooms.keys():
+                try:
+                    rooms[room_id] = self.get_room_name(room_id)
+                except NoSuchRoomException:
+                    pass
+            return rooms
+
         if skip_cache:
-            rooms = _rooms_for_user()
+            rooms = _with_pending(_rooms_for_user())
             self.env.cache.set_rooms_for_user(user_id, rooms)
             return rooms
 
@@ -785,7 +912,7 @@ class DatabaseRdbms(object):
         if rooms is not None and len(rooms) > 0:
             return rooms
 
-        rooms = _rooms_for_user()
+        rooms = _with_pending(_rooms_for_user())
         self.env.cache.set_rooms_for_user(user_id, rooms)
         return rooms
 
@@ -899,18 +1026,19 @@ class DatabaseRdbms(object):
                 return unique_users, room_info
 
             def _user_statuses(_user_ids: set):
-                user_statuses = dict()
+                valid_user_ids = list()
                 for user_id in _user_ids:
                     if not is_valid_id(user_id):
                         logger.warning('got invalid user id on rooms_for_channel: {}'.format(str(user_id)))
                         # TODO: sentry
-                        return
+                        continue
+                    valid_user_ids.append(user_id)
 
-                    user_statuses[user_id] = self.get_user_status(user_id)
-                return user_statuses
+                return self.get_user_statuses(valid_user_ids)
 
             def _get_the_rooms(all_rooms: dict, user_statuses: dict):
                 rooms_with_n_users = dict()
+                visible_users_in_rooms = dict()
                 for room_id in all_rooms.keys():
                     visible_users = set()
 
@@ -926,7 +1054,8 @@ class DatabaseRdbms(object):
                         'admin': all_rooms[room_id]['admin'],
                         'users': len(visible_users)
                     }
-                return rooms_with_n_users
+                    visible_users_in_rooms[room_id] = visible_users
+                return rooms_with_n_users, visible_users_in_rooms
 
             # avoid overwriting the session variable
             user_ids, room_data = _user_ids_and_room_data()
@@ -934,8 +1063,8 @@ class DatabaseRdbms(object):
 
         rooms = self.env.cache.get_rooms_for_channel(channel_id)
         if rooms is None:
-            rooms = _rooms()
-            self.env.cache.set_rooms_for_channel(channel_id, rooms)
+            rooms, visible_users_in_rooms = _rooms()
+            self.env.cache.set_rooms_for_channel(channel_id, rooms, visible_users=visible_users_in_rooms)
         return rooms
 
     @with_session
@@ -974,13 +1103,17 @@ class DatabaseRdbms(object):
             for user in room.users:
                 users_in_room[user.uuid] = user.name
 
+            # joins and leaves still in the journal are not yet in the tables
+            if self.journal is not None:
+                joined, left = self.journal.pending_users_in_room(room.uuid)
+                users_in_room.update(joined)
+                for user_id in left:
+                    users_in_room.pop(user_id, None)
+
             return users_in_room
 
         def _user_statuses(user_ids: dict):
-            statuses = dict()
-            for user_id in user_ids.keys():
-                statuses[user_id] = self.get_user_status(user_id)
-            return statuses
+            return self.get_user_statuses(list(user_ids.keys()))
 
         def _visible_users(every_user_in_room: dict, statuses: dict) -> dict:
             visible_users = dict()
@@ -1157,6 +1290,7 @@ class DatabaseRdbms(object):
         if rooms is None or len(rooms) == 0:
             return
 
+        removed_from = list()
         for room in rooms:
             # have other sessions in the room
             if room.uuid in room_sids and len(room_sids[room.uuid]) > 0:
@@ -1164,6 +1298,7 @@ class DatabaseRdbms(object):
 
             try:
                 room.users.remove(user)
+                removed_from.append(room.uuid)
             except ValueError:
                 # happens if the user already left a room
                 pass
@@ -1174,7 +1309,9 @@ class DatabaseRdbms(object):
             # might have just been removed by another node
             session.rollback()
 
-        self.env.cache.remove_rooms_for_user(user_id)
+        # only the rooms the user was removed from; rooms with other sessions of the user are still joined
+        for room_id in removed_from:
+            self._left_room_in_cache(user_id, room_id)
 
     def get_channels(self) -> dict:
         @with_session
@@ -1294,6 +1431,7 @@ class DatabaseRdbms(object):
             raise RoomNameExistsForChannelException(channel_id, room_name)
         _rename_room()
         self.env.cache.set_room_name(room_id, room_name)
+        self.env.cache.reset_rooms_for_channel(channel_id)
 
     def channel_for_room(self, room_id: str) -> str:
         @with_session
@@ -1502,6 +1640,7 @@ class DatabaseRdbms(object):
         logger.info('new sort order %s for room %s' % (str(sort_order), room_uuid))
         self.get_room_name(room_uuid)
         update()
+        self.env.cache.reset_rooms_for_channel(self.channel_for_room(room_uuid))
 
     def remove_channel(self, channel_id: str) -> None:
         @with_session
@@ -1606,6 +1745,51 @@ class DatabaseRdbms(object):
         self.env.cache.reset_rooms_for_channel(channel_id)
         self.env.cache.remove_room_id_for_name(room_id, room_name)
 
+    def _joined_room_in_cache(self, user_id: str, room_id: str, room_name: str) -> None:
+        self.env.cache.set_user_in_room(user_id, room_id, room_name)
+        if not self._is_invisible(user_id):
+            self._count_visible_user_in_rooms(user_id, [room_id], is_visible=True)
+
+    def _left_room_in_cache(self, user_id: str, room_id: str) -> None:
+        self.env.cache.leave_room_for_user(user_id, room_id)
+        # not counted if the user was invisible, or was already removed from the room by another session
+        self._count_visible_user_in_rooms(user_id, [room_id], is_visible=False)
+
+    def _is_invisible(self, user_id: str) -> bool:
+        return self.get_user_status(user_id) == UserKeys.STATUS_INVISIBLE
+
+    def _count_visible_user_in_rooms(self, user_id: str, room_ids, is_visible: bool) -> None:
+        """
+        update the number of visible users in the room directories of the channels (see rooms_for_channel()) when a
+        user joins, leaves or changes visibility, instead of rebuilding them; the cache keeps the visible users each
+        count is made of, so a user with many sessions in a room is only counted once
+        """
+        room_ids_per_channel = dict()
+        for room_id in room_ids:
+            try:
+                channel_id = self.channel_for_room(room_id)
+            except NoSuchRoomException:
+                continue
+
+            if channel_id not in room_ids_per_channel:
+                room_ids_per_channel[channel_id] = list()
+            room_ids_per_channel[channel_id].append(room_id)
+
+        try:
+            if is_visible:
+                self.env.cache.add_visible_user_to_rooms(user_id, room_ids_per_channel)
+            else:
+                self.env.cache.remove_visible_user_from_rooms(user_id, room_ids_per_channel)
+        except Exception as e:
+            logger.error('could not update visible users in rooms for user {}: {}'.format(user_id, str(e)))
+            logger.exception(traceback.format_exc())
+            self.env.capture_exception(sys.exc_info())
+
+    def _count_visible_user_in_joined_rooms(self, user_id: str, is_visible: bool) -> None:
+        rooms = self.rooms_for_user(user_id)
+        if rooms is not None and len(rooms) > 0:
+            self._count_visible_user_in_rooms(user_id, rooms.keys(), is_visible)
+
     def leave_room(self, user_id: str, room_id: str) -> None:
         @with_session
         def _leave(session=None):
@@ -1634,9 +1818,15 @@ class DatabaseRdbms(object):
             raise EmptyUserIdException()
 
         logger.info('user {} just left room {}'.format(user_id, room_id))
-        self.env.cache.leave_room_for_user(user_id, room_id)
+        self._left_room_in_cache(user_id, room_id)
         # self.get_room_name(room_id)
 
+        if self.journal is not None:
+            # raises NoSuchRoomException like _leave() would
+            self.get_room_name(room_id)
+            self.journal.leave(user_id, room_id)
+            return
+
         try:
             _leave()
         except ValueError as e:
@@ -1689,6 +1879,22 @@ class DatabaseRdbms(object):
 
         return user_infos
 
+    @staticmethod
+    def _update_user_info(info: UserInfo, user_info: dict) -> None:
+        info.avatar = user_info.get(SessionKeys.avatar.value)
+        info.app_avatar = user_info.get(SessionKeys.app_avatar.value)
+        info.app_avatar_safe = user_info.get(SessionKeys.app_avatar_safe.value)
+        info.age = user_info.get(SessionKeys.age.value)
+        info.gender = user_info.get(SessionKeys.gender.value)
+        info.membership = user_info.get(SessionKeys.membership.value)
+        info.group = user_info.get(SessionKeys.group.value)
+        info.country = user_info.get(SessionKeys.country.value)
+        info.has_webcam = user_info.get(SessionKeys.has_webcam.value)
+        info.fake_checked = user_info.get(SessionKeys.fake_checked.value)
+        info.is_streaming = user_info.get(SessionKeys.is_streaming.value)
+        info.enabled_safe = user_info.get(SessionKeys.enabled_safe.value)
+        info.last_login = user_info.get('last_login')
+
     def set_user_info(self, user_id: str, user_info: dict) -> None:
         @with_session
         def _set_user_info(session=None):
@@ -1697,20 +1903,7 @@ class DatabaseRdbms(object):
                 info = UserInfo()
                 info.user_id = user_id
 
-            info.avatar = user_info.get(SessionKeys.avatar.value)
-            info.app_avatar = user_info.get(SessionKeys.app_avatar.value)
-            info.app_avatar_safe = user_info.get(SessionKeys.app_avatar_safe.value)
-            info.age = user_info.get(SessionKeys.age.value)
-            info.gender = user_info.get(SessionKeys.gender.value)
-            info.membership = user_info.get(SessionKeys.membership.value)
-            info.group = user_info.get(SessionKeys.group.value)
-            info.country = user_info.get(SessionKeys.country.value)
-            info.has_webcam = user_info.get(SessionKeys.has_webcam.value)
-            info.fake_checked = user_info.get(SessionKeys.fake_checked.value)
-            info.is_streaming = user_info.get(SessionKeys.is_streaming.value)
-            info.enabled_safe = user_info.get(SessionKeys.enabled_safe.value)
-            info.last_login = user_info.get('last_login')
-
+            self._update_user_info(info, user_info)
             session.add(info)
             session.commit()
 
@@ -1760,6 +1953,12 @@ class DatabaseRdbms(object):
             except Exception as e:
                 logger.error('could not get sid from request: {}'.format(str(e)))
 
+        if self.journal is not None:
+            # the cache is authoritative for reads, the tables are updated when the journal is flushed
+            self.journal.join(user_id, user_name, room_id, sid)
+            self._joined_room_in_cache(user_id, room_id, room_name)
+            return
+
         if sid is not None:
             try:
                 _save_sid_in_room()
@@ -1791,7 +1990,119 @@ class DatabaseRdbms(object):
                                (user_name, user_id, room_name, room_id, str(e1)))
                 raise NoSuchRoomException(room_id)
 
-        self.env.cache.set_user_in_room(user_id, room_id, room_name)
+        self._joined_room_in_cache(user_id, room_id, room_name)
+
+    @with_session
+    def apply_membership_changes(self, joins: dict, leaves: set, room_sids: set, session=None) -> None:
+        if len(joins) == 0 and len(leaves) == 0 and len(room_sids) == 0:
+            return
+
+        # a join from a session that has disconnected since would make the user a member of the room again after the
+        # disconnect removed it, so skip those; joins without a known session are kept
+        sids = {sid for _, _, sid in room_sids}
+        alive_sids = set()
+        if len(sids) > 0:
+            alive_sids = {row.sid for row in session.query(Sids.sid).filter(Sids.sid.in_(sids)).all()}
+
+        sids_for_join = dict()
+        for user_id, room_id, sid in room_sids:
+            sids_for_join.setdefault((user_id, room_id), set()).add(sid)
+
+        joins = {
+            key: user_name for key, user_name in joins.items()
+            if key not in sids_for_join or len(sids_for_join[key] & alive_sids) > 0
+        }
+        room_sids = {room_sid for room_sid in room_sids if room_sid[2] in alive_sids}
+
+        room_uuids = {room_id for _, room_id in joins.keys()} | {room_id for _, room_id in leaves}
+        user_uuids = {user_id for user_id, _ in joins.keys()} | {user_id for user_id, _ in leaves}
+
+        room_ids = dict()
+        if len(room_uuids) > 0:
+            room_ids = {
+                uuid: _id for _id, uuid in
+                session.query(Rooms.id, Rooms.uuid).filter(Rooms.uuid.in_(room_uuids)).all()
+            }
+
+        user_ids = dict()
+        if len(user_uuids) > 0:
+            user_ids = {
+                uuid: _id for _id, uuid in
+                session.query(Users.id, Users.uuid).filter(Users.uuid.in_(user_uuids)).all()
+            }
+
+        missing_users = {
+            user_id: user_name for (user_id, room_id), user_name in joins.items()
+            if user_id not in user_ids and room_id in room_ids
+        }
+        if len(missing_users) > 0:
+            session.bulk_insert_mappings(Users, [
+                {'uuid': user_id, 'name': user_name or user_id}
+                for user_id, user_name in missing_users.items()
+            ])
+            user_ids.update({
+                uuid: _id for _id, uuid in
+                session.query(Users.id, Users.uuid).filter(Users.uuid.in_(missing_users.keys())).all()
+            })
+
+        # rooms removed since the join/leave was journaled are skipped
+        to_insert = [
+            {'room_id': room_ids[room_id], 'user_id': user_ids[user_id]}
+            for user_id, room_id in joins.keys()
+            if room_id in room_ids and user_id in user_ids
+        ]
+        to_delete = [
+            {'r_id': room_ids[room_id], 'u_id': user_ids[user_id]}
+            for user_id, room_id in leaves
+            if room_id in room_ids and user_id in user_ids
+        ]
+
+        association = rooms_users_association_table
+        self._insert_ignore(session, association, to_insert, ['room_id', 'user_id'])
+        self._insert_ignore(session, RoomSids.__table__, [
+            {'user_id': user_id, 'room_id': room_id, 'session_id': sid}
+            for user_id, room_id, sid in room_sids
+        ], ['user_id', 'room_id', 'session_id'])
+
+        if len(to_delete) > 0:
+            session.execute(
+                association.delete()
+                .where(association.c.room_id == bindparam('r_id'))
+                .where(association.c.user_id == bindparam('u_id')),
+                to_delete
+            )
+
+        session.commit()
+
+    @staticmethod
+    def _insert_ignore(session, table, rows: list, index_elements: list) -> None:
+        """
+        batched insert that skips rows that already exist, so replaying the same changes twice is harmless
+        """
+        if len(rows) == 0:
+            return
+
+        dialect = session.bind.dialect.name
+
+        for chunk in split_into_chunks(rows, 500):
+            if dialect in {'postgresql', 'sqlite'}:
+                if dialect == 'postgresql':
+                    from sqlalchemy.dialects.postgresql import insert
+                else:
+                    from sqlalchemy.dialects.sqlite import insert
+
+                session.execute(insert(table).on_conflict_do_nothing(index_elements=index_elements), chunk)
+
+            elif dialect == 'mysql':
+                session.execute(table.insert().prefix_with('IGNORE'), chunk)
+
+            else:
+                for row in chunk:
+                    query = session.query(table)
+                    for column in index_elements:
+                        query = query.filter(table.c[column] == row[column])
+                    if query.first() is None:
+                        session.execute(table.insert(), row)
 
     def _add_global_role(self, user_id: str, role: str):
         @with_session
@@ -2260,6 +2571,65 @@ class DatabaseRdbms(object):
         self.env.cache.set_all_acls_for_room(room_id, value)
         return value
 
+    def get_all_acls_channels(self, channel_ids: list) -> Dict[str, dict]:
+        @with_session
+        def _acls(uuids: list, session=None) -> Dict[str, dict]:
+            rows = session.query(Channels.uuid, Acls.action, Acls.acl_type, Acls.acl_value)\
+                .outerjoin(Channels.acls)\
+                .filter(Channels.uuid.in_(uuids))\
+                .all()
+            return DatabaseRdbms._format_acls_by_uuid(rows)
+
+        return self._get_all_acls_for_many(
+            channel_ids, _acls, self.env.cache.get_all_acls_for_channel, self.env.cache.set_all_acls_for_channel)
+
+    def get_all_acls_rooms(self, room_ids: list) -> Dict[str, dict]:
+        @with_session
+        def _acls(uuids: list, session=None) -> Dict[str, dict]:
+            rows = session.query(Rooms.uuid, Acls.action, Acls.acl_type, Acls.acl_value)\
+                .outerjoin(Rooms.acls)\
+                .filter(Rooms.uuid.in_(uuids))\
+                .all()
+            return DatabaseRdbms._format_acls_by_uuid(rows)
+
+        return self._get_all_acls_for_many(
+            room_ids, _acls, self.env.cache.get_all_acls_for_room, self.env.cache.set_all_acls_for_room)
+
+    @staticmethod
+    def _format_acls_by_uuid(rows: list) -> Dict[str, dict]:
+        acls = dict()
+        for target_id, action, acl_type, acl_value in rows:
+            target_acls = acls.setdefault(target_id, dict())
+
+            # outer join, so a channel/room without any acls is one row of nulls
+            if action is None:
+                continue
+
+            if action not in target_acls:
+                target_acls[action] = dict()
+            target_acls[action][acl_type] = acl_value
+        return acls
+
+    @staticmethod
+    def _get_all_acls_for_many(uuids: list, query, get_cached, set_cached) -> Dict[str, dict]:
+        """
+        the cached acls for each uuid, and the rest from a single query in chunks of 500 uuids
+        """
+        all_acls, missing = dict(), list()
+        for target_id in uuids:
+            acls = get_cached(target_id)
+            if acls is None:
+                missing.append(target_id)
+            else:
+                all_acls[target_id] = acls
+
+        for chunk in split_into_chunks(missing, 500):
+            for target_id, acls in query(chunk).items():
+                set_cached(target_id, acls)
+                all_acls[target_id] = acls
+
+        return all_acls
+
     def get_room_acls_for_action(self, action) -> Dict[str, Dict[str, str]]:
         @with_session
         def _acls(session=None):
@@ -2579,20 +2949,74 @@ class DatabaseRdbms(object):
 
     @with_session
     def update_last_read_for(self, users: set, room_id: str, time_stamp: int, session=None) -> None:
-        for user_id in users:
-            last_read = session.query(LastReads)\
-                .filter(LastReads.user_id == user_id)\
-                .filter(LastReads.room_uuid == room_id)\
-                .first()
+        if len(users) == 0:
+            return
+        self._upsert_last_reads(session, [(user_id, room_id, time_stamp) for user_id in users])
+        session.commit()
 
-            if last_read is None:
-                last_read = LastReads()
-                last_read.room_uuid = room_id
-                last_read.user_id = user_id
+    @staticmethod
+    def _upsert_last_reads(session, last_reads: list) -> None:
+        """
+        insert or update many rows in one statement per chunk, relying on the unique (user_id, room_uuid)
+        constraint, instead of one select and one insert/update per user
+
+        :param last_reads: a list of (user_id, room_id, time_stamp) tuples
+        """
+        dialect = session.bind.dialect.name
+        table = LastReads.__table__
+
+        for chunk in split_into_chunks(last_reads, 500):
+            values = [
+                {'user_id': user_id, 'room_uuid': room_id, 'time_stamp': time_stamp}
+                for user_id, room_id, time_stamp in chunk
+            ]
 
-            last_read.time_stamp = time_stamp
-            session.add(last_read)
-        session.commit()
+            if dialect in {'postgresql', 'sqlite'}:
+                if dialect == 'postgresql':
+                    from sqlalchemy.dialects.postgresql import insert
+                else:
+                    from sqlalchemy.dialects.sqlite import insert
+
+                statement = insert(table).values(values)
+                statement = statement.on_conflict_do_update(
+                    index_elements=[table.c.user_id, table.c.room_uuid],
+                    set_={'time_stamp': statement.excluded.time_stamp}
+                )
+                session.execute(statement)
+
+            elif dialect == 'mysql':
+                from sqlalchemy.dialects.mysql import insert
+
+                statement = insert(table).values(values)
+                statement = statement.on_duplicate_key_update(time_stamp=statement.inserted.time_stamp)
+                session.execute(statement)
+
+            else:
+                DatabaseRdbms._upsert_last_reads_fallback(session, chunk)
+
+    @staticmethod
+    def _upsert_last_reads_fallback(session, last_reads: list) -> None:
+        time_stamps = dict()
+        for user_id, room_id, time_stamp in last_reads:
+            time_stamps[(user_id, room_id)] = time_stamp
+
+        user_ids = {user_id for user_id, _ in time_stamps.keys()}
+        room_ids = {room_id for _, room_id in time_stamps.keys()}
+
+        existing = session.query(LastReads)\
+            .filter(LastReads.user_id.in_(user_ids))\
+            .filter(LastReads.room_uuid.in_(room_ids))\
+            .all()
+
+        for last_read in existing:
+            key = (last_read.user_id, last_read.room_uuid)
+            if key in time_stamps:
+                last_read.time_stamp = time_stamps.pop(key)
+
+        session.bulk_insert_mappings(LastReads, [
+            {'user_id': user_id, 'room_uuid': room_id, 'time_stamp': time_stamp}
+            for (user_id, room_id), time_stamp in time_stamps.items()
+        ])
 
     @with_session
     def get_last_read_timestamp(self, room_id: str, user_id: str, session=None) -> int:
@@ -2958,6 +3382,37 @@ class DatabaseRdbms(object):
             return room_ban.duration, room_ban.timestamp, room_ban.user_name
         return None, None, None
 
+    @with_session
+    def get_ban_and_mute_timestamps(self, session=None) -> list:
+        now = datetime.utcnow()
+        timestamps = list()
+
+        bans = session.query(Bans).options(
+            joinedload(Bans.room, innerjoin=False),
+            joinedload(Bans.channel, innerjoin=False)
+        ).filter(Bans.timestamp > now).all()
+
+        for ban in bans:
+            if ban.is_global:
+                timestamps.append(('global', '', ban.user_id, ban.timestamp.timestamp()))
+            elif ban.channel is not None:
+                timestamps.append(('channel', ban.channel.uuid, ban.user_id, ban.timestamp.timestamp()))
+            elif ban.room is not None:
+                timestamps.append(('room', ban.room.uuid, ban.user_id, ban.timestamp.timestamp()))
+
+        mutes = session.query(Mutes).filter(Mutes.timestamp > now).all()
+        for mute in mutes:
+            timestamps.append(('mute', mute.room_id, mute.user_id, mute.timestamp.timestamp()))
+
+        return timestamps
+
+    @with_session
+    def remove_expired_bans_and_mutes(self, session=None) -> None:
+        now = datetime.utcnow()
+        session.query(Bans).filter(Bans.timestamp < now).delete(synchronize_session=False)
+        session.query(Mutes).filter(Mutes.timestamp < now).delete(synchronize_session=False)
+        session.commit()
+
     @with_session
     def get_mutes_for_user(self, user_id: str, session=None) -> dict:
         mutes = session.query(Mutes)\
@@ -3432,6 +3887,68 @@ class DatabaseRdbms(object):
         self.env.cache.add_sid_for_user(user_id, sid)
         update_sid()
 
+    def login_session(self, user_id: str, user_name: str, sid: str, user_info: dict) -> None:
+        @with_session
+        def _login_session(session=None):
+            if user_name is not None:
+                user = session.query(Users).filter(Users.uuid == user_id).first()
+                if user is None:
+                    user = Users()
+                    user.uuid = user_id
+                user.name = user_name
+                session.add(user)
+
+            user_sid = session.query(Sids)\
+                .filter(Sids.user_uuid == user_id)\
+                .filter(Sids.sid == sid)\
+                .first()
+
+            if user_sid is None:
+                user_sid = Sids()
+                user_sid.user_uuid = user_id
+                user_sid.sid = sid
+                session.add(user_sid)
+
+            session.commit()
+
+        if user_id is None or len(user_id.strip()) == 0:
+            raise EmptyUserIdException(user_id)
+        if user_name is not None and len(user_name.strip()) == 0:
+            raise EmptyUserNameException(user_id)
+
+        # the user info is best effort, a failure to store it shouldn't prevent the login, so it's not part of the
+        # same transaction as the user and sid
+        self.set_user_info(user_id, user_info)
+        _login_session()
+        self.env.cache.login_session(user_id, user_name, sid)
+
+    def disconnect_session(self, user_id: str, sid: str, update_last_online: bool = True) -> list:
+        @with_session
+        def _disconnect_session(session=None):
+            session.query(Sids).filter(Sids.sid == sid).delete(synchronize_session=False)
+            session.query(RoomSids).filter(RoomSids.session_id == sid).delete(synchronize_session=False)
+
+            if update_last_online:
+                last_online = session.query(LastOnline).filter(LastOnline.uuid == user_id).first()
+                if last_online is None:
+                    last_online = LastOnline()
+                    last_online.uuid = user_id
+                last_online.at = int(datetime.utcnow().replace(tzinfo=pytz.utc).timestamp())
+                session.add(last_online)
+
+            user_sids = session.query(Sids).filter(Sids.user_uuid == user_id).all()
+            session.commit()
+
+            return [user_sid.sid for user_sid in user_sids if user_sid.sid is not None and len(user_sid.sid) > 0]
+
+        if user_id is None or len(user_id.strip()) == 0:
+            raise EmptyUserIdException(user_id)
+
+        remaining_sids = _disconnect_session()
+        self.env.cache.disconnect_session(
+            user_id, sid, update_last_online=update_last_online, remaining_sids=remaining_sids)
+        return remaining_sids
+
     def get_user_for_sid(self, sid: str) -> str:
         @with_session
         def _get_user_for_sid(session=None):
@@ -3512,9 +4029,29 @@ class DatabaseRdbms(object):
         ban.timestamp = datetime.fromtimestamp(int(ban_timestamp))
         ban.duration = ban_duration
 
+        # same as when banned in a room or channel, the user is no longer in any room
+        user = session.query(Users).filter(Users.uuid == user_id).first()
+        rooms = session.query(Rooms)\
+            .join(Rooms.users)\
+            .filter(Users.uuid == user_id)\
+            .all()
+
+        removed_from = list()
+        for room in rooms:
+            try:
+                room.users.remove(user)
+                removed_from.append(room.uuid)
+            except ValueError:
+                # happens if the user already left a room
+                pass
+            session.add(room)
+
         session.add(ban)
         session.commit()
 
+        for room_id in removed_from:
+            self._left_room_in_cache(user_id, room_id)
+
     def mute_user(self, room_id, user_id, mute_duration, mute_timestamp, room_name, muter_id, reason) -> None:
         @with_session
         def _mute_user(session=None):
@@ -3600,7 +4137,7 @@ class DatabaseRdbms(object):
         except NoSuchUserException:
             pass
 
-        self.env.cache.leave_room_for_user(user_id, room_id)
+        self._left_room_in_cache(user_id, room_id)
         self.env.cache.set_room_ban_timestamp(
                 room_id, user_id, ban_duration, ban_timestamp, self.get_user_name(user_id))
 
@@ -3633,12 +4170,14 @@ class DatabaseRdbms(object):
             ban.timestamp = datetime.fromtimestamp(int(ban_timestamp))
             ban.duration = ban_duration
 
-            _remove_user_from_rooms_in_channel(session)
+            removed_from = _remove_user_from_rooms_in_channel(session)
 
             session.add(ban)
             session.commit()
+            return removed_from
 
-        def _remove_user_from_rooms_in_channel(session) -> None:
+        def _remove_user_from_rooms_in_channel(session) -> list:
+            removed_from = list()
             channel = session.query(Channels)\
                 .join(Channels.rooms)\
                 .join(Rooms.users)\
@@ -3647,10 +4186,10 @@ class DatabaseRdbms(object):
                 .first()
 
             if channel is None:
-                return
+                return removed_from
 
             if channel.rooms is None or len(channel.rooms) == 0:
-                return
+                return removed_from
 
             for room in channel.rooms:
                 if room.users is None or len(room.users) == 0:
@@ -3662,12 +4201,15 @@ class DatabaseRdbms(object):
 
                     try:
                         room.users.remove(user)
+                        removed_from.append(room.uuid)
                     except ValueError:
                         # happens if the user already left a room
                         pass
 
                 session.add(room)
 
+            return removed_from
+
         if not self.channel_exists(channel_id):
             raise NoSuchChannelException(channel_id)
 
@@ -3680,4 +4222,5 @@ class DatabaseRdbms(object):
         self.env.cache.set_channel_ban_timestamp(
                 channel_id, user_id, ban_duration, ban_timestamp, self.get_user_name(user_id))
 
-        _ban_user_channel()
+        for room_id in _ban_user_channel():
+            self._left_room_in_cache(user_id, room_id)
@@ -13,6 +13,7 @@
 # limitations under the License.
 
 from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, Text, text
+from sqlalchemy import UniqueConstraint
 from sqlalchemy.orm import relationship
 
 from dino.db.rdbms import DeclarativeBase
@@ -187,6 +188,7 @@ class Sids(DeclarativeBase):
 
 class LastReads(DeclarativeBase):
     __tablename__ = 'lastreads'
+    __table_args__ = (UniqueConstraint('user_id', 'room_uuid', name='uix_lastreads_user_id_room_uuid'),)
 
     id = Column(Integer, primary_key=True)
 
@@ -61,13 +61,15 @@ class DatabaseRedis(object):
     redis = None
 
     def __init__(self, env: GNEnvironment, host: str, port: int = 6379, db: int = 0):
+        self.env = env
+
         if environ.env.config.get(ConfigKeys.TESTING, False) or host == 'mock':
-            from fakeredis import FakeStrictRedis as Redis
+            from fakeredis import FakeStrictRedis
+            self.redis = FakeStrictRedis(host=host, port=port, db=db)
         else:
-            from redis import Redis
-
-        self.env = env
-        self.redis = Redis(host=host, port=port, db=db)
+            from dino.cache.instrumentation import create_redis_client
+            db_config = env.config.get(ConfigKeys.DATABASE, default=dict()) or dict()
+            self.redis = create_redis_client(env, 'db', host, port=port, db=db, conf=db_config)
         self.acl_validator = AclValidator()
 
     def get_or_create_default_channel(self):
@@ -164,6 +166,12 @@ class DatabaseRedis(object):
     def get_last_online(self, user_id: str) -> Union[int, None]:
         raise NotImplementedError('not implemented in redis db backend')
 
+    def get_ban_and_mute_timestamps(self) -> list:
+        raise NotImplementedError('not implemented in redis db backend')
+
+    def remove_expired_bans_and_mutes(self) -> None:
+        raise NotImplementedError('not implemented in redis db backend')
+
     def get_muted_users_for_room(self, room_id: str, encode_response: bool = False) -> dict:
         raise NotImplementedError('not implemented in redis db backend')
 
@@ -211,6 +219,8 @@ class DatabaseRedis(object):
 
     def add_words_to_blacklist(self, words: list) -> None:
         self.redis.sadd(RedisKeys.black_list(), words)
+        for word in words:
+            self.env.cache.add_to_black_list(word)
 
     def get_users_roles(self, user_ids: list) -> None:
         raise NotImplementedError('not available in redis implementation of db interface')
@@ -228,8 +238,16 @@ class DatabaseRedis(object):
         raise NotImplementedError('not available in redis implementation of db interface')
 
     def get_black_list(self) -> set:
+        # the cache keeps a matcher for the list, so it's not rebuilt for every message that is checked
+        blacklist = self.env.cache.get_black_list()
+        if blacklist is not None:
+            return blacklist
+
         values = self.redis.smembers(RedisKeys.black_list())
-        return {str(value, 'utf-8') for value in values}
+        blacklist = {str(value, 'utf-8') for value in values}
+        if len(blacklist) > 0:
+            self.env.cache.set_black_list(blacklist)
+        return blacklist
 
     def search_for_users(self, query: str) -> list:
         raise NotImplementedError('not implemented in redis db backend')
@@ -240,6 +258,18 @@ class DatabaseRedis(object):
             return roles['room'][room_id]
         return list()
 
+    def get_users_roles_in_room(self, user_ids: list, room_id: str) -> dict:
+        user_ids = list(user_ids)
+        output = {user_id: list() for user_id in user_ids}
+        if len(user_ids) == 0:
+            return output
+
+        all_roles = self.redis.hmget(RedisKeys.room_roles(room_id), user_ids)
+        for user_id, roles in zip(user_ids, all_roles):
+            if roles is not None:
+                output[user_id] = [a for a in str(roles, 'utf-8').split(',')]
+        return output
+
     def get_user_roles(self, user_id: str) -> dict:
         output = {
             'global': list(),
@@ -346,6 +376,54 @@ class DatabaseRedis(object):
     def get_reason_for_ban_room(self, user_id: str, room_uuid: str) -> str:
         return ''
 
+    def get_user_roles_for_target(self, user_id: str, channel_id: str, room_id: str = None) -> dict:
+        output = {
+            'global': list(),
+            'channel': list(),
+            'room': list()
+        }
+        if user_id is None:
+            return output
+
+        with self.redis.pipeline() as p:
+            p.hget(RedisKeys.global_roles(), user_id)
+            p.hget(RedisKeys.channel_roles(channel_id), user_id)
+            if room_id is not None:
+                p.hget(RedisKeys.room_roles(room_id), user_id)
+            roles = p.execute()
+
+        for key, value in zip(['global', 'channel', 'room'], roles):
+            if value is not None:
+                output[key] = [a for a in str(value, 'utf-8').split(',') if len(a) > 0]
+        return output
+
+    def get_user_roles_for_targets(self, user_id: str, channel_ids: set, room_ids: set) -> dict:
+        channel_ids, room_ids = list(channel_ids), list(room_ids)
+        output = {
+            'global': list(),
+            'channel': {channel_id: list() for channel_id in channel_ids},
+            'room': {room_id: list() for room_id in room_ids}
+        }
+        if user_id is None:
+            return output
+
+        # read the role hashes directly, get_user_roles() only knows about rooms the user is in
+        with self.redis.pipeline() as p:
+            p.hget(RedisKeys.global_roles(), user_id)
+            for channel_id in channel_ids:
+                p.hget(RedisKeys.channel_roles(channel_id), user_id)
+            for room_id in room_ids:
+                p.hget(RedisKeys.room_roles(room_id), user_id)
+            roles = [
+                list() if value is None else [a for a in str(value, 'utf-8').split(',') if len(a) > 0]
+                for value in p.execute()
+            ]
+
+        output['global'] = roles[0]
+        output['channel'].update(zip(channel_ids, roles[1:1 + len(channel_ids)]))
+        output['room'].update(zip(room_ids, roles[1 + len(channel_ids):]))
+        return output
+
     def _has_role_in_room(self, role: str, room_id: str, user_id: str) -> bool:
         if user_id is None:
             return False
@@ -1118,6 +1196,44 @@ class DatabaseRedis(object):
 
         return acls_cleaned
 
+    def get_all_acls_channels(self, channel_ids: list) -> Dict[str, dict]:
+        with self.redis.pipeline() as p:
+            for channel_id in channel_ids:
+                p.hexists(RedisKeys.channels(), channel_id)
+                p.hgetall(RedisKeys.channel_acl(channel_id))
+            values = p.execute()
+
+        return DatabaseRedis._format_acls_for_many(channel_ids, values)
+
+    def get_all_acls_rooms(self, room_ids: list) -> Dict[str, dict]:
+        with self.redis.pipeline() as p:
+            for room_id in room_ids:
+                p.hexists(RedisKeys.room_name_for_id(), room_id)
+                p.hgetall(RedisKeys.room_acl(room_id))
+            values = p.execute()
+
+        return DatabaseRedis._format_acls_for_many(room_ids, values)
+
+    @staticmethod
+    def _format_acls_for_many(target_ids: list, values: list) -> Dict[str, dict]:
+        """
+        :param values: the result of a pipeline with one 'hexists' and one 'hgetall' per target id
+        """
+        all_acls = dict()
+        for target_id, exists, acls in zip(target_ids, values[0::2], values[1::2]):
+            if not exists:
+                continue
+
+            acls_cleaned = dict()
+            for acl_key, acl_value in acls.items():
+                acl_action, acl_type = str(acl_key, 'utf-8').split('|', 1)
+                if acl_action not in acls_cleaned:
+                    acls_cleaned[acl_action] = dict()
+                acls_cleaned[acl_action][acl_type] = str(acl_value, 'utf-8')
+
+            all_acls[target_id] = acls_cleaned
+        return all_acls
+
     def channel_for_room(self, room_id: str) -> str:
         if room_id is None or len(room_id.strip()) == 0:
             raise NoSuchRoomException(room_id)
@@ -1167,6 +1283,32 @@ class DatabaseRedis(object):
             raise EmptyUserIdException(user_id)
         self.redis.hset(RedisKeys.sid_for_user_id(), user_id, sid)
 
+    def login_session(self, user_id: str, user_name: str, sid: str, user_info: dict) -> None:
+        if user_id is None or len(user_id.strip()) == 0:
+            raise EmptyUserIdException(user_id)
+        if user_name is not None and len(user_name.strip()) == 0:
+            raise EmptyUserNameException(user_id)
+
+        self.set_user_info(user_id, user_info)
+
+        p = self.redis.pipeline()
+        if user_name is not None:
+            p.hset(RedisKeys.auth_key(user_id), SessionKeys.user_id.value, user_id)
+            p.hset(RedisKeys.auth_key(user_id), SessionKeys.user_name.value, user_name)
+            p.hset(RedisKeys.user_names(), user_id, user_name)
+        p.hset(RedisKeys.sid_for_user_id(), user_id, sid)
+        p.execute()
+
+    def disconnect_session(self, user_id: str, sid: str, update_last_online: bool = True) -> list:
+        if user_id is None or len(user_id.strip()) == 0:
+            raise EmptyUserIdException(user_id)
+
+        # only one sid is kept per user, so the user has no sessions left after a disconnect
+        self.redis.hdel(RedisKeys.sid_for_user_id(), user_id)
+        if update_last_online:
+            self.env.cache._set_last_online(user_id)
+        return list()
+
     def reset_sids_for_user(self, user_id: str) -> None:
         if user_id is None or len(user_id.strip()) == 0:
             raise EmptyUserIdException(user_id)
@@ -1254,6 +1396,24 @@ class DatabaseRedis(object):
         self.redis.hset(RedisKeys.rooms_for_user(user_id), room_id, room_name)
         self.redis.hset(RedisKeys.users_in_room(room_id), user_id, user_name)
 
+    def apply_membership_changes(self, joins: dict, leaves: set, room_sids: set) -> None:
+        if len(joins) == 0 and len(leaves) == 0:
+            return
+
+        with self.redis.pipeline() as p:
+            for (user_id, room_id), user_name in joins.items():
+                try:
+                    room_name = self.get_room_name(room_id)
+                except NoSuchRoomException:
+                    # removed since the join was journaled
+                    continue
+                p.hset(RedisKeys.rooms_for_user(user_id), room_id, room_name)
+                p.hset(RedisKeys.users_in_room(room_id), user_id, user_name)
+            for user_id, room_id in leaves:
+                p.hdel(RedisKeys.users_in_room(room_id), user_id)
+                p.hdel(RedisKeys.rooms_for_user(user_id), room_id)
+            p.execute()
+
     def create_channel(self, channel_name, channel_id, user_id) -> None:
         if self.channel_exists(channel_id):
             raise ChannelExistsException(channel_id)
@@ -1395,6 +1555,21 @@ class DatabaseRedis(object):
             return UserKeys.STATUS_UNAVAILABLE
         return str(status, 'utf-8')
 
+    def get_user_statuses(self, user_ids: list, skip_cache: bool = False) -> dict:
+        user_ids = list(user_ids)
+        statuses = self.env.cache.get_user_statuses(user_ids) or dict()
+        missing = [user_id for user_id in user_ids if user_id not in statuses]
+
+        if len(missing) > 0:
+            values = self.redis.mget([RedisKeys.user_status(user_id) for user_id in missing])
+            for user_id, status in zip(missing, values):
+                if status is None:
+                    statuses[user_id] = UserKeys.STATUS_UNAVAILABLE
+                else:
+                    statuses[user_id] = str(status, 'utf-8')
+
+        return statuses
+
     def set_user_offline(self, user_id: str) -> None:
         self.env.cache.set_user_offline(user_id)
 
@@ -1419,9 +1594,10 @@ class DatabaseRedis(object):
 
     def update_last_read_for(self, users: set, room_id: str, time_stamp: int) -> None:
         self.get_room_name(room_id)
+        if len(users) == 0:
+            return
         redis_key = RedisKeys.last_read(room_id)
-        for user_id in users:
-            self.redis.hset(redis_key, user_id, time_stamp)
+        self.redis.hset(redis_key, mapping={user_id: time_stamp for user_id in users})
 
     def get_last_read_timestamp(self, room_id: str, user_id: str) -> int:
         timestamp = self.redis.hget(RedisKeys.last_read(room_id), user_id)
@@ -0,0 +1,281 @@
+import json
+import logging
+import os
+import sys
+import time
+import traceback
+
+import eventlet
+
+__author__ = 'Oscar Eriksson <oscar.eriks@gmail.com>'
+
+logger = logging.getLogger(__name__)
+
+JOIN, LEAVE = 'join', 'leave'
+
+
+class LastReadBuffer(object):
+    """
+    Coalesces last read updates in memory and writes them to the database every 'flush_interval' seconds. A burst of
+    messages in a room only keeps the newest timestamp per (user, room), so each row is written at most once per
+    flush instead of once per message.
+
+    Updates not yet flushed are lost if the process dies; last read timestamps are only used for unread counts, so
+    that's an acceptable trade-off for not writing on every message.
+    """
+
+    def __init__(self, env, flush_interval: float):
+        self.env = env
+        self.flush_interval = flush_interval
+        self.pending = dict()
+
+        eventlet.spawn(self.loop)
+
+    def update(self, users: set, room_id: str, time_stamp: int) -> None:
+        if len(users) == 0:
+            return
+
+        time_stamps = self.pending.get(room_id)
+        if time_stamps is None:
+            time_stamps = dict()
+            self.pending[room_id] = time_stamps
+
+        for user_id in users:
+            if time_stamps.get(user_id, 0) < time_stamp:
+                time_stamps[user_id] = time_stamp
+
+    def get(self, room_id: str, user_id: str):
+        """
+        the pending (not yet flushed) timestamp, if any, so reads right after an update see it
+        """
+        return self.pending.get(room_id, dict()).get(user_id)
+
+    def flush(self) -> None:
+        pending, self.pending = self.pending, dict()
+        if len(pending) == 0:
+            return
+
+        start = time.time()
+        n_rows = 0
+
+        for room_id, time_stamps in pending.items():
+            # usually all users in a room got the same timestamp, so this is one write per room
+            users_by_time_stamp = dict()
+            for user_id, time_stamp in time_stamps.items():
+                users_by_time_stamp.setdefault(time_stamp, set()).add(user_id)
+
+            for time_stamp, users in users_by_time_stamp.items():
+                try:
+                    self.env.db.update_last_read_for(users, room_id, time_stamp)
+                    n_rows += len(users)
+                except Exception as e:
+                    logger.error('could not flush last reads for room {}: {}'.format(room_id, str(e)))
+                    logger.exception(traceback.format_exc())
+                    self.env.capture_exception(sys.exc_info())
+
+                    # keep them for the next flush unless newer ones have arrived since
+                    self.update(users, room_id, time_stamp)
+
+        self.env.stats.timing('last_reads.flush.latency', (time.time() - start) * 1000)
+        self.env.stats.gauge('last_reads.flush.rooms', len(pending))
+        self.env.stats.gauge('last_reads.flush.rows', n_rows)
+
+    def loop(self):
+        while True:
+            try:
+                eventlet.sleep(self.flush_interval)
+            except InterruptedError:
+                logger.info('interrupted, flushing and exiting loop')
+                self.flush()
+                break
+
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error('could not flush last reads: {}'.format(str(e)))
+                logger.exception(traceback.format_exc())
+
+
+class MembershipJournal(object):
+    """
+    Appends joins and leaves to a local journal file and applies them to the database in batches every
+    'flush_interval' seconds, instead of a couple of transactions per join and leave. The cache is still updated
+    directly and is what reads use, so the tables only lag behind by up to one interval.
+
+    On flush the journal is rotated to '<path>.flushing' and new changes go to a fresh file while the old one is
+    applied; the rotated file is only removed after the batch is committed. Applying a batch is idempotent, so the
+    journal can be replayed after a crash (which is done on startup) or a failed flush without duplicating rows.
+
+    Changes not yet flushed are also kept in memory per (user, room), so reads that go to the tables (e.g. with
+    skip_cache=True) can add them on top of what's in the db; see pending_rooms_for_user() and
+    pending_users_in_room(). When the batch is applied, joins from sessions that have disconnected since are dropped.
+
+    Each node has its own journal, and the pending changes are only known to that node. If a user's sessions are
+    spread over several nodes, a join on one node that is flushed after the user left the room on another node will
+    add the user back to the room in the db until the user leaves it again, so the journal should only be enabled if
+    a user's sessions are handled by the same node.
+    """
+
+    def __init__(self, env, path: str, flush_interval: float):
+        self.env = env
+        self.path = path
+        self.flushing_path = path + '.flushing'
+        self.flush_interval = flush_interval
+
+        # changes left over from before a restart are replayed on the first flush
+        changes = MembershipJournal.read(path)
+        self.size = len(changes)
+        self.pending = MembershipJournal.latest(changes)
+        self.pending_flushing = MembershipJournal.latest(MembershipJournal.read(self.flushing_path))
+        self.file = open(path, 'a')
+
+        self.flush()
+        eventlet.spawn(self.loop)
+
+    def join(self, user_id: str, user_name: str, room_id: str, sid: str = None) -> None:
+        self._append([JOIN, user_id, user_name, room_id, sid])
+
+    def leave(self, user_id: str, room_id: str) -> None:
+        self._append([LEAVE, user_id, None, room_id, None])
+
+    def _append(self, change: list) -> None:
+        self.file.write(json.dumps(change) + '\n')
+        self.file.flush()
+        self.size += 1
+
+        action, user_id, user_name, room_id, _ = change
+        self.pending[(user_id, room_id)] = (action, user_name)
+
+    def _pending_changes(self):
+        # newer changes in the current file override the ones being flushed
+        for key, change in self.pending_flushing.items():
+            if key not in self.pending:
+                yield key, change
+        yield from self.pending.items()
+
+    def pending_rooms_for_user(self, user_id: str) -> (set, set):
+        """
+        :return: a tuple of (rooms joined, rooms left) by the user that are not yet in the db
+        """
+        joined, left = set(), set()
+        for (_user_id, room_id), (action, _) in self._pending_changes():
+            if _user_id == user_id:
+                (joined if action == JOIN else left).add(room_id)
+        return joined, left
+
+    def pending_users_in_room(self, room_id: str) -> (dict, set):
+        """
+        :return: a tuple of ({user_id: user_name} that joined, {user_id} that left) the room but are not yet in the db
+        """
+        joined, left = dict(), set()
+        for (user_id, _room_id), (action, user_name) in self._pending_changes():
+            if _room_id != room_id:
+                continue
+            if action == JOIN:
+                joined[user_id] = user_name
+            else:
+                left.add(user_id)
+        return joined, left
+
+    @staticmethod
+    def latest(changes: list) -> dict:
+        """
+        :return: the last change for each (user, room), as {(user_id, room_id): (action, user_name)}
+        """
+        return {
+            (user_id, room_id): (action, user_name)
+            for action, user_id, user_name, room_id, _ in changes
+        }
+
+    @staticmethod
+    def read(path: str) -> list:
+        if not os.path.exists(path):
+            return list()
+
+        changes = list()
+        with open(path) as f:
+            for line in f:
+                try:
+                    changes.append(json.loads(line))
+                except ValueError:
+                    # partially written last line if the process died while appending
+                    logger.warning('skipping corrupt line in journal {}: {}'.format(path, line))
+
+        return changes
+
+    @staticmethod
+    def coalesce(changes: list) -> (dict, set, set):
+        """
+        reduce a list of changes to the final membership of each (user, room), in the order they happened
+
+        :return: a tuple of ({(user_id, room_id): user_name}, {(user_id, room_id)}, {(user_id, room_id, sid)})
+        """
+        joins, leaves, room_sids = dict(), set(), set()
+
+        for action, user_id, user_name, room_id, sid in changes:
+            key = (user_id, room_id)
+
+            if action == JOIN:
+                leaves.discard(key)
+                joins[key] = user_name
+                if sid is not None:
+                    room_sids.add((user_id, room_id, sid))
+            else:
+                joins.pop(key, None)
+                leaves.add(key)
+
+        return joins, leaves, room_sids
+
+    def _rotate(self) -> None:
+        self.file.close()
+
+        if os.path.exists(self.flushing_path):
+            # a previous flush failed; keep its changes before the new ones
+            with open(self.flushing_path, 'a') as flushing, open(self.path) as current:
+                flushing.write(current.read())
+            os.remove(self.path)
+        else:
+            os.rename(self.path, self.flushing_path)
+
+        self.file = open(self.path, 'a')
+        self.size = 0
+        self.pending_flushing.update(self.pending)
+        self.pending = dict()
+
+    def flush(self) -> None:
+        if self.size == 0 and not os.path.exists(self.flushing_path):
+            return
+
+        self._rotate()
+        changes = MembershipJournal.read(self.flushing_path)
+        start = time.time()
+
+        try:
+            self.env.db.apply_membership_changes(*MembershipJournal.coalesce(changes))
+        except Exception as e:
+            logger.error('could not flush {} journaled joins/leaves, will retry: {}'.format(len(changes), str(e)))
+            logger.exception(traceback.format_exc())
+            self.env.capture_exception(sys.exc_info())
+            self.env.stats.incr('journal.flush.failed')
+            return
+
+        os.remove(self.flushing_path)
+        self.pending_flushing = dict()
+
+        self.env.stats.timing('journal.flush.latency', (time.time() - start) * 1000)
+        self.env.stats.gauge('journal.flush.size', len(changes))
+
+    def loop(self):
+        while True:
+            try:
+                eventlet.sleep(self.flush_interval)
+            except InterruptedError:
+                logger.info('interrupted, flushing and exiting loop')
+                self.flush()
+                break
+
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error('could not flush journal: {}'.format(str(e)))
+                logger.exception(traceback.format_exc())
@@ -4,12 +4,11 @@ import time
 import traceback
 from abc import ABC
 
-from eventlet.semaphore import Semaphore
 from kombu.pools import producers
 
 from dino import environ
 from dino.config import ConfigKeys
-from dino.utils.decorators import locked_method
+from dino.utils.dedup import DedupCache
 
 
 class PublishException(Exception):
@@ -18,12 +17,11 @@ class PublishException(Exception):
 
 class BasePublisher(ABC):
     def __init__(self, env, is_external_queue: bool, queue_type: str, logger):
-        self._lock = Semaphore(value=1)
         self.env = env
         self.logger = logger
         self.queue_type = queue_type
-        self.recently_sent_external_hash = set()
-        self.recently_sent_external_list = list()
+        self.recently_sent_external = DedupCache.from_config(env, 'publish.{}'.format(
+            'external' if is_external_queue else 'internal'))
 
         self.is_external_queue = is_external_queue
         if is_external_queue:
@@ -35,12 +33,13 @@ class BasePublisher(ABC):
         self.queue = None
         self.exchange = None
         self.message_type = 'external' if self.is_external_queue else 'internal'
+        self.compression = env.config.get(ConfigKeys.COMPRESSION, domain=self.domain_key, default=None)
 
     def error_callback(self, exc, interval) -> None:
         self.logger.warning('could not connect to MQ (interval: %s): %s' % (str(interval), str(exc)))
 
     def try_publish(self, message, topic: str = None):
-        self.logger.info('sending "{}" with "{}"'.format(self.message_type, str(self.queue_connection)))
+        self.logger.debug('sending "{}" with "{}"'.format(self.message_type, str(self.queue_connection)))
 
         with producers[self.queue_connection].acquire(block=False) as producer:
             amqp_publish = self.queue_connection.ensure(
@@ -53,9 +52,59 @@ class BasePublisher(ABC):
             amqp_publish(
                 message,
                 exchange=self.exchange,
-                declare=[self.exchange, self.queue]
+                declare=[self.exchange, self.queue],
+                compression=self.compression
             )
 
+    def publish_to_node(self, message: dict, queue_name: str) -> None:
+        """
+        publish on the default exchange, which routes on queue name, so only the node consuming that queue gets it
+        """
+        self.logger.debug('sending "{}" to "{}" with "{}"'.format(
+            self.message_type, queue_name, str(self.queue_connection)))
+
+        with producers[self.queue_connection].acquire(block=True) as producer:
+            amqp_publish = self.queue_connection.ensure(
+                producer,
+                producer.publish,
+                errback=self.error_callback,
+                max_retries=3
+            )
+
+            amqp_publish(
+                message,
+                exchange='',
+                routing_key=queue_name,
+                compression=self.compression
+            )
+
+    def publish_batch(self, messages: list) -> None:
+        """
+        publish a list of (message, topic) tuples on one producer (and channel), declaring the exchange and queue
+        only once for the whole batch; used by BatchingPublisher
+        """
+        self.logger.debug('sending {} "{}" events with "{}"'.format(
+            len(messages), self.message_type, str(self.queue_connection)))
+
+        with producers[self.queue_connection].acquire(block=True) as producer:
+            amqp_publish = self.queue_connection.ensure(
+                producer,
+                producer.publish,
+                errback=self.error_callback,
+                max_retries=3
+            )
+
+            declare = [self.exchange, self.queue]
+            for message, topic in messages:
+                amqp_publish(
+                    message,
+                    exchange=self.exchange,
+                    declare=declare,
+                    compression=self.compression
+                )
+                declare = None
+                self.update_recently_sent(topic, message['id'])
+
     def publish(self, message: dict, topic: str = None) -> None:
         if self.recently_sent_has(topic, message['id']):
             self.logger.debug('ignoring external event with verb %s and id %s, already sent' %
@@ -110,17 +159,10 @@ class BasePublisher(ABC):
     def get_host(self):
         return socket.gethostname()
 
-    @locked_method
     def recently_sent_has(self, topic: str, msg_id: str) -> bool:
         topic_msg_hash = f"{topic or 'default'}|{msg_id}"
-        return topic_msg_hash in self.recently_sent_external_hash
+        return self.recently_sent_external.seen(topic_msg_hash)
 
-    @locked_method
     def update_recently_sent(self, topic: str, msg_id: str) -> None:
         topic_msg_hash = f"{topic or 'default'}|{msg_id}"
-        self.recently_sent_external_hash.add(topic_msg_hash)
-        self.recently_sent_external_list.append(topic_msg_hash)
-
-        if len(self.recently_sent_external_list) > 100:
-            old_id = self.recently_sent_external_list.pop(0)
-            self.recently_sent_external_hash.remove(old_id)
+        self.recently_sent_external.add(topic_msg_hash)
@@ -0,0 +1,120 @@
+import logging
+import sys
+import time
+import traceback
+from collections import deque
+
+import eventlet
+
+from dino.endpoint.base import PublishException
+
+logger = logging.getLogger(__name__)
+
+
+class BatchingPublisher(object):
+    """
+    Buffers external events in a bounded ring buffer and hands them to the wrapped publisher in batches, either when
+    'batch_size' events are waiting or every 'flush_interval' seconds, whichever comes first. Publishing an event is
+    then a deque append instead of a green thread and a producer checkout per event.
+
+    If the buffer is full (the queue is down or too slow), the oldest event is dropped to make room; drops, buffer
+    size and flush latency are reported as stats:
+
+        publish.external.dropped
+        publish.external.buffer  (events waiting when a flush starts)
+        publish.external.batch  (events in the last flush)
+        publish.external.flush.latency
+
+    A batch that fails is retried one event at a time through the publisher's normal publish(), which retries and
+    falls back to the internal queue like an unbatched publish would.
+    """
+
+    def __init__(self, env, publisher, batch_size: int, flush_interval: float, max_size: int = 10000):
+        self.env = env
+        self.publisher = publisher
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_size = max_size
+        self.buffer = deque(maxlen=max_size)
+        self.flushing = False
+
+        eventlet.spawn(self.loop)
+
+    def publish(self, message: dict, topic: str = None) -> None:
+        if self.publisher.recently_sent_has(topic, message['id']):
+            logger.debug('ignoring external event with verb %s and id %s, already sent' % (
+                message['verb'], message['id']))
+            return
+
+        if len(self.buffer) >= self.max_size:
+            # the deque drops the oldest event on append
+            self.env.stats.incr('publish.external.dropped')
+
+        self.buffer.append((message, topic))
+
+        if len(self.buffer) >= self.batch_size and not self.flushing:
+            self.flushing = True
+            eventlet.spawn_n(self.flush)
+
+    def _next_batch(self) -> list:
+        batch = list()
+        while len(batch) < self.batch_size and len(self.buffer) > 0:
+            batch.append(self.buffer.popleft())
+        return batch
+
+    def flush(self) -> None:
+        self.flushing = True
+
+        try:
+            if len(self.buffer) == 0:
+                return
+
+            self.env.stats.gauge('publish.external.buffer', len(self.buffer))
+
+            while len(self.buffer) > 0:
+                batch = self._next_batch()
+                start = time.time()
+
+                try:
+                    self.publisher.publish_batch(batch)
+                except Exception as e:
+                    logger.error('could not publish batch of {} external events: {}'.format(len(batch), str(e)))
+                    logger.exception(traceback.format_exc())
+                    self.env.stats.incr('publish.error')
+                    self._publish_one_by_one(batch)
+
+                self.env.stats.timing('publish.external.flush.latency', (time.time() - start) * 1000)
+                self.env.stats.gauge('publish.external.batch', len(batch))
+        finally:
+            self.flushing = False
+
+    def _publish_one_by_one(self, batch: list) -> None:
+        for message, topic in batch:
+            try:
+                # events in the batch that did make it are skipped as recently sent
+                self.publisher.publish(message, topic)
+            except PublishException:
+                logger.error('failed to publish external event multiple times! Republishing to internal queue')
+                self.env.internal_publisher.publish(message)
+            except Exception as e:
+                logger.error('could not publish message "%s", because: %s' % (str(message), str(e)))
+                logger.exception(traceback.format_exc())
+                self.env.capture_exception(sys.exc_info())
+
+    def loop(self):
+        while True:
+            try:
+                eventlet.sleep(self.flush_interval)
+            except InterruptedError:
+                logger.info('interrupted, flushing and exiting loop')
+                self.flush()
+                break
+
+            if self.flushing:
+                continue
+
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error('could not flush external events: {}'.format(str(e)))
+                logger.exception(traceback.format_exc())
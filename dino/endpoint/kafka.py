@@ -35,15 +35,28 @@ class KafkaPublisher(BasePublisher):
         from kafka import KafkaProducer
         import json
 
+        # the producer batches sends per partition itself; waiting up to 'linger_ms' for a batch to fill up means
+        # fewer and larger requests to the brokers, optionally compressed ('gzip', 'snappy', 'lz4' or 'zstd')
+        producer_options = dict()
+        linger_ms = env.config.get(ConfigKeys.LINGER_MS, domain=self.domain_key, default=None)
+        batch_bytes = env.config.get(ConfigKeys.BATCH_BYTES, domain=self.domain_key, default=None)
+        if linger_ms is not None:
+            producer_options['linger_ms'] = int(linger_ms)
+        if batch_bytes is not None:
+            producer_options['batch_size'] = int(batch_bytes)
+        if self.compression is not None:
+            producer_options['compression_type'] = self.compression
+
         self.queue = eq_queue
         self.queue_connection = KafkaProducer(
             bootstrap_servers=eq_host,
             value_serializer=lambda v: json.dumps(v).encode('utf-8'),
-            api_version_auto_timeout_ms=10000
+            api_version_auto_timeout_ms=10000,
+            **producer_options
         )
         logger.info('setting up pubsub for type "{}: and host(s) "{}"'.format(self.queue_type, ','.join(eq_host)))
 
-    def try_publish(self, message, topic: str = None):
+    def _prepare(self, message) -> (dict, bytes):
         if self.env.enrichment_manager is not None:
             message = self.env.enrichment_manager.handle(message)
 
@@ -65,6 +78,29 @@ class KafkaPublisher(BasePublisher):
             logger.exception(traceback.format_exc())
             environ.env.capture_exception(partition_e)
 
+        return message, topic_key
+
+    def try_publish(self, message, topic: str = None):
+        message, topic_key = self._prepare(message)
+
         # for kafka, the queue_connection is the KafkaProducer and queue is the topic name
         self.queue_connection.send(
             topic=topic or self.queue, value=message, key=topic_key)
+
+    def publish_batch(self, messages: list) -> None:
+        """
+        hand all messages to the producer without waiting for the brokers; failed sends are counted as
+        'publish.error' when their futures fail
+        """
+        for message, topic in messages:
+            message_id = message['id']
+            message, topic_key = self._prepare(message)
+
+            future = self.queue_connection.send(topic=topic or self.queue, value=message, key=topic_key)
+            future.add_errback(self._send_failed, message_id)
+            self.update_recently_sent(topic, message_id)
+
+    def _send_failed(self, message_id: str, exc) -> None:
+        # called from the producer's io thread, with the args given to add_errback() before the exception
+        logger.error('could not send external event with id {}: {}'.format(message_id, str(exc)))
+        self.env.stats.incr('publish.error')
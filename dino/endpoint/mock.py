@@ -12,6 +12,13 @@ class MockPublisher(BasePublisher):
     def try_publish(self, message, topic: str = None):
         self.logger.info('sending "{}" with "{}"'.format(self.message_type, str(self.queue_connection)))
 
+    def publish_to_node(self, message: dict, queue_name: str) -> None:
+        self.logger.debug('published event with verb {} id {} to {}'.format(message['verb'], message['id'], queue_name))
+
+    def publish_batch(self, messages: list) -> None:
+        for message, topic in messages:
+            self.publish(message, topic)
+
     def publish(self, message: dict, topic: str = None) -> None:
         if self.recently_sent_has(topic, message['id']):
             self.logger.debug(
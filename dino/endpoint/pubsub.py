@@ -20,13 +20,16 @@ else:
 class PubSub(object):
     def __init__(self, env):
         self.env = env
+        self.external_batched = False
 
         if len(self.env.config) == 0 or self.env.config.get(ConfigKeys.TESTING, False):
             self.env.publish = PubSub.mock_publish
+            self.env.publish_to_nodes = PubSub.mock_publish_to_nodes
             return
 
         conf = self.env.config
         self.env.publish = self.do_publish
+        self.env.publish_to_nodes = self.do_publish_to_nodes
 
         self._setup_internal_queue(conf, env)
         self._setup_external_queue(conf, env)
@@ -51,6 +54,10 @@ class PubSub(object):
         else:
             raise RuntimeError('unknown message queue type "{}"'.format(queue_type))
 
+        # other nodes can publish straight to this node's queue, see do_publish_to_nodes()
+        if self.env.internal_publisher.queue is not None:
+            self.env.node_queue = self.env.internal_publisher.queue.name
+
     def _setup_external_queue(self, conf, env):
         ext_queue_type = conf.get(ConfigKeys.TYPE, domain=ConfigKeys.EXTERNAL_QUEUE)
         if ext_queue_type is None:
@@ -80,11 +87,33 @@ class PubSub(object):
                     ext_queue_type)
             )
 
+        self._setup_external_batching(conf, env)
+
+    def _setup_external_batching(self, conf, env):
+        batch_size = int(conf.get(ConfigKeys.BATCH_SIZE, domain=ConfigKeys.EXTERNAL_QUEUE, default=0))
+        if batch_size <= 0:
+            return
+
+        from dino.endpoint.batching import BatchingPublisher
+        self.env.external_publisher = BatchingPublisher(
+            env,
+            self.env.external_publisher,
+            batch_size=batch_size,
+            flush_interval=float(conf.get(ConfigKeys.FLUSH_INTERVAL, domain=ConfigKeys.EXTERNAL_QUEUE, default=0.1)),
+            max_size=int(conf.get(ConfigKeys.MAX_SIZE, domain=ConfigKeys.EXTERNAL_QUEUE, default=10000))
+        )
+        self.external_batched = True
+        logger.info('batching external events, batch size {}'.format(batch_size))
+
     def do_publish(self, message: dict, external: bool = None, topic: str = None):
         logger.debug('publish: verb %s id %s external? %s' % (message['verb'], message['id'], str(external or False)))
         if external is None or not external:
             external = False
 
+        # only appends to the buffer, no need for a green thread
+        if external and self.external_batched:
+            return self.env.external_publisher.publish(message, topic)
+
         # avoid hanging clients
         eventlet.spawn(self._do_publish_async, message, external, topic)
 
@@ -117,6 +146,32 @@ class PubSub(object):
             environ.env.capture_exception(sys.exc_info())
         return None
 
+    def do_publish_to_nodes(self, message: dict, nodes: set):
+        """
+        publish on the internal queue of only the given nodes, instead of to all nodes
+
+        :param message: the event to publish
+        :param nodes: names of the internal queues of the nodes, see ICache.get_nodes_for_sids()
+        """
+        logger.debug('publish: verb %s id %s to nodes %s' % (message['verb'], message['id'], ','.join(nodes)))
+        eventlet.spawn(self._do_publish_to_nodes_async, message, nodes)
+
+    def _do_publish_to_nodes_async(self, message: dict, nodes: set):
+        try:
+            for node in nodes:
+                self.env.internal_publisher.publish_to_node(message, node)
+        except Exception as e:
+            logger.error('could not publish message to nodes "%s", because: %s; publishing to all nodes' % (
+                ','.join(nodes), str(e)))
+            logger.exception(traceback.format_exc())
+            self.env.stats.incr('publish.error')
+            return self._do_publish_internal(message)
+        return None
+
     @staticmethod
     def mock_publish(message, external=False):
         pass
+
+    @staticmethod
+    def mock_publish_to_nodes(message, nodes):
+        pass
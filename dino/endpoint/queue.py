@@ -13,6 +13,8 @@ from dino.exceptions import NoSuchUserException
 from dino.environ import GNEnvironment
 from dino import environ
 from dino import utils
+from dino.utils.dedup import DedupCache
+from dino.endpoint.sessions import LocalSessions
 
 __author__ = 'Oscar Eriksson <oscar.eriks@gmail.com>'
 
@@ -30,10 +32,9 @@ class QueueHandler(object):
     def __init__(self, socketio, env: GNEnvironment):
         self.socketio = socketio
         self.env = env
-        self.recently_delegated_events = list()
-        self.recently_delegated_events_set = set()
-        self.recently_handled_events = list()
-        self.recently_handled_events_set = set()
+        self.recently_delegated_events = DedupCache.from_config(env, 'queue.delegated')
+        self.recently_handled_events = DedupCache.from_config(env, 'queue.handled')
+        self.local_sessions = LocalSessions()
 
     def user_is_on_this_node_ignore_rooms(self, activity: Activity) -> bool:
         if self.env.node not in {'app', 'wio'}:
@@ -42,6 +43,9 @@ class QueueHandler(object):
         namespace = activity.target.url or '/ws'
         user_id = activity.object.id or activity.target.id
 
+        if namespace == '/ws':
+            return self.local_sessions.has_user(user_id)
+
         if hasattr(activity.actor, 'content') and activity.actor.content is not None and len(activity.actor.content):
             user_sids = activity.actor.content.split(",")
         else:
@@ -70,6 +74,10 @@ class QueueHandler(object):
         room_id = activity.target.id
         namespace = activity.target.url or '/ws'
         user_id = activity.object.id or activity.target.id
+
+        if namespace == '/ws':
+            return self._user_is_in_local_room(user_id, room_id, namespace)
+
         user_sids = utils.get_sids_for_user_id(user_id)
         users = list()
 
@@ -100,6 +108,28 @@ class QueueHandler(object):
             logger.exception(traceback.format_exc())
             return False
 
+    def _user_is_in_local_room(self, user_id: str, room_id: str, namespace: str) -> bool:
+        # only the user's own sids need to be checked against the room, and only if any are on this node
+        user_sids = self.local_sessions.sids_for_user(user_id)
+        if len(user_sids) == 0:
+            logger.debug('no user %s for namespace [%s] on this node' % (user_id, namespace))
+            return False
+
+        if room_id is None:
+            return True
+
+        try:
+            users = self.socketio.server.manager.rooms[namespace].get(room_id)
+        except KeyError as e:
+            logger.warning('namespace %s does not exist (maybe this is web/rest node?): %s' % (namespace, str(e)))
+            return False
+
+        if users is None:
+            logger.warning('no room %s for namespace [%s] (or room is empty/removed)' % (room_id, namespace))
+            return False
+
+        return any(user_sid in users for user_sid in user_sids)
+
     def create_ban_even_if_not_on_this_node(self, activity: Activity) -> None:
         """
         since bans can be created through the rest api we need to create the ban even though the user might not be on
@@ -140,23 +170,42 @@ class QueueHandler(object):
             else:
                 logger.info('banning user %s in room %s for %s' % (banned_id, target_id, ban_duration))
                 self.env.db.ban_user_room(banned_id, ban_timestamp, ban_duration, target_id, reason, banner_id)
+
+            if self.env.ban_index is not None:
+                self.env.ban_index.add(target_type, target_id, banned_id, ban_timestamp)
         except KeyError as ke:
             logger.error('could not ban: %s' % str(ke))
             logger.exception(traceback.format_exc())
 
+    def update_ban_index(self, activity: Activity) -> None:
+        """
+        bans are added to the index when created, see create_ban_even_if_not_on_this_node(); unbans and mutes
+        are only published to keep the ban index on each node up to date
+        """
+        if self.env.ban_index is None:
+            return
+
+        user_id = activity.object.id
+        target_type = activity.target.object_type
+        target_id = activity.target.id
+
+        if activity.verb == 'unban':
+            if target_type not in {'channel', 'room'}:
+                target_type, target_id = 'global', ''
+            self.env.ban_index.remove(target_type, target_id, user_id)
+
+        elif activity.verb == 'mute':
+            end_time = datetime.strptime(activity.object.updated, ConfigKeys.DEFAULT_DATE_FORMAT)
+            self.env.ban_index.add('mute', target_id, user_id, end_time.timestamp())
+
+        elif activity.verb == 'unmute':
+            self.env.ban_index.remove('mute', target_id, user_id)
+
     def update_recently_delegated_events(self, activity_id: str) -> None:
-        self.recently_delegated_events.append(activity_id)
-        self.recently_delegated_events_set.add(activity_id)
-        if len(self.recently_delegated_events) > 100:
-            self.recently_delegated_events_set.remove(self.recently_delegated_events[0])
-            del self.recently_delegated_events[0]
+        self.recently_delegated_events.add(activity_id)
 
     def update_recently_handled_events(self, activity_id: str) -> None:
-        self.recently_handled_events.append(activity_id)
-        self.recently_handled_events_set.add(activity_id)
-        if len(self.recently_handled_events) > 100:
-            self.recently_handled_events_set.remove(self.recently_handled_events[0])
-            del self.recently_handled_events[0]
+        self.recently_handled_events.add(activity_id)
 
     def handle_send_event(self, data: dict, activity: Activity):
         if not self.user_is_on_this_node(activity):
@@ -166,9 +215,25 @@ class QueueHandler(object):
         environ.env.out_of_scope_emit('message', data, room=target_id, json=True, namespace='/ws', broadcast=True)
 
     def send_event_to_other_node(self, data: dict) -> None:
-        logger.info('user is not on this node, will publish on queue for other nodes to try')
         self.update_recently_delegated_events(data['id'])
 
+        # if the presence registry knows which nodes the user is on, send it only there, once; those nodes ignore it
+        # if they've already handled it from the original publish
+        nodes = utils.get_nodes_for_user_id(data['object']['id'], self.env)
+        if nodes is not None:
+            nodes.discard(self.env.node_queue)
+            if len(nodes) > 0:
+                logger.info('user is not on this node, will publish to node(s) {}'.format(','.join(nodes)))
+                self.env.publish_to_nodes(data, nodes)
+                return
+
+            # the registry says the user is only on this node, but we just found they're not, so it's stale (e.g. a
+            # node crashed before removing the sessions); fall back to broadcasting instead of dropping the event
+            logger.warning('presence registry only lists this node for user {}, will broadcast'.format(
+                data['object']['id']))
+
+        logger.info('user is not on this node, will publish on queue for other nodes to try')
+
         if 'revision' not in data:
             data['revision'] = 0
         else:
@@ -220,10 +285,10 @@ class QueueHandler(object):
             logger.exception(traceback.format_exc())
 
     def _handle_server_activity(self, data: dict, activity: Activity) -> None:
-        if activity.id in self.recently_delegated_events_set:
+        if self.recently_delegated_events.seen(activity.id):
             return
 
-        if activity.id in self.recently_handled_events_set:
+        if self.recently_handled_events.seen(activity.id):
             return
 
         if 'revision' in data:
@@ -237,6 +302,9 @@ class QueueHandler(object):
         logger.debug('got internally published event with verb %s id %s' % (activity.verb, activity.id))
         self.update_recently_handled_events(activity.id)
 
+        if activity.verb == 'unban':
+            self.update_ban_index(activity)
+
         if activity.verb in ['ban', 'kick', 'remove']:
             self.handle_local_node_events(data, activity)
 
@@ -254,6 +322,9 @@ class QueueHandler(object):
         elif activity.verb == 'send':
             self.handle_send_event(data, activity)
 
+        elif activity.verb in ['mute', 'unmute']:
+            self.update_ban_index(activity)
+
         else:
             # otherwise it's external events for possible analysis
             environ.env.publish(data, external=True)
@@ -0,0 +1,75 @@
+import logging
+
+__author__ = 'Oscar Eriksson <oscar.eriks@gmail.com>'
+
+logger = logging.getLogger(__name__)
+
+
+class LocalSessions(object):
+    """
+    index of the sessions connected to this node, kept up to date by the connect, login and disconnect handlers in
+    dino.endpoint.sockets, so checking if a user is on this node doesn't need a lookup of the user's sids in redis and
+    a scan of the socketio rooms, and counting sessions is reading a counter per namespace
+
+    only green threads of this process touch it and nothing in here yields, so no locking is needed
+    """
+
+    def __init__(self):
+        self.sids_by_user = dict()
+        self.user_by_sid = dict()
+        self.namespace_by_sid = dict()
+        self.counts = dict()
+
+    def connect(self, sid: str, namespace: str = '/ws') -> None:
+        if sid in self.namespace_by_sid:
+            return
+
+        self.namespace_by_sid[sid] = namespace
+        self.counts[namespace] = self.counts.get(namespace, 0) + 1
+
+    def login(self, user_id: str, sid: str) -> None:
+        user_id = str(user_id)
+        previous_user_id = self.user_by_sid.get(sid)
+        if previous_user_id is not None and previous_user_id != user_id:
+            self._remove_sid_for_user(previous_user_id, sid)
+
+        self.connect(sid)
+        self.user_by_sid[sid] = user_id
+        self.sids_by_user.setdefault(user_id, set()).add(sid)
+
+    def disconnect(self, sid: str) -> None:
+        namespace = self.namespace_by_sid.pop(sid, None)
+        if namespace is None:
+            return
+
+        self.counts[namespace] -= 1
+
+        user_id = self.user_by_sid.pop(sid, None)
+        if user_id is not None:
+            self._remove_sid_for_user(user_id, sid)
+
+    def _remove_sid_for_user(self, user_id: str, sid: str) -> None:
+        sids = self.sids_by_user.get(user_id)
+        if sids is None:
+            return
+
+        sids.discard(sid)
+        if len(sids) == 0:
+            del self.sids_by_user[user_id]
+
+    def sids_for_user(self, user_id: str) -> set:
+        return self.sids_by_user.get(str(user_id), set())
+
+    def has_user(self, user_id: str) -> bool:
+        return str(user_id) in self.sids_by_user
+
+    def count(self, namespace: str = None) -> int:
+        """
+        number of sessions on this node, in one namespace or in total
+        """
+        if namespace is not None:
+            return self.counts.get(namespace, 0)
+        return len(self.namespace_by_sid)
+
+    def __len__(self) -> int:
+        return len(self.namespace_by_sid)
@@ -6,6 +6,7 @@ import eventlet
 
 import activitystreams as as_parser
 
+from functools import wraps
 from typing import Union
 from uuid import uuid4 as uuid
 
@@ -16,6 +17,7 @@ from kombu.mixins import ConsumerMixin
 from dino import api
 from dino import environ
 from dino.config import ConfigKeys
+from dino.config import ErrorCodes
 from dino.config import SessionKeys
 from dino.config import RedisKeys
 from dino.utils.decorators import pre_process, can_use_room_name
@@ -28,6 +30,98 @@ from dino.endpoint.queue import QueueHandler
 
 logger = logging.getLogger(__name__)
 queue_handler = QueueHandler(socketio, environ.env)
+local_sessions = queue_handler.local_sessions
+
+
+class AdmissionController(object):
+    """
+    token bucket per node for expensive events (login, join), to flatten the burst of work hitting
+    the db and redis when all clients reconnect at once after a node restart
+
+    each event takes one token; when the bucket is empty the event reserves the next free token
+    and waits for it, so queued events are processed in order at the configured rate; events that
+    would have to wait longer than max_wait are rejected with a retry-after hint instead
+    """
+
+    def __init__(self, rate: float, burst: int, max_wait: float):
+        self.rate = rate
+        self.burst = burst
+        self.max_wait = max_wait
+        self.tokens = float(burst)
+        self.last_refill = time.monotonic()
+        self.queued = 0
+        self.last_reported = 0
+
+    @staticmethod
+    def create(env):
+        admission = env.config.get(ConfigKeys.ADMISSION, default=None)
+        if env.config.get(ConfigKeys.TESTING, False) or admission is None:
+            return None
+
+        rate = float(admission.get(ConfigKeys.RATE, 0))
+        if rate <= 0:
+            return None
+
+        return AdmissionController(
+            rate=rate,
+            burst=int(admission.get(ConfigKeys.BURST, rate)),
+            max_wait=float(admission.get(ConfigKeys.MAX_WAIT, 10))
+        )
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(float(self.burst), self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def _report_queue(self, now: float) -> None:
+        if now - self.last_reported < 1:
+            return
+        self.last_reported = now
+        environ.env.stats.gauge('admission.queue', self.queued)
+
+    def admit(self) -> Union[float, None]:
+        """
+        :return: None if the event was admitted (possibly after waiting), otherwise the number of seconds
+        the client should wait before trying again
+        """
+        now = time.monotonic()
+        self._refill(now)
+
+        self.tokens -= 1
+        if self.tokens >= 0:
+            return None
+
+        wait = -self.tokens / self.rate
+        if wait > self.max_wait:
+            # give back the reservation, the client will have to come back later
+            self.tokens += 1
+            return wait
+
+        self.queued += 1
+        self._report_queue(now)
+        try:
+            eventlet.sleep(wait)
+        finally:
+            self.queued -= 1
+            self._report_queue(time.monotonic())
+
+        return None
+
+
+admission_controller = AdmissionController.create(environ.env)
+
+
+def admission_control(event_name: str):
+    def factory(view_func):
+        @wraps(view_func)
+        def decorator(*args, **kwargs):
+            if admission_controller is not None:
+                retry_after = admission_controller.admit()
+                if retry_after is not None:
+                    environ.env.stats.incr(event_name + '.rejected')
+                    return ErrorCodes.TRY_AGAIN_LATER, {'retry_after': int(retry_after) + 1}
+            return view_func(*args, **kwargs)
+        return decorator
+    return factory
 
 
 class Worker(ConsumerMixin):
@@ -82,23 +176,17 @@ def online_counter():
 
     with GracefulInterruptHandler() as interrupt_handler:
         while True:
-            session_ids = set()
-
             try:
-                for namespace in socketio.server.manager.get_namespaces():
-                    session_ids.update(socketio.server.manager.rooms[namespace][None].keys())
-
-                environ.env.cache.set_session_count(len(session_ids))
-            except KeyError:
-                # happens when there's no one online, just ignore
-                pass
+                # the counts are kept up to date on connect/disconnect, so this is only reporting them
+                for namespace in list(local_sessions.counts.keys()):
+                    environ.env.stats.gauge(
+                        'sessions.{}.count'.format(namespace.strip('/')), local_sessions.count(namespace))
+
+                session_count = local_sessions.count()
+                environ.env.stats.gauge('sessions.count', session_count)
+                environ.env.cache.set_session_count(session_count)
             except Exception as e:
                 logger.error('could not count sessions: {}'.format(str(e)))
-                logger.error('current namespaces->rooms: {}'.format(socketio.server.manager.rooms))
-                logger.error('current rooms for namespace "{}": {}'.format(
-                    namespace,
-                    socketio.server.manager.rooms[namespace])
-                )
                 logger.exception(e)
                 time.sleep(1)
 
@@ -216,17 +304,21 @@ def error_handler_chat(e):
 @respond_with('gn_connect')
 @count_connections('connect')
 def connect() -> (int, None):
+    local_sessions.connect(environ.env.request.sid, '/ws')
     return api.connect()
 
 
 @socketio.on('login', namespace='/ws')
 @respond_with('gn_login', should_disconnect=True)
+@admission_control('on_login')
 @pre_process('on_login', should_validate_request=False)
 def on_login(data: dict, activity: Activity) -> (int, str):
     try:
         status_code, msg = api.on_login(data, activity)
         if status_code != 200:
             disconnect()
+        else:
+            local_sessions.login(activity.actor.id, environ.env.request.sid)
         return status_code, msg
     except Exception as e:
         logger.error('could not login, will disconnect client: %s' % str(e))
@@ -350,6 +442,7 @@ def on_history(data: dict, activity: Activity) -> (int, Union[str, dict, None]):
 @socketio.on('join', namespace='/ws')
 @can_use_room_name()
 @respond_with('gn_join')
+@admission_control('on_join')
 @pre_process('on_join')
 def on_join(data: dict, activity: Activity) -> (int, Union[str, dict, None]):
     return api.on_join(data, activity)
@@ -409,4 +502,5 @@ def on_leave(data: dict, activity: Activity) -> (int, Union[str, dict, None]):
 @socketio.on('disconnect', namespace='/ws')
 @count_connections('disconnect')
 def on_disconnect() -> (int, None):
+    local_sessions.disconnect(environ.env.request.sid)
     return api.on_disconnect()
@@ -13,11 +13,13 @@
 import yaml
 import json
 import os
+import re
 import pkg_resources
 import logging
 import eventlet
 
 from typing import Union
+from collections.abc import Mapping
 from types import MappingProxyType
 from base64 import b64encode
 
@@ -93,6 +95,71 @@ def find_bind_port():
         return 0
 
 
+CONFIG_PLACEHOLDER = re.compile('{.*?}')
+
+
+def _config_format(s, key, params):
+    if s is None:
+        return s
+
+    if isinstance(s, list):
+        return [_config_format(r, key, params) for r in s]
+
+    if isinstance(s, dict):
+        kw = dict()
+        for k, v in s.items():
+            kw[k] = _config_format(v, key, params)
+        return kw
+
+    if not isinstance(s, str):
+        return s
+
+    if s.lower() == 'null' or s.lower() == 'none':
+        return ''
+
+    # most values don't reference other keys, no need to search for placeholders
+    if '{' not in s:
+        return s
+
+    try:
+        keydb = set('{' + key + '}')
+
+        while True:
+            sres = CONFIG_PLACEHOLDER.search(s)
+            if sres is None:
+                break
+
+            # avoid using the same reference twice
+            if sres.group() in keydb:
+                raise RuntimeError(
+                        "found circular dependency in config value '{0}' using reference '{1}'".format(
+                                s, sres.group()))
+            keydb.add(sres.group())
+            s = s.format(**params)
+
+        return s
+    except KeyError as e:
+        raise RuntimeError("missing configuration key: " + str(e))
+
+
+def _freeze_config_value(value):
+    # the resolved values are shared by every caller, so containers are handed out as read-only views
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze_config_value(v) for v in value)
+    if isinstance(value, Mapping):
+        return MappingProxyType({k: _freeze_config_value(v) for k, v in value.items()})
+    return value
+
+
+def _thaw_config_value(value):
+    # for init code that modifies a value before set()ing it back
+    if isinstance(value, (list, tuple)):
+        return [_thaw_config_value(v) for v in value]
+    if isinstance(value, Mapping):
+        return {k: _thaw_config_value(v) for k, v in value.items()}
+    return value
+
+
 class ConfigDict:
     class DefaultValue:
         def __init__(self):
@@ -108,6 +175,41 @@ class ConfigDict:
         self.params = params or dict()
         self.override = override
 
+        # formatted values for (domain, key), resolved once instead of on every get()
+        self.resolved = dict()
+        self._resolve_all()
+
+    def _resolve_all(self) -> None:
+        self.resolved = dict()
+
+        for key, value in self.params.items():
+            to_resolve = [(None, key, value)]
+            if isinstance(value, dict):
+                to_resolve.extend([(key, k, v) for k, v in value.items() if v is not None])
+
+            for domain, _key, _value in to_resolve:
+                try:
+                    self._resolve(domain, _key, _value)
+                except RuntimeError:
+                    # will raise again if the key is used, but unused keys shouldn't prevent loading the config
+                    pass
+
+    def _resolve(self, domain, key, value):
+        cache_key = (domain, key)
+        if cache_key not in self.resolved:
+            self.resolved[cache_key] = _freeze_config_value(_config_format(value, key, self.params))
+        return self.resolved[cache_key]
+
+    def _formatted(self, domain, key, value, params):
+        # explicitly supplied params are not cached since they can differ between calls
+        if params is not None:
+            return _config_format(value, key, params)
+
+        resolved = self.resolved.get((domain, key), ConfigDict.DefaultValue)
+        if resolved is ConfigDict.DefaultValue:
+            resolved = self._resolve(domain, key, value)
+        return resolved
+
     def subp(self, parent):
         p = dict(parent.params)
         p.update(self.params)
@@ -130,53 +232,13 @@ class ConfigDict:
                 self.params[domain] = dict()
             self.params[domain][key] = val
 
+        # values can reference other keys, so everything needs to be formatted again
+        self._resolve_all()
+
     def keys(self):
         return self.params.keys()
 
     def get(self, key, default: Union[None, object]=DefaultValue, params=None, domain=None):
-        def config_format(s, _params):
-            if s is None:
-                return s
-
-            if isinstance(s, list):
-                return [config_format(r, _params) for r in s]
-
-            if isinstance(s, dict):
-                kw = dict()
-                for k, v in s.items():
-                    kw[k] = config_format(v, _params)
-                return kw
-
-            if not isinstance(s, str):
-                return s
-
-            if s.lower() == 'null' or s.lower() == 'none':
-                return ''
-
-            try:
-                import re
-                keydb = set('{' + key + '}')
-
-                while True:
-                    sres = re.search("{.*?}", s)
-                    if sres is None:
-                        break
-
-                    # avoid using the same reference twice
-                    if sres.group() in keydb:
-                        raise RuntimeError(
-                                "found circular dependency in config value '{0}' using reference '{1}'".format(
-                                        s, sres.group()))
-                    keydb.add(sres.group())
-                    s = s.format(**_params)
-
-                return s
-            except KeyError as e:
-                raise RuntimeError("missing configuration key: " + str(e))
-
-        if params is None:
-            params = self.params
-
         if domain is not None:
             if domain in self.params:
                 # domain keys are allowed to be empty, e.g. for default amqp exchange etc.
@@ -186,15 +248,15 @@ class ConfigDict:
                         return ''
                     return default
 
-                return config_format(value, params)
+                return self._formatted(domain, key, value, params)
 
         if key in self.params:
-            return config_format(self.params.get(key), params)
+            return self._formatted(None, key, self.params.get(key), params)
 
         if default == ConfigDict.DefaultValue:
             raise KeyError(key)
 
-        return config_format(default, params)
+        return _config_format(default, key, self.params if params is None else params)
 
     def __contains__(self, key):
         if key in self.params:
@@ -266,16 +328,20 @@ class GNEnvironment(object):
 
         self.pub_sub = None
         self.publish = lambda message, external: None
+        self.publish_to_nodes = lambda message, nodes: None
         self.internal_publisher = None
         self.external_publisher = None
         self.consume_worker = None
 
         self.blacklist = None
         self.node = None
+        self.node_queue = None
         self.service_config = None
         self.spam = None
         self.heartbeat = None
         self.remote = None
+        self.last_read_buffer = None
+        self.ban_index = None
 
         self.event_validator_map = dict()
         self.event_validators = dict()
@@ -591,7 +657,7 @@ def init_acl_validators(gn_env: GNEnvironment) -> None:
         # assume we're testing
         return
 
-    acl_config = gn_env.config.get(ConfigKeys.ACL)
+    acl_config = _thaw_config_value(gn_env.config.get(ConfigKeys.ACL))
 
     validators = acl_config['validation']
     for acl_type, validation_config in validators.items():
@@ -882,6 +948,7 @@ def init_request_validators(gn_env: GNEnvironment) -> None:
     validation = gn_env.config.get(ConfigKeys.VALIDATION, None)
     if validation is None:
         return
+    validation = _thaw_config_value(validation)
 
     for key in validation.keys():
         if key not in gn_env.event_validator_map:
@@ -1061,7 +1128,67 @@ def init_spam_service(gn_env: GNEnvironment):
         return
 
     from dino.utils.spam import SpamClassifier
-    gn_env.spam = SpamClassifier(gn_env)
+    from dino.utils.spam import SpamBatchClassifier
+
+    classifier = SpamClassifier(gn_env)
+    batch_size = int(gn_env.config.get(ConfigKeys.BATCH_SIZE, domain=ConfigKeys.SPAM, default=1))
+
+    if batch_size <= 1:
+        gn_env.spam = classifier
+        return
+
+    gn_env.spam = SpamBatchClassifier(
+        gn_env, classifier, batch_size,
+        flush_interval=float(gn_env.config.get(ConfigKeys.FLUSH_INTERVAL, domain=ConfigKeys.SPAM, default=0.005)),
+        processes=int(gn_env.config.get(ConfigKeys.PROCESSES, domain=ConfigKeys.SPAM, default=0))
+    )
+
+
+@timeit(logger, 'init write-behind buffers')
+def init_write_behind(gn_env: GNEnvironment):
+    if len(gn_env.config) == 0 or gn_env.config.get(ConfigKeys.TESTING, False):
+        # assume we're testing
+        return
+
+    flush_interval = float(gn_env.config.get(ConfigKeys.FLUSH_INTERVAL, domain=ConfigKeys.WRITE_BEHIND, default=0))
+    if flush_interval > 0:
+        from dino.db.write_behind import LastReadBuffer
+        gn_env.last_read_buffer = LastReadBuffer(gn_env, flush_interval)
+
+    journal_path = gn_env.config.get(ConfigKeys.JOURNAL, domain=ConfigKeys.WRITE_BEHIND, default='')
+    if journal_path is None or len(journal_path.strip()) == 0:
+        return
+
+    db_type = gn_env.config.get(ConfigKeys.DATABASE, dict()).get(ConfigKeys.TYPE, None)
+    if db_type != 'rdbms':
+        logger.warning('journal is only used with the rdbms database, not "{}", ignoring'.format(db_type))
+        return
+
+    from dino.db.write_behind import MembershipJournal
+    gn_env.db.journal = MembershipJournal(
+        gn_env, journal_path.strip(),
+        flush_interval=float(gn_env.config.get(
+            ConfigKeys.JOURNAL_FLUSH_INTERVAL, domain=ConfigKeys.WRITE_BEHIND, default=1))
+    )
+
+
+@timeit(logger, 'init ban index')
+def init_ban_index(gn_env: GNEnvironment):
+    if len(gn_env.config) == 0 or gn_env.config.get(ConfigKeys.TESTING, False):
+        # assume we're testing
+        return
+
+    purge_interval = float(gn_env.config.get(ConfigKeys.PURGE_INTERVAL, domain=ConfigKeys.BAN_INDEX, default=0))
+    if purge_interval <= 0:
+        return
+
+    db_type = gn_env.config.get(ConfigKeys.DATABASE, dict()).get(ConfigKeys.TYPE, None)
+    if db_type != 'rdbms':
+        logger.warning('ban index is only used with the rdbms database, not "{}", ignoring'.format(db_type))
+        return
+
+    from dino.utils.bans import BanIndex
+    gn_env.ban_index = BanIndex(gn_env, purge_interval)
 
 
 @timeit(logger, 'init enrichment service')
@@ -1163,6 +1290,8 @@ def initialize_env(dino_env):
         init_admin_and_admin_room(dino_env)
         init_storage_engine(dino_env)
         init_spam_service(dino_env)
+        init_write_behind(dino_env)
+        init_ban_index(dino_env)
         init_service_config(dino_env)
         init_remote_handler(dino_env)
 
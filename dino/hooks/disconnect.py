@@ -24,37 +24,13 @@ class OnDisconnectHooks(object):
         :return: nothing
         """
 
-        def set_user_offline(user_id, current_sid, user_status):
-            all_sids = utils.get_sids_for_user_id(user_id)
-
-            # update last_online on every session closure
-            if user_status != UserKeys.STATUS_INVISIBLE:
-                try:
-                    environ.env.db._set_last_online(user_id)
-                    environ.env.cache._set_last_online(user_id)
-                except Exception as e:
-                    logger.error('could not set last_online in db for user {}: {}'.format(user_id, str(e)))
-                    logger.exception(traceback.format_exc())
-                    environ.env.capture_exception(sys.exc_info())
-
-            # only one of the user sessions disconnected
-            if len(all_sids) > 1:
+        def set_user_offline(user_id, remaining_sids, user_status):
+            # if the user still has another session up we don't set the user as offline
+            if len(remaining_sids) > 0:
+                logger.debug('when setting user offline, found other sids: [%s]' % ','.join(remaining_sids))
                 return
 
             try:
-                if not utils.is_valid_id(user_id):
-                    logger.warning('got invalid id on disconnect for act: {}'.format(str(activity.id)))
-                    # TODO: sentry
-                    return
-
-                environ.env.db.remove_sid_for_user(user_id, current_sid)
-                all_sids = utils.get_sids_for_user_id(user_id)
-
-                # if the user still has another session up we don't set the user as offline
-                if len(all_sids) > 0:
-                    logger.debug('when setting user offline, found other sids: [%s]' % ','.join(all_sids))
-                    return
-
                 if user_status == UserKeys.STATUS_INVISIBLE:
                     environ.env.cache.remove_from_multicast_on_disconnect(user_id)
                 else:
@@ -65,16 +41,9 @@ class OnDisconnectHooks(object):
                 logger.exception(traceback.format_exc())
                 environ.env.capture_exception(sys.exc_info())
 
-        def leave_private_room(user_id, current_sid):
-            if not utils.is_valid_id(user_id):
-                logger.warning('got invalid id on disconnect for act: {}'.format(str(activity.id)))
-                # TODO: sentry
-                return
-
-            all_sids = utils.get_sids_for_user_id(user_id)
-
+        def leave_private_room(user_id, current_sid, remaining_sids):
             # only one of the user sessions disconnected
-            if len(all_sids) > 1:
+            if len(remaining_sids) > 0:
                 return
 
             try:
@@ -84,21 +53,12 @@ class OnDisconnectHooks(object):
 
                 try:
                     environ.env.leave_room(current_sid)
-                    environ.env.db.remove_sid_for_user(user_id, current_sid)
                 except Exception as e:
-                    logger.warning('could not remove sid {} for user {}: {}'.format(current_sid, user_id, str(e)))
-
-                if user_id is None or len(user_id.strip()) == 0:
-                    return
-
-                all_sids = utils.get_sids_for_user_id(user_id)
-                all_sids = all_sids.copy()
+                    logger.warning('could not leave room for sid {} for user {}: {}'.format(current_sid, user_id, str(e)))
 
-                if len(all_sids) == 0 or (current_sid in all_sids and len(all_sids) == 1):
-                    environ.env.leave_room(user_id)
-                    environ.env.db.reset_sids_for_user(user_id)
-                    for key in SessionKeys.temporary_keys.value:
-                        environ.env.auth.update_session_for_key(activity.actor.id, key, False)
+                environ.env.leave_room(user_id)
+                for key in SessionKeys.temporary_keys.value:
+                    environ.env.auth.update_session_for_key(activity.actor.id, key, False)
 
             except Exception as e:
                 logger.error('could not leave private room: %s' % str(e))
@@ -164,7 +124,7 @@ class OnDisconnectHooks(object):
                 logger.exception(traceback.format_exc())
                 environ.env.capture_exception(sys.exc_info())
 
-        def emit_disconnect_event(user_id, current_sid, user_status) -> None:
+        def emit_disconnect_event(user_id, current_sid, remaining_sids, user_status) -> None:
             try:
                 if is_socket_disconnect:
                     user_name = environ.env.session.get(SessionKeys.user_name.value)
@@ -179,52 +139,27 @@ class OnDisconnectHooks(object):
                     except NoSuchUserException:
                         user_name = '<unknown>'
 
-                all_sids = utils.get_sids_for_user_id(user_id)
-
-                # race condition might lead to db cache saying it's still there or similar
-                make_sure_current_sid_removed(all_sids, user_id, current_sid)
-
-                if user_id is None or user_id == 'None':
-                    logger.warning('blank user_id on disconnect event, trying sid instead')
-
-                    if current_sid is None or current_sid == 'None' or current_sid == '':
-                        logger.error('blank sid as well as blank user id, ignoring disconnect event')
-                        return
-
-                    try:
-                        user_id = utils.get_user_for_sid(current_sid)
-                    except Exception as e:
-                        logger.warning('could not get user id from sid "{}": {}'.format(current_sid, str(e)))
-                        environ.env.capture_exception(sys.exc_info())
-                        user_id = '-1'
-
-                    if user_id is None or len(user_id.strip()) == 0:
-                        logger.warning('blank user id for sid "{}"'.format(current_sid))
-                        user_id = '-1'
-
                 logger.debug(
-                    'sid %s disconnected, all_sids: [%s] for user %s (%s)' % (
-                        current_sid, ','.join(all_sids), user_id, user_name))
+                    'sid %s disconnected, remaining sids: [%s] for user %s (%s)' % (
+                        current_sid, ','.join(remaining_sids), user_id, user_name))
 
-                if user_id != '-1':
-                    sid_ended_event = utils.activity_for_sid_disconnect(user_id, user_name, current_sid)
-                    environ.env.publish(sid_ended_event, external=True)
+                sid_ended_event = utils.activity_for_sid_disconnect(user_id, user_name, current_sid)
+                environ.env.publish(sid_ended_event, external=True)
 
                 # if the user still has another session up we don't send disconnect event
-                if all_sids is not None and len(all_sids) > 0:
+                if len(remaining_sids) > 0:
                     return
 
-                if user_id != '-1':
-                    activity_json = utils.activity_for_disconnect(user_id, user_name)
+                activity_json = utils.activity_for_disconnect(user_id, user_name)
 
-                    # update last_online on every session closure
-                    if user_status == UserKeys.STATUS_INVISIBLE:
-                        # invisible shouldn't get their last online at updated, so use the previous known time
-                        utils.add_last_online_at_to_event(activity_json, use_now=False)
-                    else:
-                        utils.add_last_online_at_to_event(activity_json, use_now=True)
+                # update last_online on every session closure
+                if user_status == UserKeys.STATUS_INVISIBLE:
+                    # invisible shouldn't get their last online at updated, so use the previous known time
+                    utils.add_last_online_at_to_event(activity_json, use_now=False)
+                else:
+                    utils.add_last_online_at_to_event(activity_json, use_now=True)
 
-                    environ.env.publish(activity_json, external=True)
+                environ.env.publish(activity_json, external=True)
 
             except Exception as e:
                 logger.error('could not emit disconnect event: %s' % str(e))
@@ -232,37 +167,77 @@ class OnDisconnectHooks(object):
                 logger.exception(traceback.format_exc())
                 environ.env.capture_exception(sys.exc_info())
 
-        def make_sure_current_sid_removed(all_sids, user_id, current_sid):
+        def get_user_id_for_sid(current_sid):
+            if current_sid is None or current_sid == 'None' or current_sid == '':
+                logger.error('blank sid as well as invalid user id, ignoring disconnect event')
+                return None
+
+            try:
+                user_id = utils.get_user_for_sid(current_sid)
+            except Exception as e:
+                logger.warning('could not get user id from sid "{}": {}'.format(current_sid, str(e)))
+                environ.env.capture_exception(sys.exc_info())
+                return None
+
             if not utils.is_valid_id(user_id):
-                logger.warning('got invalid id on disconnect for act: {}'.format(str(activity.id)))
-                # TODO: sentry
-                return
+                logger.warning('no valid user id for sid "{}", ignoring disconnect event'.format(current_sid))
+                return None
+            return user_id
 
-            if current_sid in all_sids:
-                try:
-                    all_sids.remove(current_sid)
-                    environ.env.db.remove_sid_for_user(user_id, current_sid)
-                except Exception as e:
-                    logger.warning('could not remove current sid: {}'.format(str(e)))
-                    logger.exception(traceback.format_exc())
-                    environ.env.capture_exception(sys.exc_info())
+        def get_remaining_sids(user_id, current_sid):
+            try:
+                sids = utils.get_sids_for_user_id(user_id) or list()
+            except Exception as e:
+                logger.error('could not get sids for user {}: {}'.format(user_id, str(e)))
+                logger.exception(traceback.format_exc())
+                environ.env.capture_exception(sys.exc_info())
+                return None
+            return [sid for sid in sids if sid != current_sid]
 
         data, activity = arg
         _user_id = activity.actor.id
 
+        if is_socket_disconnect:
+            _current_sid = environ.env.request.sid
+        else:
+            _current_sid = 'hb-{}'.format(_user_id)
+
+        if not utils.is_valid_id(_user_id):
+            logger.warning('got invalid id on disconnect for act: {}, trying sid instead'.format(str(activity.id)))
+
+            # the session might have lost the user id, but the sid is still registered for the user
+            _user_id = get_user_id_for_sid(_current_sid)
+            if _user_id is None:
+                return
+            activity.actor.id = _user_id
+
         # TODO: check why we NEED skip_cache=True here, when false, the value we get is not the value we have in
         #  redis; could be the in-memory cache that's containing the incorrect value... check more
         _user_status = utils.get_user_status(_user_id, skip_cache=True)
 
+        # removes the sid (and the room sids) and updates last_online on every session closure, using one
+        # transaction in the db and one pipeline in redis, instead of fetching the sids again for each step
+        try:
+            _remaining_sids = utils.disconnect_session(
+                _user_id, _current_sid, update_last_online=_user_status != UserKeys.STATUS_INVISIBLE)
+        except Exception as e:
+            logger.error('could not remove sid {} for user {}: {}'.format(_current_sid, _user_id, str(e)))
+            logger.exception(traceback.format_exc())
+            environ.env.capture_exception(sys.exc_info())
+
+            # other sessions might still be up, so don't treat the user as offline without checking
+            _remaining_sids = get_remaining_sids(_user_id, _current_sid)
+            if _remaining_sids is None:
+                logger.warning('not handling disconnect of sid {} for user {}, unknown if other sessions are up'.format(
+                    _current_sid, _user_id))
+                return
+
         if is_socket_disconnect:
-            _current_sid = environ.env.request.sid
-            leave_private_room(_user_id, _current_sid)
+            leave_private_room(_user_id, _current_sid, _remaining_sids)
             leave_all_public_rooms_and_emit_leave_events(_user_id, _current_sid)
-        else:
-            _current_sid = 'hb-{}'.format(_user_id)
 
-        emit_disconnect_event(_user_id, _current_sid, _user_status)
-        set_user_offline(_user_id, _current_sid, _user_status)
+        emit_disconnect_event(_user_id, _current_sid, _remaining_sids, _user_status)
+        set_user_offline(_user_id, _remaining_sids, _user_status)
 
 
 @environ.env.observer.on('on_disconnect')
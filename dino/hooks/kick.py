@@ -59,6 +59,9 @@ class OnKickHooks(object):
                     reason=reason,
                     banner_id=banner_id
                 )
+                if environ.env.ban_index is not None:
+                    # utils.is_banned() only reads the ban index when it's enabled
+                    environ.env.ban_index.add('room', room_id, banned_id, ban_timestamp_int)
             except Exception as e:
                 logger.error('failed to ban user %s from room %s: %s' % (banned_id, room_id, str(e)))
                 environ.env.capture_exception(sys.exc_info())
@@ -56,8 +56,6 @@ class OnLoginHooks(object):
             'last_login': dt.utcnow()
         }
 
-        environ.env.db.set_user_info(user_id, user_info)
-
         if activity.actor.image is None:
             environ.env.session['image_url'] = ''
             environ.env.session[SessionKeys.image.value] = 'n'
@@ -66,8 +64,7 @@ class OnLoginHooks(object):
             environ.env.session[SessionKeys.image.value] = 'y'
 
         sid = environ.env.request.sid
-        utils.create_or_update_user(user_id, user_name)
-        utils.add_sid_for_user_id(user_id, sid)
+        utils.login_session(user_id, user_name, sid, user_info)
 
         environ.env.join_room(user_id)
         environ.env.join_room(environ.env.request.sid)
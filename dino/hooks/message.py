@@ -16,10 +16,10 @@ from dino import utils
 from dino.config import ConfigKeys
 from dino.exceptions import NoSuchUserException
 from dino.utils.decorators import timeit
+from dino.utils.message import message_context_for
 
 import logging
 import traceback
-import json
 import sys
 import emoji
 import re
@@ -65,10 +65,8 @@ class OnMessageHooks(object):
                     for owner in owners:
                         send(data, _room=owner)
             else:
-                parsed_message = utils.parse_message(activity.object.content)
-
-                if parsed_message is not None and utils.is_whisper(parsed_message):
-                    for whisper_user_name in utils.get_whisper_users_from_message(parsed_message):
+                if context.is_whisper:
+                    for whisper_user_name in context.whisper_users:
                         try:
                             whisper_user_id = environ.env.db.get_user_id(whisper_user_name)
                             send(data, _room=whisper_user_id)
@@ -82,7 +80,8 @@ class OnMessageHooks(object):
 
         def store(deleted=False) -> Union[str, None]:
             try:
-                message_id = environ.env.storage.store_message(activity, deleted=deleted)
+                with context.stage('store'):
+                    message_id = environ.env.storage.store_message(activity, deleted=deleted)
             except Exception as e:
                 logger.error('could not store message %s because: %s' % (activity.id, str(e)))
                 logger.error(str(data))
@@ -158,12 +157,7 @@ class OnMessageHooks(object):
                 return False, None
 
             try:
-                _message = utils.b64d(activity.object.content)
-                try:
-                    json_body = json.loads(_message)
-                    _message = json_body.get('text')
-                except Exception:
-                    pass  # ignore, use original
+                _message = context.text
             except Exception as e:
                 logger.error('could not decode message: {}'.format(str(e)))
                 logger.exception(e)
@@ -185,7 +179,8 @@ class OnMessageHooks(object):
                 _message = remove_numbers(_message)
                 _message = replace_umlauts(_message)
 
-                _is_spam, _y_hats = environ.env.spam.is_spam(_message)
+                with context.stage('check_spam'):
+                    _is_spam, _y_hats = environ.env.spam.is_spam(_message)
                 if _is_spam and environ.env.service_config.should_save_spam():
                     _spam_id = environ.env.db.save_spam_prediction(activity, _message, _y_hats)
             except Exception as e:
@@ -198,6 +193,7 @@ class OnMessageHooks(object):
 
         data, activity = arg
         user_id = activity.actor.id
+        context = message_context_for(activity, environ.env)
 
         # for wio we don't check for spam or blacklist
         if 'wio' in environ.env.config.get(ConfigKeys.ENVIRONMENT, 'default'):
@@ -4,3 +4,14 @@ from abc import ABC
 class IRemoteHandler(ABC):
     def can_send_whisper_to(self, sender_id: str, target_user_name: str) -> (bool, int):
         raise NotImplementedError()
+
+    def can_send_whisper_to_users(self, sender_id: str, target_user_names: set) -> dict:
+        """
+        check several receivers of one whisper at once
+
+        :return: a dict of target user name to (allowed, reason code)
+        """
+        return {
+            target_user_name: self.can_send_whisper_to(sender_id, target_user_name)
+            for target_user_name in target_user_names
+        }
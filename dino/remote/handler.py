@@ -3,25 +3,82 @@ import logging
 import sys
 import traceback
 
+from eventlet.greenpool import GreenPool
 from jsonrpcclient.clients.http_client import HTTPClient
 from jsonrpcclient.requests import Request
+from requests.adapters import HTTPAdapter
 
 from dino.config import ConfigKeys, ErrorCodes
 from dino.environ import GNEnvironment
 from dino.remote import IRemoteHandler
 
+DEFAULT_POOL_SIZE = 10
+DEFAULT_TIMEOUT = 2  # seconds per call, on timeout the whisper is allowed
+
 
 class RemoteHandler(IRemoteHandler):
+    """
+    Calls the remote system to validate whispers. All calls share one client, so the keep-alive connections to the
+    remote host are reused instead of opening a new http session for every whisper, and a whisper to several users
+    is validated with concurrent calls. Results are cached per (sender, receiver) in the cache; allowed for ten
+    minutes and not allowed for thirty seconds, see CacheRedis.set_can_whisper_to_user().
+
+        remote:
+            host: 'http://remote'
+            path_can_whisper: 'whisper'
+            pool_size: 10  # max open connections and concurrent calls
+            timeout: 2
+    """
+
     def __init__(self, env: GNEnvironment):
         self.env = env
         self.logger = logging.getLogger(__name__)
         self.host = env.config.get(ConfigKeys.HOST, domain=ConfigKeys.REMOTE)
         self.path_whisper = env.config.get(ConfigKeys.PATH_CAN_WHISPER, domain=ConfigKeys.REMOTE)
         self.private_key = env.config.get(ConfigKeys.PRIVATE_KEY, domain=ConfigKeys.REMOTE)
+        self.timeout = float(env.config.get(ConfigKeys.TIMEOUT, domain=ConfigKeys.REMOTE, default=DEFAULT_TIMEOUT))
+        pool_size = int(env.config.get(ConfigKeys.POOL_SIZE, domain=ConfigKeys.REMOTE, default=DEFAULT_POOL_SIZE))
+
+        self.url = "{}/{}".format(self.host, self.path_whisper)
+        self.client = HTTPClient(self.url)
+        self.client.session.headers.update({"Content-Type": "application/json-rpc"})
+
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        self.client.session.mount('http://', adapter)
+        self.client.session.mount('https://', adapter)
+        self.pool = GreenPool(pool_size)
+
+    def can_send_whisper_to_users(self, sender_id: str, target_user_names: set) -> dict:
+        target_user_names = list(target_user_names)
+        if len(target_user_names) < 2:
+            return super().can_send_whisper_to_users(sender_id, target_user_names)
+
+        results = self.pool.imap(lambda user_name: self.can_send_whisper_to(sender_id, user_name), target_user_names)
+        return dict(zip(target_user_names, results))
 
     def can_send_whisper_to(self, sender_id: str, target_user_name: str) -> (bool, int):
-        url = "{}/{}".format(self.host, self.path_whisper)
+        try:
+            allowed, reason_code = self.env.cache.get_can_whisper_to_user(sender_id, target_user_name)
+        except Exception as e:
+            self.logger.error("could not get cached whisper result for {}: {}".format(sender_id, str(e)))
+            allowed, reason_code = None, None
+
+        if allowed is not None:
+            return allowed, reason_code
 
+        allowed, reason_code, cacheable = self._call_remote(sender_id, target_user_name)
+        if cacheable:
+            try:
+                self.env.cache.set_can_whisper_to_user(sender_id, target_user_name, allowed, reason_code)
+            except Exception as e:
+                self.logger.error("could not cache whisper result for {}: {}".format(sender_id, str(e)))
+
+        return allowed, reason_code
+
+    def _call_remote(self, sender_id: str, target_user_name: str) -> (bool, int, bool):
+        """
+        :return: if allowed, the reason code, and if the result is an answer from the remote system that can be cached
+        """
         # might not be an int in some applications
         try:
             sender_id = int(sender_id)
@@ -38,26 +95,20 @@ class RemoteHandler(IRemoteHandler):
             request_and_hash = self.private_key + request
             sign_hash = hashlib.md5(request_and_hash.encode('utf-8')).hexdigest()
 
-            client = HTTPClient(url)
-            client.session.headers.update({
-                "Content-Type": "application/json-rpc",
-                "X-RPC-SIGN": sign_hash
-            })
-
-            response = client.send(request).data
+            response = self.client.send(request, headers={"X-RPC-SIGN": sign_hash}, timeout=self.timeout).data
         except Exception as e:
-            self.logger.error("could not call remote endpoint {}: {}".format(url, str(e)))
+            self.logger.error("could not call remote endpoint {}: {}".format(self.url, str(e)))
             self.env.capture_exception(sys.exc_info())
             self.logger.exception(e)
-            return True, ErrorCodes.REMOTE_ERROR
+            return True, ErrorCodes.REMOTE_ERROR, False
 
         if response is None:
             self.logger.error("received None response for jsonrpc call")
-            return True, ErrorCodes.OK
+            return True, ErrorCodes.OK, False
 
         if not response.ok:
             self.logger.error("remote jsonrpc call failed, error_msg: {}".format(str(response)))
-            return True, ErrorCodes.OK
+            return True, ErrorCodes.OK, False
 
         self.logger.debug("response for sender_id {} and target_user_name {}: {}".format(
             sender_id, target_user_name, str(response)
@@ -88,12 +139,12 @@ class RemoteHandler(IRemoteHandler):
             ))
 
             if error_code == 50001:
-                return False, ErrorCodes.NOT_ALLOWED_TO_WHISPER_NOT_A_CONTACT
+                return False, ErrorCodes.NOT_ALLOWED_TO_WHISPER_NOT_A_CONTACT, True
             elif error_code == 50002:
-                return False, ErrorCodes.NOT_ALLOWED_TO_WHISPER_TURNED_OFF
+                return False, ErrorCodes.NOT_ALLOWED_TO_WHISPER_TURNED_OFF, True
             elif error_code == 50000 and error_msg == "whisper self":
-                return False, ErrorCodes.NOT_ALLOWED_TO_WHISPER_SELF
+                return False, ErrorCodes.NOT_ALLOWED_TO_WHISPER_SELF, True
             elif error_code == 50000:
-                return False, ErrorCodes.NOT_ALLOWED_TO_WHISPER_GENERIC_ERROR
+                return False, ErrorCodes.NOT_ALLOWED_TO_WHISPER_GENERIC_ERROR, True
 
-        return success == 1, ErrorCodes.OK
+        return success == 1, ErrorCodes.OK, True
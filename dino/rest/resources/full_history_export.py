@@ -0,0 +1,115 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import logging
+import traceback
+
+from datetime import datetime
+from flask import request
+from flask import Response
+
+from dino.rest.resources.base import BaseResource
+from dino.admin.orm import storage_manager
+from dino.utils import b64e
+
+logger = logging.getLogger(__name__)
+
+__author__ = 'Oscar Eriksson <oscar.eriks@gmail.com>'
+
+# number of messages written to the response at a time
+LINES_PER_CHUNK = 100
+
+
+class FullHistoryExportResource(BaseResource):
+    """
+    Same messages as /full-history, but streamed as newline delimited json while they're read from storage instead
+    of collected into one response, so exporting everything a user has ever written doesn't need it all in memory.
+
+    Each line is one message with a 'cursor'; if the export is interrupted, posting the same request again with the
+    last received cursor continues after that message. If reading from storage fails half-way, the last line is
+    {"error": "..."} instead of a message.
+
+    The next page is only read from storage when the previous chunk has been written to the client, so a slow
+    client slows down the export instead of building up a backlog in memory.
+    """
+
+    def __init__(self):
+        super(FullHistoryExportResource, self).__init__()
+        self.last_cleared = datetime.utcnow()
+        self.request = request
+
+    def _get_lru_method(self):
+        raise NotImplementedError()
+
+    def _get_last_cleared(self):
+        return self.last_cleared
+
+    def _set_last_cleared(self, last_cleared):
+        self.last_cleared = last_cleared
+
+    def post(self):
+        try:
+            messages = self.do_post()
+        except Exception as e:
+            logger.error('could not export messages: %s' % str(e))
+            logger.exception(traceback.format_exc())
+            return {'status_code': 500, 'data': str(e)}
+
+        return Response(self.stream(messages), mimetype='application/x-ndjson')
+
+    def do_post(self):
+        is_valid, msg, the_json = self.validate_json(self.request, silent=False)
+        if not is_valid:
+            raise ValueError(msg)
+        if the_json is None:
+            raise ValueError('empty request body')
+
+        user_id = the_json.get('user_id')
+        if user_id is None or len(user_id.strip()) == 0:
+            raise ValueError('no user_id specified')
+
+        return storage_manager.export_messages_from_user(
+            user_id,
+            the_json.get('from_time', None),
+            the_json.get('to_time', None),
+            the_json.get('cursor', None)
+        )
+
+    @staticmethod
+    def to_line(message: dict, cursor: str) -> str:
+        # only messages that are actually written out are encoded
+        message['from_user_name'] = b64e(message['from_user_name'])
+        message['body'] = b64e(message['body'])
+        message['target_name'] = b64e(message['target_name'])
+        message['channel_name'] = b64e(message['channel_name'])
+        message['cursor'] = cursor
+        return json.dumps(message) + '\n'
+
+    def stream(self, messages):
+        lines = list()
+
+        try:
+            for message, cursor in messages:
+                lines.append(FullHistoryExportResource.to_line(message, cursor))
+
+                if len(lines) >= LINES_PER_CHUNK:
+                    yield ''.join(lines)
+                    lines.clear()
+
+        except Exception as e:
+            logger.error('could not export messages: %s' % str(e))
+            logger.exception(traceback.format_exc())
+            lines.append(json.dumps({'error': str(e)}) + '\n')
+
+        if len(lines) > 0:
+            yield ''.join(lines)
@@ -8,7 +8,6 @@ from dino import environ
 from dino import utils
 from dino import validation
 from dino.config import ApiActions, ApiTargets
-from dino.exceptions import NoSuchRoomException
 from dino.rest.resources.base import BaseResource
 from dino.utils.decorators import timeit
 
@@ -50,24 +49,28 @@ class RoomsAclResource(BaseResource):
             channel_names[channel_id] = self.env.db.get_channel_name(channel_id)
             all_rooms_in_channel = self.env.db.rooms_for_channel(channel_id)
 
+            # acls of all rooms in the channel in one go, and checked together
+            all_acls = utils.get_all_acls_for_rooms(list(all_rooms_in_channel.keys()))
+            join_acls = {
+                room_id: acls.get(ApiActions.JOIN, dict())
+                for room_id, acls in all_acls.items()
+            }
+            allowed_room_ids = set(validation.acl.filter_targets_for_action(
+                activity,
+                ApiTargets.ROOM,
+                ApiActions.JOIN,
+                join_acls,
+                channel_id=channel_id,
+                session_to_use=session
+            ))
+
             for room_id, room in all_rooms_in_channel.items():
                 room["id"] = room_id
 
-                try:
-                    acls = utils.get_acls_in_room_for_action(room_id, ApiActions.JOIN)
-                except NoSuchRoomException:
+                if room_id not in all_acls:
                     continue
 
-                activity.target.id = room_id
-                is_valid, error_msg = validation.acl.validate_acl_for_action(
-                    activity, 
-                    ApiTargets.ROOM, 
-                    ApiActions.JOIN, 
-                    acls,
-                    object_type=ApiTargets.ROOM,
-                    session_to_use=session
-                )
-                if not is_valid:
+                if room_id not in allowed_room_ids:
                     logger.info("user {} is not allowed to join room {}".format(user_id, room_id))
                     continue
 
@@ -14,6 +14,7 @@ from dino.rest.resources.broadcast import BroadcastResource
 from dino.rest.resources.clear_history import ClearHistoryResource
 from dino.rest.resources.create import CreateRoomResource
 from dino.rest.resources.full_history import FullHistoryResource
+from dino.rest.resources.full_history_export import FullHistoryExportResource
 from dino.rest.resources.heartbeat import HeartbeatResource
 from dino.rest.resources.history import HistoryResource
 from dino.rest.resources.join import JoinRoomResource
@@ -107,6 +108,7 @@ api.add_resource(BroadcastResource, '/broadcast')
 api.add_resource(SendResource, '/send')
 api.add_resource(SetStatusResource, '/status')
 api.add_resource(FullHistoryResource, '/full-history')
+api.add_resource(FullHistoryExportResource, '/full-history/export')
 api.add_resource(HeartbeatResource, '/heartbeat')
 api.add_resource(AclResource, '/acl')
 api.add_resource(RoomsResource, '/rooms')
@@ -84,6 +84,29 @@ class IStorage(Interface):
         :return: a list of messages
         """
 
+    def iter_history_for_user(self, from_user_id: str, from_time: int, to_time: int, include_deleted: bool = True):
+        """
+        stream all messages sent by a user in a time range, without loading all of them into memory at once
+
+        :param from_user_id: the id of the sender
+        :param from_time: unix timestamp to start from (inclusive)
+        :param to_time: unix timestamp to end at (inclusive)
+        :param include_deleted: if False, deleted messages are skipped
+        :return: a generator of messages
+        """
+
+    def iter_history_pages_for_user(self, from_user_id: str, from_time: int, to_time: int, paging_state=None):
+        """
+        same as iter_history_for_user(), including deleted messages, but each message is yielded together with the
+        paging state of the page it was fetched in, so an export can be resumed from that page later
+
+        :param from_user_id: the id of the sender
+        :param from_time: unix timestamp to start from (inclusive)
+        :param to_time: unix timestamp to end at (inclusive)
+        :param paging_state: start from this page instead of the first one
+        :return: a generator of (message, paging_state) tuples
+        """
+
     def get_unread_history(self, room_id: str, time_stamp: int, limit: int = 100) -> list:
         """
         get unread history after a certain timestamp for a room
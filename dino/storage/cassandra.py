@@ -22,6 +22,7 @@ from dino.config import ConfigKeys
 from dino.config import AckStatus
 from dino.utils import b64d
 from dino.utils.decorators import timeit
+from dino.utils.message import message_context_for
 from dino import environ
 
 __author__ = 'Oscar Eriksson <oscar.eriks@gmail.com>'
@@ -57,7 +58,7 @@ class CassandraStorage(object):
 
     @timeit(logger, 'on_message_hooks_store')
     def store_message(self, activity: Activity, deleted=False) -> None:
-        message = b64d(activity.object.content)
+        message = message_context_for(activity).decoded
         actor_name = b64d(activity.actor.display_name)
         self.driver.msg_insert(
                 msg_id=activity.id,
@@ -212,20 +213,24 @@ class CassandraStorage(object):
             if rows is None or len(rows.current_rows) == 0:
                 return list()
         else:
-            all_rows = self.driver.msgs_select_from_user(from_user_id)
-            rows = list()
-            for row in all_rows:
-                if row.time_stamp < from_time or row.time_stamp > to_time:
-                    continue
-                rows.append(row)
-            if len(rows) == 0:
-                return list()
+            return list(self.iter_history_for_user(from_user_id, from_time, to_time))
 
         msgs = list()
         for row in rows:
             msgs.append(self._row_to_json(row))
         return msgs
 
+    def iter_history_for_user(self, from_user_id: str, from_time: int, to_time: int, include_deleted: bool = True):
+        for message, _ in self.iter_history_pages_for_user(from_user_id, from_time, to_time):
+            if not include_deleted and message['deleted']:
+                continue
+            yield message
+
+    def iter_history_pages_for_user(self, from_user_id: str, from_time: int, to_time: int, paging_state=None):
+        for row, page_paging_state in self.driver.msgs_iter_from_user_time_slice(
+                from_user_id, from_time, to_time, paging_state=paging_state):
+            yield self._row_to_json(row), page_paging_state
+
     @timeit(logger, 'on_cassandra_get_history_for_time_slice')
     def get_history_pagination(self, room_id: str, to_time: int, limit: int) -> list:
         rows = self.driver.msgs_select_pagination(room_id, to_time, limit)
@@ -245,14 +250,7 @@ class CassandraStorage(object):
             if rows is None or len(rows.current_rows) == 0:
                 return list()
         else:
-            all_rows = self.driver.msgs_select_from_user(from_user_id)
-            rows = list()
-            for row in all_rows:
-                if row.time_stamp < from_time or row.time_stamp > to_time:
-                    continue
-                rows.append(row)
-            if len(rows) == 0:
-                return list()
+            return list(self.iter_history_for_user(from_user_id, from_time, to_time))
 
         msgs = list()
         for row in rows:
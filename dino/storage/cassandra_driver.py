@@ -26,6 +26,7 @@ from zope.interface import implementer
 
 from cassandra.cluster import ResultSet
 from cassandra.cluster import Session
+from cassandra.concurrent import execute_concurrent_with_args
 from cassandra.query import ValueSequence
 from cassandra.cqlengine.query import BatchQuery
 
@@ -36,6 +37,12 @@ __author__ = 'Oscar Eriksson <oscar.eriks@gmail.com>'
 
 logger = logging.getLogger(__name__)
 
+# max number of in-flight requests when executing a statement for many parameters at once
+DEFAULT_CONCURRENCY = 50
+
+# rows per page when streaming results with paging_state
+DEFAULT_FETCH_SIZE = 500
+
 
 class StatementKeys(Enum):
     acks_update = 'acks_update'
@@ -55,6 +62,7 @@ class StatementKeys(Enum):
     msgs_select_from_user = 'msg_select_from_user'
     msgs_select_from_user_to_target = 'msg_select_from_user_to_target'
     msgs_select_from_user_to_target_time_slice = 'msg_select_from_user_to_target_time_slice'
+    msgs_select_from_user_time_slice = 'msg_select_from_user_time_slice'
     msg_select_one = 'msg_select_one'
     msg_select_msg_id_from_user_not_deleted = 'msg_select_msg_id_from_user_not_deleted'
     msg_select_msg_id_from_user_all = 'msg_select_msg_id_from_user_all'
@@ -64,8 +72,9 @@ class StatementKeys(Enum):
 
 @implementer(IDriver)
 class Driver(object):
-    def __init__(self, session: Session, key_space: str, strategy: str, replications: int):
+    def __init__(self, session: Session, key_space: str, strategy: str, replications: int, concurrency: int = DEFAULT_CONCURRENCY):
         self.session: Session = session
+        self.concurrency = concurrency
         self.statements = dict()
         self.key_space = key_space
         self.key_space_test = key_space + 'test'
@@ -307,6 +316,17 @@ class Driver(object):
                     SELECT * FROM messages_by_from_user_id WHERE from_user_id = ? AND target_id = ? AND time_stamp > ? AND time_stamp < ? LIMIT ?
                     """
             )
+            self.statements[StatementKeys.msgs_select_from_user_time_slice] = self.session.prepare(
+                    """
+                    SELECT
+                        * FROM messages_by_from_user_id
+                    WHERE
+                        from_user_id = ? AND
+                        time_stamp >= ? AND
+                        time_stamp <= ?
+                    ALLOW FILTERING
+                    """
+            )
             self.statements[StatementKeys.msg_select] = self.session.prepare(
                     """
                     SELECT target_id, from_user_id, sent_time FROM messages_by_id WHERE message_id = ?
@@ -393,9 +413,7 @@ class Driver(object):
                 body, domain, sent_time, time_stamp, channel_id, channel_name, deleted)
 
     def msg_update(self, from_user_id, target_id, body, sent_time, deleted=False) -> None:
-        dt = datetime.strptime(sent_time, ConfigKeys.DEFAULT_DATE_FORMAT)
-        dt = pytz.timezone('utc').localize(dt, is_dst=None)
-        time_stamp = int(dt.astimezone(pytz.utc).strftime('%s'))
+        time_stamp = self._time_stamp_for(sent_time)
         self._execute(StatementKeys.msg_update, body, deleted, target_id, from_user_id, sent_time, time_stamp)
 
     def get_acks_for(self, message_ids: set, receiver_id: str) -> ResultSet:
@@ -426,6 +444,39 @@ class Driver(object):
     def msgs_select_from_user_to_target_time_slice(self, from_user_id: str, target_id: str, from_time: int, to_time: int, limit: int=500) -> ResultSet:
         return self._execute(StatementKeys.msgs_select_from_user_to_target_time_slice, from_user_id, target_id, from_time, to_time, limit)
 
+    def msgs_select_from_user_time_slice(
+            self, from_user_id: str, from_time: int, to_time: int,
+            paging_state=None, fetch_size: int = DEFAULT_FETCH_SIZE
+    ) -> ResultSet:
+        """
+        the filtering on time_stamp is done by cassandra within the from_user_id partition, so no LIMIT is needed;
+        only one page of 'fetch_size' rows is fetched, use the 'paging_state' of the result to get the next one
+        """
+        statement = self.statements[StatementKeys.msgs_select_from_user_time_slice].bind(
+            (from_user_id, from_time, to_time))
+        statement.fetch_size = fetch_size
+        return self.session.execute(statement, paging_state=paging_state)
+
+    def msgs_iter_from_user_time_slice(
+            self, from_user_id: str, from_time: int, to_time: int,
+            paging_state=None, fetch_size: int = DEFAULT_FETCH_SIZE
+    ):
+        """
+        generator over all messages from a user in a time range, fetching one page at a time so at most one page is
+        kept in memory; yields (row, paging_state) where paging_state is the one the row's page was fetched with
+        (None for the first page), so passing it back in resumes from the start of that page
+        """
+        while True:
+            rows = self.msgs_select_from_user_time_slice(
+                from_user_id, from_time, to_time, paging_state=paging_state, fetch_size=fetch_size)
+
+            for row in rows.current_rows:
+                yield row, paging_state
+
+            paging_state = rows.paging_state
+            if paging_state is None:
+                break
+
     def msgs_select(self, target_id: str, limit: int=100) -> ResultSet:
         return self._execute(StatementKeys.msgs_select, target_id, limit)
 
@@ -462,11 +513,29 @@ class Driver(object):
         self._msg_delete(message_id, deleted=True, clear_body=clear_body)
 
     def msgs_delete(self, message_ids: list, clear_body=True) -> None:
-        to_update = list()
+        self._msgs_delete(message_ids, deleted=True, clear_body=clear_body)
 
-        for message_id in message_ids:
-            keys = self._execute(StatementKeys.msg_select, message_id)
-            if keys is None or len(keys.current_rows) == 0:
+    def _msg_delete(self, message_id: str, deleted: bool, clear_body: bool = True) -> None:
+        self._msgs_delete([message_id], deleted=deleted, clear_body=clear_body)
+
+    def _msgs_delete(self, message_ids: list, deleted: bool, clear_body: bool = True) -> None:
+        """
+        We're doing three queries per message here, one to get primary index of messages table from message_id, then
+        getting the complete row from messages table, and finally updating that row. This could be lowered to two
+        queries by duplicating everything from messages table to messages_by_id materialized view, but would also
+        double storage requirements.
+
+        Each of the three steps is executed concurrently for all messages (at most self.concurrency requests in
+        flight), so deleting all messages for a user takes three round trips instead of three per message.
+
+        :param message_ids: the uuids of the messages to 'delete' (will only flag as deleted, will not remove)
+        """
+        message_ids = list(message_ids)
+        keys_results = self._execute_concurrent(StatementKeys.msg_select, [(message_id,) for message_id in message_ids])
+
+        to_select = list()
+        for message_id, keys in zip(message_ids, keys_results):
+            if len(keys.current_rows) == 0:
                 # not found
                 continue
 
@@ -474,69 +543,62 @@ class Driver(object):
                 logger.warning('found %s msgs when deleting with message_id %s' % (len(keys.current_rows), message_id))
 
             for key in keys.current_rows:
-                target_id, from_user_id, sent_time = key.target_id, key.from_user_id, key.sent_time
-                message_rows = self._execute(StatementKeys.msg_select_one, target_id, from_user_id, sent_time)
+                to_select.append((key.target_id, key.from_user_id, key.sent_time))
 
-                if len(message_rows.current_rows) > 1:
-                    logger.warning(
+        rows_results = self._execute_concurrent(StatementKeys.msg_select_one, to_select)
+
+        to_update = list()
+        for (target_id, from_user_id, sent_time), message_rows in zip(to_select, rows_results):
+            if len(message_rows.current_rows) > 1:
+                logger.warning(
                         'found %s msgs when deleting with target_id %s, from_user_id %s and sent_time %s' %
                         (len(message_rows.current_rows), target_id, from_user_id, sent_time))
 
-                for message_row in message_rows.current_rows:
-                    body = message_row.body
-
-                    if clear_body:
-                        body = ''
+            time_stamp = self._time_stamp_for(sent_time)
+            for message_row in message_rows.current_rows:
+                body = message_row.body
 
-                    to_update.append((from_user_id, target_id, body, sent_time))
+                if clear_body:
+                    body = ''
 
-        update_query = self.session.prepare("""
-            UPDATE messages SET body = ?, deleted = true
-            WHERE target_id = ? AND from_user_id = ? AND sent_time = ? AND time_stamp = ?
-        """)
+                to_update.append((body, deleted, target_id, from_user_id, sent_time, time_stamp))
 
-        for from_user_id, target_id, body, sent_time in to_update:
-            dt = datetime.strptime(sent_time, ConfigKeys.DEFAULT_DATE_FORMAT)
-            dt = pytz.timezone('utc').localize(dt, is_dst=None)
-            time_stamp = int(dt.astimezone(pytz.utc).strftime('%s'))
+        self._execute_concurrent(StatementKeys.msg_update, to_update)
 
-            self.session.execute(update_query.bind([
-                body, target_id, from_user_id, sent_time, time_stamp
-            ]))
+    @staticmethod
+    def _time_stamp_for(sent_time: str) -> int:
+        dt = datetime.strptime(sent_time, ConfigKeys.DEFAULT_DATE_FORMAT)
+        dt = pytz.timezone('utc').localize(dt, is_dst=None)
+        return int(dt.astimezone(pytz.utc).strftime('%s'))
 
-    def _msg_delete(self, message_id: str, deleted: bool, clear_body: bool = True) -> None:
+    def _execute_concurrent(self, statement_key, params: list) -> list:
         """
-        We're doing three queries here, one to get primary index of messages table from message_id, then getting the
-        complete row from messages table, and finally updating that row. This could be lowered to two queries by
-        duplicating everything from messages table to messages_by_id materialized view, but would also double storage
-        requirements. Since message deletion is likely not a frequent operation we can accept doing three queries.
+        execute a prepared statement once for each tuple in params, with at most self.concurrency requests
+        in flight at a time; raises on failure like _execute(), but only after every request has completed, with
+        the error of the first failed request
 
-        :param message_id: the uuid of the message to 'delete' (will only flag as deleted, will not remove)
+        :return: a list of result sets in the same order as params
         """
-        keys = self._execute(StatementKeys.msg_select, message_id)
-        if keys is None or len(keys.current_rows) == 0:
-            # not found
-            return
-
-        if len(keys.current_rows) > 1:
-            logger.warning('found %s msgs when deleting with message_id %s' % (len(keys.current_rows), message_id))
-
-        for key in keys.current_rows:
-            target_id, from_user_id, timestamp = key.target_id, key.from_user_id, key.sent_time
-            message_rows = self._execute(StatementKeys.msg_select_one, target_id, from_user_id, timestamp)
-
-            if len(message_rows.current_rows) > 1:
-                logger.warning(
-                        'found %s msgs when deleting with target_id %s, from_user_id %s and timestamp %s' %
-                        (len(message_rows.current_rows), target_id, from_user_id, timestamp))
-
-            for message_row in message_rows.current_rows:
-                body = message_row.body
-
-                if clear_body:
-                    body = ''
-
-                self.msg_update(from_user_id, target_id, body, timestamp, deleted)
+        if len(params) == 0:
+            return list()
+
+        if len(params) == 1:
+            return [self.session.execute_async(self.statements[statement_key], params[0]).result()]
+
+        results = execute_concurrent_with_args(
+            self.session, self.statements[statement_key], params,
+            concurrency=self.concurrency, raise_on_first_error=False)
+
+        result_sets, errors = list(), list()
+        for success, result in results:
+            if not success:
+                logger.error('could not execute {}: {}'.format(statement_key.value, str(result)))
+                errors.append(result)
+            result_sets.append(result)
+
+        if len(errors) > 0:
+            raise errors[0]
+        return result_sets
 
     def _execute(self, statement_key, *params) -> ResultSet:
         if params is not None and len(params) > 0:
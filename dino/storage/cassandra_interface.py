@@ -57,6 +57,17 @@ class IDriver(Interface):
         :return: a list of message ids
         """
 
+    def msgs_iter_from_user_time_slice(self, from_user_id: str, from_time: int, to_time: int, paging_state=None):
+        """
+        Stream all messages sent by a user between two timestamps (inclusive), one page at a time.
+
+        :param from_user_id: the id of the user to find messages for
+        :param from_time: unix timestamp to start from
+        :param to_time: unix timestamp to end at
+        :param paging_state: resume from the start of this page (as yielded along with an earlier row)
+        :return: a generator of (row, paging_state the row's page was fetched with) tuples
+        """
+
     def msgs_select(self, to_user_id: str):
         """
         find all messages sent to a user id/room id
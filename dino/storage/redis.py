@@ -6,7 +6,7 @@ from dino.config import ConfigKeys
 from dino.config import SessionKeys
 from dino.config import AckStatus
 from dino.config import RedisKeys
-from dino.utils import is_base64
+from dino.utils.message import message_context_for
 from dino.utils import b64d
 from dino.utils import b64e
 
@@ -40,7 +40,7 @@ class StorageRedis(object):
         channel_name = b64e(activity.object.summary)
         msg = activity.object.content
 
-        if not is_base64(msg):
+        if not message_context_for(activity).is_base64:
             raise RuntimeError('message is not base64')
 
         self.redis.lpush(
@@ -204,14 +204,18 @@ def get_whisper_users_from_message(message) -> set:
 
 def can_send_whisper_to_user(activity: Activity, message: str, users: set) -> (bool, int):
     sender_id = activity.actor.id
+    user_names = {user for user in users if is_a_user_name(user)}
+    if len(user_names) == 0:
+        return True, ErrorCodes.OK
 
-    can_whisper_and_reason = [
-        can_send_whisper_to_user_single(sender_id, user, message)
-        for user in users
-    ]
+    # validated concurrently by the remote handler, one call per receiver
+    can_whisper_and_reason = environ.env.remote.can_send_whisper_to_users(sender_id, user_names)
 
-    for can_whisper, reason in can_whisper_and_reason:
+    for target_user_name, (can_whisper, reason) in can_whisper_and_reason.items():
         if not can_whisper:
+            logger.info("user {} is not allowed to send whisper to {} (message was: '{}')".format(
+                sender_id, target_user_name, message
+            ))
             return False, reason
 
     return True, ErrorCodes.OK
@@ -233,21 +237,6 @@ def can_send_whisper_in_channel(activity, channel_id: str):
     return is_valid
 
 
-def can_send_whisper_to_user_single(sender_id, target_user_name, message) -> (bool, int):
-    if not is_a_user_name(target_user_name):
-        return True, ErrorCodes.OK
-
-    allowed, reason_code = environ.env.remote.can_send_whisper_to(sender_id, target_user_name)
-
-    if not allowed:
-        logger.info("user {} is not allowed to send whisper to {} (message was: '{}')".format(
-            sender_id, target_user_name, message
-        ))
-        return False, reason_code
-
-    return True, ErrorCodes.OK
-
-
 def parse_message(msg, encoded=True):
     if encoded:
         msg = b64d(msg)
@@ -1051,8 +1040,25 @@ def activity_for_users_in_room(activity: Activity, users_orig: dict) -> dict:
     this_user_is_super_user = is_super_user(this_user_id) or is_global_moderator(this_user_id)
     excluded_users = get_excluded_users(this_user_id)
 
+    # fetch info, roles and statuses for everyone in the room at once instead of once per user
+    user_ids = list(users.keys())
+    all_user_info = get_user_info_attachments_for_users(user_ids)
+    all_user_roles = environ.env.db.get_users_roles_in_room(user_ids, activity.target.id)
+
+    user_statuses = dict()
+    user_ip = ''
+
+    if this_user_is_super_user:
+        user_statuses = get_user_statuses(user_ids)
+        try:
+            user_ip = environ.env.request.remote_addr
+        except Exception as e:
+            logger.error('could not get remote address of user %s: %s' % (this_user_id, str(e)))
+            logger.exception(traceback.format_exc())
+            environ.env.capture_exception(sys.exc_info())
+
     for user_id, user_name in users.items():
-        user_info = get_user_info_attachments_for(user_id)
+        user_info = all_user_info.get(user_id, list())
 
         # for WIO we don't have the username in the db (so name equals id), so get it from redis instead
         if user_name == user_id or not len(user_name):
@@ -1062,14 +1068,6 @@ def activity_for_users_in_room(activity: Activity, users_orig: dict) -> dict:
                     break
 
         if this_user_is_super_user:
-            user_ip = ''
-            try:
-                user_ip = environ.env.request.remote_addr
-            except Exception as e:
-                logger.error('could not get remote address of user %s: %s' % (user_info, str(e)))
-                logger.exception(traceback.format_exc())
-                environ.env.capture_exception(sys.exc_info())
-
             user_info.append({
                 'objectType': 'ip',
                 'content': b64e(user_ip)
@@ -1084,7 +1082,7 @@ def activity_for_users_in_room(activity: Activity, users_orig: dict) -> dict:
         if not this_user_is_super_user and should_exclude_user(user_id, excluded_users):
             continue
 
-        user_roles = environ.env.db.get_user_roles_in_room(user_id, activity.target.id)
+        user_roles = all_user_roles.get(user_id, list())
         user_attachment = {
             'id': user_id,
             'displayName': b64e(user_name),
@@ -1092,7 +1090,7 @@ def activity_for_users_in_room(activity: Activity, users_orig: dict) -> dict:
             'content': ','.join(user_roles),
             'objectType': 'user'
         }
-        if this_user_is_super_user and user_is_invisible(user_id):
+        if this_user_is_super_user and user_statuses.get(user_id) == UserKeys.STATUS_INVISIBLE:
             user_attachment['objectType'] = 'invisible'
 
         response['object']['attachments'].append(user_attachment)
@@ -1192,13 +1190,25 @@ def activity_for_remove_room(user_id: str, user_name: str, room_id: str, room_na
     return act
 
 
-def get_user_info_attachments_for(user_id: str, encode_attachments: bool=True, include_user_agent: bool=False) -> list:
-    attachments = list()
-    for info_key, info_val in environ.env.auth.get_user_info(user_id).items():
-        attachments.append({
+def _user_info_to_attachments(user_info: dict, encode_attachments: bool=True) -> list:
+    return [
+        {
             'objectType': info_key,
             'content': b64e(info_val) if encode_attachments else info_val
-        })
+        }
+        for info_key, info_val in user_info.items()
+    ]
+
+
+def get_user_info_attachments_for_users(user_ids: list, encode_attachments: bool=True) -> dict:
+    return {
+        user_id: _user_info_to_attachments(user_info, encode_attachments)
+        for user_id, user_info in environ.env.auth.get_user_infos(user_ids).items()
+    }
+
+
+def get_user_info_attachments_for(user_id: str, encode_attachments: bool=True, include_user_agent: bool=False) -> list:
+    attachments = _user_info_to_attachments(environ.env.auth.get_user_info(user_id), encode_attachments)
 
     if include_user_agent:
         for key in SessionKeys.user_agent_keys.value:
@@ -1260,6 +1270,24 @@ def add_sid_for_user_id(user_id: str, sid: str) -> None:
     environ.env.db.add_sid_for_user(user_id, sid)
 
 
+def login_session(user_id: str, user_name: str, sid: str, user_info: dict) -> None:
+    if sid is None or len(sid.strip()) == 0:
+        logger.error('empty sid when adding sid')
+        environ.env.db.set_user_info(user_id, user_info)
+        create_or_update_user(user_id, user_name)
+        return
+
+    # is none when running tests; don't create users for wio
+    if environ.env.node is not None and 'wio' in environ.env.node:
+        user_name = None
+
+    environ.env.db.login_session(user_id, user_name, sid, user_info)
+
+
+def disconnect_session(user_id: str, sid: str, update_last_online: bool = True) -> list:
+    return environ.env.db.disconnect_session(user_id, sid, update_last_online=update_last_online)
+
+
 def get_sids_for_user_id(user_id: str) -> Union[list, None]:
     return environ.env.db.get_sids_for_user(user_id)
 
@@ -1268,6 +1296,23 @@ def get_user_for_sid(sid: str) -> Union[str, None]:
     return environ.env.db.get_user_for_sid(sid)
 
 
+def get_nodes_for_user_id(user_id: str, env) -> Union[set, None]:
+    """
+    get the nodes (names of their internal queues) the user has sessions on, from the presence registry
+
+    :return: a set of nodes, or None if the user has no sessions or not all sessions have a known node
+    """
+    sids = [sid for sid in (env.db.get_sids_for_user(user_id) or list()) if sid is not None and len(sid) > 0]
+    if len(sids) == 0:
+        return None
+
+    nodes = env.cache.get_nodes_for_sids(sids)
+    if nodes is None or len(nodes) < len(sids):
+        return None
+
+    return set(nodes.values())
+
+
 def get_excluded_users(user_id: str, skip_cache: bool = False) -> Set:
     user_info = environ.env.auth.get_user_info(user_id, skip_cache=skip_cache)
     excluded = user_info.get(SessionKeys.excluded_list.value, None)
@@ -1292,42 +1337,32 @@ def create_or_update_user(user_id: str, user_name: str) -> None:
 
 
 def filter_channels_by_acl(activity, channels_with_acls, session_to_use=None):
-    filtered_channels = list()
+    """
+    the channels the user is allowed to list, with their acls as attachments; all acls of all channels are loaded in
+    one go and evaluated together instead of looking up and validating the channels one by one
+    """
+    channel_ids = [channel_info['id'] for channel_info in channels_with_acls]
+    all_acls = get_all_acls_for_channels(channel_ids)
 
+    activity.target.object_type = 'channel'
+    allowed_channel_ids = set(validation.acl.filter_targets_for_action(
+        activity,
+        ApiTargets.CHANNEL,
+        ApiActions.LIST,
+        {channel_id: all_acls[channel_id].get(ApiActions.LIST, dict()) for channel_id in channel_ids
+         if channel_id in all_acls},
+        session_to_use=session_to_use
+    ))
+
+    filtered_channels = list()
     for channel_info in channels_with_acls:
         channel_id = channel_info['id']
-        list_acls = get_acls_in_channel_for_action(channel_id, ApiActions.LIST)
-
-        activity.object.url = channel_id
-        activity.target.object_type = 'channel'
-
-        if session_to_use is None:
-            is_valid, err_msg = validation.acl.validate_acl_for_action(
-                activity,
-                ApiTargets.CHANNEL,
-                ApiActions.LIST,
-                list_acls,
-                target_id=channel_id,
-                object_type='channel'
-            )
-        # for tests
-        else:
-            is_valid, err_msg = validation.acl.validate_acl_for_action(
-                activity,
-                ApiTargets.CHANNEL,
-                ApiActions.LIST,
-                list_acls,
-                target_id=channel_id,
-                object_type='channel',
-                session_to_use=session_to_use
-            )
 
         # not allowed to list this channel
-        if not is_valid:
+        if channel_id not in allowed_channel_ids:
             continue
 
-        acls = get_acls_for_channel(channel_id)
-        acl_activity = activity_for_get_acl(activity, acls, ignore={"spoken_language"})
+        acl_activity = activity_for_get_acl(activity, all_acls[channel_id], ignore={"spoken_language"})
         channel_info['attachments'] = acl_activity['object']['attachments']
 
         filtered_channels.append(channel_info)
@@ -1338,7 +1373,7 @@ def filter_channels_by_acl(activity, channels_with_acls, session_to_use=None):
 def is_banned_globally(user_id: str) -> (bool, Union[str, None]):
     if user_id is None:
         return False, None
-    user_is_banned, timestamp = environ.env.db.is_banned_globally(user_id)
+    user_is_banned, timestamp = _ban_status_source().is_banned_globally(user_id)
     if not user_is_banned or timestamp is None or timestamp == '':
         return False, None
 
@@ -1357,8 +1392,15 @@ def reason_for_ban(user_id: str, scope: str=None, target_id: str=None) -> str:
     raise KeyError('scope not in [channel,room,global] but "%s"' % str(scope))
 
 
+def _ban_status_source():
+    # the in-process index if enabled, otherwise the db (which checks the cache before querying)
+    if environ.env.ban_index is not None:
+        return environ.env.ban_index
+    return environ.env.db
+
+
 def is_banned(user_id: str, room_id: str) -> (bool, Union[str, None]):
-    bans = environ.env.db.get_user_ban_status(room_id, user_id)
+    bans = _ban_status_source().get_user_ban_status(room_id, user_id)
 
     global_time = bans['global']
     channel_time = bans['channel']
@@ -1391,7 +1433,7 @@ def is_banned(user_id: str, room_id: str) -> (bool, Union[str, None]):
 
 
 def is_muted(user_id: str, room_id: str) -> (bool, dict):
-    mutes = environ.env.db.get_user_mute_status(room_id, user_id)
+    mutes = _ban_status_source().get_user_mute_status(room_id, user_id)
 
     room_time = mutes['room']
     now = datetime.utcnow()
@@ -1415,6 +1457,8 @@ def ban_user(room_id: str, user_id: str, ban_duration: str) -> None:
         raise NoSuchUserException(user_id)
     ban_timestamp = ban_duration_to_timestamp(ban_duration)
     environ.env.db.ban_user_room(user_id, ban_timestamp, ban_duration, room_id)
+    if environ.env.ban_index is not None:
+        environ.env.ban_index.add('room', room_id, user_id, ban_timestamp)
 
 
 def ban_duration_to_timestamp(ban_duration: str) -> str:
@@ -1553,6 +1597,14 @@ def get_acls_for_channel(channel_id: str) -> dict:
     return environ.env.db.get_all_acls_channel(channel_id)
 
 
+def get_all_acls_for_channels(channel_ids: list) -> dict:
+    return environ.env.db.get_all_acls_channels(channel_ids)
+
+
+def get_all_acls_for_rooms(room_ids: list) -> dict:
+    return environ.env.db.get_all_acls_rooms(room_ids)
+
+
 def get_owners_for_room(room_id: str) -> dict:
     return environ.env.db.get_owners_room(room_id)
 
@@ -1632,6 +1684,14 @@ def get_user_roles(user_id: str):
     return environ.env.db.get_user_roles(user_id)
 
 
+def get_user_roles_for_target(user_id: str, channel_id: str, room_id: str = None) -> dict:
+    return environ.env.db.get_user_roles_for_target(user_id, channel_id, room_id)
+
+
+def get_user_roles_for_targets(user_id: str, channel_ids: set, room_ids: set) -> dict:
+    return environ.env.db.get_user_roles_for_targets(user_id, channel_ids, room_ids)
+
+
 def rooms_for_user(user_id: str):
     rooms = environ.env.db.rooms_for_user(user_id)
     if rooms is None or len(rooms) == 0:
@@ -1871,28 +1931,43 @@ def get_user_status(user_id: str, skip_cache: bool = False) -> str:
     return str(environ.env.db.get_user_status(user_id, skip_cache))
 
 
+def get_user_statuses(user_ids, skip_cache: bool = False) -> dict:
+    statuses = environ.env.db.get_user_statuses(list(user_ids), skip_cache)
+    return {user_id: str(status) for user_id, status in statuses.items()}
+
+
 def get_last_read_for(room_id: str, user_id: str) -> str:
+    if environ.env.last_read_buffer is not None:
+        time_stamp = environ.env.last_read_buffer.get(room_id, user_id)
+        if time_stamp is not None:
+            return time_stamp
     return environ.env.db.get_last_read_timestamp(room_id, user_id)
 
 
+def _update_last_read_for(users: set, room_id: str, time_stamp: int) -> None:
+    if environ.env.last_read_buffer is not None:
+        environ.env.last_read_buffer.update(users, room_id, time_stamp)
+    else:
+        environ.env.db.update_last_read_for(users, room_id, time_stamp)
+
+
 def update_last_reads_private(user_id: str) -> None:
     status = get_user_status(user_id)
     if status in [None, UserKeys.STATUS_UNAVAILABLE, UserKeys.STATUS_UNKNOWN]:
         return
     time_stamp = int(datetime.utcnow().strftime('%s'))
-    environ.env.db.update_last_read_for({user_id}, user_id, time_stamp)
+    _update_last_read_for({user_id}, user_id, time_stamp)
 
 
 def update_last_reads(room_id: str) -> None:
     users_in_room = get_users_in_room(room_id)
     online_users_in_room = set()
 
-    for user_id, _ in users_in_room.items():
-        status = get_user_status(user_id)
+    for user_id, status in get_user_statuses(users_in_room.keys()).items():
         if status in [None, UserKeys.STATUS_UNAVAILABLE, UserKeys.STATUS_UNKNOWN]:
             continue
 
         online_users_in_room.add(user_id)
 
     time_stamp = int(datetime.utcnow().strftime('%s'))
-    environ.env.db.update_last_read_for(online_users_in_room, room_id, time_stamp)
+    _update_last_read_for(online_users_in_room, room_id, time_stamp)
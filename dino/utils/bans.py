@@ -0,0 +1,156 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import heapq
+import logging
+import sys
+import traceback
+from datetime import datetime
+
+import eventlet
+
+from dino import utils
+
+__author__ = 'Oscar Eriksson <oscar.eriks@gmail.com>'
+
+logger = logging.getLogger(__name__)
+
+GLOBAL, CHANNEL, ROOM, MUTE = 'global', 'channel', 'room', 'mute'
+
+
+class BanIndex(object):
+    """
+    In-process copy of all active bans and mutes, keyed on (scope, target_id, user_id) with the unix timestamp the
+    ban or mute ends at, so checking if a user is banned or muted is a few dict lookups instead of cache or db
+    round trips.
+
+    Loaded from the database on startup, and kept up to date from the ban/unban/mute/unmute events on the internal
+    queue (see QueueHandler). Entries past their end time are ignored on lookup and removed from the index, and from
+    the database in one batch, by a background green thread every 'purge_interval' seconds.
+
+    Timestamps are compared the same way as in DatabaseRdbms.get_user_ban_status(), i.e. naive utc datetimes
+    converted with .timestamp().
+    """
+
+    def __init__(self, env, purge_interval: float = 60):
+        self.env = env
+        self.purge_interval = purge_interval
+        self.ends_at = dict()
+        self.expiry = list()
+
+        self.load()
+        eventlet.spawn(self.loop)
+
+    @staticmethod
+    def now() -> float:
+        return datetime.utcnow().timestamp()
+
+    def load(self) -> None:
+        ends_at = dict()
+        for scope, target_id, user_id, time_stamp in self.env.db.get_ban_and_mute_timestamps():
+            ends_at[(scope, target_id or '', user_id)] = float(time_stamp)
+
+        self.ends_at = ends_at
+        self.expiry = [(time_stamp, key) for key, time_stamp in ends_at.items()]
+        heapq.heapify(self.expiry)
+
+        logger.info('loaded {} bans and mutes'.format(len(ends_at)))
+
+    def add(self, scope: str, target_id: str, user_id: str, time_stamp) -> None:
+        key = (scope, target_id or '', user_id)
+        time_stamp = float(time_stamp)
+
+        self.ends_at[key] = time_stamp
+        heapq.heappush(self.expiry, (time_stamp, key))
+
+    def remove(self, scope: str, target_id: str, user_id: str) -> None:
+        # its entry in the expiry heap is skipped when purged since it's no longer in the index
+        self.ends_at.pop((scope, target_id or '', user_id), None)
+
+    def get(self, scope: str, target_id: str, user_id: str, now: float = None):
+        time_stamp = self.ends_at.get((scope, target_id or '', user_id))
+        if time_stamp is None:
+            return None
+
+        if time_stamp < (now or BanIndex.now()):
+            # will be removed by the next purge
+            return None
+
+        return time_stamp
+
+    def _time_stamp_or_empty(self, scope: str, target_id: str, user_id: str, now: float) -> str:
+        time_stamp = self.get(scope, target_id, user_id, now)
+        if time_stamp is None:
+            return ''
+        return str(int(time_stamp))
+
+    def is_banned_globally(self, user_id: str) -> (bool, str):
+        now = BanIndex.now()
+        time_stamp = self.get(GLOBAL, '', user_id, now)
+        if time_stamp is None:
+            return False, None
+        return True, str(int(time_stamp - now))
+
+    def get_user_ban_status(self, room_id: str, user_id: str) -> dict:
+        """
+        same format as IDatabase.get_user_ban_status()
+        """
+        now = BanIndex.now()
+        return {
+            'global': self._time_stamp_or_empty(GLOBAL, '', user_id, now),
+            'channel': self._time_stamp_or_empty(CHANNEL, utils.get_channel_for_room(room_id), user_id, now),
+            'room': self._time_stamp_or_empty(ROOM, room_id, user_id, now)
+        }
+
+    def get_user_mute_status(self, room_id: str, user_id: str) -> dict:
+        """
+        same format as IDatabase.get_user_mute_status()
+        """
+        return {
+            'room': self._time_stamp_or_empty(MUTE, room_id, user_id, BanIndex.now())
+        }
+
+    def purge(self) -> int:
+        now = BanIndex.now()
+        n_expired = 0
+
+        while len(self.expiry) > 0 and self.expiry[0][0] < now:
+            time_stamp, key = heapq.heappop(self.expiry)
+
+            # could have been removed or extended since this entry was pushed
+            if self.ends_at.get(key) != time_stamp:
+                continue
+
+            del self.ends_at[key]
+            n_expired += 1
+
+        if n_expired > 0:
+            self.env.db.remove_expired_bans_and_mutes()
+
+        self.env.stats.gauge('bans.index.size', len(self.ends_at))
+        self.env.stats.gauge('bans.index.expired', n_expired)
+        return n_expired
+
+    def loop(self):
+        while True:
+            try:
+                eventlet.sleep(self.purge_interval)
+            except InterruptedError:
+                logger.info('interrupted, exiting loop')
+                break
+
+            try:
+                self.purge()
+            except Exception as e:
+                logger.error('could not purge expired bans and mutes: {}'.format(str(e)))
+                logger.exception(traceback.format_exc())
+                self.env.capture_exception(sys.exc_info())
@@ -16,13 +16,131 @@ import time
 
 from activitystreams.models.activity import Activity
 
-from dino import utils
+from dino.utils.message import message_context_for
 
 __author__ = 'Oscar Eriksson <oscar.eriks@gmail.com>'
 
 logger = logging.getLogger(__name__)
 
 
+class BlackListMatcher(set):
+    """
+    A set of blacklisted words that also keeps an Aho-Corasick automaton of the words, so that finding which
+    (if any) word is used in a message is a single pass over the message instead of one substring check per
+    word in the blacklist.
+
+    Adding a word only inserts it into the trie; the failure links are recomputed lazily on the next search.
+    Removing a word only unmarks its node in the trie, so it doesn't require any rebuild at all.
+    """
+
+    def __init__(self, words=None):
+        super().__init__()
+        # node 0 is the root; for each node: its transitions, its failure link, and the word ending there (if any)
+        self.goto = [dict()]
+        self.fail = [0]
+        self.word_at = [None]
+        # closest node reachable through failure links (the node itself excluded) that ends a word
+        self.output = [0]
+        self.dirty = False
+
+        if words is not None:
+            self.update(words)
+
+    def add(self, word: str) -> None:
+        if word is None or len(word) == 0:
+            return
+
+        super().add(word)
+        node = 0
+        for char in word:
+            next_node = self.goto[node].get(char)
+            if next_node is None:
+                next_node = len(self.goto)
+                self.goto.append(dict())
+                self.fail.append(0)
+                self.word_at.append(None)
+                self.output.append(0)
+                self.goto[node][char] = next_node
+            node = next_node
+
+        self.word_at[node] = word
+        self.dirty = True
+
+    def update(self, *others) -> None:
+        for words in others:
+            for word in words:
+                self.add(word)
+
+    def discard(self, word: str) -> None:
+        if word not in self:
+            return
+
+        super().discard(word)
+        node = 0
+        for char in word:
+            node = self.goto[node][char]
+        self.word_at[node] = None
+
+    def remove(self, word: str) -> None:
+        if word not in self:
+            raise KeyError(word)
+        self.discard(word)
+
+    def _build(self) -> None:
+        queue = list()
+        for node in self.goto[0].values():
+            self.fail[node] = 0
+            self.output[node] = 0
+            queue.append(node)
+
+        # breadth first, since the failure link of a node is always less deep than the node itself
+        i = 0
+        while i < len(queue):
+            node = queue[i]
+            i += 1
+
+            for char, child in self.goto[node].items():
+                queue.append(child)
+
+                fail = self.fail[node]
+                while fail > 0 and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+
+                fail = self.goto[fail].get(char, 0)
+                self.fail[child] = fail
+                self.output[child] = fail if self.word_at[fail] is not None else self.output[fail]
+
+        self.dirty = False
+
+    def find(self, message: str):
+        """
+        :param message: the (lowercased) message to check
+        :return: the first blacklisted word found in the message, or None if none of the words are used
+        """
+        if self.dirty:
+            self._build()
+
+        goto, fail, word_at, output = self.goto, self.fail, self.word_at, self.output
+        node = 0
+
+        for char in message:
+            while node > 0 and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+
+            if word_at[node] is not None:
+                return word_at[node]
+
+            # a removed word's node is still linked, so keep following until an actual word is found
+            match = output[node]
+            while match > 0:
+                if word_at[match] is not None:
+                    return word_at[match]
+                match = output[match]
+
+        return None
+
+
 class BlackListChecker(object):
     """
     Check if a blacklisted word is used in a message. Here the check is implemented in this way:
@@ -70,39 +188,48 @@ class BlackListChecker(object):
         [cuckoo] done in 24.35s, avg time: 0.0243ms
         [regular] done in 82.57s, avg time: 0.0826ms
         [partial] done in 3.34s, avg time: 0.0033ms
+
+    The check is now done using an Aho-Corasick automaton (see BlackListMatcher), which finds the first blacklisted
+    word in one pass over the message, independent of the size of the blacklist. Run bin/benchmark_blacklist.py to
+    compare it with the 'regular' check above.
     """
 
     def __init__(self, env):
         self.env = env
+        self.matcher = None
+        self.matcher_source = None
 
     def _get_black_list(self):
         # cached in db object
         return self.env.db.get_black_list()
 
+    def _get_matcher(self, blacklist: set):
+        # the cache keeps a matcher that is updated when the list changes; other sources return plain sets, which
+        # are compared by identity since comparing the contents would be a full pass over the list for every message
+        if isinstance(blacklist, BlackListMatcher):
+            return blacklist
+
+        if self.matcher is None or self.matcher_source is not blacklist:
+            self.matcher = BlackListMatcher(blacklist)
+            self.matcher_source = blacklist
+        return self.matcher
+
     def _contains_blacklisted_word(self, activity: Activity):
         message = activity.object.content
         blacklist = self._get_black_list()
 
         if blacklist is None or len(blacklist) == 0:
             return None
-        if message is not None and len(message) > 0:
-            message = utils.b64d(message).lower()
-
-        contains_forbidden_word = any(
-            word in message
-            for word in blacklist
-        )
-
-        if not contains_forbidden_word:
+        if message is None or len(message) == 0:
             return None
 
-        for word in blacklist:
-            if word not in message:
-                continue
+        message = message_context_for(activity, self.env).lowercase
+        word = self._get_matcher(blacklist).find(message)
+        if word is None:
+            return None
 
-            logger.warning('message from user %s used a blacklisted word "%s"' % (activity.actor.id, word))
-            return word
-        return None
+        logger.warning('message from user %s used a blacklisted word "%s"' % (activity.actor.id, word))
+        return word
 
     def contains_blacklisted_word(self, activity: Activity) -> (bool, str):
         start = time.time()
@@ -13,6 +13,7 @@ from dino import validation
 from dino import environ
 from dino import utils
 from dino.exceptions import NoSuchUserException
+from dino.utils.message import MessageContext
 from dino.config import ConfigKeys
 from dino.config import SessionKeys
 from dino.config import ErrorCodes
@@ -171,6 +172,10 @@ def pre_process(validation_name, should_validate_request=True):
 
                     activity = as_parser.parse(data)
 
+                    # decode the message body once and share it between validation, hooks and storage
+                    if validation_name == 'on_message':
+                        activity.message_context = MessageContext(activity.object.content, environ.env)
+
                     # the login request will not have user id in session yet, which this would check
                     if should_validate_request:
                         is_valid, error_msg = validation.request.validate_request(activity)
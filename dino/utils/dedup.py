@@ -0,0 +1,201 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import logging
+import math
+import time
+from collections import OrderedDict
+
+from dino.config import ConfigKeys
+
+__author__ = 'Oscar Eriksson <oscar.eriks@gmail.com>'
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter(object):
+    """
+    fixed size bloom filter; never has false negatives, and false positives at about 'error_rate' when 'capacity'
+    keys have been added
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        self.capacity = capacity
+        self.n_bits = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.n_hashes = max(1, int(round(self.n_bits / capacity * math.log(2))))
+        self.bits = bytearray((self.n_bits + 7) // 8)
+        self.size = 0
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+
+        # double hashing, k positions from two hashes
+        for i in range(self.n_hashes):
+            yield (h1 + i * h2) % self.n_bits
+
+    def add(self, key: str) -> None:
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.size += 1
+
+    def __contains__(self, key: str) -> bool:
+        for position in self._positions(key):
+            if not self.bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+
+class DedupCache(object):
+    """
+    Remembers the most recently seen keys (e.g. event ids) to drop duplicates. Keeps at most 'max_size' keys, and
+    forgets keys older than 'ttl' seconds if set; both adding and checking are O(1).
+
+    With 'bloom_capacity' set, keys pushed out of the exact window are kept in two rotating bloom filters of that
+    capacity, so duplicates arriving long after the original are still caught at high rates without keeping every
+    key; the trade-off is a small chance (about 'error_rate') of dropping an event that was never seen.
+
+    Hits (duplicates found) and misses are reported every 'report_interval' seconds as e.g.
+
+        dedup.queue.delegated.hits
+        dedup.queue.delegated.misses
+        dedup.queue.delegated.hit_rate  (percent, since last report)
+        dedup.queue.delegated.size
+    """
+
+    def __init__(
+            self, env=None, name: str = 'default', max_size: int = 10000, ttl: float = None,
+            bloom_capacity: int = 0, error_rate: float = 0.001, report_interval: float = 60
+    ):
+        self.env = env
+        self.name = name
+        self.max_size = max_size
+        self.ttl = ttl
+        self.bloom_capacity = bloom_capacity
+        self.error_rate = error_rate
+        self.report_interval = report_interval
+
+        self.keys = OrderedDict()
+        self.blooms = list()
+        if bloom_capacity > 0:
+            self.blooms = [BloomFilter(bloom_capacity, error_rate)]
+
+        self.hits = 0
+        self.misses = 0
+        self.last_reported = time.time()
+
+    @staticmethod
+    def from_config(env, name: str) -> 'DedupCache':
+        """
+        create a cache with the settings from the 'dedup' block in the config, e.g.:
+
+            dedup:
+                max_size: 10000
+                ttl: 300
+                bloom_capacity: 0
+        """
+        conf = env.config
+        ttl = float(conf.get(ConfigKeys.TTL, domain=ConfigKeys.DEDUP, default=0))
+
+        return DedupCache(
+            env, name,
+            max_size=int(conf.get(ConfigKeys.MAX_SIZE, domain=ConfigKeys.DEDUP, default=10000)),
+            ttl=ttl if ttl > 0 else None,
+            bloom_capacity=int(conf.get(ConfigKeys.BLOOM_CAPACITY, domain=ConfigKeys.DEDUP, default=0))
+        )
+
+    def _expire(self, now: float) -> None:
+        while len(self.keys) > self.max_size:
+            self._evict()
+
+        if self.ttl is None:
+            return
+
+        while len(self.keys) > 0:
+            key, added_at = next(iter(self.keys.items()))
+            if now - added_at < self.ttl:
+                break
+            self._evict()
+
+    def _evict(self) -> None:
+        key, _ = self.keys.popitem(last=False)
+        if len(self.blooms) == 0:
+            return
+
+        if self.blooms[-1].size >= self.bloom_capacity:
+            # keep the previous generation around so keys don't all disappear at once on rotation
+            self.blooms = [self.blooms[-1], BloomFilter(self.bloom_capacity, self.error_rate)]
+        self.blooms[-1].add(key)
+
+    def add(self, key: str) -> None:
+        now = time.time()
+        self.keys[key] = now
+        self.keys.move_to_end(key)
+        self._expire(now)
+
+    def _contains(self, key: str) -> bool:
+        added_at = self.keys.get(key)
+        if added_at is not None:
+            return self.ttl is None or time.time() - added_at < self.ttl
+
+        for bloom in self.blooms:
+            if key in bloom:
+                return True
+        return False
+
+    def seen(self, key: str) -> bool:
+        """
+        check if the key has been added recently, counting it as a hit or miss
+        """
+        found = self._contains(key)
+        if found:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+        now = time.time()
+        if now - self.last_reported > self.report_interval:
+            self.report(now)
+
+        return found
+
+    def __contains__(self, key: str) -> bool:
+        return self._contains(key)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        if total == 0:
+            return 0.0
+        return self.hits / total
+
+    def report(self, now: float = None) -> None:
+        self.last_reported = now or time.time()
+        hits, misses, hit_rate = self.hits, self.misses, self.hit_rate()
+        self.hits, self.misses = 0, 0
+
+        stats = getattr(self.env, 'stats', None)
+        if stats is None:
+            return
+
+        try:
+            prefix = 'dedup.{}'.format(self.name)
+            stats.gauge(prefix + '.hits', hits)
+            stats.gauge(prefix + '.misses', misses)
+            stats.gauge(prefix + '.hit_rate', int(hit_rate * 100))
+            stats.gauge(prefix + '.size', len(self.keys))
+        except Exception as e:
+            logger.warning('could not report dedup stats for {}: {}'.format(self.name, str(e)))
@@ -0,0 +1,151 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import logging
+import time
+from base64 import b64decode
+from contextlib import contextmanager
+
+from activitystreams.models.activity import Activity
+
+from dino import utils
+
+__author__ = 'Oscar Eriksson <oscar.eriks@gmail.com>'
+
+logger = logging.getLogger(__name__)
+
+_NOT_SET = object()
+
+
+class MessageContext(object):
+    """
+    The body of one chat message, decoded at most once per event. Created in pre_process for on_message and attached
+    to the activity, so validation, the blacklist and spam checks, storage and the broadcast all read the decoded,
+    parsed and lowercased forms from here instead of decoding the base64 content again each.
+
+    Everything is computed lazily on first access and then memoized.
+    """
+
+    def __init__(self, content: str, env=None):
+        self.raw = content
+        self.env = env
+        self._valid = None
+        self._decoded = None
+        self._lowercase = None
+        self._parsed = _NOT_SET
+        self._text = _NOT_SET
+        self._whisper_users = None
+
+    def _decode(self) -> None:
+        start = time.time()
+        self._valid, self._decoded = False, ''
+
+        if self.raw is not None and len(self.raw.strip()) > 0:
+            try:
+                self._decoded = str(b64decode(bytes(self.raw, 'utf-8')), 'utf-8')
+                self._valid = True
+            except Exception as e:
+                logger.error('could not b64decode because: %s, value was: \n%s' % (str(e), str(self.raw)))
+
+        self._timing('decode', start)
+
+    @property
+    def is_base64(self) -> bool:
+        if self._valid is None:
+            self._decode()
+        return self._valid
+
+    @property
+    def decoded(self) -> str:
+        """
+        the decoded body, or an empty string if the content is missing or not base64
+        """
+        if self._decoded is None:
+            self._decode()
+        return self._decoded
+
+    @property
+    def lowercase(self) -> str:
+        if self._lowercase is None:
+            self._lowercase = self.decoded.lower()
+        return self._lowercase
+
+    @property
+    def parsed(self):
+        """
+        the 'text' of a json body, the same as utils.parse_message() returns, or None if it's not a json body
+        """
+        if self._parsed is _NOT_SET:
+            self._parsed = utils.parse_message(self.decoded, encoded=False)
+        return self._parsed
+
+    @property
+    def text(self) -> str:
+        """
+        the 'text' field if the body is json, otherwise the whole decoded body
+        """
+        if self._text is _NOT_SET:
+            self._text = self.decoded
+            try:
+                self._text = json.loads(self.decoded).get('text')
+            except Exception:
+                pass  # ignore, use original
+        return self._text
+
+    @property
+    def is_whisper(self) -> bool:
+        return self.parsed is not None and utils.is_whisper(self.parsed)
+
+    @property
+    def whisper_users(self) -> set:
+        if self._whisper_users is None:
+            self._whisper_users = set()
+            if self.is_whisper:
+                self._whisper_users = utils.get_whisper_users_from_message(self.parsed)
+        return self._whisper_users
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        time one stage of handling the message, reported as 'event.on_message.<name>'
+        """
+        start = time.time()
+        try:
+            yield self
+        finally:
+            self._timing(name, start)
+
+    def _timing(self, name: str, start: float) -> None:
+        stats = getattr(self.env, 'stats', None)
+        if stats is None:
+            return
+
+        try:
+            stats.timing('event.on_message.' + name, (time.time() - start) * 1000)
+        except Exception as e:
+            logger.warning('could not report timing for stage {}: {}'.format(name, str(e)))
+
+
+def message_context_for(activity: Activity, env=None) -> MessageContext:
+    """
+    get the context attached to the activity, or create and attach one if there's none yet (e.g. for messages sent
+    through the rest api) or if the content was changed since it was created
+    """
+    content = activity.object.content
+    context = getattr(activity, 'message_context', None)
+
+    if context is None or context.raw is not content:
+        context = MessageContext(content, env)
+        activity.message_context = context
+
+    return context
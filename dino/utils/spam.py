@@ -1,5 +1,16 @@
 import os
+import sys
+import math
+import time
 import logging
+import traceback
+import multiprocessing
+
+import eventlet
+from eventlet import tpool
+from eventlet.event import Event
+from eventlet.queue import Empty
+from eventlet.queue import LightQueue
 
 from dino.utils import suppress_stdout_stderr
 from dino.environ import GNEnvironment
@@ -9,6 +20,41 @@ __author__ = 'Oscar Eriksson <oscar.eriks@gmail.com>'
 
 logger = logging.getLogger(__name__)
 
+# only set in the worker processes of SpamBatchClassifier
+_worker_classifier = None
+
+
+def _init_worker(root_path: str) -> None:
+    # runs once in each worker process of the pool; the models are too large to send with every batch
+    global _worker_classifier
+
+    class WorkerEnv(object):
+        pass
+
+    env = WorkerEnv()
+    env.root_path = root_path
+    _worker_classifier = SpamClassifier(env)
+
+
+def _classify_in_worker(messages: list, threshold: float) -> list:
+    return _worker_classifier.is_spam_batch(messages, threshold)
+
+
+def _worker_loop(root_path: str, conn) -> None:
+    # a worker process of SpamBatchClassifier; answers each (messages, threshold) on the pipe with (predictions, error)
+    _init_worker(root_path)
+
+    while True:
+        try:
+            messages, threshold = conn.recv()
+        except EOFError:
+            break
+
+        try:
+            conn.send((_classify_in_worker(messages, threshold), None))
+        except Exception as e:
+            conn.send((None, str(e)))
+
 
 class SpamClassifier(object):
     def __init__(self, env: GNEnvironment, skip_loading: bool=False):
@@ -52,6 +98,34 @@ class SpamClassifier(object):
         x = self.sparse.hstack((self.tfidf_char.transform(x), self.tfidf_word.transform(x))).A
         return self.pca.transform(x)
 
+    def transform_batch(self, messages: list):
+        # stays sparse until the pca, which only accepts dense input; densify once for the whole batch
+        x = self.sparse.hstack((self.tfidf_char.transform(messages), self.tfidf_word.transform(messages)), format='csr')
+        return self.pca.transform(x.toarray())
+
+    def predict_batch(self, x, threshold: float) -> list:
+        xgb_probas = self.xgb.predict_proba(x)[:, 1]
+        rfc_probas = self.rfc.predict_proba(x)[:, 1]
+        svc_predictions = self.svc.predict(x)
+
+        predictions = list()
+        for y_hat in zip(xgb_probas, rfc_probas, svc_predictions):
+            # if 2 out of 3 classifiers are at least 'threshold' % certain it's spam, classify it as such
+            predictions.append((1 if sum(1 for e in y_hat if e > threshold) >= 2 else 0, y_hat))
+        return predictions
+
+    def is_spam_batch(self, messages: list, threshold: float) -> list:
+        """
+        classify many messages at once, the length of the messages is not checked
+
+        :param messages: the messages to classify
+        :param threshold: the spam threshold, between 0 and 1
+        :return: a list of (is_spam, y_hats), in the same order as the messages
+        """
+        if len(messages) == 0:
+            return list()
+        return self.predict_batch(self.transform_batch(messages), threshold)
+
     @timeit(logger, 'on_predict')
     def predict(self, x):
         y_hat = (
@@ -77,3 +151,153 @@ class SpamClassifier(object):
 
         # short or overly long messages are usually not spam, and the models weren't trained on it
         return len(message) < min_len or len(message) > max_len
+
+
+class SpamBatchClassifier(object):
+    """
+    Collects messages to classify for up to 'flush_interval' seconds (or until 'batch_size' messages are waiting) and
+    classifies them all at once. Callers of is_spam() block on an event until their batch is done, so for them it
+    works the same as SpamClassifier.is_spam().
+
+    The classification runs in 'processes' worker processes if larger than 0, each batch split between them,
+    otherwise in a native thread, so the cpu bound work never runs on the eventlet hub. The workers are plain processes
+    connected with pipes; waiting for the answer is a blocking read in a native thread, which doesn't touch any locks
+    that eventlet has monkey patched (as waiting on a concurrent.futures future would).
+    """
+
+    def __init__(self, env, classifier: SpamClassifier, batch_size: int, flush_interval: float, processes: int = 0):
+        self.env = env
+        self.classifier = classifier
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = LightQueue()
+        self.workers = list()
+        self.worker_target = _worker_loop
+
+        self.root_path = env.root_path
+        if self.root_path == '':
+            self.root_path = '.'
+
+        for _ in range(processes):
+            self.workers.append(self.start_worker(self.root_path, target=self.worker_target))
+
+        eventlet.spawn(self.loop)
+
+    @staticmethod
+    def start_worker(root_path: str, target=_worker_loop):
+        conn, worker_conn = multiprocessing.Pipe()
+        process = multiprocessing.Process(target=target, args=(root_path, worker_conn), daemon=True)
+        process.start()
+
+        # only the worker should have this end open, so a dead worker shows up as EOFError on our end
+        worker_conn.close()
+        return conn
+
+    def restart_worker(self, index: int) -> None:
+        try:
+            self.workers[index].close()
+        except OSError:
+            pass
+        self.workers[index] = self.start_worker(self.root_path, target=self.worker_target)
+
+    def send_to_worker(self, index: int, task: tuple) -> None:
+        try:
+            self.workers[index].send(task)
+        except OSError as e:
+            # the worker died while idle (BrokenPipeError), replace it and try once more
+            logger.warning('could not send to spam worker {}, restarting it: {}'.format(index, str(e)))
+            self.restart_worker(index)
+            self.workers[index].send(task)
+
+    def is_spam(self, message) -> (bool, tuple):
+        if self.classifier.too_long_or_too_short(message):
+            return False, None
+
+        result = Event()
+        self.queue.put((message, result))
+        return result.wait()
+
+    def next_batch(self) -> list:
+        # block until there's at least one message, then wait at most 'flush_interval' for more
+        batch = [self.queue.get()]
+        flush_at = time.time() + self.flush_interval
+
+        while len(batch) < self.batch_size:
+            remaining = flush_at - time.time()
+            if remaining <= 0:
+                break
+
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except Empty:
+                break
+
+        return batch
+
+    def loop(self):
+        while True:
+            try:
+                batch = self.next_batch()
+            except InterruptedError:
+                logger.info('interrupted, exiting loop')
+                break
+
+            try:
+                self.classify(batch)
+            except Exception as e:
+                logger.error('could not classify batch of {} messages: {}'.format(len(batch), str(e)))
+                logger.exception(traceback.format_exc())
+                self.env.capture_exception(sys.exc_info())
+
+                for _, result in batch:
+                    # some results might have been sent before the failure
+                    if not result.ready():
+                        result.send_exception(e)
+
+    def classify(self, batch: list) -> None:
+        messages = [message for message, _ in batch]
+        threshold = float(self.env.service_config.get_spam_threshold()) / 100
+        start = time.time()
+
+        if len(self.workers) > 0:
+            predictions = self.classify_in_workers(messages, threshold)
+        else:
+            predictions = tpool.execute(self.classifier.is_spam_batch, messages, threshold)
+
+        self.env.stats.timing('spam.batch.latency', (time.time() - start) * 1000)
+        self.env.stats.gauge('spam.batch.size', len(batch))
+        self.env.stats.gauge('spam.queue.size', self.queue.qsize())
+
+        for (_, result), prediction in zip(batch, predictions):
+            result.send(prediction)
+
+    def classify_in_workers(self, messages: list, threshold: float) -> list:
+        chunk_size = math.ceil(len(messages) / len(self.workers))
+        chunks = [messages[i:i + chunk_size] for i in range(0, len(messages), chunk_size)]
+
+        sent, errors = list(), list()
+        for i, chunk in enumerate(chunks):
+            try:
+                self.send_to_worker(i, (chunk, threshold))
+                sent.append(i)
+            except OSError as e:
+                errors.append('could not send to worker: {}'.format(str(e)))
+
+        # read every answer from the workers that got a chunk before failing, otherwise the next batch would get the
+        # answer to this one
+        predictions = list()
+        for i in sent:
+            try:
+                chunk_predictions, error = tpool.execute(self.workers[i].recv)
+            except (EOFError, OSError):
+                chunk_predictions, error = None, 'worker process exited'
+                self.restart_worker(i)
+
+            if error is not None:
+                errors.append(error)
+            else:
+                predictions.extend(chunk_predictions)
+
+        if len(errors) > 0:
+            raise RuntimeError('worker(s) could not classify batch: {}'.format(', '.join(errors)))
+        return predictions
@@ -13,6 +13,9 @@
 # limitations under the License.
 
 import logging
+from collections import OrderedDict
+from typing import Dict
+from typing import Union
 
 from activitystreams.models.activity import Activity
 
@@ -20,6 +23,7 @@ from dino.validation.generic import GenericValidator
 from dino.exceptions import ValidationException
 from dino.config import ConfigKeys
 from dino.config import ApiTargets
+from dino.config import RoleKeys
 from dino import environ
 from dino import utils
 
@@ -28,7 +32,57 @@ __author__ = 'Oscar Eriksson <oscar.eriks@gmail.com>'
 logger = logging.getLogger(__name__)
 
 
+class AclDecisionCache(object):
+    """
+    lru cache of acl decisions per (user, target type, target id, action); each decision is stored with a fingerprint
+    of what it was based on (the acls of the target and the session values they check), so a decision is only reused
+    while neither the acls nor the user's session have changed
+    """
+
+    def __init__(self, max_size: int = 10000):
+        self.max_size = max_size
+        self.decisions = OrderedDict()
+
+    def get(self, key: tuple, fingerprint: tuple):
+        fingerprint_and_decision = self.decisions.get(key)
+        if fingerprint_and_decision is None or fingerprint_and_decision[0] != fingerprint:
+            return None
+
+        self.decisions.move_to_end(key)
+        return fingerprint_and_decision[1]
+
+    def set(self, key: tuple, fingerprint: tuple, decision: tuple) -> None:
+        if self.max_size <= 0:
+            return
+
+        self.decisions[key] = (fingerprint, decision)
+        self.decisions.move_to_end(key)
+        while len(self.decisions) > self.max_size:
+            self.decisions.popitem(last=False)
+
+    def clear(self) -> None:
+        self.decisions.clear()
+
+    def __len__(self) -> int:
+        return len(self.decisions)
+
+
 class AclValidator(object):
+    """
+    The acl types to check for each target type and action, with their validators, are resolved from the acl config
+    once (and again only if the config is replaced), instead of walking the config on every check.
+
+    Role bypasses (admin, super user, global moderator, channel and room owner) are resolved from a single lookup of
+    the user's roles, and only if the target has acls at all; they are checked before the decision cache, so role
+    changes apply immediately. Decisions only based on session values (e.g. gender, age, custom patterns of those)
+    are then cached per user, target and action until the acls or the session values change.
+    """
+
+    def __init__(self, decision_cache_size: int = 10000):
+        self.rules = dict()
+        self.rules_for = None
+        self.decisions = AclDecisionCache(decision_cache_size)
+
     def is_acl_valid(self, acl_type, acl_value):
         all_acls = environ.env.config.get(ConfigKeys.ACL)
         all_validators = all_acls['validation']
@@ -56,6 +110,63 @@ class AclValidator(object):
             return False, e.msg
         return True, None
 
+    def _rules_for_action(self, all_acls: dict, target: str, action: str) -> list:
+        """
+        :return: the acl types checked for the action on the target type, with their validators, e.g.
+        [('gender', AclStrInCsvValidator), ('age', AclRangeValidator)]
+        """
+        if all_acls is not self.rules_for:
+            self.rules = dict()
+            self.rules_for = all_acls
+            self.decisions.clear()
+
+        rules = self.rules.get((target, action))
+        if rules is not None:
+            return rules
+
+        validators = all_acls['validation']
+        rules = [
+            (acl, validators[acl]['value'] if acl in validators else None)
+            for acl in all_acls[target][action].get('acls', list())
+        ]
+        self.rules[(target, action)] = rules
+        return rules
+
+    @staticmethod
+    def _has_bypassing_role(user_id: str, channel_id: str, room_id: str = None) -> bool:
+        if user_id is None:
+            return False
+
+        roles = utils.get_user_roles_for_target(user_id, channel_id, room_id)
+
+        if RoleKeys.SUPER_USER in roles['global'] or RoleKeys.GLOBAL_MODERATOR in roles['global']:
+            return True
+        if RoleKeys.ADMIN in roles['channel'] or RoleKeys.OWNER in roles['channel']:
+            return True
+        return RoleKeys.OWNER in roles['room']
+
+    @staticmethod
+    def _fingerprint(rules: list, target_acls: dict, session) -> Union[tuple, None]:
+        """
+        the acls and session values a decision is based on, or None if it's based on anything else (e.g. roles or the
+        rooms in the activity) and can't be cached
+        """
+        acls, session_keys = list(), list()
+        for acl, validator in rules:
+            if acl not in target_acls:
+                continue
+            if not isinstance(validator, BaseAclValidator):
+                return None
+
+            keys = validator.session_keys(acl, target_acls[acl])
+            if keys is None:
+                return None
+
+            acls.append((acl, target_acls[acl]))
+            session_keys.extend(keys)
+
+        return tuple(acls), tuple(session.get(key) for key in session_keys)
+
     def validate_acl_for_action(
             self,
             activity: Activity,
@@ -94,43 +205,146 @@ class AclValidator(object):
             if channel_id is None:
                 channel_id = activity.object.url
 
-        if utils.is_admin(channel_id, user_id):
-            return True, None
-        if utils.is_super_user(user_id):
-            return True, None
-        if utils.is_global_moderator(user_id):
-            return True, None
-
         # no acls for this target (room/channel) and action (join/kick/etc)
         if target not in all_acls or action not in all_acls[target] or len(all_acls[target][action]) == 0:
             return True, None  # 'no acl set that allows action "%s" for target type "%s"' % (action, target)
 
-        if utils.is_owner_channel(channel_id, user_id):
-            return True, None
-
-        if target == 'channel':
-            pass
-        elif target == 'room':
-            if utils.is_owner(target_id, user_id):
-                return True, None
-
         # no acls for this target and action
         if target_acls is None or len(target_acls) == 0:
             return True, None
 
-        possible_acls = all_acls[target][action]
-        for acl_rule, acl_values in possible_acls.items():
-            if acl_rule != 'acls':
-                continue
-            for acl in acl_values:
-                if acl not in target_acls.keys():
+        if self._has_bypassing_role(user_id, channel_id, target_id if target == 'room' else None):
+            return True, None
+
+        rules = self._rules_for_action(all_acls, target, action)
+
+        # the range validator always reads the session from the environment, so only cache when that's what's used
+        fingerprint, key = None, None
+        if session_to_use is environ.env.session:
+            fingerprint = AclValidator._fingerprint(rules, target_acls, session_to_use)
+            key = (user_id, target, target_id, action)
+
+        if fingerprint is not None:
+            decision = self.decisions.get(key, fingerprint)
+            if decision is not None:
+                return decision
+
+        decision = self._validate_rules(activity, rules, target_acls, session_to_use)
+        if fingerprint is not None:
+            self.decisions.set(key, fingerprint, decision)
+        return decision
+
+    def filter_targets_for_action(
+            self,
+            activity: Activity,
+            target: str,
+            action: str,
+            acls_per_target: Dict[str, dict],
+            channel_id: str = None,
+            session_to_use=None,
+    ) -> list:
+        """
+        the same decision as validate_acl_for_action() for many rooms or channels at once, e.g. which channels a user
+        may list; the rules are resolved once, targets with the same acls are only evaluated once against the
+        session, and the user's roles are only looked up (once) if any target was denied by its acls
+
+        :param activity: the activity of the request; validators that read the activity (e.g. samechannel) see the
+        id of each target in object.url (channels) or target.id (rooms)
+        :param target: the type of the targets, 'room' or 'channel'
+        :param action: the action on the targets, e.g. 'list'
+        :param acls_per_target: target id to the acls for the action on it
+        :param channel_id: the channel of the rooms, if the targets are rooms
+        :param session_to_use: for testing purposes, defaults to the session of the request
+        :return: the target ids the user is allowed to do the action on, in the order of acls_per_target
+        """
+        if session_to_use is None:
+            session_to_use = environ.env.session
+
+        if not hasattr(activity, 'target') or not hasattr(activity.target, 'object_type'):
+            return list()
+        if activity.target.object_type is None or len(activity.target.object_type.strip()) == 0:
+            return list()
+
+        all_acls = environ.env.config.get(ConfigKeys.ACL)
+        if target not in all_acls or action not in all_acls[target] or len(all_acls[target][action]) == 0:
+            return list(acls_per_target.keys())
+
+        rules = self._rules_for_action(all_acls, target, action)
+        decisions, denied = dict(), set()
+
+        # where validators reading the activity look for the id of the target
+        if target == ApiTargets.CHANNEL:
+            target_id_on, target_id_attr = activity.object, 'url'
+        else:
+            target_id_on, target_id_attr = activity.target, 'id'
+        original_target_id = getattr(target_id_on, target_id_attr, None)
+
+        try:
+            for target_id, target_acls in acls_per_target.items():
+                if target_acls is None or len(target_acls) == 0:
                     continue
 
-                is_valid_func = all_acls['validation'][acl]['value']
-                is_valid, msg = is_valid_func(activity, environ.env, acl, target_acls[acl], False, session_to_use)
+                fingerprint = AclValidator._fingerprint(rules, target_acls, session_to_use)
+                if fingerprint is not None and fingerprint in decisions:
+                    is_valid = decisions[fingerprint]
+                else:
+                    setattr(target_id_on, target_id_attr, target_id)
+                    is_valid, _ = self._validate_rules(activity, rules, target_acls, session_to_use)
+                    if fingerprint is not None:
+                        decisions[fingerprint] = is_valid
+
                 if not is_valid:
-                    return False, 'acl "%s" did not validate for target acl "%s": %s' % (
-                        acl, target_acls[acl], msg)
+                    denied.add(target_id)
+        finally:
+            setattr(target_id_on, target_id_attr, original_target_id)
+
+        if len(denied) > 0:
+            denied -= AclValidator._bypassed_targets(activity.actor.id, target, denied, channel_id)
+
+        return [target_id for target_id in acls_per_target.keys() if target_id not in denied]
+
+    @staticmethod
+    def _bypassed_targets(user_id: str, target: str, target_ids: set, channel_id: str = None) -> set:
+        """
+        the targets where the user has a role that bypasses acls, from one lookup of the user's roles in all of them
+        """
+        if user_id is None:
+            return set()
+
+        if target == ApiTargets.CHANNEL:
+            channel_for_target = {target_id: target_id for target_id in target_ids}
+            room_ids = set()
+        else:
+            channel_for_target = {
+                target_id: channel_id or utils.get_channel_for_room(target_id)
+                for target_id in target_ids
+            }
+            room_ids = set(target_ids)
+
+        roles = utils.get_user_roles_for_targets(user_id, set(channel_for_target.values()), room_ids)
+        if RoleKeys.SUPER_USER in roles['global'] or RoleKeys.GLOBAL_MODERATOR in roles['global']:
+            return set(target_ids)
+
+        bypassed = set()
+        for target_id in target_ids:
+            channel_roles = roles['channel'].get(channel_for_target[target_id], list())
+            if RoleKeys.ADMIN in channel_roles or RoleKeys.OWNER in channel_roles:
+                bypassed.add(target_id)
+            elif RoleKeys.OWNER in roles['room'].get(target_id, list()):
+                bypassed.add(target_id)
+
+        return bypassed
+
+    @staticmethod
+    def _validate_rules(activity: Activity, rules: list, target_acls: dict, session_to_use) -> (bool, str):
+        for acl, is_valid_func in rules:
+            if acl not in target_acls.keys():
+                continue
+
+            is_valid, msg = is_valid_func(activity, environ.env, acl, target_acls[acl], False, session_to_use)
+            if not is_valid:
+                return False, 'acl "%s" did not validate for target acl "%s": %s' % (
+                    acl, target_acls[acl], msg)
 
         return True, None
 
@@ -139,6 +353,13 @@ class BaseAclValidator(object):
     def validate_new_acl(self, values):
         raise NotImplementedError('validate_new_acl')
 
+    def session_keys(self, acl_type: str, acl_values: str) -> Union[tuple, None]:
+        """
+        :return: the session keys the outcome of this validator depends on, or None if it depends on anything other
+        than the session, e.g. roles or the activity; only outcomes of session-only validators are cached
+        """
+        return None
+
 
 class AclIsAdminValidator(BaseAclValidator):
     def __init__(self):
@@ -229,9 +450,29 @@ class AclIsSuperUserValidator(BaseAclValidator):
         return False, 'not super user'
 
 
+def _all_of(predicates: list):
+    return lambda activity, env: all(predicate(activity, env) for predicate in predicates)
+
+
+def _any_of(predicates: list):
+    return lambda activity, env: any(predicate(activity, env) for predicate in predicates)
+
+
 class AclPatternValidator(BaseAclValidator):
+    """
+    Validates 'custom' acls, e.g. "gender=m|age=:35" or "gender=f,(membership=tg_p|membership=tg)".
+
+    A pattern is parsed once into a predicate closure (ors of ands of 'type=value' clauses, each clause calling the
+    validator for its acl type) and kept by pattern, instead of splitting the string on every check; patterns set
+    through set_acl or the admin api are compiled when validated, others on first use.
+    """
+
+    MAX_COMPILED = 10000
+
     def __init__(self):
         self.acl_type = 'custom'
+        self.compiled = dict()
+        self.compiled_for = None
         pattern = '^[0-9a-z!\|,\(\):=_]*$'
 
         try:
@@ -263,9 +504,16 @@ class AclPatternValidator(BaseAclValidator):
                     raise ValidationException('nest parenthesis not allowed in pattern: %s' % values)
 
         groups = dict()
-        self._split_and_test_clause(groups, values, is_validating_a_user=False)
+        self._split_and_test_clause(groups, values)
+        self._compiled(values)
 
-    def _test_a_clause(self, clause, is_validating_a_user: bool, activity: Activity=None, env=None):
+    def session_keys(self, acl_type: str, acl_values: str) -> Union[tuple, None]:
+        try:
+            return self._compiled(acl_values)[1]
+        except ValidationException:
+            return None
+
+    def _validator_for_clause(self, clause: str, validators: dict) -> (str, str, bool, BaseAclValidator):
         if '=' not in clause:
             raise ValidationException('no equal sign in clause: %s' % clause)
 
@@ -273,9 +521,7 @@ class AclPatternValidator(BaseAclValidator):
             raise ValidationException('equal sign mismatch in clause: %s' % clause)
 
         acl_type, acl_value = clause.split('=')
-        all_acls = environ.env.config.get(ConfigKeys.ACL)
-        all_validators = all_acls['validation']
-        if acl_type not in all_validators:
+        if acl_type not in validators:
             raise ValidationException(
                     'invalid acl "%s" in clause: %s' % (acl_type, clause))
 
@@ -284,45 +530,28 @@ class AclPatternValidator(BaseAclValidator):
                     'nested custom acls not allowed in clause: %s' % clause)
 
         value_is_negated = False
-        if acl_value[0] == '!':
+        if len(acl_value) > 0 and acl_value[0] == '!':
             acl_value = acl_value[1:]
             value_is_negated = True
 
-        validator_func = all_validators[acl_type]['value']
+        validator_func = validators[acl_type]['value']
         if not isinstance(validator_func, BaseAclValidator):
             raise ValidationException(
                     'validator for acl type "%s" is not of instance BaseAclValidator '
                     'but "%s"' % (acl_type, str(type(validator_func))))
 
-        # a user is using the api, so validate his action against set pattern
-        if is_validating_a_user:
-            if not callable(validator_func):
-                raise ValidationException('validator function is not callable')
+        return acl_type, acl_value, value_is_negated, validator_func
 
-            is_valid, msg = validator_func(activity, env, acl_type, acl_value, value_is_negated)
-            return is_valid, msg
-        # now we're validating a new acl rule set in admin interface
-        else:
-            validator_func.validate_new_acl(acl_value)
-            return True, None
+    def _test_a_clause(self, clause):
+        validators = environ.env.config.get(ConfigKeys.ACL)['validation']
+        _, acl_value, _, validator_func = self._validator_for_clause(clause, validators)
+        validator_func.validate_new_acl(acl_value)
 
-    def _split_and_test_clause(self, groups, clause, is_validating_a_user: bool=False, activity: Activity=None, env=None):
+    @staticmethod
+    def _extract_groups(groups: dict, clause: str) -> str:
         """
-        The default value for is_validating_a_user is False, meaning we're validating a new acl rule someone set in the
-        admin web interface. In this case the activity and env variables are not used. On the other hand, if
-        is_validating_a_user is set to true, it means we're validating the "custom" acl rule for something a user did
-        through the API, and in this case the activity and env is needed, since we'll be validating against the user
-        info set on the environment for this user, e.g. age, gender or whatever it could be in the current 7
-        implementation.
-
-        :param groups: the first time this method is called this dict has to be empty; it is used to store parenthesis
-        clauses, so we can split the and/or tokens without affecting the parenthesises; since this method is recursive
-        we have to pass this dict throughout the recursion
-        :param clause: the value of the "custom" acl, e.g. "gender=m|age=:35,gender=!m"
-        :param is_validating_a_user: true means validate a user api action, false means validate a new custom acl rule
-        :param activity: the activity the user supplied (if is_validating_a_user is True, None otherwise)
-        :param env: the current environ.env (if is_validating_a_user is True, None otherwise)
-        :return: nothing
+        replace each parenthesis clause with '@<index>@' and store it in groups, so the and/or tokens can be split
+        without affecting the parenthesises
         """
         while '(' in clause:
             pos = len(groups)
@@ -330,6 +559,25 @@ class AclPatternValidator(BaseAclValidator):
             end = clause.index(')')
             groups[pos] = clause[start:end]
             clause = clause[:start-1] + '@%s@' % pos + clause[end+1:]
+        return clause
+
+    @staticmethod
+    def _group_for(groups: dict, and_clause: str) -> str:
+        if and_clause[0] != '@' or and_clause[-1] != '@' or and_clause.count('@') != 2:
+            raise ValidationException('mismatched at-signs in clause: %s' % and_clause)
+        return groups[int(and_clause[1:len(and_clause)-1])]
+
+    def _split_and_test_clause(self, groups, clause):
+        """
+        Validate a new acl rule someone set in the admin web interface or through the api.
+
+        :param groups: the first time this method is called this dict has to be empty; it is used to store parenthesis
+        clauses, so we can split the and/or tokens without affecting the parenthesises; since this method is recursive
+        we have to pass this dict throughout the recursion
+        :param clause: the value of the "custom" acl, e.g. "gender=m|age=:35,gender=!m"
+        :return: nothing
+        """
+        clause = AclPatternValidator._extract_groups(groups, clause)
 
         or_clauses = [clause]
         if '|' in clause:
@@ -340,38 +588,83 @@ class AclPatternValidator(BaseAclValidator):
             if ',' in or_clause:
                 and_clauses = or_clause.split(',')
 
-            all_and_ok = True
             for and_clause in and_clauses:
                 if '@' in and_clause:
-                    if and_clause[0] != '@' or and_clause[-1] != '@' or and_clause.count('@') != 2:
-                        raise ValidationException('mismatched at-signs in clause: %s' % and_clause)
-                    and_clause = groups[int(and_clause[1:len(and_clause)-1])]
+                    and_clause = AclPatternValidator._group_for(groups, and_clause)
 
                 try:
                     if len([c for c in and_clause if c in '|,']) > 0:
-                        self._split_and_test_clause(groups, and_clause, is_validating_a_user, activity, env)
+                        self._split_and_test_clause(groups, and_clause)
                     else:
-                        is_valid, error_msg = self._test_a_clause(and_clause, is_validating_a_user, activity, env)
-                        if not is_valid:
-                            logger.error('during AND checks: %s' % error_msg)
-                            all_and_ok = False
-                            break
+                        self._test_a_clause(and_clause)
                 except ValidationException as e:
                     logger.error('during AND checks: %s' % e.msg)
                     raise e
-            if not all_and_ok:
-                continue
 
             # at least one OR was ok so we can return
             return
 
-        # if more than two we have or clauses, otherwise just one and clause
-        if len(or_clauses) > 1:
-            raise ValidationException(
-                'no OR clause validated true for: %s' % ('|'.join(or_clauses)))
-        else:
-            raise ValidationException(
-                'the AND clause did not validate for: %s' % (or_clauses[0]))
+    def _compile(self, groups: dict, clause: str, validators: dict):
+        """
+        :return: a predicate for the clause taking (activity, env), and the session keys it depends on (or None if it
+        depends on anything else)
+        """
+        clause = AclPatternValidator._extract_groups(groups, clause)
+        or_predicates, session_keys = list(), tuple()
+
+        for or_clause in clause.split('|'):
+            and_predicates = list()
+
+            for and_clause in or_clause.split(','):
+                if '@' in and_clause:
+                    and_clause = AclPatternValidator._group_for(groups, and_clause)
+
+                if len([c for c in and_clause if c in '|,']) > 0:
+                    predicate, keys = self._compile(groups, and_clause, validators)
+                else:
+                    predicate, keys = self._compile_clause(and_clause, validators)
+
+                and_predicates.append(predicate)
+                session_keys = None if keys is None or session_keys is None else session_keys + keys
+
+            or_predicates.append(_all_of(and_predicates))
+
+        return _any_of(or_predicates), session_keys
+
+    def _compile_clause(self, clause: str, validators: dict):
+        acl_type, acl_value, value_is_negated, validator_func = self._validator_for_clause(clause, validators)
+
+        if not callable(validator_func):
+            raise ValidationException('validator function is not callable')
+
+        def predicate(activity: Activity, env) -> bool:
+            is_valid, _ = validator_func(activity, env, acl_type, acl_value, value_is_negated)
+            return is_valid
+
+        return predicate, validator_func.session_keys(acl_type, acl_value)
+
+    def _compiled(self, pattern: str):
+        validators = environ.env.config.get(ConfigKeys.ACL)['validation']
+        if validators is not self.compiled_for:
+            self.compiled = dict()
+            self.compiled_for = validators
+
+        compiled = self.compiled.get(pattern)
+        if compiled is None:
+            try:
+                compiled = self._compile(dict(), pattern, validators)
+            except ValidationException as e:
+                compiled = e
+            except Exception as e:
+                compiled = ValidationException('could not parse pattern "%s": %s' % (pattern, str(e)))
+
+            if len(self.compiled) >= AclPatternValidator.MAX_COMPILED:
+                self.compiled.clear()
+            self.compiled[pattern] = compiled
+
+        if isinstance(compiled, ValidationException):
+            raise compiled
+        return compiled
 
     def __call__(self, *args, **kwargs):
         activity = args[0]
@@ -387,12 +680,13 @@ class AclPatternValidator(BaseAclValidator):
         acl_value = args[3]
 
         try:
-            #  _split_and_test_clause() is called recursively, but we need to retain the extracted parenthesis "groups"
-            groups = dict()
-            self._split_and_test_clause(groups, acl_value, is_validating_a_user=True, activity=activity, env=env)
+            predicate, _ = self._compiled(acl_value)
         except ValidationException as e:
             logger.error(e.msg)
             return False, e.msg
+
+        if not predicate(activity, env):
+            return False, 'no clause validated true for: %s' % acl_value
         return True, None
 
 
@@ -403,6 +697,9 @@ class AclDisallowValidator(BaseAclValidator):
     def validate_new_acl(self, values: str):
         pass
 
+    def session_keys(self, acl_type: str, acl_values: str) -> Union[tuple, None]:
+        return tuple()
+
     def __call__(self, *args, **kwargs):
         return False, 'not allowed'
 
@@ -503,6 +800,9 @@ class BaseInCsvAclValidator(BaseAclValidator):
                     'new acl value(s) "%s" does not match configured possible value(s) "%s"' %
                     (values, self.valid_csvs))
 
+    def session_keys(self, acl_type: str, acl_values: str) -> Union[tuple, None]:
+        return acl_type,
+
 
 class AclStrInCsvValidator(BaseInCsvAclValidator):
     def __call__(self, *args, **kwargs):
@@ -603,6 +903,9 @@ class AclRangeValidator(BaseAclValidator):
             if not GenericValidator.is_digit(range_max):
                 raise ValidationException('last value in range "%s" is not a number' % values)
 
+    def session_keys(self, acl_type: str, acl_values: str) -> Union[tuple, None]:
+        return acl_type,
+
     def __call__(self, *args, **kwargs):
         # activity = args[0]
         env = args[1]
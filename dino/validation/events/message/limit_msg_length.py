@@ -15,10 +15,10 @@ import traceback
 from yapsy.IPlugin import IPlugin
 from activitystreams.models.activity import Activity
 
-from dino import utils
 from dino.config import ErrorCodes
 from dino.config import ConfigKeys
 from dino.environ import GNEnvironment
+from dino.utils.message import message_context_for
 
 logger = logging.getLogger(__name__)
 
@@ -49,11 +49,12 @@ class OnMessageCheckContentLength(IPlugin):
         if message is None or len(message.strip()) == 0:
             return True, None, None
 
-        if not utils.is_base64(message):
+        context = message_context_for(activity, self.env)
+        if not context.is_base64:
             return False, ErrorCodes.NOT_BASE64, \
                    'invalid message content, not base64 encoded'
 
-        message = utils.b64d(message)
+        message = context.decoded
         if len(message) > self.max_length:
             return False, ErrorCodes.MSG_TOO_LONG, \
                    'message content needs to be shorter than %s characters' % self.max_length
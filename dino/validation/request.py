@@ -21,6 +21,7 @@ from dino.exceptions import NoSuchUserException
 from dino.exceptions import NoSuchChannelException
 from dino.exceptions import NoChannelFoundException
 from dino.exceptions import MultipleRoomsFoundForNameException
+from dino.utils.message import message_context_for
 from dino import validation
 from dino import environ
 from dino.validation.duration import DurationValidator
@@ -47,7 +48,8 @@ class RequestValidator(BaseValidator):
         if message is None or len(message.strip()) == 0:
             return False, ECodes.EMPTY_MESSAGE, 'empty message body'
 
-        if not utils.is_base64(message):
+        context = message_context_for(activity, environ.env)
+        if not context.is_base64:
             return False, ECodes.NOT_BASE64, 'invalid message content, not base64 encoded'
 
         if room_id is None or room_id == '':
@@ -100,9 +102,9 @@ class RequestValidator(BaseValidator):
                     return False, ECodes.USER_IS_BANNED, json_act
 
             if utils.should_validate_whispers():
-                message = utils.parse_message(message)
-                if message is not None and utils.is_whisper(message):
-                    users = utils.get_whisper_users_from_message(message)
+                message = context.parsed
+                if context.is_whisper:
+                    users = context.whisper_users
 
                     if len(users) > 0:
                         if not utils.can_send_whisper_in_channel(activity, channel_id):
@@ -72,6 +72,16 @@ class CacheRedisTest(TestCase):
         self.cache.set_user_status(CacheRedisTest.USER_ID, '1')
         self.assertEqual('1', self.cache.get_user_status(CacheRedisTest.USER_ID))
 
+    def test_get_user_statuses(self):
+        self.cache.set_user_status(CacheRedisTest.USER_ID, '1')
+        self.assertEqual({CacheRedisTest.USER_ID: '1'}, self.cache.get_user_statuses([CacheRedisTest.USER_ID, '9999']))
+
+    def test_get_user_statuses_after_expired(self):
+        self.cache.set_user_statuses({CacheRedisTest.USER_ID: '1', '9999': '2'})
+        self.cache._del(RedisKeys.user_status(CacheRedisTest.USER_ID))
+        statuses = self.cache.get_user_statuses([CacheRedisTest.USER_ID, '9999'])
+        self.assertEqual({CacheRedisTest.USER_ID: '1', '9999': '2'}, statuses)
+
     def test_user_check_status(self):
         self.assertFalse(self.cache.user_check_status(CacheRedisTest.USER_ID, '1'))
         self.cache.set_user_status(CacheRedisTest.USER_ID, '1')
@@ -178,3 +188,138 @@ class CacheRedisTest(TestCase):
         self.cache._del(key)
 
         self.assertEqual('1', self.cache.get_user_status(CacheRedisTest.USER_ID))
+
+    def test_node_for_sid_registered_on_login(self):
+        self.env.node_queue = 'node_queue_test_host_5000'
+        self.cache.login_session(CacheRedisTest.USER_ID, CacheRedisTest.USER_NAME, 'sid-1')
+        self.cache.add_sid_for_user(CacheRedisTest.USER_ID, 'sid-2')
+
+        self.assertEqual(
+            {'sid-1': 'node_queue_test_host_5000', 'sid-2': 'node_queue_test_host_5000'},
+            self.cache.get_nodes_for_sids(['sid-1', 'sid-2', 'sid-3']))
+
+    def test_node_for_sid_removed_on_disconnect(self):
+        self.env.node_queue = 'node_queue_test_host_5000'
+        self.cache.login_session(CacheRedisTest.USER_ID, CacheRedisTest.USER_NAME, 'sid-1')
+        self.cache.add_sid_for_user(CacheRedisTest.USER_ID, 'sid-2')
+
+        self.cache.disconnect_session(CacheRedisTest.USER_ID, 'sid-1', update_last_online=False)
+        self.cache.remove_sid_for_user(CacheRedisTest.USER_ID, 'sid-2')
+
+        self.assertEqual(dict(), self.cache.get_nodes_for_sids(['sid-1', 'sid-2']))
+
+    def test_node_for_sid_not_registered_without_node_queue(self):
+        self.cache.add_sid_for_user(CacheRedisTest.USER_ID, 'sid-1')
+        self.assertEqual(dict(), self.cache.get_nodes_for_sids(['sid-1']))
+
+    def test_session_count_summed_over_nodes(self):
+        self.cache.set_session_count(10)
+        self.cache.redis.hset(RedisKeys.session_count(), 'other-host-5000', 5)
+        self.cache.redis.zadd(RedisKeys.session_count_heartbeat(), {'other-host-5000': time.time()})
+
+        self.assertEqual(15, self.cache.get_session_count())
+
+    def test_session_count_of_stale_node_removed(self):
+        self.cache.redis.hset(RedisKeys.session_count(), 'other-host-5000', 5)
+        self.cache.redis.zadd(RedisKeys.session_count_heartbeat(), {'other-host-5000': time.time() - 3600})
+        self.assertEqual(0, self.cache.get_session_count())
+
+        self.cache.set_session_count(10)
+
+        self.assertEqual(10, self.cache.get_session_count())
+        self.assertIsNone(self.cache.redis.hget(RedisKeys.session_count(), 'other-host-5000'))
+        self.assertIsNone(self.cache.redis.zscore(RedisKeys.session_count_heartbeat(), 'other-host-5000'))
+
+    def test_can_whisper_to_user_cached(self):
+        self.cache.set_can_whisper_to_user(CacheRedisTest.USER_ID, 'friend', True, 0)
+        self.cache.cache.flushall()
+
+        self.assertEqual((True, 0), self.cache.get_can_whisper_to_user(CacheRedisTest.USER_ID, 'friend'))
+
+    def test_can_whisper_to_user_expires_per_receiver(self):
+        self.cache.set_can_whisper_to_user(CacheRedisTest.USER_ID, 'friend', True, 0)
+        key = RedisKeys.can_whisper_to(CacheRedisTest.USER_ID, 'friend')
+        self.assertTrue(0 < self.cache.redis.ttl(key) <= 10*60)
+
+        # whispering to someone else doesn't extend it
+        self.cache.redis.expire(key, 5)
+        self.cache.set_can_whisper_to_user(CacheRedisTest.USER_ID, 'other', True, 0)
+        self.assertTrue(0 < self.cache.redis.ttl(key) <= 5)
+
+        self.cache.redis.delete(key)
+        self.cache.cache.flushall()
+        self.assertEqual((None, None), self.cache.get_can_whisper_to_user(CacheRedisTest.USER_ID, 'friend'))
+
+    def test_can_not_whisper_to_user_only_cached_in_memory(self):
+        self.cache.set_can_whisper_to_user(CacheRedisTest.USER_ID, 'blocked', False, 762)
+        self.assertEqual((False, 762), self.cache.get_can_whisper_to_user(CacheRedisTest.USER_ID, 'blocked'))
+
+        self.cache.cache.flushall()
+        self.assertEqual((None, None), self.cache.get_can_whisper_to_user(CacheRedisTest.USER_ID, 'blocked'))
+
+    def room_directory(self, users: int = 2) -> dict:
+        return {CacheRedisTest.ROOM_ID: {
+            'name': CacheRedisTest.ROOM_NAME,
+            'sort_order': 1,
+            'ephemeral': False,
+            'admin': False,
+            'users': users
+        }}
+
+    def test_rooms_for_channel_with_info(self):
+        self.assertIsNone(self.cache.get_rooms_for_channel(CacheRedisTest.CHANNEL_ID))
+        self.cache.set_rooms_for_channel(CacheRedisTest.CHANNEL_ID, self.room_directory())
+        self.assertEqual(self.room_directory(), self.cache.get_rooms_for_channel(CacheRedisTest.CHANNEL_ID))
+
+    def test_rooms_for_channel_with_info_empty_channel(self):
+        self.cache.set_rooms_for_channel(CacheRedisTest.CHANNEL_ID, dict())
+        self.assertEqual(dict(), self.cache.get_rooms_for_channel(CacheRedisTest.CHANNEL_ID))
+
+    def set_room_directory(self, *visible_users):
+        self.cache.set_rooms_for_channel(
+            CacheRedisTest.CHANNEL_ID, self.room_directory(users=len(visible_users)),
+            visible_users={CacheRedisTest.ROOM_ID: set(visible_users)})
+
+    def visible_users_in_room(self) -> int:
+        return self.cache.get_rooms_for_channel(CacheRedisTest.CHANNEL_ID)[CacheRedisTest.ROOM_ID]['users']
+
+    def test_add_visible_user_to_rooms(self):
+        self.set_room_directory('1', '2')
+        self.cache.add_visible_user_to_rooms('3', {CacheRedisTest.CHANNEL_ID: [CacheRedisTest.ROOM_ID]})
+        self.assertEqual(3, self.visible_users_in_room())
+
+    def test_add_visible_user_to_rooms_already_counted(self):
+        self.set_room_directory('1', '2')
+        self.cache.add_visible_user_to_rooms('2', {CacheRedisTest.CHANNEL_ID: [CacheRedisTest.ROOM_ID]})
+        self.cache.add_visible_user_to_rooms('3', {CacheRedisTest.CHANNEL_ID: [CacheRedisTest.ROOM_ID]})
+        self.cache.add_visible_user_to_rooms('3', {CacheRedisTest.CHANNEL_ID: [CacheRedisTest.ROOM_ID]})
+        self.assertEqual(3, self.visible_users_in_room())
+
+    def test_remove_visible_user_from_rooms(self):
+        self.set_room_directory('1', '2')
+        self.cache.remove_visible_user_from_rooms('2', {CacheRedisTest.CHANNEL_ID: [CacheRedisTest.ROOM_ID]})
+        self.cache.remove_visible_user_from_rooms('2', {CacheRedisTest.CHANNEL_ID: [CacheRedisTest.ROOM_ID]})
+        self.assertEqual(1, self.visible_users_in_room())
+
+    def test_remove_visible_user_from_rooms_not_counted(self):
+        self.set_room_directory()
+        self.cache.remove_visible_user_from_rooms('1', {CacheRedisTest.CHANNEL_ID: [CacheRedisTest.ROOM_ID]})
+        self.assertEqual(0, self.visible_users_in_room())
+
+    def test_add_visible_user_to_rooms_without_directory(self):
+        self.cache.add_visible_user_to_rooms('1', {CacheRedisTest.CHANNEL_ID: [CacheRedisTest.ROOM_ID]})
+        self.assertIsNone(self.cache.get_rooms_for_channel(CacheRedisTest.CHANNEL_ID))
+        self.assertEqual(0, self.cache.redis.exists(RedisKeys.rooms_for_channel_with_info(CacheRedisTest.CHANNEL_ID)))
+        self.assertEqual(0, self.cache.redis.exists(RedisKeys.visible_users_in_directory(CacheRedisTest.ROOM_ID)))
+
+    def test_add_visible_user_to_rooms_after_reset(self):
+        self.set_room_directory('1')
+        self.cache.reset_rooms_for_channel(CacheRedisTest.CHANNEL_ID)
+        self.cache.add_visible_user_to_rooms('2', {CacheRedisTest.CHANNEL_ID: [CacheRedisTest.ROOM_ID]})
+        self.assertIsNone(self.cache.get_rooms_for_channel(CacheRedisTest.CHANNEL_ID))
+
+    def test_rebuilt_directory_replaces_visible_users(self):
+        self.set_room_directory('1', '2')
+        self.set_room_directory('1')
+        self.cache.remove_visible_user_from_rooms('2', {CacheRedisTest.CHANNEL_ID: [CacheRedisTest.ROOM_ID]})
+        self.assertEqual(1, self.visible_users_in_room())
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from unittest import TestCase
+
+import fakeredis
+
+from dino.cache.instrumentation import InstrumentedConnectionPool
+from dino.cache.instrumentation import InstrumentedRedis
+from dino.cache.instrumentation import RedisInstrumentation
+from dino.stats.statsd import MockStatsd
+
+__author__ = 'Oscar Eriksson <oscar.eriks@gmail.com>'
+
+
+class RedisInstrumentationTest(TestCase):
+    class FakeEnv(object):
+        def __init__(self):
+            self.stats = MockStatsd()
+
+    def setUp(self):
+        self.env = RedisInstrumentationTest.FakeEnv()
+        self.instrumentation = RedisInstrumentation(self.env, 'cache')
+        pool = InstrumentedConnectionPool(
+            self.instrumentation,
+            connection_class=fakeredis.FakeConnection,
+            server=fakeredis.FakeServer(),
+            max_connections=2
+        )
+        self.redis = InstrumentedRedis(connection_pool=pool)
+
+    def test_commands_counted_per_name(self):
+        self.redis.set('foo', 'bar')
+        self.assertEqual(b'bar', self.redis.get('foo'))
+        self.redis.get('foo')
+
+        self.assertEqual(1, self.instrumentation.counters['SET'][0])
+        self.assertEqual(2, self.instrumentation.counters['GET'][0])
+
+    def test_pipeline_counted_once(self):
+        pipe = self.redis.pipeline()
+        pipe.set('foo', 'bar')
+        pipe.get('foo')
+        self.assertEqual([True, b'bar'], pipe.execute())
+
+        self.assertEqual(1, self.instrumentation.counters['PIPELINE'][0])
+        self.assertNotIn('GET', self.instrumentation.counters)
+
+    def test_connections_reused(self):
+        for _ in range(10):
+            self.redis.get('foo')
+        self.assertEqual(1, len(self.redis.connection_pool._connections))
+
+    def test_report_resets_counters(self):
+        self.redis.get('foo')
+        self.instrumentation.report()
+
+        self.assertEqual(1, self.env.stats.vals['redis.cache.get.count'])
+        self.assertIn('redis.cache.get.latency', self.env.stats.timings)
+        self.assertIn('redis.cache.get.pool_wait', self.env.stats.timings)
+        self.assertEqual(0, len(self.instrumentation.counters))
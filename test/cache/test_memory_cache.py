@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from unittest import TestCase
+from unittest.mock import patch
+
+import time
+
+from dino.cache.redis import MemoryCache
+from dino.stats.statsd import MockStatsd
+
+__author__ = 'Oscar Eriksson <oscar.eriks@gmail.com>'
+
+
+class MemoryCacheTest(TestCase):
+    class FakeEnv(object):
+        def __init__(self):
+            self.stats = MockStatsd()
+
+    def setUp(self):
+        self.env = MemoryCacheTest.FakeEnv()
+        self.cache = MemoryCache(max_size=3, env=self.env)
+
+    def test_evicts_least_recently_used(self):
+        for key in ['user:status:1', 'user:status:2', 'user:status:3']:
+            self.cache.set(key, 'a')
+
+        # touch the oldest key so the second one is the least recently used
+        self.assertEqual('a', self.cache.get('user:status:1'))
+        self.cache.set('user:status:4', 'a')
+
+        self.assertEqual(3, len(self.cache.vals))
+        self.assertIsNone(self.cache.get('user:status:2'))
+        self.assertEqual('a', self.cache.get('user:status:1'))
+
+    def test_expired_keys_purged_on_set(self):
+        self.cache.set('user:status:1', 'a', ttl=0.05)
+        self.cache.set('user:status:2', 'a', ttl=60)
+        time.sleep(0.1)
+        self.cache.set('user:status:3', 'a')
+
+        self.assertNotIn('user:status:1', self.cache.vals)
+        self.assertIn('user:status:2', self.cache.vals)
+
+    def test_overwrite_keeps_new_expiry(self):
+        self.cache.set('user:status:1', 'a', ttl=0.05)
+        self.cache.set('user:status:1', 'b', ttl=60)
+        time.sleep(0.1)
+        self.cache.cleanup()
+        self.assertEqual('b', self.cache.get('user:status:1'))
+
+    def test_cleanup_only_pops_expired_entries(self):
+        self.cache.set('user:status:1', 'a', ttl=0.05)
+        self.cache.set('user:status:2', 'a', ttl=60)
+        time.sleep(0.1)
+
+        with patch.object(self.cache, '_rebuild_expiry') as rebuild_expiry:
+            self.cache.cleanup()
+
+        rebuild_expiry.assert_not_called()
+        self.assertNotIn('user:status:1', self.cache.vals)
+        self.assertEqual([(self.cache.vals['user:status:2'][0], 'user:status:2')], self.cache.expiry)
+
+    def test_ttl_override_for_family(self):
+        cache = MemoryCache(ttls={'user:status': 0.05})
+        cache.set('user:status:1', 'a', ttl=60)
+        cache.set('user:online:last:1', 'a', ttl=60)
+        time.sleep(0.1)
+        self.assertIsNone(cache.get('user:status:1'))
+        self.assertEqual('a', cache.get('user:online:last:1'))
+
+    def test_counters_reported_per_family(self):
+        for key in ['user:status:1', 'user:status:2', 'user:status:3', 'user:status:4']:
+            self.cache.set(key, 'a')
+        self.cache.get('user:status:4')
+        self.cache.get('user:status:1')
+        self.cache.report_stats()
+
+        self.assertEqual(1, self.env.stats.vals['cache.memory.user_status.hits'])
+        self.assertEqual(1, self.env.stats.vals['cache.memory.user_status.misses'])
+        self.assertEqual(1, self.env.stats.vals['cache.memory.user_status.evictions'])
+        self.assertEqual(3, self.env.stats.vals['cache.memory.size'])
+
+    def test_key_family(self):
+        self.assertEqual('user:status', MemoryCache.key_family('user:status:1234'))
+        self.assertEqual('users:roles', MemoryCache.key_family('users:roles-1234'))
+        self.assertEqual('room:acls', MemoryCache.key_family('room:acls:1aa1e0a2-d6c8-11e6-9ac3-ef6c4df5dbd2'))
+        self.assertEqual('room', MemoryCache.key_family('room:abcdefab-d6c8-11e6-9ac3-ef6c4df5dbd2'))
+        self.assertEqual('other', MemoryCache.key_family('1234'))
@@ -1,6 +1,10 @@
+import os
+import shutil
+import tempfile
 import time
 from datetime import datetime
 from datetime import timedelta
+from unittest.mock import patch
 from uuid import uuid4 as uuid
 
 from activitystreams import parse
@@ -12,7 +16,9 @@ from dino.config import ApiActions, RedisKeys
 from dino.config import ConfigKeys
 from dino.config import SessionKeys
 from dino.config import UserKeys
+from dino.config import RoleKeys
 from dino.db.rdbms.handler import DatabaseRdbms
+from dino.db.write_behind import MembershipJournal
 from dino.environ import ConfigDict
 from dino.environ import GNEnvironment
 from dino.exceptions import ChannelExistsException
@@ -52,6 +58,7 @@ class BaseDatabaseTest(BaseTest):
             self.node = 'test'
             self.auth = AuthRedis(env=self, host='mock')
             self.request = BaseDatabaseTest.FakeRequest()
+            self.capture_exception = lambda e: False
 
     MESSAGE_ID = str(uuid())
 
@@ -228,6 +235,52 @@ class BaseDatabaseTest(BaseTest):
         rooms = self._rooms_for_user()
         self.assertEqual(0, len(rooms))
 
+    def _test_apply_membership_changes(self):
+        self._create_channel()
+        self._create_room()
+
+        joins = {(BaseTest.USER_ID, BaseTest.ROOM_ID): BaseTest.USER_NAME}
+        room_sids = {(BaseTest.USER_ID, BaseTest.ROOM_ID, 'sid-1')}
+        self.db.login_session(BaseTest.USER_ID, BaseTest.USER_NAME, 'sid-1', dict())
+
+        # applying the same batch twice, e.g. replaying a journal, should not fail or duplicate anything
+        self.db.apply_membership_changes(joins, set(), room_sids)
+        self.db.apply_membership_changes(joins, set(), room_sids)
+        self.assertEqual([BaseTest.ROOM_ID], list(self.db.rooms_for_user(BaseTest.USER_ID, skip_cache=True).keys()))
+
+        self.db.apply_membership_changes(dict(), {(BaseTest.USER_ID, BaseTest.ROOM_ID)}, set())
+        self.assertEqual(0, len(self.db.rooms_for_user(BaseTest.USER_ID, skip_cache=True)))
+
+    def _test_apply_membership_changes_session_ended(self):
+        self._create_channel()
+        self._create_room()
+
+        joins = {(BaseTest.USER_ID, BaseTest.ROOM_ID): BaseTest.USER_NAME}
+        self.db.apply_membership_changes(joins, set(), {(BaseTest.USER_ID, BaseTest.ROOM_ID, 'sid-1')})
+
+        self.assertEqual(0, len(self.db.rooms_for_user(BaseTest.USER_ID, skip_cache=True)))
+        self.assertEqual(0, len(self.db.get_rooms_with_sid(BaseTest.USER_ID)))
+
+    def _test_journaled_changes_read_before_flush(self):
+        self._create_channel()
+        self._create_room()
+        journal_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, journal_dir)
+        self.db.journal = MembershipJournal(self.env, os.path.join(journal_dir, 'joins.journal'), flush_interval=3600)
+
+        self._join()
+        self.assertEqual([BaseTest.ROOM_ID], list(self.db.rooms_for_user(BaseTest.USER_ID, skip_cache=True).keys()))
+        self.assertIn(BaseTest.USER_ID, self.db.users_in_room(BaseTest.ROOM_ID, skip_cache=True))
+
+        self._leave()
+        self.assertEqual(0, len(self.db.rooms_for_user(BaseTest.USER_ID, skip_cache=True)))
+        self.assertNotIn(BaseTest.USER_ID, self.db.users_in_room(BaseTest.ROOM_ID, skip_cache=True))
+
+    def _test_apply_membership_changes_room_removed(self):
+        self._create_channel()
+        self.db.apply_membership_changes({(BaseTest.USER_ID, BaseTest.ROOM_ID): BaseTest.USER_NAME}, set(), set())
+        self.assertEqual(0, len(self.db.rooms_for_user(BaseTest.USER_ID, skip_cache=True)))
+
     def _test_leave_room_joined(self):
         self._create_channel()
         self._create_room()
@@ -765,6 +818,168 @@ class BaseDatabaseTest(BaseTest):
         self.assertTrue(exists_1)
         self.assertFalse(self.db.room_exists(str(uuid()), str(uuid())))
 
+    def _test_get_user_statuses(self):
+        self.db.set_user_online(BaseTest.USER_ID)
+        statuses = self.db.get_user_statuses([BaseTest.USER_ID, BaseTest.OTHER_USER_ID])
+        self.assertEqual(UserKeys.STATUS_AVAILABLE, statuses[BaseTest.USER_ID])
+        self.assertEqual(UserKeys.STATUS_UNAVAILABLE, statuses[BaseTest.OTHER_USER_ID])
+
+    def _test_get_users_roles_in_room(self):
+        self._create_channel()
+        self._create_room()
+        self._set_moderator()
+        roles = self.db.get_users_roles_in_room([BaseTest.USER_ID, BaseTest.OTHER_USER_ID], BaseTest.ROOM_ID)
+        self.assertIn(RoleKeys.MODERATOR, roles[BaseTest.USER_ID])
+        self.assertEqual(list(), roles[BaseTest.OTHER_USER_ID])
+
+    def _test_get_user_roles_for_target(self):
+        self._create_channel()
+        self._create_room()
+        self._set_admin()
+
+        roles = self.db.get_user_roles_for_target(BaseTest.USER_ID, BaseTest.CHANNEL_ID, BaseTest.ROOM_ID)
+        self.assertIn(RoleKeys.ADMIN, roles['channel'])
+        self.assertIn(RoleKeys.OWNER, roles['room'])
+
+        roles = self.db.get_user_roles_for_target(BaseTest.OTHER_USER_ID, BaseTest.CHANNEL_ID, BaseTest.ROOM_ID)
+        self.assertEqual({'global': list(), 'channel': list(), 'room': list()}, roles)
+
+    def _test_get_user_roles_for_targets_not_joined(self):
+        other_room_id = str(uuid())
+        self._create_channel()
+        self._create_room()
+        self.db.create_room('other', other_room_id, BaseTest.CHANNEL_ID, BaseTest.OTHER_USER_ID, 'other-name')
+        self._set_admin()
+
+        # owner and admin without having joined any of the rooms
+        roles = self.db.get_user_roles_for_targets(
+            BaseTest.USER_ID, {BaseTest.CHANNEL_ID}, {BaseTest.ROOM_ID, other_room_id})
+        self.assertEqual(list(), roles['global'])
+        self.assertIn(RoleKeys.ADMIN, roles['channel'][BaseTest.CHANNEL_ID])
+        self.assertIn(RoleKeys.OWNER, roles['room'][BaseTest.ROOM_ID])
+        self.assertEqual(list(), roles['room'][other_room_id])
+
+        roles = self.db.get_user_roles_for_targets(BaseTest.OTHER_USER_ID, {BaseTest.CHANNEL_ID}, {other_room_id})
+        self.assertEqual(list(), roles['channel'][BaseTest.CHANNEL_ID])
+        self.assertIn(RoleKeys.OWNER, roles['room'][other_room_id])
+
+    def _test_get_all_acls_channels(self):
+        self._create_channel()
+        self.db.add_acls_in_channel_for_action(BaseTest.CHANNEL_ID, ApiActions.LIST, {'gender': 'm,f'})
+
+        acls = self.db.get_all_acls_channels([BaseTest.CHANNEL_ID, str(uuid())])
+        self.assertEqual({BaseTest.CHANNEL_ID: {ApiActions.LIST: {'gender': 'm,f'}}}, acls)
+
+    def _test_get_all_acls_rooms(self):
+        other_room_id = str(uuid())
+        self._create_channel()
+        self._create_room()
+        self.db.create_room('other', other_room_id, BaseTest.CHANNEL_ID, BaseTest.USER_ID, BaseTest.USER_NAME)
+        self.db.add_acls_in_room_for_action(BaseTest.ROOM_ID, ApiActions.JOIN, {'gender': 'f'})
+
+        acls = self.db.get_all_acls_rooms([BaseTest.ROOM_ID, other_room_id, str(uuid())])
+        self.assertEqual(dict(), acls[other_room_id])
+        self.assertEqual({'gender': 'f'}, acls[BaseTest.ROOM_ID][ApiActions.JOIN])
+        self.assertEqual(2, len(acls))
+
+    def _test_room_directory_counts_without_rebuild(self):
+        self._create_channel()
+        self._create_room()
+        self.assertEqual(0, self._rooms_for_channel()[BaseTest.ROOM_ID]['users'])
+
+        rebuild = patch.object(self.env.cache, 'set_rooms_for_channel', wraps=self.env.cache.set_rooms_for_channel)
+        with rebuild as set_rooms_for_channel:
+            self._join()
+            self.assertEqual(1, self._rooms_for_channel()[BaseTest.ROOM_ID]['users'])
+            self._join()
+            self.assertEqual(1, self._rooms_for_channel()[BaseTest.ROOM_ID]['users'])
+
+            self.db.set_user_invisible(BaseTest.USER_ID)
+            self.assertEqual(0, self._rooms_for_channel()[BaseTest.ROOM_ID]['users'])
+            self.db.set_user_online(BaseTest.USER_ID)
+            self.assertEqual(1, self._rooms_for_channel()[BaseTest.ROOM_ID]['users'])
+
+            self._leave()
+            self.assertEqual(0, self._rooms_for_channel()[BaseTest.ROOM_ID]['users'])
+            self.assertEqual(0, set_rooms_for_channel.call_count)
+
+    def _test_room_directory_counts_with_rooms_for_user_reset(self):
+        other_room_id = str(uuid())
+        self._create_channel()
+        self._create_room()
+        self.db.create_room('other', other_room_id, BaseTest.CHANNEL_ID, BaseTest.OTHER_USER_ID, 'other-name')
+        self.db.join_room(BaseTest.USER_ID, BaseTest.USER_NAME, BaseTest.ROOM_ID, BaseTest.ROOM_NAME, sid='sid-1')
+        self.db.join_room(BaseTest.USER_ID, BaseTest.USER_NAME, other_room_id, 'other', sid='sid-2')
+        self.db.remove_sid_for_user_in_room(BaseTest.USER_ID, other_room_id, 'sid-2')
+        self.assertEqual(1, self._rooms_for_channel()[BaseTest.ROOM_ID]['users'])
+        self.assertEqual(1, self._rooms_for_channel()[other_room_id]['users'])
+
+        # still has a session in the room, only removed from the other room
+        self.db.remove_current_rooms_for_user(BaseTest.USER_ID)
+        self.assertEqual(1, self._rooms_for_channel()[BaseTest.ROOM_ID]['users'])
+        self.assertEqual(0, self._rooms_for_channel()[other_room_id]['users'])
+
+        # the rooms of the user in the cache expire, or are set again from the db
+        self.env.cache.remove_rooms_for_user(BaseTest.USER_ID)
+        self._join()
+        self.assertEqual(1, self._rooms_for_channel()[BaseTest.ROOM_ID]['users'])
+
+        self.env.cache.remove_rooms_for_user(BaseTest.USER_ID)
+        self._leave()
+        self.assertEqual(0, self._rooms_for_channel()[BaseTest.ROOM_ID]['users'])
+
+        self._join()
+        self.assertEqual(1, self._rooms_for_channel()[BaseTest.ROOM_ID]['users'])
+
+    def _test_room_directory_counts_after_bans(self):
+        other_room_id = str(uuid())
+        self._create_channel()
+        self._create_room()
+        self.db.create_room('other', other_room_id, BaseTest.CHANNEL_ID, BaseTest.OTHER_USER_ID, 'other-name')
+        self._join()
+        self.db.join_room(BaseTest.USER_ID, BaseTest.USER_NAME, other_room_id, 'other')
+        self.db.join_room(BaseTest.OTHER_USER_ID, BaseTest.OTHER_USER_NAME, other_room_id, 'other')
+        self.assertEqual(1, self._rooms_for_channel()[BaseTest.ROOM_ID]['users'])
+        self.assertEqual(2, self._rooms_for_channel()[other_room_id]['users'])
+
+        ban_timestamp = str(int((datetime.utcnow() + timedelta(minutes=5)).timestamp()))
+        self.db.ban_user_channel(BaseTest.USER_ID, ban_timestamp, '5m', BaseTest.CHANNEL_ID)
+        self.assertEqual(0, self._rooms_for_channel()[BaseTest.ROOM_ID]['users'])
+        self.assertEqual(1, self._rooms_for_channel()[other_room_id]['users'])
+
+        self.db.ban_user_global(BaseTest.OTHER_USER_ID, ban_timestamp, '5m')
+        self.assertEqual(0, self._rooms_for_channel()[other_room_id]['users'])
+
+        # same as when rebuilt from the database
+        self.env.cache.reset_rooms_for_channel(BaseTest.CHANNEL_ID)
+        self.assertEqual(0, self._rooms_for_channel()[BaseTest.ROOM_ID]['users'])
+        self.assertEqual(0, self._rooms_for_channel()[other_room_id]['users'])
+
+    def _test_login_session(self, user_info: dict):
+        self.db.login_session(BaseTest.USER_ID, BaseTest.USER_NAME, 'sid-1', user_info)
+        self.assertEqual(BaseTest.USER_NAME, self.db.get_user_name(BaseTest.USER_ID))
+        self.assertIn('sid-1', self.db.get_sids_for_user(BaseTest.USER_ID))
+
+    def _test_disconnect_session_other_sid_remains(self, user_info: dict):
+        self.db.login_session(BaseTest.USER_ID, BaseTest.USER_NAME, 'sid-1', user_info)
+        self.db.login_session(BaseTest.USER_ID, BaseTest.USER_NAME, 'sid-2', user_info)
+
+        self.assertEqual(['sid-2'], self.db.disconnect_session(BaseTest.USER_ID, 'sid-1'))
+        self.assertEqual(['sid-2'], self.db.get_sids_for_user(BaseTest.USER_ID))
+
+    def _test_login_session_user_info_fails(self, user_info: dict):
+        with patch.object(self.db, '_update_user_info', side_effect=ValueError('bad user info')):
+            self.db.login_session(BaseTest.USER_ID, BaseTest.USER_NAME, 'sid-1', user_info)
+
+        self.assertEqual(BaseTest.USER_NAME, self.db.get_user_name(BaseTest.USER_ID))
+        self.assertIn('sid-1', self.db.get_sids_for_user(BaseTest.USER_ID))
+
+    def _test_disconnect_session_last_sid(self, user_info: dict):
+        self.db.login_session(BaseTest.USER_ID, BaseTest.USER_NAME, 'sid-1', user_info)
+
+        self.assertEqual(list(), self.db.disconnect_session(BaseTest.USER_ID, 'sid-1'))
+        self.assertEqual(list(), self.db.get_sids_for_user(BaseTest.USER_ID))
+
     def _test_get_user_status_from_cache(self):
         status_1 = self.db.get_user_status(BaseTest.USER_ID)
         status_2 = self.db.get_user_status(BaseTest.USER_ID)
@@ -1414,6 +1629,38 @@ class BaseDatabaseTest(BaseTest):
         ban_status = self.db.get_user_ban_status(BaseTest.ROOM_ID, BaseTest.USER_ID)
         self.assertNotEqual('', len(ban_status['global']))
 
+    def _test_get_ban_and_mute_timestamps(self):
+        self._create_channel()
+        self._create_room()
+        timestamp = str(int((datetime.utcnow() + timedelta(minutes=5)).timestamp()))
+        expired = str(int((datetime.utcnow() + timedelta(minutes=-5)).timestamp()))
+
+        self.db.ban_user_global(BaseTest.USER_ID, timestamp, '5m')
+        self.db.ban_user_channel(BaseTest.USER_ID, timestamp, '5m', BaseTest.CHANNEL_ID)
+        self.db.ban_user_room(BaseTest.USER_ID, expired, '5m', BaseTest.ROOM_ID)
+        self.db.mute_user(BaseTest.ROOM_ID, BaseTest.USER_ID, '5m', int(timestamp), BaseTest.ROOM_NAME, None, None)
+
+        self.assertEqual({
+            ('global', '', BaseTest.USER_ID, float(timestamp)),
+            ('channel', BaseTest.CHANNEL_ID, BaseTest.USER_ID, float(timestamp)),
+            ('mute', BaseTest.ROOM_ID, BaseTest.USER_ID, float(timestamp))
+        }, set(self.db.get_ban_and_mute_timestamps()))
+
+    def _test_remove_expired_bans_and_mutes(self):
+        self._create_channel()
+        self._create_room()
+        timestamp = str(int((datetime.utcnow() + timedelta(minutes=5)).timestamp()))
+        expired = str(int((datetime.utcnow() + timedelta(minutes=-5)).timestamp()))
+
+        self.db.ban_user_global(BaseTest.USER_ID, timestamp, '5m')
+        self.db.ban_user_room(BaseTest.USER_ID, expired, '5m', BaseTest.ROOM_ID)
+        self.db.mute_user(BaseTest.ROOM_ID, BaseTest.USER_ID, '5m', int(expired), BaseTest.ROOM_NAME, None, None)
+        self.db.remove_expired_bans_and_mutes()
+
+        self.assertIn(BaseTest.USER_ID, self.db.get_banned_users_global())
+        self.assertEqual(0, len(self.db.get_banned_users_for_room(BaseTest.ROOM_ID)))
+        self.assertEqual(0, len(self.db.get_muted_users_for_room(BaseTest.ROOM_ID)))
+
     def _test_get_banned_users_global_is_empty(self):
         self._create_channel()
         self._create_room()
@@ -1731,6 +1978,15 @@ class BaseDatabaseTest(BaseTest):
         self.assertIsNotNone(timestamp_fetched)
         self.assertEqual(timestamp, timestamp_fetched)
 
+    def _test_update_last_read_for_existing_row(self):
+        self._create_channel()
+        self._create_room()
+        timestamp = int(datetime.utcnow().timestamp())
+        self.db.update_last_read_for({BaseTest.USER_ID, BaseTest.OTHER_USER_ID}, BaseTest.ROOM_ID, timestamp)
+        self.db.update_last_read_for({BaseTest.USER_ID}, BaseTest.ROOM_ID, timestamp + 10)
+        self.assertEqual(timestamp + 10, self.db.get_last_read_timestamp(BaseTest.ROOM_ID, BaseTest.USER_ID))
+        self.assertEqual(timestamp, self.db.get_last_read_timestamp(BaseTest.ROOM_ID, BaseTest.OTHER_USER_ID))
+
     def _test_get_last_read_timestamp_before_set(self):
         self._create_channel()
         self._create_room()
@@ -521,6 +521,30 @@ class DatabaseRedisTest(BaseDatabaseTest):
     def test_get_user_status_after_set(self):
         self._test_get_user_status_after_set()
 
+    def test_get_user_statuses(self):
+        self._test_get_user_statuses()
+
+    def test_get_users_roles_in_room(self):
+        self._test_get_users_roles_in_room()
+
+    def test_get_user_roles_for_target(self):
+        self._test_get_user_roles_for_target()
+
+    def test_get_user_roles_for_targets_not_joined(self):
+        self._test_get_user_roles_for_targets_not_joined()
+
+    def test_get_all_acls_channels(self):
+        self._test_get_all_acls_channels()
+
+    def test_get_all_acls_rooms(self):
+        self._test_get_all_acls_rooms()
+
+    def test_login_session(self):
+        self._test_login_session({SessionKeys.gender.value: 'm', 'last_login': datetime.utcnow().timestamp()})
+
+    def test_disconnect_session_last_sid(self):
+        self._test_disconnect_session_last_sid({SessionKeys.gender.value: 'm', 'last_login': datetime.utcnow().timestamp()})
+
     def test_set_user_invisible_twice_ignores_second(self):
         self._test_set_user_invisible_twice_ignores_second()
 
@@ -596,6 +620,15 @@ class DatabaseRedisTest(BaseDatabaseTest):
     def test_update_last_read_for(self):
         self._test_update_last_read_for()
 
+    def test_apply_membership_changes(self):
+        self._test_apply_membership_changes()
+
+    def test_apply_membership_changes_room_removed(self):
+        self._test_apply_membership_changes_room_removed()
+
+    def test_update_last_read_for_existing_row(self):
+        self._test_update_last_read_for_existing_row()
+
     def test_update_username(self):
         self._test_update_username()
 
@@ -535,6 +535,45 @@ class DatabaseSqliteTest(BaseDatabaseTest):
     def test_get_user_status_after_set(self):
         self._test_get_user_status_after_set()
 
+    def test_get_user_statuses(self):
+        self._test_get_user_statuses()
+
+    def test_get_users_roles_in_room(self):
+        self._test_get_users_roles_in_room()
+
+    def test_get_user_roles_for_target(self):
+        self._test_get_user_roles_for_target()
+
+    def test_get_user_roles_for_targets_not_joined(self):
+        self._test_get_user_roles_for_targets_not_joined()
+
+    def test_get_all_acls_channels(self):
+        self._test_get_all_acls_channels()
+
+    def test_get_all_acls_rooms(self):
+        self._test_get_all_acls_rooms()
+
+    def test_room_directory_counts_without_rebuild(self):
+        self._test_room_directory_counts_without_rebuild()
+
+    def test_room_directory_counts_with_rooms_for_user_reset(self):
+        self._test_room_directory_counts_with_rooms_for_user_reset()
+
+    def test_room_directory_counts_after_bans(self):
+        self._test_room_directory_counts_after_bans()
+
+    def test_login_session(self):
+        self._test_login_session({SessionKeys.gender.value: 'm', 'last_login': datetime.utcnow()})
+
+    def test_login_session_user_info_fails(self):
+        self._test_login_session_user_info_fails({SessionKeys.gender.value: 'm', 'last_login': datetime.utcnow()})
+
+    def test_disconnect_session_last_sid(self):
+        self._test_disconnect_session_last_sid({SessionKeys.gender.value: 'm', 'last_login': datetime.utcnow()})
+
+    def test_disconnect_session_other_sid_remains(self):
+        self._test_disconnect_session_other_sid_remains({SessionKeys.gender.value: 'm', 'last_login': datetime.utcnow()})
+
     def test_set_user_invisible_twice_ignores_second(self):
         self._test_set_user_invisible_twice_ignores_second()
 
@@ -610,6 +649,27 @@ class DatabaseSqliteTest(BaseDatabaseTest):
     def test_update_last_read_for(self):
         self._test_update_last_read_for()
 
+    def test_get_ban_and_mute_timestamps(self):
+        self._test_get_ban_and_mute_timestamps()
+
+    def test_remove_expired_bans_and_mutes(self):
+        self._test_remove_expired_bans_and_mutes()
+
+    def test_apply_membership_changes(self):
+        self._test_apply_membership_changes()
+
+    def test_apply_membership_changes_session_ended(self):
+        self._test_apply_membership_changes_session_ended()
+
+    def test_journaled_changes_read_before_flush(self):
+        self._test_journaled_changes_read_before_flush()
+
+    def test_apply_membership_changes_room_removed(self):
+        self._test_apply_membership_changes_room_removed()
+
+    def test_update_last_read_for_existing_row(self):
+        self._test_update_last_read_for_existing_row()
+
     def test_update_username(self):
         self._test_update_username()
 
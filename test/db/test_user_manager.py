@@ -39,6 +39,7 @@ class UserManagerTest(BaseDatabaseTest):
     def setUp(self):
         self.set_up_env('redis')
         self.env.publish = UserManagerTest._publish
+        UserManagerTest._act = None
         self.env.out_of_scope_emit = UserManagerTest._emit_out_of_scope
         self._act = None
         self.env.db = self.db
@@ -72,6 +73,22 @@ class UserManagerTest(BaseDatabaseTest):
         self.assertEqual(UserManagerTest._act['object']['id'], BaseDatabaseTest.USER_ID)
         self.assertEqual(UserManagerTest._act['target']['id'], BaseDatabaseTest.ROOM_ID)
 
+    def test_kick_user_published_to_user_nodes(self):
+        self._create_channel()
+        self._create_room()
+        self.env.node_queue = 'node_queue_test_host_5000'
+        self.env.cache.login_session(BaseDatabaseTest.USER_ID, BaseDatabaseTest.USER_NAME, 'sid-1')
+        self.env.db.add_sid_for_user(BaseDatabaseTest.USER_ID, 'sid-1')
+
+        published_to_nodes = list()
+        self.env.publish_to_nodes = lambda data, nodes: published_to_nodes.append((data, nodes))
+        self.manager.kick_user(BaseDatabaseTest.ROOM_ID, BaseDatabaseTest.USER_ID)
+
+        self.assertIsNone(UserManagerTest._act)
+        self.assertEqual(1, len(published_to_nodes))
+        self.assertEqual({'node_queue_test_host_5000'}, published_to_nodes[0][1])
+        self.assertEqual(BaseDatabaseTest.USER_ID, published_to_nodes[0][0]['object']['id'])
+
     def test_kick_user_is_base64(self):
         self._create_channel()
         self._create_room()
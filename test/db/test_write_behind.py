@@ -0,0 +1,162 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from dino.db.write_behind import LastReadBuffer
+from dino.db.write_behind import MembershipJournal
+from dino.stats.statsd import MockStatsd
+
+__author__ = 'Oscar Eriksson <oscar.eriks@gmail.com>'
+
+
+class FakeDb(object):
+    def __init__(self):
+        self.calls = list()
+        self.memberships = list()
+        self.fail = False
+
+    def apply_membership_changes(self, joins, leaves, room_sids):
+        if self.fail:
+            raise RuntimeError('db is down')
+        self.memberships.append((joins, leaves, room_sids))
+
+    def update_last_read_for(self, users, room_id, time_stamp):
+        if self.fail:
+            raise RuntimeError('db is down')
+        self.calls.append((set(users), room_id, time_stamp))
+
+
+class FakeEnv(object):
+    def __init__(self):
+        self.db = FakeDb()
+        self.stats = MockStatsd()
+        self.capture_exception = lambda e: None
+
+
+class LastReadBufferTest(TestCase):
+    def setUp(self):
+        self.env = FakeEnv()
+        # long interval so the background loop never flushes during a test
+        self.buffer = LastReadBuffer(self.env, flush_interval=3600)
+
+    def test_burst_coalesced_to_one_write_per_room(self):
+        for time_stamp in range(100, 200):
+            self.buffer.update({'1', '2'}, 'room', time_stamp)
+        self.buffer.flush()
+
+        self.assertEqual([({'1', '2'}, 'room', 199)], self.env.db.calls)
+        self.assertEqual(2, self.env.stats.vals['last_reads.flush.rows'])
+
+    def test_older_timestamp_does_not_overwrite(self):
+        self.buffer.update({'1'}, 'room', 200)
+        self.buffer.update({'1'}, 'room', 100)
+        self.assertEqual(200, self.buffer.get('room', '1'))
+
+    def test_pending_cleared_after_flush(self):
+        self.buffer.update({'1'}, 'room', 100)
+        self.buffer.flush()
+        self.buffer.flush()
+        self.assertEqual(1, len(self.env.db.calls))
+        self.assertIsNone(self.buffer.get('room', '1'))
+
+    def test_failed_flush_kept_for_next_one(self):
+        self.env.db.fail = True
+        self.buffer.update({'1'}, 'room', 100)
+        self.buffer.flush()
+
+        self.env.db.fail = False
+        self.buffer.flush()
+        self.assertEqual([({'1'}, 'room', 100)], self.env.db.calls)
+
+
+class MembershipJournalTest(TestCase):
+    def setUp(self):
+        self.env = FakeEnv()
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'joins.journal')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def journal(self):
+        return MembershipJournal(self.env, self.path, flush_interval=3600)
+
+    def test_changes_coalesced_per_user_and_room(self):
+        journal = self.journal()
+        journal.join('1', 'a', 'room-1', 'sid-1')
+        journal.join('2', 'b', 'room-1', 'sid-2')
+        journal.leave('1', 'room-1')
+        journal.leave('2', 'room-2')
+        journal.join('2', 'b', 'room-2', None)
+        journal.flush()
+
+        joins, leaves, room_sids = self.env.db.memberships[0]
+        self.assertEqual({('2', 'room-1'): 'b', ('2', 'room-2'): 'b'}, joins)
+        self.assertEqual({('1', 'room-1')}, leaves)
+        self.assertEqual({('1', 'room-1', 'sid-1'), ('2', 'room-1', 'sid-2')}, room_sids)
+
+    def test_nothing_applied_if_no_changes(self):
+        self.journal().flush()
+        self.assertEqual(0, len(self.env.db.memberships))
+
+    def test_journal_emptied_after_flush(self):
+        journal = self.journal()
+        journal.join('1', 'a', 'room-1', 'sid-1')
+        journal.flush()
+        journal.flush()
+
+        self.assertEqual(1, len(self.env.db.memberships))
+        self.assertEqual(0, len(MembershipJournal.read(self.path)))
+        self.assertFalse(os.path.exists(self.path + '.flushing'))
+
+    def test_failed_flush_retried_with_new_changes(self):
+        journal = self.journal()
+        journal.join('1', 'a', 'room-1', None)
+        self.env.db.fail = True
+        journal.flush()
+
+        journal.leave('1', 'room-1')
+        self.env.db.fail = False
+        journal.flush()
+
+        self.assertEqual([(dict(), {('1', 'room-1')}, set())], self.env.db.memberships)
+
+    def test_replayed_on_startup(self):
+        journal = self.journal()
+        journal.join('1', 'a', 'room-1', None)
+        journal.file.write('["join", "2", "b"')  # process died while appending
+        journal.file.close()
+
+        self.journal()
+        self.assertEqual([({('1', 'room-1'): 'a'}, set(), set())], self.env.db.memberships)
+
+    def test_pending_changes_until_flushed(self):
+        journal = self.journal()
+        journal.join('1', 'a', 'room-1', 'sid-1')
+        journal.join('2', 'b', 'room-1', 'sid-2')
+        journal.leave('2', 'room-2')
+
+        self.assertEqual(({'room-1'}, set()), journal.pending_rooms_for_user('1'))
+        self.assertEqual(({'room-1'}, {'room-2'}), journal.pending_rooms_for_user('2'))
+        self.assertEqual(({'1': 'a', '2': 'b'}, set()), journal.pending_users_in_room('room-1'))
+
+        journal.flush()
+        self.assertEqual((set(), set()), journal.pending_rooms_for_user('1'))
+
+    def test_pending_changes_kept_if_flush_failed(self):
+        journal = self.journal()
+        journal.join('1', 'a', 'room-1', None)
+        self.env.db.fail = True
+        journal.flush()
+
+        self.assertEqual(({'room-1'}, set()), journal.pending_rooms_for_user('1'))
+        journal.leave('1', 'room-1')
+        self.assertEqual((set(), {'room-1'}), journal.pending_rooms_for_user('1'))
+
+    def test_pending_changes_replayed_on_startup(self):
+        journal = self.journal()
+        journal.join('1', 'a', 'room-1', None)
+        self.env.db.fail = True
+
+        self.assertEqual(({'room-1'}, set()), self.journal().pending_rooms_for_user('1'))
@@ -0,0 +1,89 @@
+from unittest import TestCase
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+from activitystreams import parse as as_parser
+
+from dino import environ
+from dino.config import ConfigKeys
+
+environ.env.config.set(ConfigKeys.TESTING, True)
+
+from dino.hooks.disconnect import OnDisconnectHooks
+
+
+class DisconnectHookTest(TestCase):
+    USER_ID = '1234'
+    SID = 'sid-1'
+
+    def setUp(self):
+        self.env = MagicMock()
+        self.env.request.sid = DisconnectHookTest.SID
+        self.env.db.rooms_for_user.return_value = dict()
+
+        self.utils = MagicMock()
+        self.utils.is_valid_id.side_effect = lambda user_id: user_id is not None and str(user_id).isdigit()
+        self.utils.get_user_status.return_value = '0'
+        self.utils.disconnect_session.return_value = list()
+
+        patchers = [
+            patch('dino.hooks.disconnect.environ.env', self.env),
+            patch('dino.hooks.disconnect.utils', self.utils)
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def disconnect(self, user_id: str = USER_ID):
+        data = {'verb': 'disconnect', 'actor': {'id': user_id, 'content': DisconnectHookTest.SID}}
+        OnDisconnectHooks.handle_disconnect((data, as_parser(data)), is_socket_disconnect=True)
+
+    def test_last_session_sets_user_offline(self):
+        self.disconnect()
+        self.env.db.set_user_offline.assert_called_once_with(DisconnectHookTest.USER_ID)
+        self.env.leave_room.assert_any_call(DisconnectHookTest.USER_ID)
+
+    def test_failed_disconnect_checks_other_sessions(self):
+        self.utils.disconnect_session.side_effect = RuntimeError('db down')
+        self.utils.get_sids_for_user_id.return_value = [DisconnectHookTest.SID, 'sid-2']
+
+        self.disconnect()
+
+        self.env.db.set_user_offline.assert_not_called()
+        self.utils.activity_for_disconnect.assert_not_called()
+        self.assertNotIn(((DisconnectHookTest.USER_ID,),), self.env.leave_room.call_args_list)
+
+    def test_failed_disconnect_without_other_sessions_sets_user_offline(self):
+        self.utils.disconnect_session.side_effect = RuntimeError('db down')
+        self.utils.get_sids_for_user_id.return_value = [DisconnectHookTest.SID]
+
+        self.disconnect()
+        self.env.db.set_user_offline.assert_called_once_with(DisconnectHookTest.USER_ID)
+
+    def test_failed_disconnect_and_sids_unknown_is_not_handled(self):
+        self.utils.disconnect_session.side_effect = RuntimeError('db down')
+        self.utils.get_sids_for_user_id.side_effect = RuntimeError('db down')
+
+        self.disconnect()
+
+        self.env.db.set_user_offline.assert_not_called()
+        self.env.publish.assert_not_called()
+
+    def test_user_id_from_sid_if_missing_in_session(self):
+        self.utils.get_user_for_sid.return_value = DisconnectHookTest.USER_ID
+
+        self.disconnect(user_id='None')
+
+        self.utils.get_user_for_sid.assert_called_once_with(DisconnectHookTest.SID)
+        self.utils.disconnect_session.assert_called_once_with(
+            DisconnectHookTest.USER_ID, DisconnectHookTest.SID, update_last_online=True)
+        self.env.db.rooms_for_user.assert_called_once_with(DisconnectHookTest.USER_ID, skip_cache=True)
+        self.env.db.set_user_offline.assert_called_once_with(DisconnectHookTest.USER_ID)
+
+    def test_no_user_for_sid_is_ignored(self):
+        self.utils.get_user_for_sid.return_value = None
+
+        self.disconnect(user_id='None')
+
+        self.utils.disconnect_session.assert_not_called()
+        self.env.db.set_user_offline.assert_not_called()
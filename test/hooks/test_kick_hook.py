@@ -0,0 +1,65 @@
+from unittest import TestCase
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+from activitystreams import parse as as_parser
+
+from dino import environ
+from dino import utils
+from dino.config import ConfigKeys
+
+environ.env.config.set(ConfigKeys.TESTING, True)
+
+from dino.hooks.kick import OnKickHooks
+from dino.utils.bans import BanIndex
+
+
+class KickHookTest(TestCase):
+    USER_ID = '1234'
+    KICKER_ID = '5678'
+    ROOM_ID = 'room-1'
+    CHANNEL_ID = 'channel-1'
+
+    def setUp(self):
+        self.env = MagicMock()
+        self.env.db.get_ban_and_mute_timestamps.return_value = list()
+        # long interval so the background loop never purges during a test
+        self.env.ban_index = BanIndex(self.env, purge_interval=3600)
+
+        patchers = [
+            patch('dino.environ.env', self.env),
+            patch('dino.hooks.kick.sockets'),
+            patch('dino.utils.get_channel_for_room', return_value=KickHookTest.CHANNEL_ID)
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def kick(self):
+        data = {
+            'verb': 'kick',
+            'actor': {'id': KickHookTest.KICKER_ID},
+            'object': {'id': KickHookTest.USER_ID},
+            'target': {'id': KickHookTest.ROOM_ID, 'url': '/ws'}
+        }
+        OnKickHooks.create_ban_and_publish_kick_activity((data, as_parser(data)))
+
+    def test_kicked_user_is_banned_with_ban_index(self):
+        self.assertFalse(utils.is_banned(KickHookTest.USER_ID, KickHookTest.ROOM_ID)[0])
+        self.kick()
+
+        is_banned, info = utils.is_banned(KickHookTest.USER_ID, KickHookTest.ROOM_ID)
+        self.assertTrue(is_banned)
+        self.assertEqual('room', info['scope'])
+        self.env.db.ban_user_room.assert_called_once()
+
+    def test_kicked_user_not_banned_in_other_room(self):
+        self.kick()
+        self.assertFalse(utils.is_banned(KickHookTest.USER_ID, 'room-2')[0])
+
+    def test_ban_user_updates_ban_index(self):
+        utils.ban_user(KickHookTest.ROOM_ID, KickHookTest.USER_ID, '10m')
+
+        is_banned, info = utils.is_banned(KickHookTest.USER_ID, KickHookTest.ROOM_ID)
+        self.assertTrue(is_banned)
+        self.assertEqual('room', info['scope'])
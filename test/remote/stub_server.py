@@ -0,0 +1,84 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+
+__author__ = 'Oscar Eriksson <oscar.eriks@gmail.com>'
+
+
+class StubWhisperServer(object):
+    """
+    local json-rpc server answering 'whisper.validate' like the remote system does, with an optional delay per call
+    to measure latency; receivers in 'blocked' get error 50002 (whisper turned off), everyone else is allowed
+
+        server = StubWhisperServer(delay=0.05).start()
+        ... RemoteHandler with remote.host set to server.url ...
+        server.stop()
+    """
+
+    def __init__(self, delay: float = 0, blocked: set = None):
+        self.delay = delay
+        self.blocked = blocked or set()
+        self.requests = list()
+        self.connections = 0
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive
+            disable_nagle_algorithm = True
+            wbufsize = -1  # headers and body in one write, flushed after each request
+
+            def setup(self):
+                super().setup()
+                stub.connections += 1
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                request = json.loads(str(body, 'utf-8'))
+                stub.requests.append((request, self.headers.get('X-RPC-SIGN')))
+
+                if stub.delay > 0:
+                    time.sleep(stub.delay)
+
+                result = {'success': 1}
+                if request['params']['receiverName'] in stub.blocked:
+                    result = {'success': 0, 'error': 50002, 'error_msg': 'whisper is turned off'}
+
+                response = bytes(json.dumps({'jsonrpc': '2.0', 'result': result, 'id': request['id']}), 'utf-8')
+                try:
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(response)))
+                    self.end_headers()
+                    self.wfile.write(response)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # the client timed out
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = 'http://127.0.0.1:{}'.format(self.server.server_address[1])
+
+    def start(self) -> 'StubWhisperServer':
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
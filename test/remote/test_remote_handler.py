@@ -0,0 +1,97 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from unittest import TestCase
+
+from dino.cache.redis import CacheRedis
+from dino.config import ConfigKeys
+from dino.config import ErrorCodes
+from dino.environ import ConfigDict
+from dino.environ import GNEnvironment
+from dino.remote.handler import RemoteHandler
+from test.remote.stub_server import StubWhisperServer
+
+__author__ = 'Oscar Eriksson <oscar.eriks@gmail.com>'
+
+
+class RemoteHandlerTest(TestCase):
+    class FakeEnv(GNEnvironment):
+        def __init__(self, host: str, timeout: float = 2):
+            super(RemoteHandlerTest.FakeEnv, self).__init__(None, ConfigDict(), skip_init=True)
+            self.config = ConfigDict()
+            self.config.set(ConfigKeys.TESTING, True)
+            self.config.set(ConfigKeys.REMOTE, {
+                ConfigKeys.HOST: host,
+                ConfigKeys.PATH_CAN_WHISPER: 'whisper',
+                ConfigKeys.PRIVATE_KEY: 'secret',
+                ConfigKeys.TIMEOUT: timeout
+            })
+            self.cache = CacheRedis(self, 'mock')
+            self.capture_exception = lambda _: None
+
+    SENDER_ID = '1234'
+
+    def setUp(self):
+        self.server = StubWhisperServer(blocked={'blocked'}).start()
+        self.env = RemoteHandlerTest.FakeEnv(self.server.url)
+        self.env.cache._flushall()
+        self.remote = RemoteHandler(self.env)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_allowed(self):
+        self.assertEqual((True, ErrorCodes.OK), self.remote.can_send_whisper_to(self.SENDER_ID, 'friend'))
+
+        request, sign = self.server.requests[0]
+        self.assertEqual('whisper.validate', request['method'])
+        self.assertEqual({'senderId': 1234, 'receiverName': 'friend'}, request['params'])
+        self.assertIsNotNone(sign)
+
+    def test_not_allowed(self):
+        self.assertEqual(
+            (False, ErrorCodes.NOT_ALLOWED_TO_WHISPER_TURNED_OFF),
+            self.remote.can_send_whisper_to(self.SENDER_ID, 'blocked'))
+
+    def test_allowed_is_cached(self):
+        self.remote.can_send_whisper_to(self.SENDER_ID, 'friend')
+        self.assertEqual((True, ErrorCodes.OK), self.remote.can_send_whisper_to(self.SENDER_ID, 'friend'))
+        self.assertEqual(1, len(self.server.requests))
+
+    def test_not_allowed_is_cached(self):
+        self.remote.can_send_whisper_to(self.SENDER_ID, 'blocked')
+        self.assertEqual(
+            (False, ErrorCodes.NOT_ALLOWED_TO_WHISPER_TURNED_OFF),
+            self.remote.can_send_whisper_to(self.SENDER_ID, 'blocked'))
+        self.assertEqual(1, len(self.server.requests))
+
+    def test_connection_reused(self):
+        for user_name in ['friend-1', 'friend-2', 'friend-3']:
+            self.remote.can_send_whisper_to(self.SENDER_ID, user_name)
+
+        self.assertEqual(3, len(self.server.requests))
+        self.assertEqual(1, self.server.connections)
+
+    def test_many_receivers(self):
+        results = self.remote.can_send_whisper_to_users(self.SENDER_ID, {'friend', 'blocked', 'other'})
+        self.assertEqual({
+            'friend': (True, ErrorCodes.OK),
+            'other': (True, ErrorCodes.OK),
+            'blocked': (False, ErrorCodes.NOT_ALLOWED_TO_WHISPER_TURNED_OFF)
+        }, results)
+
+    def test_timeout_allows_and_is_not_cached(self):
+        self.server.delay = 0.5
+        remote = RemoteHandler(RemoteHandlerTest.FakeEnv(self.server.url, timeout=0.1))
+
+        self.assertEqual((True, ErrorCodes.REMOTE_ERROR), remote.can_send_whisper_to(self.SENDER_ID, 'blocked'))
+        self.assertEqual((None, None), remote.env.cache.get_can_whisper_to_user(self.SENDER_ID, 'blocked'))
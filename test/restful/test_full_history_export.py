@@ -0,0 +1,119 @@
+import json
+from datetime import datetime
+from unittest import TestCase
+
+from dino import environ
+from dino.config import ConfigKeys
+from dino.rest.resources import full_history_export
+from dino.rest.resources.full_history_export import FullHistoryExportResource
+from dino.utils import b64d
+
+
+class FakeStorage(object):
+    PAGE_SIZE = 3
+
+    def __init__(self, messages):
+        self.messages = messages
+        self.fail_after = None
+
+    def iter_history_pages_for_user(self, from_user_id, from_time, to_time, paging_state=None):
+        offset = 0 if paging_state is None else int(paging_state.decode('utf-8'))
+
+        for i, message in enumerate(self.messages[offset:]):
+            if self.fail_after is not None and offset + i >= self.fail_after:
+                raise RuntimeError('storage is down')
+
+            page_offset = offset + i - (offset + i) % FakeStorage.PAGE_SIZE
+            page_paging_state = None if page_offset == 0 else str(page_offset).encode('utf-8')
+            yield dict(message), page_paging_state
+
+
+class FakeRequest(object):
+    _json = dict()
+
+    def get_json(self, silent=False):
+        return FakeRequest._json
+
+
+class FullHistoryExportTest(TestCase):
+    USER_ID = '8888'
+
+    def setUp(self):
+        now = datetime.utcnow().strftime(ConfigKeys.DEFAULT_DATE_FORMAT)
+        self.messages = [{
+            'message_id': str(i),
+            'from_user_id': FullHistoryExportTest.USER_ID,
+            'from_user_name': 'batman',
+            'target_id': '1234',
+            'target_name': 'cool guys',
+            'body': 'message %s' % i,
+            'domain': 'room',
+            'channel_id': '5555',
+            'channel_name': 'Shanghai',
+            'timestamp': now,
+            'deleted': i == 4
+        } for i in range(10)]
+
+        self.storage = FakeStorage(self.messages)
+        self.original_storage = environ.env.storage
+        environ.env.storage = self.storage
+
+        self.resource = FullHistoryExportResource()
+        self.resource.request = FakeRequest()
+        FakeRequest._json = {'user_id': FullHistoryExportTest.USER_ID}
+
+    def tearDown(self):
+        environ.env.storage = self.original_storage
+
+    def export(self, cursor=None) -> list:
+        if cursor is not None:
+            FakeRequest._json['cursor'] = cursor
+        lines = ''.join(self.resource.stream(self.resource.do_post())).splitlines()
+        return [json.loads(line) for line in lines]
+
+    def test_deleted_messages_skipped(self):
+        message_ids = [message['message_id'] for message in self.export()]
+        self.assertEqual(['0', '1', '2', '3', '5', '6', '7', '8', '9'], message_ids)
+
+    def test_emitted_messages_encoded(self):
+        message = self.export()[0]
+        self.assertEqual('message 0', b64d(message['body']))
+        self.assertEqual('batman', b64d(message['from_user_name']))
+
+    def test_resume_from_cursor(self):
+        exported = self.export()
+
+        # cursor of a message in the middle of the second page
+        resumed = self.export(cursor=exported[4]['cursor'])
+        self.assertEqual(
+            [message['message_id'] for message in exported[5:]],
+            [message['message_id'] for message in resumed])
+
+    def test_resume_from_cursor_at_end_of_page(self):
+        exported = self.export()
+        resumed = self.export(cursor=exported[2]['cursor'])
+        self.assertEqual('3', resumed[0]['message_id'])
+
+    def test_written_in_chunks(self):
+        full_history_export.LINES_PER_CHUNK = 4
+        try:
+            chunks = list(self.resource.stream(self.resource.do_post()))
+        finally:
+            full_history_export.LINES_PER_CHUNK = 100
+
+        self.assertEqual([4, 4, 1], [len(chunk.splitlines()) for chunk in chunks])
+
+    def test_error_line_when_storage_fails(self):
+        self.storage.fail_after = 2
+        lines = self.export()
+        self.assertEqual(['0', '1'], [line['message_id'] for line in lines[:-1]])
+        self.assertIn('error', lines[-1])
+
+    def test_invalid_cursor(self):
+        FakeRequest._json['cursor'] = 'not a cursor'
+        self.assertRaises(RuntimeError, self.resource.do_post)
+        self.assertEqual(500, self.resource.post()['status_code'])
+
+    def test_missing_user_id(self):
+        FakeRequest._json = dict()
+        self.assertEqual(500, self.resource.post()['status_code'])
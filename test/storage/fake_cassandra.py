@@ -14,6 +14,10 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 from zope.interface import implementer
 from datetime import datetime
 
@@ -36,7 +40,8 @@ class FakeResultSet(object):
                 return None
             return self.__dict__['vals'][item]
 
-    def __init__(self, current_rows):
+    def __init__(self, current_rows, paging_state=None):
+        self.paging_state = paging_state
         if isinstance(current_rows, dict):
             self.current_rows = list()
             row = FakeResultSet.FakeRow()
@@ -92,6 +97,12 @@ class FakeCassandraDriver(object):
             rows.append(row)
         return FakeResultSet(rows)
 
+    def msgs_iter_from_user_time_slice(self, from_user_id: str, from_time: int, to_time: int, paging_state=None):
+        for to_user_id in self.msgs_to_user.keys():
+            for row in self.msgs_select(to_user_id, 999999):
+                if row.from_user_id == from_user_id and from_time <= row.time_stamp <= to_time:
+                    yield row, None
+
     def msgs_select_since_time(self, to_user_id: str, time_stamp: int) -> FakeResultSet:
         msgs = self.msgs_select(to_user_id, 999999)
         filtered = list()
@@ -114,3 +125,176 @@ class FakeCassandraDriver(object):
             if found:
                 self.msgs_to_user[room_id] = new_msgs
                 break
+
+
+class FakePreparedStatement(object):
+    def __init__(self, query: str):
+        self.query = ' '.join(query.split())
+
+    def bind(self, params):
+        return FakeBoundStatement(self, params)
+
+
+class FakeBoundStatement(object):
+    def __init__(self, statement: FakePreparedStatement, params):
+        self.prepared_statement = statement
+        self.values = tuple(params)
+        self.fetch_size = None
+
+
+class FakeResponseFuture(object):
+    """
+    enough of cassandra.cluster.ResponseFuture to be used by execute_concurrent_with_args()
+    """
+    def __init__(self):
+        self.has_more_pages = False
+        self._col_names = None
+        self._col_types = None
+        self._continuous_paging_session = None
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._result = None
+        self._error = None
+        self._callbacks = list()
+
+    def _set(self, result=None, error=None):
+        with self._lock:
+            self._result, self._error = result, error
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, list()
+        for callback in callbacks:
+            callback()
+
+    def add_callbacks(self, callback, errback, callback_args=(), callback_kwargs=None,
+                      errback_args=(), errback_kwargs=None):
+        def run():
+            if self._error is not None:
+                errback(self._error, *errback_args, **(errback_kwargs or {}))
+            else:
+                callback(self._result, *callback_args, **(callback_kwargs or {}))
+
+        with self._lock:
+            if not self._done.is_set():
+                self._callbacks.append(run)
+                return
+        run()
+
+    def clear_callbacks(self):
+        with self._lock:
+            self._callbacks = list()
+
+    def result(self):
+        self._done.wait()
+        if self._error is not None:
+            raise self._error
+        return FakeResultSet(self._result)
+
+
+class FakeCassandraSession(object):
+    """
+    in-memory stand-in for a cassandra session, supporting the statements used when deleting messages;
+    each request sleeps for `latency` seconds to simulate the network round trip
+    """
+    def __init__(self, latency: float = 0.0, max_workers: int = 100):
+        self.latency = latency
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.n_requests = 0
+        self.messages = dict()
+        # requests for these message ids fail, e.g. to simulate a timeout
+        self.failing_message_ids = set()
+
+    def add_message(self, message_id, target_id, from_user_id, sent_time, body, deleted=False, domain='room'):
+        self.messages[message_id] = {
+            'message_id': message_id,
+            'target_id': target_id,
+            'from_user_id': from_user_id,
+            'sent_time': sent_time,
+            'time_stamp': int(datetime.strptime(sent_time, ConfigKeys.DEFAULT_DATE_FORMAT).timestamp()),
+            'body': body,
+            'domain': domain,
+            'deleted': deleted
+        }
+
+    def set_keyspace(self, key_space):
+        pass
+
+    def prepare(self, query: str) -> FakePreparedStatement:
+        return FakePreparedStatement(query)
+
+    def _rows(self, statement, params) -> list:
+        self.n_requests += 1
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+        if not isinstance(statement, (FakePreparedStatement, FakeBoundStatement)):
+            # schema statements etc.
+            return list()
+
+        if isinstance(statement, FakeBoundStatement):
+            statement, params = statement.prepared_statement, statement.values
+
+        query = statement.query
+        if query.startswith('SELECT target_id, from_user_id, sent_time FROM messages_by_id'):
+            message = self.messages.get(params[0])
+            return [] if message is None else [self._row(message)]
+
+        if query.startswith('SELECT * FROM messages WHERE target_id = ?'):
+            target_id, from_user_id, sent_time = params
+            return [
+                self._row(message) for message in self.messages.values()
+                if (message['target_id'], message['from_user_id'], message['sent_time']) ==
+                   (target_id, from_user_id, sent_time)
+            ]
+
+        if query.startswith('SELECT * FROM messages_by_from_user_id WHERE from_user_id = ? AND time_stamp >= ?'):
+            from_user_id, from_time, to_time = params
+            return [
+                self._row(message) for message in sorted(
+                    self.messages.values(), key=lambda m: (m['target_id'], m['time_stamp'], m['sent_time']))
+                if message['from_user_id'] == from_user_id and from_time <= message['time_stamp'] <= to_time
+            ]
+
+        if query.startswith('UPDATE messages SET body = ?, deleted = ?'):
+            body, deleted, target_id, from_user_id, sent_time, _ = params
+            for message in self.messages.values():
+                if (message['target_id'], message['from_user_id'], message['sent_time']) == \
+                        (target_id, from_user_id, sent_time):
+                    if message['message_id'] in self.failing_message_ids:
+                        raise RuntimeError('timed out updating message {}'.format(message['message_id']))
+                    message['body'] = body
+                    message['deleted'] = deleted
+            return list()
+
+        return list()
+
+    @staticmethod
+    def _row(message: dict):
+        row = FakeResultSet.FakeRow()
+        for key, value in message.items():
+            row.__setattr__(key, value)
+        return row
+
+    def execute(self, statement, params=None, paging_state=None):
+        rows = self._rows(statement, params)
+
+        fetch_size = getattr(statement, 'fetch_size', None)
+        if fetch_size is None:
+            return FakeResultSet(rows)
+
+        # the paging state is just the offset of the page here, but opaque bytes for the caller like the real one
+        offset = 0 if paging_state is None else int(paging_state.decode('utf-8'))
+        next_offset = offset + fetch_size
+        next_paging_state = str(next_offset).encode('utf-8') if next_offset < len(rows) else None
+        return FakeResultSet(rows[offset:next_offset], paging_state=next_paging_state)
+
+    def execute_async(self, statement, params=None, **kwargs) -> FakeResponseFuture:
+        future = FakeResponseFuture()
+
+        def run():
+            try:
+                future._set(result=self._rows(statement, params))
+            except Exception as e:
+                future._set(error=e)
+
+        self.executor.submit(run)
+        return future
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from datetime import datetime
+from unittest import TestCase
+from uuid import uuid4 as uuid
+
+from dino.storage.cassandra_driver import Driver
+from test.storage.fake_cassandra import FakeCassandraSession
+
+__author__ = 'Oscar Eriksson <oscar.eriks@gmail.com>'
+
+
+class CassandraDriverDeleteTest(TestCase):
+    SENT_TIME = '2017-01-01T10:00:00Z'
+
+    def setUp(self):
+        self.session = FakeCassandraSession()
+        self.driver = Driver(self.session, 'dino', 'SimpleStrategy', 1, concurrency=4)
+        self.driver.init()
+
+        self.message_ids = list()
+        for i in range(10):
+            message_id = str(uuid())
+            sent_time = '2017-01-01T10:00:%02dZ' % i
+            self.session.add_message(message_id, 'room', '1234', sent_time, 'body %s' % i)
+            self.message_ids.append(message_id)
+
+    def test_msgs_delete(self):
+        self.driver.msgs_delete(self.message_ids)
+
+        for message_id in self.message_ids:
+            self.assertTrue(self.session.messages[message_id]['deleted'])
+            self.assertEqual('', self.session.messages[message_id]['body'])
+
+    def test_msgs_delete_keep_body(self):
+        self.driver.msgs_delete(self.message_ids[:2], clear_body=False)
+
+        self.assertTrue(self.session.messages[self.message_ids[0]]['deleted'])
+        self.assertEqual('body 0', self.session.messages[self.message_ids[0]]['body'])
+        self.assertFalse(self.session.messages[self.message_ids[2]]['deleted'])
+
+    def test_msgs_delete_unknown_ids_ignored(self):
+        self.driver.msgs_delete([str(uuid()), self.message_ids[0]])
+        self.assertTrue(self.session.messages[self.message_ids[0]]['deleted'])
+
+    def test_msgs_delete_raises_if_an_update_fails(self):
+        self.session.failing_message_ids.add(self.message_ids[3])
+        self.assertRaises(RuntimeError, self.driver.msgs_delete, self.message_ids)
+
+        # the other updates still completed
+        self.assertFalse(self.session.messages[self.message_ids[3]]['deleted'])
+        self.assertTrue(self.session.messages[self.message_ids[4]]['deleted'])
+
+    def test_msg_delete_and_undelete(self):
+        self.driver.msg_delete(self.message_ids[0])
+        self.assertTrue(self.session.messages[self.message_ids[0]]['deleted'])
+
+        self.driver.msg_undelete(self.message_ids[0])
+        self.assertFalse(self.session.messages[self.message_ids[0]]['deleted'])
+
+
+class CassandraDriverUserHistoryTest(TestCase):
+    def setUp(self):
+        self.session = FakeCassandraSession()
+        self.driver = Driver(self.session, 'dino', 'SimpleStrategy', 1)
+        self.driver.init()
+
+        for i in range(25):
+            self.session.add_message(str(uuid()), 'room-%s' % (i % 3), '1234', '2017-01-01T10:00:%02dZ' % i, 'body')
+        self.session.add_message(str(uuid()), 'room-0', '5678', '2017-01-01T10:00:01Z', 'other user')
+
+        self.from_time = int(datetime(2017, 1, 1, 10, 0, 5).timestamp())
+        self.to_time = int(datetime(2017, 1, 1, 10, 0, 20).timestamp())
+
+    def test_time_range_filtered_by_statement(self):
+        rows = [row for row, _ in self.driver.msgs_iter_from_user_time_slice('1234', self.from_time, self.to_time)]
+        self.assertEqual(16, len(rows))
+        self.assertTrue(all(self.from_time <= row.time_stamp <= self.to_time for row in rows))
+        self.assertTrue(all(row.from_user_id == '1234' for row in rows))
+
+    def test_fetched_one_page_at_a_time(self):
+        rows = self.driver.msgs_iter_from_user_time_slice('1234', self.from_time, self.to_time, fetch_size=5)
+        n_requests = self.session.n_requests
+
+        next(rows)
+        self.assertEqual(n_requests + 1, self.session.n_requests)
+        self.assertEqual(15, len(list(rows)))
+        self.assertEqual(n_requests + 4, self.session.n_requests)
+
+    def test_resume_from_paging_state(self):
+        rows = list(self.driver.msgs_iter_from_user_time_slice('1234', self.from_time, self.to_time, fetch_size=5))
+        _, paging_state = rows[7]
+
+        resumed = list(self.driver.msgs_iter_from_user_time_slice(
+            '1234', self.from_time, self.to_time, paging_state=paging_state, fetch_size=5))
+        self.assertEqual(
+            [row.message_id for row, _ in rows[5:]],
+            [row.message_id for row, _ in resumed])
@@ -87,6 +87,20 @@ class StorageMockCassandraTest(BaseTest):
         self.assertEqual(BaseTest.USER_ID, res[0]['from_user_id'])
         self.assertEqual(BaseTest.ROOM_ID, res[0]['target_id'])
 
+    def test_history_for_user_not_truncated(self):
+        for _ in range(600):
+            self.storage.store_message(self.act_message())
+
+        now = int(time.time())
+        res = self.storage.get_history_for_time_slice('', BaseTest.USER_ID, now - 60, now + 60)
+        self.assertEqual(600, len(res))
+
+    def test_history_for_user_outside_time_slice(self):
+        self.storage.store_message(self.act_message())
+
+        now = int(time.time())
+        self.assertEqual(0, len(self.storage.get_history_for_time_slice('', BaseTest.USER_ID, now - 120, now - 60)))
+
     def join(self):
         environ.env.db.join_room(BaseTest.USER_ID, BaseTest.USER_NAME, BaseTest.ROOM_ID, BaseTest.ROOM_NAME)
 
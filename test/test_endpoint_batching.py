@@ -0,0 +1,122 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from unittest import TestCase
+
+import eventlet
+
+from dino.config import ConfigKeys
+from dino import environ
+environ.env.config.set(ConfigKeys.TESTING, True)
+
+from dino.endpoint.base import PublishException
+from dino.endpoint.batching import BatchingPublisher
+from dino.stats.statsd import MockStatsd
+
+__author__ = 'Oscar Eriksson <oscar.eriks@gmail.com>'
+
+
+class FakePublisher(object):
+    def __init__(self, fail_batch=False, fail_single=False):
+        self.fail_batch = fail_batch
+        self.fail_single = fail_single
+        self.batches = list()
+        self.published = list()
+        self.recently_sent = set()
+
+    def recently_sent_has(self, topic, msg_id):
+        return (topic, msg_id) in self.recently_sent
+
+    def publish_batch(self, messages):
+        if self.fail_batch:
+            raise RuntimeError('queue down')
+        self.batches.append(messages)
+        for message, topic in messages:
+            self.recently_sent.add((topic, message['id']))
+
+    def publish(self, message, topic=None):
+        if self.fail_single:
+            raise PublishException()
+        self.published.append((message, topic))
+
+
+class BatchingPublisherTest(TestCase):
+    class FakeEnv(object):
+        def __init__(self):
+            self.stats = MockStatsd()
+            self.internal_publisher = FakePublisher()
+
+        def capture_exception(self, _):
+            pass
+
+    def setUp(self):
+        self.env = BatchingPublisherTest.FakeEnv()
+        self.publisher = FakePublisher()
+        self.batching = BatchingPublisher(self.env, self.publisher, batch_size=3, flush_interval=60, max_size=5)
+
+    @staticmethod
+    def message(msg_id) -> dict:
+        return {'id': str(msg_id), 'verb': 'send'}
+
+    def test_publish_only_buffers(self):
+        self.batching.publish(self.message(1))
+        self.batching.publish(self.message(2))
+        self.assertEqual(2, len(self.batching.buffer))
+        self.assertEqual(0, len(self.publisher.batches))
+
+    def test_flush_when_batch_size_reached(self):
+        for i in range(3):
+            self.batching.publish(self.message(i), 'topic')
+        eventlet.sleep(0)
+
+        self.assertEqual(1, len(self.publisher.batches))
+        self.assertEqual(['0', '1', '2'], [m['id'] for m, _ in self.publisher.batches[0]])
+        self.assertEqual('topic', self.publisher.batches[0][0][1])
+        self.assertEqual(0, len(self.batching.buffer))
+
+    def test_flush_splits_into_batches(self):
+        for i in range(5):
+            self.batching.buffer.append((self.message(i), None))
+        self.batching.flush()
+
+        self.assertEqual([3, 2], [len(batch) for batch in self.publisher.batches])
+        self.assertEqual(2, self.env.stats.vals['publish.external.batch'])
+        self.assertIn('publish.external.flush.latency', self.env.stats.timings)
+
+    def test_oldest_dropped_when_full(self):
+        self.batching.flushing = True
+        for i in range(7):
+            self.batching.publish(self.message(i))
+
+        self.assertEqual(['2', '3', '4', '5', '6'], [m['id'] for m, _ in self.batching.buffer])
+        self.assertEqual(2, self.env.stats.vals['publish.external.dropped'])
+
+    def test_recently_sent_ignored(self):
+        self.publisher.recently_sent.add(('topic', '1'))
+        self.batching.publish(self.message(1), 'topic')
+        self.assertEqual(0, len(self.batching.buffer))
+
+    def test_failed_batch_published_one_by_one(self):
+        self.publisher.fail_batch = True
+        self.batching.buffer.append((self.message(1), None))
+        self.batching.flush()
+
+        self.assertEqual(1, len(self.publisher.published))
+        self.assertEqual(1, self.env.stats.vals['publish.error'])
+
+    def test_failed_single_publish_falls_back_to_internal(self):
+        self.publisher.fail_batch = True
+        self.publisher.fail_single = True
+        self.batching.buffer.append((self.message(1), None))
+        self.batching.flush()
+
+        self.assertEqual(1, len(self.env.internal_publisher.published))
@@ -0,0 +1,169 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+from unittest.mock import patch
+
+from activitystreams import parse as as_parser
+
+from dino.config import ConfigKeys
+from dino import environ
+environ.env.config.set(ConfigKeys.TESTING, True)
+
+# imported before the queue handler, which otherwise circularly imports itself through dino.hooks
+from dino.endpoint import sockets
+from dino.endpoint.queue import QueueHandler
+from dino.endpoint.sessions import LocalSessions
+
+__author__ = 'Oscar Eriksson <oscar.eriks@gmail.com>'
+
+
+class LocalSessionsTest(unittest.TestCase):
+    def setUp(self):
+        self.sessions = LocalSessions()
+
+    def test_connect_counted_before_login(self):
+        self.sessions.connect('sid-1')
+        self.assertEqual(1, len(self.sessions))
+        self.assertFalse(self.sessions.has_user('1234'))
+
+    def test_login_adds_sid_for_user(self):
+        self.sessions.connect('sid-1')
+        self.sessions.login(1234, 'sid-1')
+        self.sessions.login('1234', 'sid-2')
+
+        self.assertEqual({'sid-1', 'sid-2'}, self.sessions.sids_for_user('1234'))
+        self.assertEqual(2, len(self.sessions))
+
+    def test_disconnect_removes_user_with_last_sid(self):
+        self.sessions.login('1234', 'sid-1')
+        self.sessions.login('1234', 'sid-2')
+
+        self.sessions.disconnect('sid-1')
+        self.assertTrue(self.sessions.has_user('1234'))
+
+        self.sessions.disconnect('sid-2')
+        self.assertFalse(self.sessions.has_user('1234'))
+        self.assertEqual(0, len(self.sessions))
+
+    def test_disconnect_twice_ignored(self):
+        self.sessions.connect('sid-1')
+        self.sessions.disconnect('sid-1')
+        self.sessions.disconnect('sid-1')
+        self.assertEqual(0, len(self.sessions))
+
+    def test_counted_per_namespace(self):
+        self.sessions.connect('sid-1', '/ws')
+        self.sessions.connect('sid-2', '/ws')
+        self.sessions.connect('sid-3', '/admin')
+        self.sessions.disconnect('sid-1')
+
+        self.assertEqual(1, self.sessions.count('/ws'))
+        self.assertEqual(1, self.sessions.count('/admin'))
+        self.assertEqual(0, self.sessions.count('/other'))
+        self.assertEqual(2, self.sessions.count())
+
+    def test_relogin_as_other_user_moves_sid(self):
+        self.sessions.login('1234', 'sid-1')
+        self.sessions.login('4321', 'sid-1')
+
+        self.assertFalse(self.sessions.has_user('1234'))
+        self.assertEqual({'sid-1'}, self.sessions.sids_for_user('4321'))
+        self.assertEqual(1, len(self.sessions))
+
+
+class QueueHandlerLocalSessionsTest(unittest.TestCase):
+    class FakeManager(object):
+        def __init__(self):
+            self.rooms = {
+                '/ws': {
+                    'room-1': {'sid-1': True},
+                    'room-2': {'sid-other': True}
+                }
+            }
+
+    class FakeServer(object):
+        def __init__(self):
+            self.manager = QueueHandlerLocalSessionsTest.FakeManager()
+
+    class FakeSocketIO(object):
+        def __init__(self):
+            self.server = QueueHandlerLocalSessionsTest.FakeServer()
+
+    class FakeEnv(object):
+        def __init__(self):
+            self.node = 'app'
+            self.config = environ.env.config
+
+    def setUp(self):
+        self.handler = QueueHandler(
+            QueueHandlerLocalSessionsTest.FakeSocketIO(), QueueHandlerLocalSessionsTest.FakeEnv())
+        self.handler.local_sessions.login('1234', 'sid-1')
+
+    @staticmethod
+    def activity(user_id: str, room_id: str = None):
+        return as_parser({
+            'verb': 'kick',
+            'object': {'id': user_id},
+            'target': {'id': room_id, 'url': '/ws'}
+        })
+
+    def test_user_on_this_node(self):
+        self.assertTrue(self.handler.user_is_on_this_node(self.activity('1234')))
+        self.assertTrue(self.handler.user_is_on_this_node_ignore_rooms(self.activity('1234', 'room-2')))
+
+    def test_user_not_on_this_node(self):
+        self.assertFalse(self.handler.user_is_on_this_node(self.activity('4321')))
+        self.assertFalse(self.handler.user_is_on_this_node_ignore_rooms(self.activity('4321')))
+
+    def test_user_in_local_room(self):
+        self.assertTrue(self.handler.user_is_on_this_node(self.activity('1234', 'room-1')))
+        self.assertFalse(self.handler.user_is_on_this_node(self.activity('1234', 'room-2')))
+        self.assertFalse(self.handler.user_is_on_this_node(self.activity('1234', 'room-3')))
+
+
+class QueueHandlerSendToOtherNodeTest(unittest.TestCase):
+    class FakeEnv(object):
+        def __init__(self):
+            self.node = 'app'
+            self.node_queue = 'node_queue_this'
+            self.config = environ.env.config
+            self.published_to_nodes = list()
+
+        def publish_to_nodes(self, data, nodes):
+            self.published_to_nodes.append((data, nodes))
+
+    def setUp(self):
+        self.env = QueueHandlerSendToOtherNodeTest.FakeEnv()
+        self.handler = QueueHandler(None, self.env)
+        self.data = {'id': 'event-1', 'verb': 'kick', 'object': {'id': '1234'}}
+
+    def send(self, nodes):
+        with patch('dino.endpoint.queue.utils.get_nodes_for_user_id', return_value=nodes), \
+                patch('dino.endpoint.queue.environ.env.publish') as publish:
+            self.handler.send_event_to_other_node(self.data)
+        return publish
+
+    def test_sent_to_nodes_of_user(self):
+        publish = self.send({'node_queue_this', 'node_queue_other'})
+        self.assertEqual([(self.data, {'node_queue_other'})], self.env.published_to_nodes)
+        publish.assert_not_called()
+
+    def test_broadcast_if_nodes_unknown(self):
+        publish = self.send(None)
+        publish.assert_called_once_with(self.data)
+        self.assertEqual(0, self.data['revision'])
+
+    def test_broadcast_if_registry_only_lists_this_node(self):
+        publish = self.send({'node_queue_this'})
+        publish.assert_called_once_with(self.data)
+        self.assertEqual(0, len(self.env.published_to_nodes))
@@ -11,18 +11,23 @@
 # limitations under the License.
 
 import unittest
+from unittest.mock import MagicMock
+from unittest.mock import patch
 from nose_parameterized import parameterized
 from activitystreams import parse as as_parser
 from fakeredis import FakeRedis
 from uuid import uuid4 as uuid
 
 from dino.config import ConfigKeys
+from dino.config import ErrorCodes
 from dino.config import RedisKeys
 from dino import environ
 environ.env.config.set(ConfigKeys.TESTING, True)
 
 import dino.api
 from dino.endpoint import sockets
+from dino.utils.decorators import respond_with
+from dino.utils.formatter import SimpleResponseFormatter
 
 
 class SocketsHasApiMethodsTest(unittest.TestCase):
@@ -134,3 +139,51 @@ class SocketsTest(unittest.TestCase):
         }
         sockets.socketio.server = MockServer()
         sockets.queue_handler.handle_server_activity(activity, as_parser(activity))
+
+
+class AdmissionControllerTest(unittest.TestCase):
+    def setUp(self):
+        from dino.stats.statsd import MockStatsd
+        environ.env.stats = MockStatsd()
+
+    def test_admits_burst_without_waiting(self):
+        controller = sockets.AdmissionController(rate=1, burst=3, max_wait=10)
+        for _ in range(3):
+            self.assertIsNone(controller.admit())
+        self.assertEqual(0, controller.queued)
+
+    def test_waits_for_next_token(self):
+        controller = sockets.AdmissionController(rate=100, burst=1, max_wait=1)
+        self.assertIsNone(controller.admit())
+        self.assertIsNone(controller.admit())
+        self.assertEqual(0, controller.queued)
+
+    def test_rejects_with_retry_after_when_wait_too_long(self):
+        controller = sockets.AdmissionController(rate=1, burst=1, max_wait=0.5)
+        self.assertIsNone(controller.admit())
+
+        retry_after = controller.admit()
+        self.assertIsNotNone(retry_after)
+        self.assertGreater(retry_after, 0.5)
+
+        # the rejected request shouldn't have reserved a token
+        self.assertLess(controller.tokens, 0.1)
+        self.assertGreater(controller.tokens, -0.1)
+
+    def test_rejected_response_has_retry_after_under_error_key(self):
+        controller = sockets.AdmissionController(rate=1, burst=1, max_wait=0.5)
+        self.assertIsNone(controller.admit())
+
+        @respond_with('gn_login')
+        @sockets.admission_control('on_login')
+        def on_login():
+            return ErrorCodes.OK, None
+
+        with patch.object(sockets, 'admission_controller', controller), \
+                patch.object(environ.env, 'response_formatter', SimpleResponseFormatter('status_code', 'data', 'error')), \
+                patch.object(environ.env, 'emit', MagicMock(), create=True):
+            response = on_login()
+
+        self.assertEqual(ErrorCodes.TRY_AGAIN_LATER, response['status_code'])
+        self.assertNotIn('data', response)
+        self.assertGreater(response['error']['retry_after'], 0)
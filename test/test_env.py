@@ -15,6 +15,7 @@ import os
 import tempfile
 
 from dino.environ import create_env
+from dino.environ import ConfigDict
 from dino.config import ConfigKeys
 from dino import environ
 from dino.exceptions import AclValueNotFoundException
@@ -28,6 +29,47 @@ class FakeDb(object):
         raise AclValueNotFoundException('asdf', 'asdf')
 
 
+class TestConfigDict(unittest.TestCase):
+    def test_get_formats_references(self):
+        config = ConfigDict({'host': 'localhost', 'url': 'redis://{host}:6379'})
+        self.assertEqual('redis://localhost:6379', config.get('url'))
+
+    def test_get_null_is_empty(self):
+        config = ConfigDict({'exchange': 'null'})
+        self.assertEqual('', config.get('exchange'))
+
+    def test_get_from_domain(self):
+        config = ConfigDict({'cache': {'type': 'redis', 'host': '{host}'}, 'host': 'localhost'})
+        self.assertEqual('localhost', config.get('host', domain='cache'))
+
+    def test_set_invalidates_formatted_values(self):
+        config = ConfigDict({'host': 'localhost', 'url': 'redis://{host}'})
+        self.assertEqual('redis://localhost', config.get('url'))
+        config.set('host', 'otherhost')
+        self.assertEqual('redis://otherhost', config.get('url'))
+
+    def test_returned_value_is_read_only(self):
+        config = ConfigDict({'validation': {'on_message': [{'name': 'no_empty'}]}})
+        validation = config.get('validation')
+        with self.assertRaises(TypeError):
+            validation['on_join'] = list()
+        with self.assertRaises(TypeError):
+            validation['on_message'][0]['name'] = 'other'
+        self.assertIsInstance(validation['on_message'], tuple)
+
+    def test_returned_value_is_not_copied(self):
+        config = ConfigDict({'validation': {'on_message': [{'name': 'no_empty'}]}})
+        self.assertIs(config.get('validation')['on_message'], config.get('validation')['on_message'])
+
+    def test_missing_reference_raises_on_get(self):
+        config = ConfigDict({'url': 'redis://{host}'})
+        self.assertRaises(RuntimeError, config.get, 'url')
+
+    def test_explicit_params(self):
+        config = ConfigDict({'url': 'redis://{host}'})
+        self.assertEqual('redis://somehost', config.get('url', params={'host': 'somehost'}))
+
+
 class TestEnvironment(unittest.TestCase):
     def test_env(self):
         if 'DINO_ENVIRONMENT' in os.environ:
@@ -0,0 +1,79 @@
+from unittest import TestCase
+from unittest.mock import patch
+
+from dino.stats.statsd import MockStatsd
+from dino.utils.bans import BanIndex
+
+
+class FakeDb(object):
+    def __init__(self, timestamps):
+        self.timestamps = timestamps
+        self.n_removals = 0
+
+    def get_ban_and_mute_timestamps(self):
+        return self.timestamps
+
+    def remove_expired_bans_and_mutes(self):
+        self.n_removals += 1
+
+
+class FakeEnv(object):
+    def __init__(self, timestamps):
+        self.db = FakeDb(timestamps)
+        self.stats = MockStatsd()
+        self.capture_exception = lambda e: None
+
+
+class BanIndexTest(TestCase):
+    def setUp(self):
+        self.now = BanIndex.now()
+        self.env = FakeEnv([
+            ('global', '', 'banned-globally', self.now + 300),
+            ('channel', 'channel-1', 'banned-in-channel', self.now + 300),
+            ('room', 'room-1', 'banned-in-room', self.now + 300),
+            ('mute', 'room-1', 'muted', self.now + 300),
+            ('room', 'room-1', 'expired', self.now - 300),
+        ])
+        # long interval so the background loop never purges during a test
+        self.index = BanIndex(self.env, purge_interval=3600)
+
+    @patch('dino.utils.get_channel_for_room', return_value='channel-1')
+    def test_ban_status_same_format_as_db(self, _):
+        self.assertEqual(
+            {'global': '', 'channel': '', 'room': str(int(self.now + 300))},
+            self.index.get_user_ban_status('room-1', 'banned-in-room'))
+        self.assertEqual(
+            {'global': '', 'channel': str(int(self.now + 300)), 'room': ''},
+            self.index.get_user_ban_status('room-1', 'banned-in-channel'))
+        self.assertEqual(
+            {'global': '', 'channel': '', 'room': ''},
+            self.index.get_user_ban_status('room-1', 'expired'))
+
+    def test_banned_globally(self):
+        is_banned, seconds = self.index.is_banned_globally('banned-globally')
+        self.assertTrue(is_banned)
+        self.assertTrue(295 < int(seconds) <= 300)
+        self.assertEqual((False, None), self.index.is_banned_globally('banned-in-room'))
+
+    def test_mute_status(self):
+        self.assertEqual({'room': str(int(self.now + 300))}, self.index.get_user_mute_status('room-1', 'muted'))
+        self.assertEqual({'room': ''}, self.index.get_user_mute_status('room-2', 'muted'))
+
+    def test_add_and_remove(self):
+        self.index.add('room', 'room-2', 'user', self.now + 60)
+        self.assertIsNotNone(self.index.get('room', 'room-2', 'user'))
+        self.index.remove('room', 'room-2', 'user')
+        self.assertIsNone(self.index.get('room', 'room-2', 'user'))
+
+    def test_purge_removes_expired_in_one_batch(self):
+        self.index.add('room', 'room-2', 'user', self.now - 10)
+        self.assertEqual(2, self.index.purge())
+        self.assertEqual(1, self.env.db.n_removals)
+        self.assertNotIn(('room', 'room-1', 'expired'), self.index.ends_at)
+        self.assertEqual(4, self.env.stats.vals['bans.index.size'])
+
+    def test_purge_keeps_extended_ban(self):
+        self.index.add('room', 'room-1', 'expired', self.now + 60)
+        self.assertEqual(0, self.index.purge())
+        self.assertEqual(0, self.env.db.n_removals)
+        self.assertIsNotNone(self.index.get('room', 'room-1', 'expired'))
@@ -0,0 +1,69 @@
+from unittest import TestCase
+
+from dino.utils.blacklist import BlackListChecker
+from dino.utils.blacklist import BlackListMatcher
+
+
+class BlackListMatcherTest(TestCase):
+    def test_no_match(self):
+        matcher = BlackListMatcher({'foo', 'bar baz'})
+        self.assertIsNone(matcher.find('nothing to see here'))
+
+    def test_match_substring(self):
+        matcher = BlackListMatcher({'foo', 'bar baz'})
+        self.assertEqual('bar baz', matcher.find('some bar baz here'))
+
+    def test_match_through_failure_link(self):
+        matcher = BlackListMatcher({'abcd', 'bc'})
+        self.assertEqual('bc', matcher.find('xabcx'))
+
+    def test_match_suffix_of_other_word(self):
+        matcher = BlackListMatcher({'the donald', 'donald'})
+        self.assertEqual('donald', matcher.find('i like donald'))
+
+    def test_add_word(self):
+        matcher = BlackListMatcher({'foo'})
+        self.assertIsNone(matcher.find('some bar'))
+        matcher.add('bar')
+        self.assertEqual('bar', matcher.find('some bar'))
+        self.assertIn('bar', matcher)
+
+    def test_remove_word(self):
+        matcher = BlackListMatcher({'foo', 'oo'})
+        matcher.remove('oo')
+        self.assertIsNone(matcher.find('boo'))
+        self.assertEqual('foo', matcher.find('a foo'))
+        self.assertNotIn('oo', matcher)
+
+    def test_remove_word_that_is_prefix(self):
+        matcher = BlackListMatcher({'foo', 'foobar'})
+        matcher.discard('foo')
+        self.assertIsNone(matcher.find('foo'))
+        self.assertEqual('foobar', matcher.find('a foobar'))
+
+    def test_remove_missing_word_raises(self):
+        matcher = BlackListMatcher({'foo'})
+        self.assertRaises(KeyError, matcher.remove, 'bar')
+
+    def test_equals_plain_set(self):
+        self.assertEqual({'foo', 'bar'}, BlackListMatcher({'foo', 'bar'}))
+
+
+class BlackListCheckerTest(TestCase):
+    def setUp(self):
+        self.checker = BlackListChecker(env=None)
+
+    def test_matcher_reused_for_same_list(self):
+        blacklist = {'foo', 'bar'}
+        matcher = self.checker._get_matcher(blacklist)
+        self.assertIs(matcher, self.checker._get_matcher(blacklist))
+
+    def test_matcher_rebuilt_for_new_list(self):
+        matcher = self.checker._get_matcher({'foo'})
+        other = self.checker._get_matcher({'foo', 'bar'})
+        self.assertIsNot(matcher, other)
+        self.assertEqual('bar', other.find('some bar'))
+
+    def test_matcher_from_cache_used_as_is(self):
+        matcher = BlackListMatcher({'foo'})
+        self.assertIs(matcher, self.checker._get_matcher(matcher))
@@ -0,0 +1,103 @@
+from unittest import TestCase
+from unittest.mock import patch
+
+from dino.stats.statsd import MockStatsd
+from dino.utils.dedup import BloomFilter
+from dino.utils.dedup import DedupCache
+
+
+class FakeEnv(object):
+    def __init__(self):
+        self.stats = MockStatsd()
+
+
+class DedupCacheTest(TestCase):
+    def setUp(self):
+        self.env = FakeEnv()
+        self.cache = DedupCache(self.env, 'test', max_size=3)
+
+    def test_seen_after_add(self):
+        self.assertFalse(self.cache.seen('a'))
+        self.cache.add('a')
+        self.assertTrue(self.cache.seen('a'))
+
+    def test_oldest_evicted_when_full(self):
+        for key in ['a', 'b', 'c', 'd']:
+            self.cache.add(key)
+
+        self.assertEqual(3, len(self.cache))
+        self.assertNotIn('a', self.cache)
+        self.assertIn('d', self.cache)
+
+    def test_readding_moves_key_to_end(self):
+        for key in ['a', 'b', 'c', 'a', 'd']:
+            self.cache.add(key)
+
+        self.assertIn('a', self.cache)
+        self.assertNotIn('b', self.cache)
+
+    def test_expired_by_ttl(self):
+        cache = DedupCache(self.env, 'test', max_size=10, ttl=60)
+
+        with patch('dino.utils.dedup.time.time', return_value=1000):
+            cache.add('a')
+        with patch('dino.utils.dedup.time.time', return_value=1030):
+            cache.add('b')
+            self.assertIn('a', cache)
+        with patch('dino.utils.dedup.time.time', return_value=1070):
+            self.assertNotIn('a', cache)
+            cache.add('c')
+
+        self.assertEqual(['b', 'c'], list(cache.keys.keys()))
+
+    def test_evicted_keys_kept_in_bloom_filter(self):
+        cache = DedupCache(self.env, 'test', max_size=2, bloom_capacity=100)
+        for key in ['a', 'b', 'c', 'd']:
+            cache.add(key)
+
+        self.assertEqual(2, len(cache))
+        self.assertTrue(cache.seen('a'))
+        self.assertFalse(cache.seen('never-added'))
+
+    def test_bloom_filters_rotated(self):
+        cache = DedupCache(self.env, 'test', max_size=1, bloom_capacity=2)
+        for key in ['a', 'b', 'c', 'd', 'e', 'f']:
+            cache.add(key)
+
+        self.assertEqual(2, len(cache.blooms))
+        self.assertNotIn('a', cache)
+        self.assertIn('e', cache)
+
+    def test_hit_rate_reported(self):
+        self.cache.add('a')
+        self.cache.seen('a')
+        self.cache.seen('a')
+        self.cache.seen('a')
+        self.cache.seen('b')
+        self.assertEqual(0.75, self.cache.hit_rate())
+
+        self.cache.report()
+        self.assertEqual(3, self.env.stats.vals['dedup.test.hits'])
+        self.assertEqual(1, self.env.stats.vals['dedup.test.misses'])
+        self.assertEqual(75, self.env.stats.vals['dedup.test.hit_rate'])
+        self.assertEqual(1, self.env.stats.vals['dedup.test.size'])
+        self.assertEqual(0.0, self.cache.hit_rate())
+
+
+class BloomFilterTest(TestCase):
+    def test_no_false_negatives(self):
+        bloom = BloomFilter(1000)
+        keys = [str(i) for i in range(1000)]
+        for key in keys:
+            bloom.add(key)
+
+        for key in keys:
+            self.assertIn(key, bloom)
+
+    def test_few_false_positives(self):
+        bloom = BloomFilter(1000, error_rate=0.01)
+        for i in range(1000):
+            bloom.add(str(i))
+
+        false_positives = sum(1 for i in range(1000, 11000) if str(i) in bloom)
+        self.assertLess(false_positives, 300)
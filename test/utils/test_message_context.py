@@ -0,0 +1,80 @@
+import base64
+from unittest import TestCase
+from unittest.mock import patch
+
+from activitystreams import parse as as_parser
+
+from dino.stats.statsd import MockStatsd
+from dino.utils import b64e
+from dino.utils.message import MessageContext
+from dino.utils.message import message_context_for
+
+
+class FakeEnv(object):
+    def __init__(self):
+        self.stats = MockStatsd()
+
+
+class MessageContextTest(TestCase):
+    def setUp(self):
+        self.env = FakeEnv()
+
+    def test_decoded_once(self):
+        context = MessageContext(b64e('Hello There'), self.env)
+
+        with patch('dino.utils.message.b64decode', wraps=base64.b64decode) as decode:
+            self.assertTrue(context.is_base64)
+            self.assertEqual('Hello There', context.decoded)
+            self.assertEqual('hello there', context.lowercase)
+            self.assertIsNone(context.parsed)
+            self.assertEqual(1, decode.call_count)
+
+        self.assertIn('event.on_message.decode', self.env.stats.timings)
+
+    def test_not_base64(self):
+        context = MessageContext('not base64 åäö')
+        self.assertFalse(context.is_base64)
+        self.assertEqual('', context.decoded)
+
+    def test_empty_content(self):
+        self.assertFalse(MessageContext(None).is_base64)
+        self.assertFalse(MessageContext('  ').is_base64)
+
+    def test_whisper_users_from_json_body(self):
+        context = MessageContext(b64e('{"text": "-foo, hi -bar!"}'))
+        self.assertEqual('-foo, hi -bar!', context.parsed)
+        self.assertEqual('-foo, hi -bar!', context.text)
+        self.assertTrue(context.is_whisper)
+        self.assertEqual({'foo', 'bar'}, context.whisper_users)
+
+    def test_no_whisper_users_for_plain_body(self):
+        context = MessageContext(b64e('-foo hi'))
+        self.assertFalse(context.is_whisper)
+        self.assertEqual(set(), context.whisper_users)
+        self.assertEqual('-foo hi', context.text)
+
+    def test_stage_timed(self):
+        context = MessageContext(b64e('hi'), self.env)
+        with context.stage('store'):
+            pass
+        self.assertIn('event.on_message.store', self.env.stats.timings)
+
+
+class MessageContextForTest(TestCase):
+    @staticmethod
+    def activity(content: str):
+        return as_parser({'verb': 'send', 'object': {'content': content}})
+
+    def test_context_attached_and_reused(self):
+        activity = self.activity(b64e('hi'))
+        context = message_context_for(activity)
+        self.assertIs(context, activity.message_context)
+        self.assertIs(context, message_context_for(activity))
+
+    def test_new_context_when_content_changed(self):
+        activity = self.activity(b64e('hi'))
+        context = message_context_for(activity)
+
+        activity.object.content = b64e('bye')
+        self.assertIsNot(context, message_context_for(activity))
+        self.assertEqual('bye', message_context_for(activity).decoded)
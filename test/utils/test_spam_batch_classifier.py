@@ -0,0 +1,137 @@
+import multiprocessing
+from unittest import TestCase
+
+import eventlet
+
+from dino.environ import GNEnvironment, ConfigDict
+from dino.utils.spam import SpamBatchClassifier
+
+
+class FakeServiceConfig(object):
+    def get_spam_threshold(self):
+        return 80
+
+    def get_spam_min_length(self):
+        return 5
+
+    def get_spam_max_length(self):
+        return 50
+
+
+class FakeStats(object):
+    def __init__(self):
+        self.timings = dict()
+        self.gauges = dict()
+
+    def timing(self, key, ms):
+        self.timings[key] = ms
+
+    def gauge(self, key, value):
+        self.gauges[key] = value
+
+
+class FakeClassifier(object):
+    def __init__(self):
+        self.batches = list()
+
+    def too_long_or_too_short(self, message):
+        return len(message) < 5 or len(message) > 50
+
+    def is_spam_batch(self, messages, threshold):
+        self.batches.append(messages)
+        return [(1 if 'spam' in message else 0, (threshold,)) for message in messages]
+
+
+class FailingClassifier(FakeClassifier):
+    def is_spam_batch(self, messages, threshold):
+        # fails after the first prediction has already been sent to its caller
+        def predictions():
+            yield 0, (threshold,)
+            raise ValueError('failed mid batch')
+
+        if len(self.batches) == 0:
+            self.batches.append(messages)
+            return predictions()
+        return super().is_spam_batch(messages, threshold)
+
+
+def fake_worker_loop(root_path, conn):
+    while True:
+        try:
+            messages, threshold = conn.recv()
+        except EOFError:
+            break
+        conn.send(([(1 if 'spam' in message else 0, (threshold,)) for message in messages], None))
+
+
+class FakeEnv(GNEnvironment):
+    def __init__(self):
+        super().__init__('.', ConfigDict(), skip_init=True)
+        self.service_config = FakeServiceConfig()
+        self.stats = FakeStats()
+        self.capture_exception = lambda e: False
+
+
+class SpamBatchClassifierTest(TestCase):
+    def setUp(self):
+        self.env = FakeEnv()
+        self.classifier = FakeClassifier()
+        self.spam = SpamBatchClassifier(self.env, self.classifier, batch_size=10, flush_interval=0.05)
+
+    def test_too_short_is_not_batched(self):
+        self.assertEqual((False, None), self.spam.is_spam('a'))
+        self.assertEqual(0, len(self.classifier.batches))
+
+    def test_messages_are_classified_in_one_batch(self):
+        messages = ['some spam here', 'a normal message', 'more spam here']
+        threads = [eventlet.spawn(self.spam.is_spam, message) for message in messages]
+        results = [thread.wait() for thread in threads]
+
+        self.assertEqual([1, 0, 1], [is_spam for is_spam, _ in results])
+        self.assertEqual(1, len(self.classifier.batches))
+        self.assertEqual(3, self.env.stats.gauges['spam.batch.size'])
+        self.assertIn('spam.batch.latency', self.env.stats.timings)
+
+    def test_batch_size_is_respected(self):
+        self.spam.batch_size = 2
+        threads = [eventlet.spawn(self.spam.is_spam, 'message {}'.format(i)) for i in range(5)]
+        for thread in threads:
+            thread.wait()
+
+        self.assertTrue(all(len(batch) <= 2 for batch in self.classifier.batches))
+        self.assertEqual(5, sum(len(batch) for batch in self.classifier.batches))
+
+    def test_loop_survives_failure_after_some_results_sent(self):
+        self.classifier = FailingClassifier()
+        self.spam.classifier = self.classifier
+
+        threads = [eventlet.spawn(self.spam.is_spam, message) for message in ['first message', 'second message']]
+        self.assertEqual((0, (0.8,)), threads[0].wait())
+        self.assertRaises(ValueError, threads[1].wait)
+
+        self.assertEqual(1, self.spam.is_spam('some spam here')[0])
+
+    def start_workers(self, processes: int = 2):
+        self.spam.worker_target = fake_worker_loop
+        self.spam.workers = [SpamBatchClassifier.start_worker('.', target=fake_worker_loop) for _ in range(processes)]
+
+    def classify(self, messages: list) -> list:
+        threads = [eventlet.spawn(self.spam.is_spam, message) for message in messages]
+        return [is_spam for is_spam, _ in [thread.wait() for thread in threads]]
+
+    def test_classified_in_worker_processes(self):
+        self.start_workers()
+
+        self.assertEqual([1, 0, 1], self.classify(['some spam here', 'a normal message', 'more spam here']))
+        self.assertEqual(0, len(self.classifier.batches))
+
+    def test_idle_worker_killed_is_restarted(self):
+        self.start_workers()
+        self.assertEqual([1, 0], self.classify(['some spam here', 'a normal message']))
+
+        for process in multiprocessing.active_children():
+            process.kill()
+            process.join()
+
+        self.assertEqual([0, 1], self.classify(['a normal message', 'more spam here']))
+        self.assertEqual([1, 1, 0], self.classify(['some spam here', 'more spam here', 'a normal message']))
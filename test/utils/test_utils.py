@@ -82,6 +82,17 @@ class FakeDb(object):
     def is_moderator(self, room_id, user_id):
         return room_id in FakeDb._moderators and user_id in FakeDb._moderators[room_id]
 
+    def get_user_roles_for_target(self, user_id, channel_id, room_id=None):
+        return {
+            'global': [role for role, has_role in [
+                ('superuser', self.is_super_user(user_id)),
+                ('globalmod', self.is_global_moderator(user_id))] if has_role],
+            'channel': [role for role, has_role in [
+                ('admin', self.is_admin(channel_id, user_id)),
+                ('owner', self.is_owner_channel(channel_id, user_id))] if has_role],
+            'room': ['owner'] if room_id is not None and self.is_owner(room_id, user_id) else []
+        }
+
     def room_contains(self, room_id, user_id):
         if room_id not in FakeDb._room_contains:
             return False
@@ -15,6 +15,7 @@
 from activitystreams import parse as as_parser
 
 from unittest import TestCase
+from unittest.mock import patch
 from uuid import uuid4 as uuid
 
 from dino import environ
@@ -342,6 +343,19 @@ class CustomPatternAclValidatorTest(TestCase):
         environ.env.session[SessionKeys.membership.value] = 'premium'
         self.true(pattern)
 
+    def test_pattern_compiled_once(self):
+        pattern = 'gender=f,(membership=tg_p|membership=tg)'
+        with patch.object(self.validator, '_compile', wraps=self.validator._compile) as compile_pattern:
+            self.new_acl_ok(pattern)
+            self.validator(self.act(), environ.env, 'custom', pattern)
+            self.validator(self.act(), environ.env, 'custom', pattern)
+            self.assertEqual(1, len([c for c in compile_pattern.call_args_list if c.args[1] == pattern]))
+
+    def test_session_keys_of_pattern(self):
+        self.assertEqual(
+            {'gender', 'membership'},
+            set(self.validator.session_keys('custom', 'gender=f,(membership=tg_p|membership=tg)')))
+
     def false(self, pattern):
         is_valid, _ = self.validator(self.act(), environ.env, 'custom', pattern)
         self.assertFalse(is_valid)
@@ -93,6 +93,9 @@ class FakeDb(object):
     def is_super_user(self, *args):
         return False
 
+    def get_user_roles_for_target(self, *args):
+        return {'global': [], 'channel': [], 'room': []}
+
     def get_acls_in_channel_for_action(self, channel_id, action):
         return FakeDb._channel_acls[channel_id][action]
 
@@ -25,6 +25,7 @@ from dino.config import RedisKeys
 from dino.config import ApiTargets
 from dino.exceptions import ValidationException
 from dino.validation import AclValidator
+from dino.validation.acl import AclDecisionCache
 from dino.validation.acl import AclStrInCsvValidator
 from dino.validation.acl import AclRangeValidator
 from dino.validation.acl import AclIsAdminValidator
@@ -65,6 +66,25 @@ class FakeDb(object):
     def is_super_user(self, user_id):
         return user_id in FakeDb._super_users
 
+    def get_user_roles_for_target(self, user_id, channel_id, room_id=None):
+        return {
+            'global': ['superuser'] if self.is_super_user(user_id) else [],
+            'channel': ['admin'] if self.is_admin(channel_id, user_id) else [],
+            'room': ['owner'] if room_id is not None and self.is_owner(room_id, user_id) else []
+        }
+
+    def get_user_roles_for_targets(self, user_id, channel_ids, room_ids):
+        return {
+            'global': ['superuser'] if self.is_super_user(user_id) else [],
+            'channel': {
+                channel_id: ['admin'] if user_id in FakeDb._admins.get(channel_id, set()) else []
+                for channel_id in channel_ids
+            },
+            'room': {
+                room_id: ['owner'] if user_id in FakeDb._owners.get(room_id, set()) else [] for room_id in room_ids
+            }
+        }
+
     def channel_for_room(self, room_id):
         return BaseAclTestValidator.CHANNEL_ID
 
@@ -860,6 +880,143 @@ class TestAclValidator(BaseAclTestValidator):
         self.assertFalse(is_valid)
 
 
+class TestAclDecisionCache(BaseAclTestValidator):
+    def setUp(self):
+        super(TestAclDecisionCache, self).setUp()
+        FakeDb._owners = dict()
+        self.validate_calls = 0
+        self.count_validations()
+
+    def count_validations(self):
+        def counting_validate_rules(*args):
+            self.validate_calls += 1
+            return AclValidator._validate_rules(*args)
+
+        self.validator._validate_rules = counting_validate_rules
+
+    def join(self, acls=None):
+        return self.validator.validate_acl_for_action(
+                self.act(), 'room', 'join', acls or self.acls_for_room_join())
+
+    def test_decision_is_cached(self):
+        self.assertTrue(self.join()[0])
+        self.assertTrue(self.join()[0])
+        self.assertEqual(1, self.validate_calls)
+
+    def test_session_change_invalidates(self):
+        self.assertTrue(self.join()[0])
+        environ.env.session[SessionKeys.gender.value] = 'm'
+        self.assertFalse(self.join()[0])
+        self.assertEqual(2, self.validate_calls)
+
+    def test_acl_change_invalidates(self):
+        self.assertTrue(self.join()[0])
+        self.assertFalse(self.join({'gender': 'm'})[0])
+        self.assertEqual(2, self.validate_calls)
+
+    def test_role_change_applies_immediately(self):
+        environ.env.session[SessionKeys.gender.value] = 'm'
+        self.assertFalse(self.join()[0])
+        self.set_owner()
+        self.assertTrue(self.join()[0])
+
+    def test_other_session_not_cached(self):
+        session = dict(environ.env.session)
+        for _ in range(2):
+            self.validator.validate_acl_for_action(
+                    self.act(), 'room', 'join', self.acls_for_room_join(), session_to_use=session)
+        self.assertEqual(2, self.validate_calls)
+
+    def test_same_room_not_cached(self):
+        environ.env.config[ConfigKeys.ACL]['room']['join']['acls'].append('sameroom')
+        environ.env.config[ConfigKeys.ACL]['validation']['sameroom'] = {
+            'type': 'sameroom',
+            'value': AclSameRoomValidator()
+        }
+        self.validator = AclValidator()
+        self.count_validations()
+
+        for _ in range(2):
+            self.join({'gender': 'f', 'sameroom': ''})
+        self.assertEqual(2, self.validate_calls)
+
+    def test_lru_eviction(self):
+        cache = AclDecisionCache(max_size=2)
+        cache.set('a', (), (True, None))
+        cache.set('b', (), (True, None))
+        cache.get('a', ())
+        cache.set('c', (), (True, None))
+
+        self.assertEqual(2, len(cache))
+        self.assertIsNotNone(cache.get('a', ()))
+        self.assertIsNone(cache.get('b', ()))
+
+    def test_fingerprint_mismatch_is_a_miss(self):
+        cache = AclDecisionCache()
+        cache.set('a', ('f',), (True, None))
+        self.assertIsNone(cache.get('a', ('m',)))
+
+
+class TestFilterTargetsForAction(BaseAclTestValidator):
+    OTHER_ROOM_ID = '5678'
+
+    def setUp(self):
+        super(TestFilterTargetsForAction, self).setUp()
+        FakeDb._owners = dict()
+        self.validate_calls = 0
+
+        def counting_validate_rules(*args):
+            self.validate_calls += 1
+            return AclValidator._validate_rules(*args)
+
+        self.validator._validate_rules = counting_validate_rules
+
+    def filter(self, acls_per_target: dict) -> list:
+        return self.validator.filter_targets_for_action(
+                self.act(), 'room', 'join', acls_per_target, channel_id=BaseAclTestValidator.CHANNEL_ID)
+
+    def test_filters_denied(self):
+        allowed = self.filter({
+            BaseAclTestValidator.ROOM_ID: {'gender': 'm'},
+            TestFilterTargetsForAction.OTHER_ROOM_ID: {'gender': 'f'},
+            'no-acls': dict()
+        })
+        self.assertEqual([TestFilterTargetsForAction.OTHER_ROOM_ID, 'no-acls'], allowed)
+
+    def test_same_acls_evaluated_once(self):
+        allowed = self.filter({str(i): {'gender': 'f', 'age': '25:'} for i in range(10)})
+        self.assertEqual(10, len(allowed))
+        self.assertEqual(1, self.validate_calls)
+
+    def test_owner_bypasses(self):
+        self.set_owner()
+        allowed = self.filter({
+            BaseAclTestValidator.ROOM_ID: {'gender': 'm'},
+            TestFilterTargetsForAction.OTHER_ROOM_ID: {'gender': 'm'}
+        })
+        self.assertEqual([BaseAclTestValidator.ROOM_ID], allowed)
+
+    def test_admin_bypasses(self):
+        self.set_admin()
+        allowed = self.filter({
+            BaseAclTestValidator.ROOM_ID: {'gender': 'm'},
+            TestFilterTargetsForAction.OTHER_ROOM_ID: {'gender': 'm'}
+        })
+        self.assertEqual(2, len(allowed))
+
+    def test_same_decisions_as_one_by_one(self):
+        acls_per_target = {
+            BaseAclTestValidator.ROOM_ID: {'gender': 'f', 'age': ':25'},
+            TestFilterTargetsForAction.OTHER_ROOM_ID: {'gender': 'f,m', 'age': '25:35'},
+            'third': {'age': '31:'}
+        }
+        expected = [
+            room_id for room_id, acls in acls_per_target.items()
+            if self.validator.validate_acl_for_action(self.act(), 'room', 'join', acls, target_id=room_id)[0]
+        ]
+        self.assertEqual(expected, self.filter(acls_per_target))
+
+
 class BaseAclTestValidatorTest(TestCase):
     def test_is_not_implemented(self):
         validator = BaseAclValidator()